@@ -16,9 +16,24 @@ if config.config_file_name is not None:
 
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+# Importar los modelos registra sus tablas (e índices) en SQLModel.metadata
+from sqlmodel import SQLModel
+from backend_rx.apps.modelos import busqueda, estadistica, foto, transaccion, usuario, vehiculo  # noqa: F401
+target_metadata = SQLModel.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Excluye del autogenerate las tablas que no vienen de los modelos
+    (índice FTS5 vehiculo_fts y sus tablas internas)"""
+    if type_ == "table" and name.startswith("vehiculo_fts"):
+        return False
+    return True
+
+
+# Si alembic.ini no define una URL real, usar la db_url de rxconfig.py
+if config.get_main_option("sqlalchemy.url", "").startswith("driver://"):
+    from reflex.config import get_config
+    config.set_main_option("sqlalchemy.url", get_config().db_url)
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -44,6 +59,8 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=url.startswith("sqlite"),
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -65,7 +82,10 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite",
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,55 @@
+"""Índices compuestos y parciales de vehiculo
+
+Revision ID: 3f9a2c7d1b04
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a2c7d1b04'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVO = "activo = 1"
+
+# (nombre, columnas, condición del índice parcial). Debe coincidir con
+# INDICES_VEHICULO en backend_rx/apps/modelos/vehiculo.py
+INDICES = [
+    ("ix_vehiculo_listado_fecha", ["estado", "fecha_creacion", "id"], ACTIVO),
+    ("ix_vehiculo_listado_precio", ["estado", "precio", "id"], ACTIVO),
+    ("ix_vehiculo_listado_vistas", ["estado", "vistas", "id"], ACTIVO),
+    ("ix_vehiculo_destacados", ["estado", "fecha_creacion"], "activo = 1 AND destacado = 1"),
+    ("ix_vehiculo_similares_marca", ["marca", "estado", "precio"], ACTIVO),
+    ("ix_vehiculo_similares_tipo", ["tipo_vehiculo", "estado", "precio"], ACTIVO),
+    ("ix_vehiculo_provincia", ["ubicacion_provincia", "estado", "fecha_creacion"], ACTIVO),
+    ("ix_vehiculo_vendedor", ["vendedor_id", "fecha_creacion"], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # En una base de datos nueva la tabla se crea desde los modelos, que ya
+    # incluyen estos índices
+    if not sa.inspect(op.get_bind()).has_table("vehiculo"):
+        return
+    for nombre, columnas, condicion in INDICES:
+        op.create_index(
+            nombre, "vehiculo", columnas,
+            if_not_exists=True,
+            sqlite_where=sa.text(condicion) if condicion else None,
+        )
+    op.execute("ANALYZE vehiculo")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for nombre, _, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name="vehiculo", if_exists=True)
@@ -0,0 +1,50 @@
+"""Coordenadas y celda de la rejilla de vehiculo
+
+Revision ID: 5d2e8f3a9c61
+Revises: e4a7c2b9d813
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2e8f3a9c61'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c2b9d813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNAS = [("latitud", sa.Float), ("longitud", sa.Float), ("celda_geo", sa.Integer)]
+
+# Debe coincidir con ix_vehiculo_geo en backend_rx/apps/modelos/vehiculo.py
+INDICE = ("ix_vehiculo_geo", ["celda_geo", "estado", "latitud", "longitud"], "activo = 1")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # En una base de datos nueva la tabla se crea desde los modelos, que ya
+    # incluyen las columnas y el índice
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("vehiculo"):
+        return
+    existentes = {columna["name"] for columna in sa.inspect(bind).get_columns("vehiculo")}
+    # ADD COLUMN directo: en modo batch SQLite recrearía la tabla y perdería los triggers FTS
+    for nombre, tipo in COLUMNAS:
+        if nombre not in existentes:
+            op.add_column("vehiculo", sa.Column(nombre, tipo(), nullable=True))
+    nombre, columnas, condicion = INDICE
+    op.create_index(nombre, "vehiculo", columnas, if_not_exists=True, sqlite_where=sa.text(condicion))
+    # Los anuncios existentes se geocodifican después con
+    # python -m backend_rx.apps.servicio.geografia geocodificar
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(INDICE[0], table_name="vehiculo", if_exists=True)
+    # DROP COLUMN directo (SQLite 3.35 o posterior), por el mismo motivo
+    for nombre, _ in reversed(COLUMNAS):
+        op.drop_column("vehiculo", nombre)
@@ -0,0 +1,70 @@
+"""Índice de texto libre FTS5 de vehiculo
+
+Revision ID: 8c41e5a0d6f2
+Revises: 3f9a2c7d1b04
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41e5a0d6f2'
+down_revision: Union[str, Sequence[str], None] = '3f9a2c7d1b04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia de SENTENCIAS_FTS en backend_rx/apps/servicio/busqueda_texto.py
+SENTENCIAS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS vehiculo_fts USING fts5(
+        marca, modelo, descripcion,
+        content='vehiculo', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS vehiculo_fts_ai AFTER INSERT ON vehiculo
+    WHEN new.activo BEGIN
+        INSERT INTO vehiculo_fts(rowid, marca, modelo, descripcion)
+        VALUES (new.id, new.marca, new.modelo, new.descripcion);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vehiculo_fts_ad AFTER DELETE ON vehiculo
+    WHEN old.activo BEGIN
+        INSERT INTO vehiculo_fts(vehiculo_fts, rowid, marca, modelo, descripcion)
+        VALUES ('delete', old.id, old.marca, old.modelo, old.descripcion);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vehiculo_fts_au
+    AFTER UPDATE OF marca, modelo, descripcion, activo ON vehiculo BEGIN
+        INSERT INTO vehiculo_fts(vehiculo_fts, rowid, marca, modelo, descripcion)
+        SELECT 'delete', old.id, old.marca, old.modelo, old.descripcion WHERE old.activo;
+        INSERT INTO vehiculo_fts(rowid, marca, modelo, descripcion)
+        SELECT new.id, new.marca, new.modelo, new.descripcion WHERE new.activo;
+    END""",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite" or not sa.inspect(bind).has_table("vehiculo"):
+        return
+    for sentencia in SENTENCIAS:
+        op.execute(sentencia)
+    # Poblar con los vehículos activos existentes
+    op.execute("INSERT INTO vehiculo_fts(vehiculo_fts) VALUES ('delete-all')")
+    op.execute(
+        "INSERT INTO vehiculo_fts(rowid, marca, modelo, descripcion) "
+        "SELECT id, marca, modelo, descripcion FROM vehiculo WHERE activo"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for trigger in ("vehiculo_fts_au", "vehiculo_fts_ad", "vehiculo_fts_ai"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS vehiculo_fts")
@@ -0,0 +1,60 @@
+"""Fotos de vehiculo y foto de portada
+
+Revision ID: 9b3d61f0a7c2
+Revises: 5d2e8f3a9c61
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3d61f0a7c2'
+down_revision: Union[str, Sequence[str], None] = '5d2e8f3a9c61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'foto_vehiculo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('vehiculo_id', sa.Integer(), nullable=False),
+        sa.Column('hash', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+        sa.Column('orden', sa.Integer(), nullable=False),
+        sa.Column('formato', sqlmodel.sql.sqltypes.AutoString(length=10), nullable=False),
+        sa.Column('ancho', sa.Integer(), nullable=False),
+        sa.Column('alto', sa.Integer(), nullable=False),
+        sa.Column('tamano_bytes', sa.Integer(), nullable=False),
+        sa.Column('estado', sa.Enum('PENDIENTE', 'LISTA', 'ERROR', name='estadofoto'), nullable=False),
+        sa.Column('fecha_creacion', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['vehiculo_id'], ['vehiculo.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('vehiculo_id', 'hash', name='uq_foto_vehiculo'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_foto_vehiculo_orden', 'foto_vehiculo', ['vehiculo_id', 'orden'], if_not_exists=True)
+    op.create_index('ix_foto_vehiculo_hash', 'foto_vehiculo', ['hash'], if_not_exists=True)
+
+    # En una base de datos nueva vehiculo se crea desde el modelo, que ya incluye la columna
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("vehiculo"):
+        return
+    existentes = {columna["name"] for columna in sa.inspect(bind).get_columns("vehiculo")}
+    # ADD COLUMN directo: en modo batch SQLite recrearía la tabla y perdería los triggers FTS
+    if "foto_portada" not in existentes:
+        op.add_column("vehiculo", sa.Column("foto_portada", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # DROP COLUMN directo (SQLite 3.35 o posterior), por el mismo motivo
+    op.drop_column("vehiculo", "foto_portada")
+    op.drop_index('ix_foto_vehiculo_hash', table_name='foto_vehiculo', if_exists=True)
+    op.drop_index('ix_foto_vehiculo_orden', table_name='foto_vehiculo', if_exists=True)
+    op.drop_table('foto_vehiculo', if_exists=True)
@@ -0,0 +1,31 @@
+"""Índice de vehiculo por fecha_actualizacion
+
+Revision ID: a3c9e5f17b42
+Revises: e71a4c9d2f58
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e5f17b42'
+down_revision: Union[str, Sequence[str], None] = 'e71a4c9d2f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table("vehiculo"):
+        return
+    op.create_index("ix_vehiculo_actualizacion", "vehiculo", ["fecha_actualizacion"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_vehiculo_actualizacion", table_name="vehiculo", if_exists=True)
@@ -0,0 +1,41 @@
+"""Tabla estadistica_vehiculo con contadores incrementales
+
+Revision ID: b27e94f1c5a3
+Revises: 8c41e5a0d6f2
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b27e94f1c5a3'
+down_revision: Union[str, Sequence[str], None] = '8c41e5a0d6f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # La tabla se rellena en la primera lectura (estadisticas.leer) o con
+    # python -m backend_rx.apps.servicio.estadisticas reconstruir
+    op.create_table(
+        'estadistica_vehiculo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('dimension', sqlmodel.sql.sqltypes.AutoString(length=20), nullable=False),
+        sa.Column('clave', sqlmodel.sql.sqltypes.AutoString(length=100), nullable=False),
+        sa.Column('cantidad', sa.Integer(), nullable=False),
+        sa.Column('suma_precio', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('dimension', 'clave', name='uq_estadistica_vehiculo'),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('estadistica_vehiculo', if_exists=True)
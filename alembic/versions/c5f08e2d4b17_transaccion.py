@@ -0,0 +1,60 @@
+"""Transacciones de reserva y compra
+
+Revision ID: c5f08e2d4b17
+Revises: 9b3d61f0a7c2
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f08e2d4b17'
+down_revision: Union[str, Sequence[str], None] = '9b3d61f0a7c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Deben coincidir con __table_args__ en backend_rx/apps/modelos/transaccion.py
+INDICES = [
+    ("ux_transaccion_vehiculo_activa", ["vehiculo_id"], True, "estado IN ('RESERVADA', 'COMPLETADA')"),
+    ("ix_transaccion_expira", ["expira"], False, "estado = 'RESERVADA'"),
+    ("ix_transaccion_comprador", ["comprador_id", "fecha_creacion"], False, None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'transaccion',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('vehiculo_id', sa.Integer(), nullable=False),
+        sa.Column('comprador_id', sa.Integer(), nullable=False),
+        sa.Column('vendedor_id', sa.Integer(), nullable=False),
+        sa.Column('clave_idempotencia', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+        sa.Column('precio', sa.Float(), nullable=False),
+        sa.Column('estado', sa.Enum('RESERVADA', 'COMPLETADA', 'CANCELADA', 'EXPIRADA',
+                                    name='estadotransaccion'), nullable=False),
+        sa.Column('expira', sa.DateTime(), nullable=False),
+        sa.Column('fecha_creacion', sa.DateTime(), nullable=False),
+        sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['vehiculo_id'], ['vehiculo.id']),
+        sa.ForeignKeyConstraint(['comprador_id'], ['usuario.id']),
+        sa.ForeignKeyConstraint(['vendedor_id'], ['usuario.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('comprador_id', 'clave_idempotencia', name='uq_transaccion_idempotencia'),
+        if_not_exists=True,
+    )
+    for nombre, columnas, unico, condicion in INDICES:
+        op.create_index(nombre, 'transaccion', columnas, unique=unico, if_not_exists=True,
+                        sqlite_where=sa.text(condicion) if condicion else None)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for nombre, _, _, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name='transaccion', if_exists=True)
+    op.drop_table('transaccion', if_exists=True)
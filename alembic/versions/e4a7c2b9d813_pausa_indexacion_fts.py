@@ -0,0 +1,52 @@
+"""Pausa del trigger de inserción FTS para la importación masiva
+
+Revision ID: e4a7c2b9d813
+Revises: b27e94f1c5a3
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c2b9d813'
+down_revision: Union[str, Sequence[str], None] = 'b27e94f1c5a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia de SENTENCIAS_FTS en backend_rx/apps/servicio/busqueda_texto.py
+TRIGGER_CON_PAUSA = """CREATE TRIGGER vehiculo_fts_ai AFTER INSERT ON vehiculo
+    WHEN new.activo AND NOT EXISTS (SELECT 1 FROM vehiculo_fts_pausa) BEGIN
+        INSERT INTO vehiculo_fts(rowid, marca, modelo, descripcion)
+        VALUES (new.id, new.marca, new.modelo, new.descripcion);
+    END"""
+
+TRIGGER_ANTERIOR = """CREATE TRIGGER vehiculo_fts_ai AFTER INSERT ON vehiculo
+    WHEN new.activo BEGIN
+        INSERT INTO vehiculo_fts(rowid, marca, modelo, descripcion)
+        VALUES (new.id, new.marca, new.modelo, new.descripcion);
+    END"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite" or not sa.inspect(bind).has_table("vehiculo"):
+        return
+    op.execute("CREATE TABLE IF NOT EXISTS vehiculo_fts_pausa (id INTEGER PRIMARY KEY)")
+    op.execute("DROP TRIGGER IF EXISTS vehiculo_fts_ai")
+    op.execute(TRIGGER_CON_PAUSA)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite" or not sa.inspect(bind).has_table("vehiculo"):
+        return
+    op.execute("DROP TRIGGER IF EXISTS vehiculo_fts_ai")
+    op.execute(TRIGGER_ANTERIOR)
+    op.execute("DROP TABLE IF EXISTS vehiculo_fts_pausa")
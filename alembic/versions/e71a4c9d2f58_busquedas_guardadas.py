@@ -0,0 +1,61 @@
+"""Búsquedas guardadas y avisos
+
+Revision ID: e71a4c9d2f58
+Revises: c5f08e2d4b17
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71a4c9d2f58'
+down_revision: Union[str, Sequence[str], None] = 'c5f08e2d4b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'busqueda_guardada',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('usuario_id', sa.Integer(), nullable=False),
+        sa.Column('nombre', sqlmodel.sql.sqltypes.AutoString(length=100), nullable=False),
+        sa.Column('filtros', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('activa', sa.Boolean(), nullable=False),
+        sa.Column('fecha_creacion', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_busqueda_guardada_usuario', 'busqueda_guardada', ['usuario_id'], if_not_exists=True)
+    op.create_table(
+        'alerta_busqueda',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('busqueda_id', sa.Integer(), nullable=False),
+        sa.Column('vehiculo_id', sa.Integer(), nullable=False),
+        sa.Column('usuario_id', sa.Integer(), nullable=False),
+        sa.Column('leida', sa.Boolean(), nullable=False),
+        sa.Column('fecha_creacion', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['busqueda_id'], ['busqueda_guardada.id']),
+        sa.ForeignKeyConstraint(['vehiculo_id'], ['vehiculo.id']),
+        sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('busqueda_id', 'vehiculo_id', name='uq_alerta_busqueda'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_alerta_busqueda_usuario', 'alerta_busqueda',
+                    ['usuario_id', 'leida', 'fecha_creacion'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_alerta_busqueda_usuario', table_name='alerta_busqueda', if_exists=True)
+    op.drop_table('alerta_busqueda', if_exists=True)
+    op.drop_index('ix_busqueda_guardada_usuario', table_name='busqueda_guardada', if_exists=True)
+    op.drop_table('busqueda_guardada', if_exists=True)
@@ -0,0 +1,318 @@
+"""
+Servicio de autenticación
+Registro, inicio de sesión con bcrypt y tokens JWT.
+
+- bcrypt tarda cientos de milisegundos a propósito (coste_bcrypt, 2^coste rondas). Las
+  corrutinas iniciar_sesion y registrar lo ejecutan en un pool de hilos acotado
+  (hilos_bcrypt): bcrypt libera el GIL, así que el bucle de eventos sigue atendiendo otras
+  peticiones durante una avalancha de inicios de sesión. Si hay más de max_en_espera
+  esperando, el inicio de sesión se rechaza en el acto (SATURADO) en vez de encolarse.
+- Los tokens se verifican sin estado (firma y caducidad). Para no decodificarlos ni
+  consultar el usuario en cada petición, verificar_token guarda en dos cachés con TTL
+  el id de cada token ya verificado y los datos del usuario que deciden el acceso (activo,
+  puede_publicar, tipo). Un cambio en el usuario tarda como mucho cache_ttl_s en verse
+  en otros procesos; en este, invalidar_usuario lo aplica al momento.
+
+Ajustes en rxconfig.py con el prefijo autenticacion_ o variables
+REFLEX_AUTENTICACION_<AJUSTE>. El secreto de firma no debe ir en rxconfig.py:
+
+    REFLEX_AUTENTICACION_SECRETO=... reflex run
+"""
+import asyncio
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+
+import bcrypt
+import jwt
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from backend_rx.apps.modelos.usuario import Usuario, TipoUsuario
+from backend_rx.apps.modelos.validaciones import validar_datos_usuario, BYTES_MAXIMOS_PASSWORD
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.instrumentacion import instrumentar, con_mediciones
+from backend_rx.apps.servicio.motor import leer_ajustes
+
+logger = logging.getLogger(__name__)
+
+SATURADO = "Demasiados inicios de sesión a la vez, inténtalo de nuevo en unos segundos"
+CREDENCIALES_INVALIDAS = "Email o contraseña incorrectos"
+
+@dataclass(frozen=True)
+class ConfiguracionAutenticacion:
+    """Ajustes de contraseñas y tokens"""
+    secreto: str = ""                   # vacío: uno aleatorio por proceso (los tokens no sobreviven al reinicio)
+    algoritmo: str = "HS256"
+    emisor: str = "marketplace-autos"
+    expiracion_min: int = 60
+    coste_bcrypt: int = 12              # cada punto duplica el tiempo de hash
+    hilos_bcrypt: int = 4
+    max_en_espera: int = 64
+    cache_ttl_s: float = 30.0
+    cache_max: int = 10000
+
+class UsuarioAutenticado(NamedTuple):
+    """Datos del usuario de un token válido, lo justo para decidir permisos"""
+    id: int
+    email: str
+    tipo_usuario: TipoUsuario
+    puede_publicar: bool
+    
+    @property
+    def es_admin(self) -> bool:
+        return self.tipo_usuario == TipoUsuario.ADMIN
+
+class CacheTTL:
+    """Diccionario acotado con caducidad por entrada; al llenarse descarta la más antigua"""
+    
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave: Hashable, defecto: Any = None) -> Any:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return defecto
+            if entrada[0] < time.monotonic():
+                del self._datos[clave]
+                return defecto
+            return entrada[1]
+    
+    def guardar(self, clave: Hashable, valor: Any, ttl_s: float) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl_s, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+    
+    def descartar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+    
+    def vaciar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+_SIN_DATOS = object()
+
+# verificar_token se llama en cada petición: se deja fuera de la instrumentación para que
+# un acierto de caché cueste microsegundos (las consultas de los fallos sí se miden)
+@instrumentar("verificar_token", "iniciar_sesion", "registrar", "cerrar")
+class AutenticacionService:
+    """Servicio de registro, inicio de sesión y verificación de tokens"""
+    
+    def __init__(self):
+        self.db = db_service
+        self._config: Optional[ConfiguracionAutenticacion] = None
+        self._secreto: Optional[str] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._en_espera = 0
+        self._lock = threading.Lock()
+        self._tokens = CacheTTL(ConfiguracionAutenticacion.cache_max)
+        self._usuarios = CacheTTL(ConfiguracionAutenticacion.cache_max)
+        # Hash con el que se compara la contraseña de un email que no existe, para que
+        # la respuesta tarde lo mismo y no revele qué emails están registrados
+        self._hash_ficticio: Optional[bytes] = None
+    
+    @property
+    def config(self) -> ConfiguracionAutenticacion:
+        if self._config is None:
+            self.configurar(leer_ajustes(ConfiguracionAutenticacion, "autenticacion"))
+        return self._config
+    
+    def configurar(self, config: ConfiguracionAutenticacion) -> None:
+        """Aplica los ajustes y vacía las cachés (pruebas y benchmarks)"""
+        self.cerrar()
+        self._config = config
+        self._secreto = config.secreto or None
+        self._tokens = CacheTTL(config.cache_max)
+        self._usuarios = CacheTTL(config.cache_max)
+        self._hash_ficticio = None
+    
+    @property
+    def secreto(self) -> str:
+        if self._secreto is None:
+            self._secreto = self.config.secreto or secrets.token_urlsafe(32)
+            if not self.config.secreto:
+                logger.warning("Sin autenticacion_secreto: los tokens solo valen en este proceso")
+        return self._secreto
+    
+    # ==================== CONTRASEÑAS ====================
+    
+    def cifrar_password(self, password: str) -> str:
+        """Hash bcrypt de la contraseña con el coste configurado (bloquea el hilo)"""
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.config.coste_bcrypt)).decode()
+    
+    def comprobar_password(self, password: str, password_hash: str) -> bool:
+        """Compara la contraseña con su hash (bloquea el hilo)"""
+        clave = password.encode()
+        if len(clave) > BYTES_MAXIMOS_PASSWORD:
+            return False
+        try:
+            return bcrypt.checkpw(clave, password_hash.encode())
+        except ValueError:
+            # Hash que no es de bcrypt (usuarios sin contraseña, datos sintéticos)
+            return False
+    
+    def _comprobar_ficticio(self, password: str) -> None:
+        if self._hash_ficticio is None:
+            self._hash_ficticio = bcrypt.hashpw(b"-", bcrypt.gensalt(self.config.coste_bcrypt))
+        bcrypt.checkpw(password.encode()[:BYTES_MAXIMOS_PASSWORD], self._hash_ficticio)
+    
+    # ==================== REGISTRO E INICIO DE SESIÓN ====================
+    
+    def registrar_usuario(self, datos: Dict[str, Any]) -> Tuple[bool, str, Optional[Usuario]]:
+        """Crea un usuario con la contraseña cifrada (bloquea el hilo durante bcrypt)"""
+        try:
+            es_valido, mensaje = validar_datos_usuario(datos)
+            if not es_valido:
+                return False, mensaje, None
+            
+            usuario = Usuario(
+                email=datos["email"].strip().lower(),
+                password_hash=self.cifrar_password(datos["password"]),
+                nombre=datos["nombre"],
+                apellido=datos["apellido"],
+                telefono=datos.get("telefono"),
+                ciudad=datos["ciudad"],
+                provincia=datos["provincia"],
+            )
+            return True, "Usuario registrado exitosamente", self.db.create(usuario)
+        
+        except IntegrityError:
+            return False, "Ya existe un usuario con ese email", None
+        except Exception as e:
+            return False, f"Error al registrar usuario: {str(e)}", None
+    
+    def autenticar(self, email: str, password: str) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+        """Comprueba las credenciales y emite un token (bloquea el hilo durante bcrypt)"""
+        try:
+            with self.db.get_session(solo_lectura=True) as session:
+                usuario = session.exec(select(Usuario).where(Usuario.email == email.strip().lower())).first()
+            if usuario is None:
+                self._comprobar_ficticio(password)
+                return False, CREDENCIALES_INVALIDAS, None
+            if not self.comprobar_password(password, usuario.password_hash):
+                return False, CREDENCIALES_INVALIDAS, None
+            if not usuario.activo:
+                return False, "La cuenta está desactivada", None
+            
+            if bcrypt_coste(usuario.password_hash) != self.config.coste_bcrypt:
+                # Coste cambiado desde que se guardó: se aprovecha la contraseña en claro
+                usuario.password_hash = self.cifrar_password(password)
+                usuario.fecha_actualizacion = datetime.now()
+                self.db.update(usuario)
+            
+            token, expira = self.emitir_token(usuario)
+            self._guardar_usuario(usuario)
+            return True, "Sesión iniciada", {
+                "access_token": token,
+                "token_type": "bearer",
+                "expira": expira,
+                "usuario": {"id": usuario.id, "email": usuario.email, "nombre": usuario.nombre_completo,
+                            "tipo_usuario": usuario.tipo_usuario.value, "puede_publicar": usuario.puede_publicar},
+            }
+        
+        except Exception as e:
+            return False, f"Error al iniciar sesión: {str(e)}", None
+    
+    async def iniciar_sesion(self, email: str, password: str) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+        """autenticar en el pool de bcrypt, sin bloquear el bucle de eventos"""
+        return await self._en_pool(self.autenticar, email, password)
+    
+    async def registrar(self, datos: Dict[str, Any]) -> Tuple[bool, str, Optional[Usuario]]:
+        """registrar_usuario en el pool de bcrypt, sin bloquear el bucle de eventos"""
+        return await self._en_pool(self.registrar_usuario, datos)
+    
+    async def _en_pool(self, funcion, *args) -> Tuple[bool, str, Any]:
+        with self._lock:
+            if self._en_espera >= self.config.max_en_espera:
+                return False, SATURADO, None
+            self._en_espera += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.config.hilos_bcrypt, thread_name_prefix="bcrypt")
+            pool = self._pool
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(pool, partial(con_mediciones(funcion), *args))
+        finally:
+            with self._lock:
+                self._en_espera -= 1
+    
+    # ==================== TOKENS ====================
+    
+    def emitir_token(self, usuario: Usuario) -> Tuple[str, datetime]:
+        """Token firmado para el usuario y su fecha de caducidad"""
+        ahora = int(time.time())
+        expira = ahora + self.config.expiracion_min * 60
+        token = jwt.encode(
+            {"sub": str(usuario.id), "iss": self.config.emisor, "iat": ahora, "exp": expira},
+            self.secreto, algorithm=self.config.algoritmo,
+        )
+        return token, datetime.fromtimestamp(expira, tz=timezone.utc)
+    
+    def verificar_token(self, token: str) -> Optional[UsuarioAutenticado]:
+        """Usuario del token si la firma es válida, no ha caducado y el usuario sigue activo"""
+        config = self.config
+        usuario_id = self._tokens.obtener(token)
+        if usuario_id is None:
+            try:
+                datos = jwt.decode(token, self.secreto, algorithms=[config.algoritmo],
+                                   issuer=config.emisor, options={"require": ["exp", "sub", "iss"]})
+                usuario_id = int(datos["sub"])
+            except (jwt.InvalidTokenError, ValueError):
+                # Los tokens no válidos no se guardan: no pueden llenar la caché
+                return None
+            # Nunca más allá de la caducidad del propio token
+            ttl = min(config.cache_ttl_s, datos["exp"] - time.time())
+            if ttl > 0:
+                self._tokens.guardar(token, usuario_id, ttl)
+        
+        usuario = self._usuarios.obtener(usuario_id, _SIN_DATOS)
+        if usuario is _SIN_DATOS:
+            usuario = self._cargar_usuario(usuario_id)
+        return usuario
+    
+    def invalidar_usuario(self, usuario_id: int) -> None:
+        """Olvida los datos en caché del usuario (al desactivarlo o cambiar sus permisos)"""
+        self._usuarios.descartar(usuario_id)
+    
+    def _cargar_usuario(self, usuario_id: int) -> Optional[UsuarioAutenticado]:
+        with self.db.get_session(solo_lectura=True) as session:
+            fila = session.exec(
+                select(Usuario.id, Usuario.email, Usuario.tipo_usuario, Usuario.puede_publicar, Usuario.activo)
+                .where(Usuario.id == usuario_id)
+            ).first()
+        usuario = UsuarioAutenticado(*fila[:4]) if fila and fila.activo else None
+        # También se guarda la ausencia: un token de un usuario desactivado no consulta cada vez
+        self._usuarios.guardar(usuario_id, usuario, self.config.cache_ttl_s)
+        return usuario
+    
+    def _guardar_usuario(self, usuario: Usuario) -> None:
+        datos = UsuarioAutenticado(usuario.id, usuario.email, usuario.tipo_usuario, usuario.puede_publicar)
+        self._usuarios.guardar(usuario.id, datos, self.config.cache_ttl_s)
+    
+    def cerrar(self) -> None:
+        """Espera a los hash en curso y cierra el pool"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+def bcrypt_coste(password_hash: str) -> Optional[int]:
+    """Coste de un hash bcrypt ($2b$12$...), o None si no lo es"""
+    partes = password_hash.split("$")
+    return int(partes[2]) if len(partes) == 4 and partes[2].isdigit() else None
+
+# Instancia global del servicio
+autenticacion_service = AutenticacionService()
@@ -1,13 +1,195 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from enum import Enum
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import json
+import os
 
-app = FastAPI()
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic import BaseModel
 
-vehiculos_db = [
-    {"id": 1, "marca": "BMW", "modelo": "Serie 3", "precio": 25000},
-    {"id": 2, "marca": "Mercedes", "modelo": "Clase A", "precio": 30000},
-    {"id": 3, "marca": "Audi", "modelo": "A4", "precio": 28000}
-]
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, TarjetaVehiculo
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+from backend_rx.apps.servicio.ranking import ranking_vistas
+from backend_rx.apps.servicio.fotos import fotos_service
+from backend_rx.apps.modelos.foto import FotoVehiculo
+from backend_rx.apps.servicio.checkout_service import (
+    checkout_service, VEHICULO_NO_ENCONTRADO, TRANSACCION_NO_ENCONTRADA,
+)
+from backend_rx.apps.autenticacion.autenticacion_service import (
+    autenticacion_service, UsuarioAutenticado, SATURADO,
+)
+from backend_rx.apps.servicio.alertas import alertas_service
+from backend_rx.apps.servicio import instrumentacion
 
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json de la biblioteca estándar
+    orjson = None
+
+def _por_defecto(valor: Any) -> Any:
+    """Tipos que json no sabe serializar (orjson ya los trata igual)"""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Enum):
+        return valor.value
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+def a_json(datos: Any) -> bytes:
+    """Serializa a JSON con orjson si está instalado. Las claves no str (los ids de
+    'distancias') pasan a texto, como hace json"""
+    if orjson is not None:
+        return orjson.dumps(datos, default=_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(datos, default=_por_defecto, ensure_ascii=False, separators=(",", ":")).encode()
+
+class RespuestaJSON(Response):
+    """Respuesta JSON con el codificador rápido"""
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return a_json(content)
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    """Al arrancar, carga el ranking de vistas desde la base de datos y retoma las fotos
+    que quedaron sin procesar; al parar, cierra los pools de las fotos y de bcrypt y el hilo
+    de los avisos de búsquedas guardadas"""
+    ranking_vistas.reconstruir()
+    fotos_service.reprocesar_pendientes()
+    yield
+    fotos_service.cerrar()
+    autenticacion_service.cerrar()
+    alertas_service.cerrar()
+
+app = FastAPI(default_response_class=RespuestaJSON, lifespan=ciclo_de_vida)
+
+# Tamaño de página de las búsquedas y de los bloques de la exportación
+LIMITE_MAXIMO = 100
+BLOQUE_EXPORTACION = 500
+
+# Ordenamientos admitidos en la API (con '-' para descendente). La paginación por cursor
+# (search_keyset) necesita una columna como clave: no admite 'distancia'
+ORDENAMIENTO = r"^-?(fecha_creacion|precio|vistas|año|kilometraje|distancia)$"
+ORDENAMIENTO_CURSOR = r"^-?(fecha_creacion|precio|vistas|año|kilometraje)$"
+
+CAMPOS_VEHICULO = list(Vehiculo.model_fields)
+
+# Con campos=tarjeta los listados leen y devuelven solo las columnas de TarjetaVehiculo
+CAMPOS = r"^(completo|tarjeta)$"
+PROYECCIONES = {"completo": None, "tarjeta": TarjetaVehiculo}
+
+# Las variantes de las fotos llevan el hash en la URL y no cambian nunca
+CACHE_FOTOS = "public, max-age=31536000, immutable"
+
+def vehiculo_a_dict(vehiculo: Vehiculo) -> Dict[str, Any]:
+    if isinstance(vehiculo, tuple):
+        return vehiculo._asdict()
+    return {campo: getattr(vehiculo, campo) for campo in CAMPOS_VEHICULO}
+
+def foto_a_dict(foto: FotoVehiculo) -> Dict[str, Any]:
+    datos = {campo: getattr(foto, campo) for campo in ("id", "orden", "estado", "ancho", "alto")}
+    datos["url"] = fotos_service.url_variante(foto.hash, "grande")
+    datos["miniatura"] = fotos_service.url_variante(foto.hash)
+    datos["srcset"] = fotos_service.srcset(foto)
+    return datos
+
+# ==================== PETICIONES CONDICIONALES ====================
+
+def _ultima_modificacion(vehiculo: Vehiculo) -> datetime:
+    """Fecha de la última modificación del anuncio (las vistas no cuentan)"""
+    return vehiculo.fecha_actualizacion or vehiculo.fecha_creacion
+
+def _fecha_http(fecha: datetime) -> str:
+    # Las fechas se guardan en hora local sin zona
+    return format_datetime(fecha.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+def validadores(vehiculos: Iterable[Vehiculo], extra: str = "") -> Dict[str, str]:
+    """ETag (débil) y Last-Modified de uno o varios vehículos, a partir de su id y su
+    fecha de actualización. Cualquier alta, baja o cambio en el resultado cambia el ETag"""
+    huella = blake2b(extra.encode(), digest_size=12)
+    ultima: Optional[datetime] = None
+    for vehiculo in vehiculos:
+        modificado = _ultima_modificacion(vehiculo)
+        huella.update(f"{vehiculo.id}:{modificado.isoformat()};".encode())
+        ultima = modificado if ultima is None else max(ultima, modificado)
+    cabeceras = {"ETag": f'W/"{huella.hexdigest()}"', "Cache-Control": "no-cache"}
+    if ultima is not None:
+        cabeceras["Last-Modified"] = _fecha_http(ultima)
+    return cabeceras
+
+def no_modificado(request: Request, cabeceras: Dict[str, str]) -> bool:
+    """Comprueba If-None-Match (prioritario) o If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etiquetas = {etiqueta.strip().removeprefix("W/") for etiqueta in if_none_match.split(",")}
+        return "*" in etiquetas or cabeceras["ETag"].removeprefix("W/") in etiquetas
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in cabeceras:
+        try:
+            return parsedate_to_datetime(cabeceras["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def respuesta_condicional(request: Request, vehiculos: List[Vehiculo], contenido: Any,
+                        extra: str = "") -> Response:
+    """304 sin cuerpo si el cliente ya tiene esta versión; si no, el JSON con ETag y Last-Modified"""
+    cabeceras = validadores(vehiculos, extra)
+    if no_modificado(request, cabeceras):
+        return Response(status_code=304, headers=cabeceras)
+    return RespuestaJSON(contenido, headers=cabeceras)
+
+# ==================== AUTENTICACIÓN ====================
+
+class Credenciales(BaseModel):
+    email: str
+    password: str
+
+class Registro(Credenciales):
+    nombre: str
+    apellido: str
+    telefono: Optional[str] = None
+    ciudad: str
+    provincia: str
+
+async def usuario_actual(authorization: Optional[str] = Header(None)) -> UsuarioAutenticado:
+    """Dependencia de los endpoints protegidos: usuario del token Bearer. Con la caché de
+    autenticacion_service no decodifica el token ni consulta la base de datos en cada petición"""
+    esquema, _, token = (authorization or "").partition(" ")
+    usuario = autenticacion_service.verificar_token(token) if esquema.lower() == "bearer" and token else None
+    if usuario is None:
+        raise HTTPException(status_code=401, detail="Token no válido o caducado",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return usuario
+
+@app.post("/auth/registro", status_code=201)
+async def registrar(datos: Registro):
+    """Crea una cuenta. El hash de la contraseña se calcula en el pool de bcrypt"""
+    exito, mensaje, usuario = await autenticacion_service.registrar(datos.model_dump())
+    if not exito:
+        raise HTTPException(status_code=429 if mensaje == SATURADO else 400, detail=mensaje)
+    return {"mensaje": mensaje, "id": usuario.id}
+
+@app.post("/auth/login")
+async def iniciar_sesion(credenciales: Credenciales):
+    """Token de acceso a partir del email y la contraseña"""
+    exito, mensaje, sesion = await autenticacion_service.iniciar_sesion(credenciales.email, credenciales.password)
+    if not exito:
+        if mensaje == SATURADO:
+            raise HTTPException(status_code=429, detail=mensaje, headers={"Retry-After": "1"})
+        raise HTTPException(status_code=401, detail=mensaje)
+    return sesion
+
+@app.get("/auth/yo")
+async def yo(usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    return {**usuario._asdict(), "es_admin": usuario.es_admin}
+
+# ==================== ENDPOINTS ====================
 
 @app.get("/")
 def hola():
@@ -15,17 +197,297 @@ def hola():
     return {"mensaje": "Mi primer mensaje con API"}
 
 
+def filtros_busqueda(marca: Optional[str], tipo_motor: Optional[TipoMotor],
+                    tipo_vehiculo: Optional[TipoVehiculo], provincia: Optional[str],
+                    precio_min: Optional[float], precio_max: Optional[float],
+                    año_min: Optional[int], año_max: Optional[int], order_by: str) -> Dict[str, Any]:
+    """Traduce los parámetros de la URL al formato de filtros de VehiculosService"""
+    filtros: Dict[str, Any] = {"order_by": order_by}
+    if marca:
+        filtros["marca"] = marca
+    if tipo_motor:
+        filtros["tipo_motor"] = tipo_motor
+    if tipo_vehiculo:
+        filtros["tipo_vehiculo"] = tipo_vehiculo
+    if provincia:
+        filtros["ubicacion_provincia"] = provincia
+    for campo, minimo, maximo in (("precio", precio_min, precio_max), ("año", año_min, año_max)):
+        if minimo is not None and maximo is not None:
+            filtros[campo] = {"between": (minimo, maximo)}
+        elif minimo is not None:
+            filtros[campo] = {"gte": minimo}
+        elif maximo is not None:
+            filtros[campo] = {"lte": maximo}
+    return filtros
+
 
 @app.get("/vehiculos")
-def visualizar_vehiculos():
-    """Devuelve la lista de vehículos disponibles en la base de datos."""
-    return vehiculos_db
-
-
-@app.get("/vehiculos/{mi_id}")
-def obtener_vehiculo(vehiculo_id: int):
-    """Busca y retorna un vehículo por su ID. Si no existe, retorna un error."""
-    for vehiculo in vehiculos_db:
-        if vehiculo["id"]==vehiculo_id:
-            return vehiculo
-    return {"error": "Vehiculo no encontrado"}
\ No newline at end of file
+def visualizar_vehiculos(
+    request: Request,
+    pagina: int = Query(1, ge=1),
+    limite: int = Query(20, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    marca: Optional[str] = None,
+    tipo_motor: Optional[TipoMotor] = None,
+    tipo_vehiculo: Optional[TipoVehiculo] = None,
+    provincia: Optional[str] = None,
+    precio_min: Optional[float] = Query(None, ge=0),
+    precio_max: Optional[float] = Query(None, ge=0),
+    año_min: Optional[int] = None,
+    año_max: Optional[int] = None,
+    order_by: str = Query("-fecha_creacion", pattern=ORDENAMIENTO),
+    ciudad: Optional[str] = None,
+    latitud: Optional[float] = Query(None, ge=-90, le=90),
+    longitud: Optional[float] = Query(None, ge=-180, le=180),
+    radio_km: Optional[float] = Query(None, gt=0, le=500),
+    campos: str = Query("completo", pattern=CAMPOS),
+):
+    """Devuelve una página de vehículos disponibles con filtros.
+    Con cursor (el siguiente_cursor de la respuesta anterior) la paginación es por cursor,
+    con cualquier ordenamiento salvo 'distancia'.
+    Con radio_km se buscan los vehículos a esa distancia de latitud y longitud o de la
+    ciudad (y provincia), que además se pueden ordenar por distancia.
+    Con campos=tarjeta cada vehículo trae solo los datos de su tarjeta del listado."""
+    filtros = filtros_busqueda(marca, tipo_motor, tipo_vehiculo, provincia,
+                               precio_min, precio_max, año_min, año_max, order_by)
+    if radio_km is not None:
+        # La provincia pasa a ser la de la ciudad del centro, no un filtro
+        filtros.pop("ubicacion_provincia", None)
+        filtros["cerca"] = {"ciudad": ciudad, "provincia": provincia,
+                            "latitud": latitud, "longitud": longitud, "radio_km": radio_km}
+    if cursor is not None:
+        if order_by.lstrip("-") == "distancia":
+            raise HTTPException(status_code=400, detail="Ordenar por distancia solo admite paginación por página")
+        resultado = vehiculos_service.buscar_vehiculos_cursor(filtros, limite, cursor,
+                                                              proyeccion=PROYECCIONES[campos])
+    else:
+        resultado = vehiculos_service.buscar_vehiculos(filtros, limite, pagina, proyeccion=PROYECCIONES[campos])
+    if "error" in resultado:
+        raise HTTPException(status_code=400, detail=resultado["error"])
+    
+    vehiculos = resultado["vehiculos"]
+    contenido = {**resultado, "vehiculos": [vehiculo_a_dict(v) for v in vehiculos]}
+    return respuesta_condicional(request, vehiculos, contenido,
+                                 extra=f"{request.url.query}|{resultado.get('total')}")
+
+
+@app.get("/vehiculos/exportar")
+def exportar_vehiculos(
+    marca: Optional[str] = None,
+    tipo_motor: Optional[TipoMotor] = None,
+    tipo_vehiculo: Optional[TipoVehiculo] = None,
+    provincia: Optional[str] = None,
+    precio_min: Optional[float] = Query(None, ge=0),
+    precio_max: Optional[float] = Query(None, ge=0),
+    año_min: Optional[int] = None,
+    año_max: Optional[int] = None,
+    order_by: str = Query("-fecha_creacion", pattern=ORDENAMIENTO_CURSOR),
+    campos: str = Query("completo", pattern=CAMPOS),
+):
+    """Todos los vehículos que cumplen los filtros como un array JSON en streaming.
+    Se recorren por cursor en bloques, así que la memoria no depende del tamaño del resultado.
+    Un error en el primer bloque es un 400; uno posterior corta la respuesta sin cerrar el
+    array, para que el cliente no lo tome por un resultado completo."""
+    filtros = filtros_busqueda(marca, tipo_motor, tipo_vehiculo, provincia,
+                               precio_min, precio_max, año_min, año_max, order_by)
+    
+    def siguiente_bloque(cursor: Optional[str]) -> Dict[str, Any]:
+        return vehiculos_service.buscar_vehiculos_cursor(filtros, BLOQUE_EXPORTACION, cursor,
+                                                         proyeccion=PROYECCIONES[campos])
+    
+    primero = siguiente_bloque(None)
+    if "error" in primero:
+        raise HTTPException(status_code=400, detail=primero["error"])
+    
+    def generar() -> Iterator[bytes]:
+        yield b"["
+        separador = b""
+        resultado = primero
+        while True:
+            if resultado["vehiculos"]:
+                bloque = b",".join(a_json(vehiculo_a_dict(v)) for v in resultado["vehiculos"])
+                yield separador + bloque
+                separador = b","
+            cursor = resultado["siguiente_cursor"]
+            if cursor is None:
+                break
+            resultado = siguiente_bloque(cursor)
+            if "error" in resultado:
+                raise RuntimeError(f"Exportación interrumpida: {resultado['error']}")
+        yield b"]"
+    
+    return StreamingResponse(generar(), media_type="application/json")
+
+
+@app.get("/metricas")
+def metricas(usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Métricas de la instrumentación: consultas por llamada y por evento, histogramas de
+    tiempos y las últimas consultas lentas. Solo para administradores: las consultas lentas
+    llevan el SQL y sus parámetros, que pueden incluir datos personales"""
+    if not usuario.es_admin:
+        raise HTTPException(status_code=403, detail="Solo para administradores")
+    return instrumentacion.metricas()
+
+
+@app.post("/vehiculos/{vehiculo_id}/fotos", status_code=202)
+async def subir_foto(vehiculo_id: int, foto: UploadFile = File(...),
+                     usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Añade una foto al anuncio. Responde al guardar el original (202): las variantes se
+    generan en segundo plano y la foto aparece en el listado cuando están listas"""
+    if not usuario.puede_publicar:
+        raise HTTPException(status_code=403, detail="La cuenta no puede publicar")
+    limite = fotos_service.config.max_bytes
+    contenido = await foto.read(limite + 1)
+    if len(contenido) > limite:
+        raise HTTPException(status_code=413, detail="La foto es demasiado grande")
+    exito, mensaje, registro = await run_in_threadpool(
+        fotos_service.subir_foto, vehiculo_id, usuario.id, contenido)
+    if not exito:
+        raise HTTPException(status_code=400, detail=mensaje)
+    return {"mensaje": mensaje, "foto": foto_a_dict(registro)}
+
+@app.get("/vehiculos/{vehiculo_id}/fotos")
+def listar_fotos(vehiculo_id: int):
+    """Fotos listas del anuncio, en orden, con sus URLs y el srcset"""
+    return [foto_a_dict(foto) for foto in fotos_service.obtener_fotos(vehiculo_id)]
+
+@app.delete("/vehiculos/{vehiculo_id}/fotos/{foto_id}")
+def eliminar_foto(vehiculo_id: int, foto_id: int, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    exito, mensaje = fotos_service.eliminar_foto(foto_id, usuario.id)
+    if not exito:
+        raise HTTPException(status_code=400, detail=mensaje)
+    return {"mensaje": mensaje}
+
+@app.get("/fotos/{hash}/{variante}.webp")
+def servir_foto(hash: str, variante: str, request: Request):
+    """Variante de una foto. El contenido de cada URL es inmutable: ETag fijo y caché de un
+    año. El fichero no pasa por Python: FileResponse lo envía con http.response.pathsend
+    (sendfile) si el servidor lo admite, y con fotos_x_accel_redirect lo envía nginx"""
+    ruta = fotos_service.ruta_variante(hash, variante)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Foto no encontrada")
+    cabeceras = {"ETag": f'"{hash[:32]}-{variante}"', "Cache-Control": CACHE_FOTOS}
+    if no_modificado(request, cabeceras):
+        return Response(status_code=304, headers=cabeceras)
+    prefijo = fotos_service.config.x_accel_redirect
+    if prefijo:
+        relativa = os.path.relpath(ruta, fotos_service.config.directorio).replace(os.sep, "/")
+        cabeceras["X-Accel-Redirect"] = prefijo.rstrip("/") + "/" + relativa
+        return Response(headers=cabeceras, media_type="image/webp")
+    return FileResponse(ruta, media_type="image/webp", headers=cabeceras)
+
+# ==================== CHECKOUT ====================
+
+def _error_checkout(mensaje: str) -> HTTPException:
+    """404 si no existe; 409 si existe pero no está en el estado necesario"""
+    no_encontrado = mensaje in (VEHICULO_NO_ENCONTRADO, TRANSACCION_NO_ENCONTRADA)
+    return HTTPException(status_code=404 if no_encontrado else 409, detail=mensaje)
+
+@app.post("/vehiculos/{vehiculo_id}/reservas", status_code=201)
+def reservar_vehiculo(vehiculo_id: int, clave: str = Header(..., alias="Idempotency-Key", max_length=64),
+                      usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Reserva el vehículo. Repetir la petición con la misma Idempotency-Key devuelve la
+    misma reserva"""
+    exito, mensaje, transaccion = checkout_service.reservar(vehiculo_id, usuario.id, clave)
+    if not exito:
+        raise _error_checkout(mensaje)
+    return {"mensaje": mensaje, "transaccion": transaccion.model_dump()}
+
+@app.get("/transacciones/{transaccion_id}")
+def obtener_transaccion(transaccion_id: int, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    transaccion = checkout_service.obtener_transaccion(transaccion_id, usuario.id)
+    if transaccion is None:
+        raise HTTPException(status_code=404, detail=TRANSACCION_NO_ENCONTRADA)
+    return transaccion.model_dump()
+
+@app.post("/transacciones/{transaccion_id}/confirmar")
+def confirmar_compra(transaccion_id: int, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    exito, mensaje, transaccion = checkout_service.confirmar_compra(transaccion_id, usuario.id)
+    if not exito:
+        raise _error_checkout(mensaje)
+    return {"mensaje": mensaje, "transaccion": transaccion.model_dump()}
+
+@app.post("/transacciones/{transaccion_id}/cancelar")
+def cancelar_reserva(transaccion_id: int, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    exito, mensaje = checkout_service.cancelar_reserva(transaccion_id, usuario.id)
+    if not exito:
+        raise _error_checkout(mensaje)
+    return {"mensaje": mensaje}
+
+# ==================== PANEL DEL VENDEDOR ====================
+
+@app.get("/vendedores/yo/panel")
+def panel_vendedor(usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Vehículos por estado, vistas, precio medio y días en el mercado del usuario"""
+    return vehiculos_service.obtener_panel_vendedor(usuario.id)
+
+@app.get("/vendedores/yo/vehiculos")
+def inventario_vendedor(
+    incluir_inactivos: bool = False,
+    campos: str = Query("tarjeta", pattern=CAMPOS),
+    usuario: UsuarioAutenticado = Depends(usuario_actual),
+):
+    """Todo el inventario del usuario como un array JSON en streaming, por bloques como
+    /vehiculos/exportar"""
+    bloques = vehiculos_service.iterar_vehiculos_vendedor(usuario.id, incluir_inactivos, BLOQUE_EXPORTACION,
+                                                         proyeccion=PROYECCIONES[campos])
+    
+    def generar() -> Iterator[bytes]:
+        yield b"["
+        separador = b""
+        for bloque in bloques:
+            yield separador + b",".join(a_json(vehiculo_a_dict(v)) for v in bloque)
+            separador = b","
+        yield b"]"
+    
+    return StreamingResponse(generar(), media_type="application/json")
+
+# ==================== BÚSQUEDAS GUARDADAS ====================
+
+class NuevaBusqueda(BaseModel):
+    nombre: str
+    filtros: Dict[str, Any]
+
+class AlertasLeidas(BaseModel):
+    ids: Optional[List[int]] = None
+
+def busqueda_a_dict(busqueda) -> Dict[str, Any]:
+    return {**busqueda.model_dump(), "filtros": json.loads(busqueda.filtros)}
+
+@app.post("/busquedas", status_code=201)
+def guardar_busqueda(datos: NuevaBusqueda, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Guarda los filtros (los de GET /vehiculos) para recibir avisos de los anuncios nuevos"""
+    exito, mensaje, busqueda = alertas_service.guardar_busqueda(usuario.id, datos.nombre, datos.filtros)
+    if not exito:
+        raise HTTPException(status_code=400, detail=mensaje)
+    return {"mensaje": mensaje, "busqueda": busqueda_a_dict(busqueda)}
+
+@app.get("/busquedas")
+def listar_busquedas(usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    return [busqueda_a_dict(b) for b in alertas_service.obtener_busquedas(usuario.id)]
+
+@app.delete("/busquedas/{busqueda_id}")
+def eliminar_busqueda(busqueda_id: int, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    exito, mensaje = alertas_service.eliminar_busqueda(busqueda_id, usuario.id)
+    if not exito:
+        raise HTTPException(status_code=404, detail=mensaje)
+    return {"mensaje": mensaje}
+
+@app.get("/alertas")
+def listar_alertas(solo_no_leidas: bool = False, limite: int = Query(50, ge=1, le=200),
+                   usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Avisos de anuncios nuevos que cumplen alguna búsqueda guardada, los más recientes primero"""
+    return [a.model_dump() for a in alertas_service.obtener_alertas(usuario.id, solo_no_leidas, limite)]
+
+@app.post("/alertas/leidas")
+def marcar_alertas_leidas(datos: AlertasLeidas, usuario: UsuarioAutenticado = Depends(usuario_actual)):
+    """Marca como leídos los avisos indicados, o todos si no se indica ninguno"""
+    return {"marcadas": alertas_service.marcar_leidas(usuario.id, datos.ids)}
+
+@app.get("/vehiculos/{vehiculo_id}")
+def obtener_vehiculo(vehiculo_id: int, request: Request):
+    """Busca y retorna un vehículo por su ID. Si no existe, retorna un error 404."""
+    vehiculo = vehiculos_service.obtener_vehiculo(vehiculo_id)
+    if not vehiculo or not vehiculo.activo:
+        raise HTTPException(status_code=404, detail="Vehiculo no encontrado")
+    return respuesta_condicional(request, [vehiculo], vehiculo_a_dict(vehiculo))
@@ -0,0 +1,38 @@
+"""
+Modelos BusquedaGuardada y AlertaBusqueda
+
+Búsquedas que guarda un comprador para recibir avisos de los anuncios nuevos que las
+cumplen, y los avisos generados (servicio/alertas.py).
+"""
+import reflex as rx
+from datetime import datetime
+from sqlmodel import Field
+from sqlalchemy import Index, UniqueConstraint
+
+class BusquedaGuardada(rx.Model, table=True):
+    __tablename__ = "busqueda_guardada"
+    __table_args__ = (
+        Index("ix_busqueda_guardada_usuario", "usuario_id"),
+    )
+    
+    usuario_id: int = Field(foreign_key="usuario.id")
+    nombre: str = Field(max_length=100)
+    # Filtros en el formato de buscar_vehiculos, como JSON (los enums por nombre)
+    filtros: str
+    activa: bool = True
+    fecha_creacion: datetime = Field(default_factory=datetime.now)
+
+class AlertaBusqueda(rx.Model, table=True):
+    __tablename__ = "alerta_busqueda"
+    __table_args__ = (
+        # Un aviso por búsqueda y anuncio, aunque el anuncio se procese dos veces
+        UniqueConstraint("busqueda_id", "vehiculo_id", name="uq_alerta_busqueda"),
+        # Avisos de un usuario, los más recientes primero
+        Index("ix_alerta_busqueda_usuario", "usuario_id", "leida", "fecha_creacion"),
+    )
+    
+    busqueda_id: int = Field(foreign_key="busqueda_guardada.id")
+    vehiculo_id: int = Field(foreign_key="vehiculo.id")
+    usuario_id: int = Field(foreign_key="usuario.id")
+    leida: bool = False
+    fecha_creacion: datetime = Field(default_factory=datetime.now)
@@ -0,0 +1,18 @@
+"""
+Modelo EstadisticaVehiculo
+
+Contadores agregados del catálogo de vehículos, mantenidos de forma incremental.
+"""
+import reflex as rx
+from sqlmodel import Field
+from sqlalchemy import UniqueConstraint
+
+class EstadisticaVehiculo(rx.Model, table=True):
+    """Un contador por (dimension, clave), p. ej. ('estado', 'disponible') o ('marca', 'Toyota')"""
+    __tablename__ = "estadistica_vehiculo"
+    __table_args__ = (UniqueConstraint("dimension", "clave", name="uq_estadistica_vehiculo"),)
+    
+    dimension: str = Field(max_length=20)
+    clave: str = Field(max_length=100)
+    cantidad: int = 0
+    suma_precio: float = 0.0
@@ -0,0 +1,36 @@
+"""
+Modelo FotoVehiculo
+
+Fotos de los anuncios. El fichero se guarda una sola vez por contenido (servicio/fotos.py):
+varias fotos, del mismo o de distintos vehículos, pueden compartir hash.
+"""
+import reflex as rx
+from datetime import datetime
+from enum import Enum
+from sqlmodel import Field
+from sqlalchemy import Index, UniqueConstraint
+
+class EstadoFoto(Enum):
+    PENDIENTE = "pendiente"     # original guardado, variantes en proceso
+    LISTA = "lista"
+    ERROR = "error"             # no se pudo decodificar o procesar
+
+class FotoVehiculo(rx.Model, table=True):
+    __tablename__ = "foto_vehiculo"
+    __table_args__ = (
+        UniqueConstraint("vehiculo_id", "hash", name="uq_foto_vehiculo"),
+        # Fotos de un vehículo en orden
+        Index("ix_foto_vehiculo_orden", "vehiculo_id", "orden"),
+        # Fotos que comparten fichero (al terminar el proceso y al purgar)
+        Index("ix_foto_vehiculo_hash", "hash"),
+    )
+    
+    vehiculo_id: int = Field(foreign_key="vehiculo.id")
+    hash: str = Field(max_length=64)    # sha256 del fichero original
+    orden: int = 0
+    formato: str = Field(max_length=10)
+    ancho: int
+    alto: int
+    tamano_bytes: int
+    estado: EstadoFoto = EstadoFoto.PENDIENTE
+    fecha_creacion: datetime = Field(default_factory=datetime.now)
@@ -2,5 +2,50 @@
 Modelo Transaccion
 
 Contiene la definición y lógica del modelo Transaccion para el ecosistema de negocios de autos.
+Cada transacción es una reserva de un vehículo por un comprador, que termina completada
+(venta), cancelada o caducada (servicio/checkout_service.py).
 """
-# Aquí va la definición del modelo Transaccion.
\ No newline at end of file
+import reflex as rx
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+from sqlmodel import Field
+from sqlalchemy import Index, UniqueConstraint, text
+
+class EstadoTransaccion(Enum):
+    RESERVADA = "reservada"
+    COMPLETADA = "completada"
+    CANCELADA = "cancelada"
+    EXPIRADA = "expirada"
+
+# Estados que ocupan el vehículo (los enums se guardan por nombre)
+_OCUPA = "estado IN ('RESERVADA', 'COMPLETADA')"
+
+class Transaccion(rx.Model, table=True):
+    __table_args__ = (
+        # Un reintento con la misma clave devuelve la transacción ya creada
+        UniqueConstraint("comprador_id", "clave_idempotencia", name="uq_transaccion_idempotencia"),
+        # Como mucho una reserva en curso o una venta por vehículo, aunque falle el servicio
+        Index("ux_transaccion_vehiculo_activa", "vehiculo_id", unique=True, sqlite_where=text(_OCUPA)),
+        # Reservas caducadas pendientes de liberar
+        Index("ix_transaccion_expira", "expira", sqlite_where=text("estado = 'RESERVADA'")),
+        Index("ix_transaccion_comprador", "comprador_id", "fecha_creacion"),
+    )
+    
+    vehiculo_id: int = Field(foreign_key="vehiculo.id")
+    comprador_id: int = Field(foreign_key="usuario.id")
+    vendedor_id: int = Field(foreign_key="usuario.id")
+    clave_idempotencia: str = Field(max_length=64)
+    
+    # Precio del vehículo en el momento de la reserva
+    precio: float
+    estado: EstadoTransaccion = EstadoTransaccion.RESERVADA
+    expira: datetime
+    
+    # Fechas
+    fecha_creacion: datetime = Field(default_factory=datetime.now)
+    fecha_actualizacion: Optional[datetime] = None
+    
+    @property
+    def caducada(self) -> bool:
+        return self.estado == EstadoTransaccion.RESERVADA and self.expira <= datetime.now()
@@ -35,4 +35,29 @@ def validar_datos_vehiculo(datos: Dict[str, Any]) -> Tuple[bool, str]:
     if not re.match(r'^[a-zA-Z0-9\s\-]+$', datos["modelo"]):
         return False, "El modelo contiene caracteres no válidos"
     
-    return True, "Validación exitosa"
\ No newline at end of file
+    return True, "Validación exitosa"
+
+
+LONGITUD_MINIMA_PASSWORD = 8
+# Bcrypt solo usa los primeros 72 bytes de la contraseña
+BYTES_MAXIMOS_PASSWORD = 72
+
+def validar_datos_usuario(datos: Dict[str, Any]) -> Tuple[bool, str]:
+    """Valida los datos de registro de un usuario"""
+    
+    # Campos obligatorios
+    campos_requeridos = ["email", "password", "nombre", "apellido", "ciudad", "provincia"]
+    for campo in campos_requeridos:
+        if not datos.get(campo):
+            return False, f"El campo {campo} es obligatorio"
+    
+    if not re.match(r'^[^@\s]+@[^@\s]+\.[^@\s]+$', datos["email"]) or len(datos["email"]) > 255:
+        return False, "El email no es válido"
+    
+    # Validar contraseña
+    if len(datos["password"]) < LONGITUD_MINIMA_PASSWORD:
+        return False, f"La contraseña debe tener al menos {LONGITUD_MINIMA_PASSWORD} caracteres"
+    if len(datos["password"].encode()) > BYTES_MAXIMOS_PASSWORD:
+        return False, f"La contraseña no puede superar {BYTES_MAXIMOS_PASSWORD} bytes"
+    
+    return True, "Validación exitosa"
@@ -11,10 +11,11 @@ Modelo Vehiculo
 Contiene la definición y lógica del modelo Vehiculo para el ecosistema de negocios de autos.
 """
 import reflex as rx
-from typing import Optional
+from typing import NamedTuple, Optional
 from datetime import datetime
 from enum import Enum
 from sqlmodel import Field
+from sqlalchemy import Index, text
 
 class TipoMotor(Enum):
     GASOLINA = "gasolina"
@@ -38,7 +39,37 @@ class TipoVehiculo(Enum):
     MONOVOLUMEN = "monovolumen"
     FURGONETA = "furgoneta"
 
+# Índices para las consultas de vehiculos_service.py. Los parciales (WHERE activo = 1)
+# solo indexan anuncios activos; SQLite los usa cuando la consulta incluye activo = 1
+# como literal, que es como compilar_filtros renderiza los filtros booleanos.
+# Cualquier cambio aquí necesita su migración en alembic/versions.
+_ACTIVO = text("activo = 1")
+
+INDICES_VEHICULO = (
+    # Listado (buscar_vehiculos, recientes, mas_visitados) según el ordenamiento
+    Index("ix_vehiculo_listado_fecha", "estado", "fecha_creacion", "id", sqlite_where=_ACTIVO),
+    Index("ix_vehiculo_listado_precio", "estado", "precio", "id", sqlite_where=_ACTIVO),
+    Index("ix_vehiculo_listado_vistas", "estado", "vistas", "id", sqlite_where=_ACTIVO),
+    # Destacados
+    Index("ix_vehiculo_destacados", "estado", "fecha_creacion",
+          sqlite_where=text("activo = 1 AND destacado = 1")),
+    # Similares: misma marca o mismo tipo en un rango de precio
+    Index("ix_vehiculo_similares_marca", "marca", "estado", "precio", sqlite_where=_ACTIVO),
+    Index("ix_vehiculo_similares_tipo", "tipo_vehiculo", "estado", "precio", sqlite_where=_ACTIVO),
+    # Por provincia
+    Index("ix_vehiculo_provincia", "ubicacion_provincia", "estado", "fecha_creacion", sqlite_where=_ACTIVO),
+    # Por distancia: celdas de la rejilla (IN) con las coordenadas en el índice para
+    # descartar los que quedan fuera del radio sin leer la fila
+    Index("ix_vehiculo_geo", "celda_geo", "estado", "latitud", "longitud", sqlite_where=_ACTIVO),
+    # Por vendedor (incluye inactivos)
+    Index("ix_vehiculo_vendedor", "vendedor_id", "fecha_creacion"),
+    # Últimos cambios, para refrescar los índices en memoria (facetas.py); incluye inactivos
+    Index("ix_vehiculo_actualizacion", "fecha_actualizacion"),
+)
+
 class Vehiculo(rx.Model, table=True):
+    __table_args__ = INDICES_VEHICULO
+    
     id: Optional[int] = Field(primary_key=True)
     marca: str = Field(max_length=50)
     modelo: str = Field(max_length=100)
@@ -56,6 +87,10 @@ class Vehiculo(rx.Model, table=True):
     # Ubicación
     ubicacion_ciudad: str = Field(max_length=100)
     ubicacion_provincia: str = Field(max_length=100)
+    # Coordenadas del nomenclátor y celda de la rejilla (servicio/geografia.py)
+    latitud: Optional[float] = None
+    longitud: Optional[float] = None
+    celda_geo: Optional[int] = None
     
     # Estado y gestión
     estado: EstadoVehiculo = EstadoVehiculo.DISPONIBLE
@@ -74,6 +109,9 @@ class Vehiculo(rx.Model, table=True):
     disponible_financiacion: bool = False
     acepta_parte_pago: bool = False
     motivo_inactivo: Optional[str] = None
+    
+    # Hash de la primera foto lista (servicio/fotos.py), para las tarjetas sin consultar las fotos
+    foto_portada: Optional[str] = Field(default=None, max_length=64)
 
     @property
     def precio_formateado(self) -> str:
@@ -91,4 +129,32 @@ class Vehiculo(rx.Model, table=True):
     def activar_destacado(self):
         """Marca el vehículo como destacado"""
         self.destacado = True
-        self.fecha_actualizacion = datetime.now()
\ No newline at end of file
+        self.fecha_actualizacion = datetime.now()
+
+class TarjetaVehiculo(NamedTuple):
+    """Proyección de Vehiculo con las columnas de una tarjeta del listado (sin descripción
+    ni características). Es una tupla: no la sigue la sesión y no se puede modificar"""
+    id: int
+    marca: str
+    modelo: str
+    año: int
+    tipo_motor: TipoMotor
+    tipo_vehiculo: TipoVehiculo
+    precio: float
+    kilometraje: int
+    ubicacion_ciudad: str
+    ubicacion_provincia: str
+    latitud: Optional[float]
+    longitud: Optional[float]
+    estado: EstadoVehiculo
+    activo: bool
+    destacado: bool
+    vistas: int
+    vendedor_id: int
+    fecha_creacion: datetime
+    fecha_actualizacion: Optional[datetime]
+    foto_portada: Optional[str]
+    
+    @property
+    def precio_formateado(self) -> str:
+        return f"€{self.precio:,.0f}"
@@ -0,0 +1,470 @@
+"""
+Alertas de búsquedas guardadas
+Un comprador guarda unos filtros, en el mismo formato que buscar_vehiculos, y recibe un
+aviso (AlertaBusqueda) por cada anuncio nuevo que los cumple.
+
+Comprobar todas las búsquedas con cada alta cuesta O(búsquedas) por anuncio. El índice
+(IndiceBusquedas) resuelve la consulta al revés, como un percolador:
+
+- Índice invertido por marca, provincia y tipo de motor: cada búsqueda está en la cubeta
+  de su combinación de valores, con None en los campos que no filtra (con 'in', en una
+  cubeta por valor). Un anuncio solo mira las 8 cubetas compatibles con sus valores.
+- Dentro de cada cubeta, los intervalos de precio, año y kilometraje en arrays ordenados
+  por el precio mínimo: una búsqueda binaria descarta las que piden más precio y el resto
+  de intervalos y el tipo de vehículo se comprueban en bloque con numpy.
+- Lo que el índice no evalúa (otros campos, 'ne', 'like', distancia...) se comprueba en
+  las búsquedas candidatas con una consulta, con las condiciones SQL de buscar_vehiculos.
+
+crear_vehiculo encola el anuncio después del commit (db_service.al_confirmar) y un hilo
+procesa la cola por lotes: el alta no espera a las alertas y un rollback no genera avisos.
+La cola está en memoria; tras un reinicio se pueden volver a procesar los anuncios de los
+últimos minutos (los avisos repetidos se ignoran):
+
+    python -m backend_rx.apps.servicio.alertas reprocesar 60
+
+Cada proceso tiene su índice y, antes de cada lote, carga las búsquedas que se hayan
+guardado desde la última carga. Las borradas en otro proceso se descartan al insertar.
+
+Ajustes en rxconfig.py con el prefijo alertas_ o variables REFLEX_ALERTAS_<AJUSTE>.
+"""
+import json
+import logging
+import queue
+import sys
+import threading
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import select, update, func
+from sqlalchemy import literal
+from sqlalchemy.dialects.sqlite import insert
+
+from ..modelos.busqueda import BusquedaGuardada, AlertaBusqueda
+from ..modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, EstadoVehiculo
+from .base_datos import db_service, compilar_filtros
+from .instrumentacion import instrumentar
+from .motor import leer_ajustes
+from . import geografia
+
+logger = logging.getLogger(__name__)
+
+# Campos del índice invertido y campos con intervalo
+_CLAVES = ("marca", "ubicacion_provincia", "tipo_motor")
+_INTERVALOS = ("precio", "año", "kilometraje")
+_ENUMS = {"tipo_motor": TipoMotor, "tipo_vehiculo": TipoVehiculo}
+_TIPOS = list(TipoVehiculo)
+# Los avisos son siempre de anuncios activos y disponibles: estas claves no se guardan
+_IGNORADAS = ("order_by", "activo", "estado")
+
+# Cubetas por búsqueda como máximo al repartir los 'in'; si no, el campo se comprueba aparte
+MAX_CUBETAS = 64
+FILAS_POR_PARTE = 20000
+
+@dataclass(frozen=True)
+class ConfiguracionAlertas:
+    """Ajustes de las búsquedas guardadas y del proceso de avisos"""
+    lote: int = 200                     # anuncios procesados juntos por el hilo
+    max_busquedas_usuario: int = 50
+
+def _nombre_enum(tipo, valor: Any) -> str:
+    """Nombre del miembro (como se guardan los enums) a partir del miembro, el nombre o el valor"""
+    if isinstance(valor, tipo):
+        return valor.name
+    if isinstance(valor, str):
+        if valor in tipo.__members__:
+            return valor
+        for miembro in tipo:
+            if miembro.value == valor:
+                return miembro.name
+    raise ValueError(f"Valor no válido para {tipo.__name__}: {valor}")
+
+def normalizar_filtros(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Filtros de buscar_vehiculos listos para guardar como JSON: sin ordenamiento ni estado
+    y con los enums por nombre. ValueError si buscar_vehiculos no los aceptaría"""
+    normalizados: Dict[str, Any] = {}
+    for campo, valor in filtros.items():
+        if campo in _IGNORADAS:
+            continue
+        if campo in _ENUMS:
+            operaciones = valor if isinstance(valor, dict) else {"eq": valor}
+            valor = {
+                operador: [_nombre_enum(_ENUMS[campo], v) for v in argumento] if operador == "in"
+                else argumento if argumento is None or operador == "isnull"
+                else _nombre_enum(_ENUMS[campo], argumento)
+                for operador, argumento in operaciones.items()
+            }
+        elif campo not in ("cerca", "caja") and not hasattr(Vehiculo, campo):
+            raise ValueError(f"Campo de filtro no válido: {campo}")
+        normalizados[campo] = valor
+    if not normalizados:
+        raise ValueError("La búsqueda necesita al menos un filtro")
+    compilar_filtros(Vehiculo, geografia.filtros_ubicacion(normalizados))
+    # Tuplas a listas, como quedarán al leerlos del JSON
+    return json.loads(json.dumps(normalizados))
+
+def _siguiente(valor: float, hacia: float) -> float:
+    return float(np.nextafter(float(valor), hacia))
+
+def descomponer(filtros: Dict[str, Any]) -> Tuple[Dict[str, list], Dict[str, List[float]], int, Dict[str, Any]]:
+    """Reparte los filtros entre el índice y las comprobaciones aparte: valores de cada campo
+    del índice invertido (None = cualquiera), intervalo [mínimo, máximo] de cada campo
+    numérico, código del tipo de vehículo (-1 = cualquiera) y filtros restantes"""
+    valores: Dict[str, list] = {campo: [None] for campo in _CLAVES}
+    intervalos = {campo: [-np.inf, np.inf] for campo in _INTERVALOS}
+    tipo = -1
+    resto: Dict[str, Dict[str, Any]] = {}
+    for campo, valor in geografia.filtros_ubicacion(filtros).items():
+        operaciones = valor if isinstance(valor, dict) else {"eq": valor}
+        for operador, argumento in operaciones.items():
+            if argumento is None or operador == "isnull":
+                resto.setdefault(campo, {})[operador] = argumento
+            elif campo in _CLAVES and operador in ("eq", "in") and valores[campo] == [None]:
+                valores[campo] = list(argumento) if operador == "in" else [argumento]
+            elif campo in _INTERVALOS and operador in ("eq", "lt", "lte", "gt", "gte", "between"):
+                minimo, maximo = intervalos[campo]
+                if operador in ("eq", "gte", "between"):
+                    minimo = max(minimo, float(argumento[0] if operador == "between" else argumento))
+                if operador in ("eq", "lte", "between"):
+                    maximo = min(maximo, float(argumento[1] if operador == "between" else argumento))
+                if operador == "gt":
+                    minimo = max(minimo, _siguiente(argumento, np.inf))
+                if operador == "lt":
+                    maximo = min(maximo, _siguiente(argumento, -np.inf))
+                intervalos[campo] = [minimo, maximo]
+            elif campo == "tipo_vehiculo" and operador == "eq" and tipo < 0:
+                tipo = _TIPOS.index(TipoVehiculo[argumento] if isinstance(argumento, str) else argumento)
+            else:
+                resto.setdefault(campo, {})[operador] = argumento
+    
+    # Un 'in' muy largo multiplicaría las cubetas: ese campo se comprueba aparte
+    while np.prod([len(v) for v in valores.values()]) > MAX_CUBETAS:
+        campo = max(valores, key=lambda c: len(valores[c]))
+        resto.setdefault(campo, {})["in"] = valores[campo]
+        valores[campo] = [None]
+    return valores, intervalos, tipo, resto
+
+class _Cubeta:
+    """Búsquedas de una combinación de valores del índice invertido: las nuevas se añaden
+    a pendientes y se ordenan por precio mínimo en la siguiente consulta"""
+    __slots__ = ("ids", "precio_min", "pendientes")
+    
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.precio_min = np.empty(0)
+        self.pendientes = array("q")
+
+class IndiceBusquedas:
+    """Percolador en memoria: qué búsquedas guardadas cumple un anuncio"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cubetas: Dict[tuple, _Cubeta] = {}
+        # Arrays indexados por id de búsqueda
+        self._activa = np.zeros(0, dtype=bool)
+        self._minimos = {campo: np.zeros(0) for campo in _INTERVALOS}
+        self._maximos = {campo: np.zeros(0) for campo in _INTERVALOS}
+        self._tipo = np.zeros(0, dtype=np.int8)
+        self._con_resto = np.zeros(0, dtype=bool)
+        self._resto: Dict[int, Dict[str, Any]] = {}
+    
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._activa))
+    
+    def _reservar(self, max_id: int) -> None:
+        actual = len(self._activa)
+        if max_id < actual:
+            return
+        capacidad = max(max_id + 1, 2 * actual)
+        
+        def ampliar(columna: np.ndarray) -> np.ndarray:
+            nueva = np.zeros(capacidad, dtype=columna.dtype)
+            nueva[:actual] = columna
+            return nueva
+        
+        self._activa, self._tipo, self._con_resto = (ampliar(c) for c in (self._activa, self._tipo, self._con_resto))
+        self._minimos = {campo: ampliar(c) for campo, c in self._minimos.items()}
+        self._maximos = {campo: ampliar(c) for campo, c in self._maximos.items()}
+    
+    def agregar(self, busqueda_id: int, filtros: Dict[str, Any]) -> None:
+        """Añade una búsqueda (si ya estaba, no hace nada)"""
+        valores, intervalos, tipo, resto = descomponer(filtros)
+        with self._lock:
+            self._reservar(busqueda_id)
+            if self._activa[busqueda_id]:
+                return
+            self._activa[busqueda_id] = True
+            for campo, (minimo, maximo) in intervalos.items():
+                self._minimos[campo][busqueda_id] = minimo
+                self._maximos[campo][busqueda_id] = maximo
+            self._tipo[busqueda_id] = tipo
+            self._con_resto[busqueda_id] = bool(resto)
+            if resto:
+                self._resto[busqueda_id] = resto
+            for clave in product(*valores.values()):
+                cubeta = self._cubetas.get(clave)
+                if cubeta is None:
+                    cubeta = self._cubetas[clave] = _Cubeta()
+                cubeta.pendientes.append(busqueda_id)
+    
+    def quitar(self, busqueda_id: int) -> None:
+        """Quita una búsqueda. Sus entradas en las cubetas se descartan al reordenarlas"""
+        with self._lock:
+            if busqueda_id < len(self._activa):
+                self._activa[busqueda_id] = False
+                self._resto.pop(busqueda_id, None)
+    
+    def _ordenar(self, cubeta: _Cubeta) -> None:
+        ids = np.concatenate([cubeta.ids, np.frombuffer(cubeta.pendientes, dtype=np.int64)])
+        ids = ids[self._activa[ids]]
+        orden = np.argsort(self._minimos["precio"][ids], kind="stable")
+        cubeta.ids = ids[orden]
+        cubeta.precio_min = self._minimos["precio"][cubeta.ids]
+        cubeta.pendientes = array("q")
+    
+    def coincidencias(self, vehiculo: Vehiculo) -> Tuple[np.ndarray, Dict[int, Dict[str, Any]]]:
+        """Ids de las búsquedas que cumple el anuncio según el índice y, de ellas, las que
+        además tienen filtros que hay que comprobar aparte (id -> filtros restantes)"""
+        claves = [(valor, None) for valor in (vehiculo.marca, vehiculo.ubicacion_provincia, vehiculo.tipo_motor.name)]
+        numeros = {"precio": vehiculo.precio, "año": vehiculo.año, "kilometraje": vehiculo.kilometraje}
+        tipo = _TIPOS.index(vehiculo.tipo_vehiculo)
+        partes = []
+        with self._lock:
+            for clave in product(*claves):
+                cubeta = self._cubetas.get(clave)
+                if cubeta is None:
+                    continue
+                if len(cubeta.pendientes):
+                    self._ordenar(cubeta)
+                # Solo las búsquedas con precio mínimo por debajo del precio del anuncio
+                ids = cubeta.ids[:np.searchsorted(cubeta.precio_min, vehiculo.precio, side="right")]
+                mascara = self._activa[ids] & (self._maximos["precio"][ids] >= vehiculo.precio)
+                for campo in ("año", "kilometraje"):
+                    if numeros[campo] is None:
+                        # Sin valor no cumple ninguna condición sobre el campo (como NULL en SQL)
+                        mascara &= (self._minimos[campo][ids] == -np.inf) & (self._maximos[campo][ids] == np.inf)
+                    else:
+                        mascara &= (self._minimos[campo][ids] <= numeros[campo]) & (self._maximos[campo][ids] >= numeros[campo])
+                tipos = self._tipo[ids]
+                mascara &= (tipos < 0) | (tipos == tipo)
+                partes.append(ids[mascara])
+            ids = np.unique(np.concatenate(partes)) if partes else np.empty(0, dtype=np.int64)
+            restos = {int(i): self._resto[int(i)] for i in ids[self._con_resto[ids]]}
+        return ids, restos
+
+@instrumentar("encolar", "esperar", "cerrar")
+class AlertasService:
+    """Servicio de búsquedas guardadas y avisos de anuncios nuevos"""
+    
+    def __init__(self):
+        self.db = db_service
+        self.indice = IndiceBusquedas()
+        self._config: Optional[ConfiguracionAlertas] = None
+        self._ultimo_id = 0
+        self._lock_carga = threading.Lock()
+        self._cola: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def config(self) -> ConfiguracionAlertas:
+        if self._config is None:
+            self._config = leer_ajustes(ConfiguracionAlertas, "alertas")
+        return self._config
+    
+    # ==================== BÚSQUEDAS GUARDADAS ====================
+    
+    def guardar_busqueda(self, usuario_id: int, nombre: str,
+                         filtros: Dict[str, Any]) -> Tuple[bool, str, Optional[BusquedaGuardada]]:
+        """Guarda los filtros de una búsqueda para recibir avisos de los anuncios nuevos"""
+        try:
+            nombre = (nombre or "").strip()
+            if not nombre or len(nombre) > 100:
+                return False, "El nombre debe tener entre 1 y 100 caracteres", None
+            try:
+                filtros = normalizar_filtros(filtros or {})
+            except (ValueError, TypeError) as e:
+                return False, f"Filtros no válidos: {e}", None
+            
+            with self.db.transaction() as session:
+                guardadas = session.exec(
+                    select(func.count()).select_from(BusquedaGuardada)
+                    .where(BusquedaGuardada.usuario_id == usuario_id, BusquedaGuardada.activa == True)
+                ).one()
+                if guardadas >= self.config.max_busquedas_usuario:
+                    return False, f"Máximo de {self.config.max_busquedas_usuario} búsquedas guardadas", None
+                busqueda = self.db.create(BusquedaGuardada(
+                    usuario_id=usuario_id, nombre=nombre, filtros=json.dumps(filtros, ensure_ascii=False),
+                ))
+            # El índice la carga antes del siguiente lote, como las de otros procesos
+            return True, "Búsqueda guardada", busqueda
+        
+        except Exception as e:
+            return False, f"Error al guardar la búsqueda: {str(e)}", None
+    
+    def eliminar_busqueda(self, busqueda_id: int, usuario_id: int) -> Tuple[bool, str]:
+        """Deja de avisar de una búsqueda (los avisos ya generados se conservan)"""
+        try:
+            with self.db.transaction() as session:
+                resultado = session.execute(
+                    update(BusquedaGuardada)
+                    .where(BusquedaGuardada.id == busqueda_id, BusquedaGuardada.usuario_id == usuario_id,
+                           BusquedaGuardada.activa == True)
+                    .values(activa=False)
+                    .execution_options(synchronize_session=False)
+                )
+            if resultado.rowcount != 1:
+                return False, "Búsqueda no encontrada"
+            self.indice.quitar(busqueda_id)
+            return True, "Búsqueda eliminada"
+        
+        except Exception as e:
+            return False, f"Error al eliminar la búsqueda: {str(e)}"
+    
+    def obtener_busquedas(self, usuario_id: int) -> List[BusquedaGuardada]:
+        """Búsquedas activas del usuario"""
+        return self.db.search(BusquedaGuardada, {"usuario_id": usuario_id, "activa": True},
+                              limit=self.config.max_busquedas_usuario, order_by="id")
+    
+    def obtener_alertas(self, usuario_id: int, solo_no_leidas: bool = False,
+                        limite: int = 50) -> List[AlertaBusqueda]:
+        """Avisos del usuario, los más recientes primero"""
+        filtros = {"usuario_id": usuario_id}
+        if solo_no_leidas:
+            filtros["leida"] = False
+        return self.db.search(AlertaBusqueda, filtros, limit=limite, order_by="-fecha_creacion")
+    
+    def marcar_leidas(self, usuario_id: int, alerta_ids: Optional[List[int]] = None) -> int:
+        """Marca como leídos esos avisos del usuario, o todos. Devuelve cuántos"""
+        sentencia = update(AlertaBusqueda).where(AlertaBusqueda.usuario_id == usuario_id,
+                                                 AlertaBusqueda.leida == False)
+        if alerta_ids is not None:
+            sentencia = sentencia.where(AlertaBusqueda.id.in_(alerta_ids))
+        with self.db.transaction() as session:
+            resultado = session.execute(sentencia.values(leida=True).execution_options(synchronize_session=False))
+        return resultado.rowcount
+    
+    # ==================== PROCESO DE LOS ANUNCIOS NUEVOS ====================
+    
+    def encolar(self, vehiculo_id: int) -> None:
+        """Pide comprobar un anuncio nuevo en segundo plano (llamar después del commit)"""
+        self._iniciar()
+        self._cola.put(vehiculo_id)
+    
+    def actualizar_indice(self) -> int:
+        """Añade al índice las búsquedas guardadas desde la última carga. Devuelve cuántas"""
+        with self._lock_carga:
+            cargadas = 0
+            with self.db.get_session(solo_lectura=True) as session:
+                resultado = session.connection().execution_options(yield_per=FILAS_POR_PARTE).execute(
+                    select(BusquedaGuardada.id, BusquedaGuardada.filtros)
+                    .where(BusquedaGuardada.id > self._ultimo_id, BusquedaGuardada.activa == True)
+                    .order_by(BusquedaGuardada.id)
+                )
+                for filas in resultado.partitions():
+                    for busqueda_id, filtros in filas:
+                        self.indice.agregar(busqueda_id, json.loads(filtros))
+                    cargadas += len(filas)
+                    self._ultimo_id = filas[-1][0]
+            return cargadas
+    
+    def procesar(self, vehiculo_ids: List[int]) -> int:
+        """Genera los avisos de esos anuncios (los que sigan activos y disponibles).
+        Devuelve el número de avisos nuevos"""
+        self.actualizar_indice()
+        with self.db.get_session(solo_lectura=True) as session:
+            vehiculos = session.exec(select(Vehiculo).where(
+                Vehiculo.id.in_(vehiculo_ids), Vehiculo.activo == True,
+                Vehiculo.estado == EstadoVehiculo.DISPONIBLE,
+            )).all()
+        
+        avisos = []
+        for vehiculo in vehiculos:
+            ids, restos = self.indice.coincidencias(vehiculo)
+            descartadas = {
+                busqueda_id for busqueda_id, resto in restos.items()
+                if not self.db.count(Vehiculo, {**resto, "id": vehiculo.id})
+            }
+            ids = [int(i) for i in ids if int(i) not in descartadas]
+            if ids:
+                avisos.append((vehiculo, ids))
+        if not avisos:
+            return 0
+        
+        ahora = datetime.now()
+        nuevos = 0
+        with self.db.transaction() as session:
+            for vehiculo, ids in avisos:
+                # Las borradas en otro proceso siguen en este índice: se filtran aquí
+                sentencia = insert(AlertaBusqueda).from_select(
+                    ["busqueda_id", "vehiculo_id", "usuario_id", "leida", "fecha_creacion"],
+                    select(BusquedaGuardada.id, literal(vehiculo.id), BusquedaGuardada.usuario_id,
+                           literal(False), literal(ahora))
+                    .where(BusquedaGuardada.id.in_(ids), BusquedaGuardada.activa == True,
+                           BusquedaGuardada.usuario_id != vehiculo.vendedor_id)
+                ).on_conflict_do_nothing(index_elements=["busqueda_id", "vehiculo_id"])
+                nuevos += session.execute(sentencia).rowcount
+        return nuevos
+    
+    def reprocesar(self, minutos: int) -> int:
+        """Vuelve a procesar los anuncios publicados en los últimos minutos, p. ej. los que
+        quedaron en la cola al reiniciar. Devuelve el número de avisos nuevos"""
+        desde = datetime.now() - timedelta(minutes=minutos)
+        with self.db.get_session(solo_lectura=True) as session:
+            ids = session.exec(select(Vehiculo.id).where(Vehiculo.fecha_creacion >= desde)).all()
+        return sum(self.procesar(ids[i:i + self.config.lote]) for i in range(0, len(ids), self.config.lote))
+    
+    def esperar(self) -> None:
+        """Espera a que se procesen los anuncios encolados"""
+        self._cola.join()
+    
+    def cerrar(self) -> None:
+        """Procesa lo encolado y para el hilo"""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo is not None:
+            self._cola.put(None)
+            hilo.join()
+    
+    def _iniciar(self) -> None:
+        """Arranca el hilo de proceso en el primer uso"""
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="alertas", daemon=True)
+                self._hilo.start()
+    
+    def _bucle(self) -> None:
+        terminar = False
+        while not terminar:
+            lote = [self._cola.get()]
+            while len(lote) < self.config.lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            terminar = None in lote
+            vehiculo_ids = [vehiculo_id for vehiculo_id in lote if vehiculo_id is not None]
+            try:
+                if vehiculo_ids:
+                    self.procesar(vehiculo_ids)
+            except Exception:
+                # Se pueden recuperar con reprocesar
+                logger.exception("Error al generar los avisos de %s anuncios", len(lote))
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+# Instancia global del servicio
+alertas_service = AlertasService()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "reprocesar":
+        print(f"{alertas_service.reprocesar(int(sys.argv[2]))} avisos nuevos")
+    else:
+        print("Uso: python -m backend_rx.apps.servicio.alertas reprocesar <minutos>")
+        sys.exit(2)
@@ -2,100 +2,427 @@
 Servicio de base de datos
 Contiene la lógica base para operaciones CRUD y acceso a datos.
 """
-import reflex as rx
 from sqlmodel import Session, select, and_, or_, func
-from typing import List, Dict, Any, Optional, Type, TypeVar
+from sqlalchemy import bindparam, event, tuple_
+from typing import Callable, List, Dict, Any, Optional, Tuple, Type, TypeVar
 from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from datetime import datetime
+from enum import Enum
+import base64
+import json
+import math
+
+from .motor import motor_escritura, motor_lectura
+from . import geografia
+from .instrumentacion import instrumentar
 
 T = TypeVar('T')
 
+# Sesión de la transacción en curso (unidad de trabajo) en este hilo o tarea
+_sesion_transaccion: ContextVar[Optional[Session]] = ContextVar('_sesion_transaccion', default=None)
+
+@instrumentar("get_session", "transaction", "in_transaction", "al_confirmar")
 class DatabaseService:
     """Servicio base para operaciones de base de datos"""
     
     @contextmanager
-    def get_session(self):
-        with rx.session() as session:
+    def get_session(self, solo_lectura: bool = False):
+        """Sesión de la transacción en curso o, si no hay, una nueva. Con solo_lectura se
+        usa el pool de lectores en lugar de la conexión de escritura (ver motor.py)"""
+        sesion = _sesion_transaccion.get()
+        if sesion is not None:
+            # Dentro de una transacción todas las operaciones comparten su sesión
+            yield sesion
+            return
+        with Session(motor_lectura() if solo_lectura else motor_escritura()) as session:
             yield session
     
+    @contextmanager
+    def transaction(self):
+        """Unidad de trabajo: una sesión y una transacción compartidas por todas las
+        operaciones del bloque. Los objetos leídos quedan en el mapa de identidad de la
+        sesión (get_by_id devuelve la misma instancia), create/update solo hacen flush
+        y al salir se hace un único commit, o rollback si hay una excepción.
+        Las transacciones anidadas se unen a la exterior."""
+        if _sesion_transaccion.get() is not None:
+            yield _sesion_transaccion.get()
+            return
+        
+        with Session(motor_escritura()) as session:
+            # Los objetos siguen siendo utilizables tras el commit y el cierre
+            session.expire_on_commit = False
+            # Un rollback, también el de transactional, descarta lo registrado con al_confirmar
+            event.listen(session, "after_rollback", lambda s: s.info.pop("al_confirmar", None))
+            token = _sesion_transaccion.set(session)
+            try:
+                yield session
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                _sesion_transaccion.reset(token)
+            for funcion in session.info.pop("al_confirmar", []):
+                funcion()
+    
+    def in_transaction(self) -> bool:
+        return _sesion_transaccion.get() is not None
+    
+    def al_confirmar(self, funcion: Callable[[], None]) -> None:
+        """Ejecuta funcion después del commit de la transacción en curso, y nunca si se
+        deshace; fuera de una transacción, en el momento. Para trabajo posterior que no
+        debe ver datos sin confirmar (p. ej. encolar un proceso en segundo plano)"""
+        sesion = _sesion_transaccion.get()
+        if sesion is None:
+            funcion()
+            return
+        sesion.info.setdefault("al_confirmar", []).append(funcion)
+    
     def create(self, instance: T) -> T:
         with self.get_session() as session:
             session.add(instance)
+            if self.in_transaction():
+                # El id se asigna con el flush; el commit lo hace la transacción
+                session.flush()
+                return instance
             session.commit()
             session.refresh(instance)
             return instance
     
     def get_by_id(self, model: Type[T], id: int) -> Optional[T]:
-        with self.get_session() as session:
+        with self.get_session(solo_lectura=True) as session:
             return session.get(model, id)
     
     def update(self, instance: T) -> T:
         with self.get_session() as session:
             session.add(instance)
+            if self.in_transaction():
+                session.flush()
+                return instance
             session.commit()
             session.refresh(instance)
             return instance
     
     def search(self, model: Type[T], filtros: Dict[str, Any], 
             limit: int = 20, offset: int = 0, 
-            order_by: str = 'id') -> List[T]:
-        with self.get_session() as session:
-            query = select(model)
-            
-            # Aplicar filtros
-            for field, value in filtros.items():
-                if hasattr(model, field):
-                    if isinstance(value, dict):
-                        # Filtros especiales como {'lte': 100}
-                        if 'lte' in value:
-                            query = query.where(getattr(model, field) <= value['lte'])
-                        if 'gte' in value:
-                            query = query.where(getattr(model, field) >= value['gte'])
-                        if 'between' in value:
-                            min_val, max_val = value['between']
-                            query = query.where(getattr(model, field).between(min_val, max_val))
-                    else:
-                        query = query.where(getattr(model, field) == value)
-            
-            # Ordenamiento
-            if order_by.startswith('-'):
-                field = order_by[1:]
-                if hasattr(model, field):
-                    query = query.order_by(getattr(model, field).desc())
-            else:
-                if hasattr(model, order_by):
-                    query = query.order_by(getattr(model, order_by))
+            order_by: str = 'id', proyeccion: Optional[type] = None) -> List[T]:
+        """Con proyeccion (una NamedTuple cuyos campos son columnas del modelo) solo se leen
+        esas columnas y se devuelven tuplas en lugar de instancias del modelo"""
+        forma, parametros = compilar_filtros(model, filtros)
+        query = _sentencia_busqueda(model, forma, order_by, False, proyeccion)
+        
+        with self.get_session(solo_lectura=True) as session:
+            filas = session.exec(query, params={**parametros, "_limit": limit, "_offset": offset}).all()
+            return list(map(proyeccion._make, filas)) if proyeccion else list(filas)
+    
+    def search_with_count(self, model: Type[T], filtros: Dict[str, Any],
+            limit: int = 20, offset: int = 0, order_by: str = 'id',
+            total: str = 'ventana', proyeccion: Optional[type] = None) -> Tuple[List[T], Optional[int]]:
+        """Página de resultados y total de coincidencias en una sola sesión.
+        
+        total: 'ventana' (COUNT(*) OVER () en la misma consulta), 'separado'
+        (consulta COUNT aparte) o 'ninguno' (no se calcula, devuelve None).
+        proyeccion: como en search.
+        """
+        if total not in ('ventana', 'separado', 'ninguno'):
+            raise ValueError(f"Modo de total no válido: {total}")
+        
+        forma, parametros = compilar_filtros(model, filtros)
+        parametros = {**parametros, "_limit": limit, "_offset": offset}
+        
+        with self.get_session(solo_lectura=True) as session:
+            if total == 'ventana':
+                filas = session.exec(_sentencia_busqueda(model, forma, order_by, True, proyeccion), params=parametros).all()
+                if proyeccion:
+                    resultados = [proyeccion._make(fila[:-1]) for fila in filas]
+                else:
+                    resultados = [fila[0] for fila in filas]
+                if filas:
+                    return resultados, filas[0][-1]
+                if offset == 0:
+                    return resultados, 0
+                # Página fuera de rango: la ventana no devuelve filas, se cuenta aparte
+                return resultados, session.exec(_sentencia_conteo(model, forma), params=parametros).one()
             
-            return list(session.exec(query.offset(offset).limit(limit)).all())
+            filas = session.exec(_sentencia_busqueda(model, forma, order_by, False, proyeccion), params=parametros).all()
+            resultados = list(map(proyeccion._make, filas)) if proyeccion else list(filas)
+            if total == 'ninguno':
+                return resultados, None
+            return resultados, session.exec(_sentencia_conteo(model, forma), params=parametros).one()
+    
+    def search_keyset(self, model: Type[T], filtros: Dict[str, Any],
+            limit: int = 20, order_by: str = 'id',
+            cursor: Optional[str] = None, proyeccion: Optional[type] = None) -> Tuple[List[T], Optional[str]]:
+        """Paginación por cursor: busca directamente tras la última clave (campo, id) vista.
+        proyeccion: como en search; debe incluir el campo de ordenamiento y el id"""
+        field = order_by.lstrip('-')
+        if not hasattr(model, field):
+            raise ValueError(f"Campo de ordenamiento no válido: {field}")
+        if proyeccion and not {field, 'id'} <= set(proyeccion._fields):
+            raise ValueError(f"La proyección {proyeccion.__name__} no incluye el campo de ordenamiento: {field}")
+        
+        forma, parametros = compilar_filtros(model, filtros)
+        tipo_cursor = None
+        if cursor:
+            valor, ultimo_id = _decodificar_cursor(cursor, getattr(model, field), order_by)
+            tipo_cursor = 'nulo' if valor is None else 'valor'
+            parametros.update({"_cursor_valor": valor, "_cursor_id": ultimo_id})
+        
+        # Se pide un elemento extra para saber si hay página siguiente
+        parametros["_limit"] = limit + 1
+        query = _sentencia_keyset(model, forma, order_by, tipo_cursor, proyeccion)
+        
+        with self.get_session(solo_lectura=True) as session:
+            filas = session.exec(query, params=parametros).all()
+            resultados = list(map(proyeccion._make, filas)) if proyeccion else list(filas)
+        
+        siguiente = None
+        if len(resultados) > limit:
+            resultados = resultados[:limit]
+            ultimo = resultados[-1]
+            siguiente = _codificar_cursor(getattr(ultimo, field), ultimo.id, order_by)
+        
+        return resultados, siguiente
     
     def count(self, model: Type[T], filtros: Dict[str, Any]) -> int:
-        with self.get_session() as session:
-            query = select(func.count()).select_from(model)
-            for field, value in filtros.items():
-                if hasattr(model, field):
-                    if isinstance(value, dict):
-                        if 'lte' in value:
-                            query = query.where(getattr(model, field) <= value['lte'])
-                        if 'gte' in value:
-                            query = query.where(getattr(model, field) >= value['gte'])
-                    else:
-                        query = query.where(getattr(model, field) == value)
-            return session.exec(query).first() or 0
+        forma, parametros = compilar_filtros(model, filtros)
+        with self.get_session(solo_lectura=True) as session:
+            return session.exec(_sentencia_conteo(model, forma), params=parametros).one() or 0
     
     def get_stats(self, model: Type[T]) -> Dict[str, Any]:
-        with self.get_session() as session:
+        with self.get_session(solo_lectura=True) as session:
             total = session.exec(select(func.count()).select_from(model)).first()
             return {"total": total or 0}
 
+# ==================== COMPILADOR DE FILTROS ====================
+
+# Operadores admitidos en filtros tipo {'campo': {'operador': valor}}.
+# Un valor simple equivale a {'eq': valor}.
+# 'radio' (latitud, longitud, km) y 'caja' (lat_min, lon_min, lat_max, lon_max) se aplican
+# a la columna de celdas de la rejilla (celda_geo) y usan las columnas latitud y longitud
+# del modelo; con 'radio' se puede ordenar por 'distancia'.
+OPERADORES = ('eq', 'ne', 'lt', 'lte', 'gt', 'gte', 'between', 'in', 'like', 'isnull', 'radio', 'caja')
+
+def compilar_filtros(model, filtros: Dict[str, Any]) -> Tuple[tuple, Dict[str, Any]]:
+    """Separa los filtros en su forma (campos y operadores, hashable) y sus parámetros.
+    
+    Las consultas se construyen y cachean a partir de la forma, de modo que dos
+    búsquedas con los mismos campos y operadores reutilizan la misma sentencia.
+    Los campos que no existen en el modelo se ignoran (p. ej. 'order_by').
+    """
+    forma = []
+    parametros = {}
+    for field, value in filtros.items():
+        if not hasattr(model, field):
+            continue
+        operaciones = value if isinstance(value, dict) else {'eq': value}
+        for operador, valor in operaciones.items():
+            if operador not in OPERADORES:
+                raise ValueError(f"Operador de filtro no válido: {operador}")
+            nombre = f"{field}__{operador}"
+            if operador in ('eq', 'ne') and isinstance(valor, bool):
+                # Los booleanos se incrustan como literal (activo = 1) para que
+                # SQLite pueda usar los índices parciales definidos en los modelos
+                forma.append((field, operador, valor))
+            elif operador == 'isnull' or (operador in ('eq', 'ne') and valor is None):
+                # IS NULL / IS NOT NULL forman parte de la estructura de la consulta
+                es_nulo = bool(valor) if operador == 'isnull' else operador == 'eq'
+                forma.append((field, 'isnull', es_nulo))
+            elif operador == 'between':
+                min_val, max_val = valor
+                forma.append((field, operador, None))
+                parametros[nombre + "_min"] = min_val
+                parametros[nombre + "_max"] = max_val
+            elif operador in ('radio', 'caja'):
+                forma.append((field, operador, None))
+                parametros.update(_parametros_geo(nombre, operador, valor))
+            else:
+                forma.append((field, operador, None))
+                parametros[nombre] = list(valor) if operador == 'in' else valor
+    return tuple(sorted(forma, key=lambda f: (f[0], f[1]))), parametros
+
+def _condicion(model, field: str, operador: str, extra: Any):
+    """Condición SQL de un filtro con parámetros enlazados (bindparam)"""
+    columna = getattr(model, field)
+    nombre = f"{field}__{operador}"
+    parametro = lambda n=nombre: bindparam(n, type_=columna.type)
+    if operador == 'isnull':
+        return columna.is_(None) if extra else columna.isnot(None)
+    if operador == 'eq':
+        return columna == (parametro() if extra is None else extra)
+    if operador == 'ne':
+        return columna != (parametro() if extra is None else extra)
+    if operador == 'lt':
+        return columna < parametro()
+    if operador == 'lte':
+        return columna <= parametro()
+    if operador == 'gt':
+        return columna > parametro()
+    if operador == 'gte':
+        return columna >= parametro()
+    if operador == 'between':
+        return columna.between(parametro(nombre + "_min"), parametro(nombre + "_max"))
+    if operador == 'in':
+        return columna.in_(bindparam(nombre, expanding=True, type_=columna.type))
+    if operador == 'radio':
+        return and_(columna.in_(bindparam(nombre, expanding=True)),
+                    _distancia(model, nombre) <= bindparam(nombre + "_r2"))
+    if operador == 'caja':
+        return and_(columna.in_(bindparam(nombre, expanding=True)),
+                    model.latitud.between(bindparam(nombre + "_lat_min"), bindparam(nombre + "_lat_max")),
+                    model.longitud.between(bindparam(nombre + "_lon_min"), bindparam(nombre + "_lon_max")))
+    return columna.like(bindparam(nombre))
+
+def _parametros_geo(nombre: str, operador: str, valor: Any) -> Dict[str, Any]:
+    """Celdas de la rejilla y parámetros de la condición de un filtro 'radio' o 'caja'"""
+    if operador == 'caja':
+        lat_min, lon_min, lat_max, lon_max = valor
+        return {nombre: geografia.celdas_en_caja(lat_min, lon_min, lat_max, lon_max),
+                nombre + "_lat_min": lat_min, nombre + "_lat_max": lat_max,
+                nombre + "_lon_min": lon_min, nombre + "_lon_max": lon_max}
+    latitud, longitud, radio_km = valor
+    return {nombre: geografia.celdas_en_radio(latitud, longitud, radio_km),
+            nombre + "_lat": latitud, nombre + "_lon": longitud,
+            nombre + "_cos2": math.cos(math.radians(latitud)) ** 2,
+            nombre + "_r2": (radio_km / geografia.KM_POR_GRADO) ** 2}
+
+def _distancia(model, nombre: str):
+    """Cuadrado de la distancia al centro de un filtro 'radio', en grados de latitud.
+    Aproximación equirectangular (sin funciones matemáticas en SQL): a 50 km el error es
+    de unos cientos de metros"""
+    dlat = model.latitud - bindparam(nombre + "_lat")
+    dlon = model.longitud - bindparam(nombre + "_lon")
+    return dlat * dlat + dlon * dlon * bindparam(nombre + "_cos2")
+
+def _condiciones(model, forma: tuple) -> list:
+    return [_condicion(model, field, operador, extra) for field, operador, extra in forma]
+
+def _ordenamiento(model, order_by: str, forma: tuple = ()) -> list:
+    field = order_by.lstrip('-')
+    if field == 'distancia':
+        radios = [f"{campo}__radio" for campo, operador, _ in forma if operador == 'radio']
+        if not radios:
+            raise ValueError("Ordenar por distancia requiere un filtro de radio")
+        distancia = _distancia(model, radios[0])
+        return [distancia.desc() if order_by.startswith('-') else distancia, model.id]
+    if not hasattr(model, field):
+        return []
+    columna = getattr(model, field)
+    return [columna.desc() if order_by.startswith('-') else columna]
+
+def _columnas(model, proyeccion: Optional[type]) -> list:
+    """Columnas del SELECT: la entidad completa o solo las de la proyección"""
+    if proyeccion is None:
+        return [model]
+    return [getattr(model, campo) for campo in proyeccion._fields]
+
+@lru_cache(maxsize=256)
+def _sentencia_busqueda(model, forma: tuple, order_by: str, con_total: bool, proyeccion: Optional[type] = None):
+    columnas = _columnas(model, proyeccion)
+    if con_total:
+        columnas.append(func.count().over().label('total'))
+    return (
+        select(*columnas)
+        .where(*_condiciones(model, forma))
+        .order_by(*_ordenamiento(model, order_by, forma))
+        .limit(bindparam('_limit'))
+        .offset(bindparam('_offset'))
+    )
+
+@lru_cache(maxsize=256)
+def _sentencia_conteo(model, forma: tuple):
+    return select(func.count()).select_from(model).where(*_condiciones(model, forma))
+
+@lru_cache(maxsize=256)
+def _sentencia_keyset(model, forma: tuple, order_by: str, tipo_cursor: Optional[str],
+                      proyeccion: Optional[type] = None):
+    descendente = order_by.startswith('-')
+    columna = getattr(model, order_by.lstrip('-'))
+    columna_id = getattr(model, 'id')
+    
+    query = select(*_columnas(model, proyeccion)).where(*_condiciones(model, forma))
+    if tipo_cursor:
+        valor = None if tipo_cursor == 'nulo' else bindparam('_cursor_valor', type_=columna.type)
+        query = query.where(_condicion_keyset(columna, columna_id, valor, bindparam('_cursor_id'), descendente))
+    
+    if descendente:
+        query = query.order_by(columna.desc(), columna_id.desc())
+    else:
+        query = query.order_by(columna.asc(), columna_id.asc())
+    return query.limit(bindparam('_limit'))
+
+# ==================== CURSORES (PAGINACIÓN KEYSET) ====================
+
+def _codificar_cursor(valor: Any, id: int, order_by: str) -> str:
+    """Genera un token opaco a partir de la clave de ordenamiento del último elemento"""
+    if isinstance(valor, datetime):
+        valor = valor.isoformat()
+    elif isinstance(valor, Enum):
+        valor = valor.value
+    datos = json.dumps({"o": order_by, "v": valor, "id": id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+def _decodificar_cursor(cursor: str, columna, order_by: str) -> Tuple[Any, int]:
+    """Recupera (valor, id) de un token generado por _codificar_cursor"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        valor, id = datos["v"], int(datos["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Cursor no válido")
+    
+    if datos.get("o") != order_by:
+        raise ValueError("El cursor no corresponde al ordenamiento solicitado")
+    
+    if valor is not None:
+        try:
+            tipo = columna.type.python_type
+        except NotImplementedError:
+            tipo = None
+        if tipo is datetime:
+            valor = datetime.fromisoformat(valor)
+        elif isinstance(tipo, type) and issubclass(tipo, Enum):
+            valor = tipo(valor)
+    return valor, id
+
+def _condicion_keyset(columna, columna_id, valor: Any, ultimo_id: Any, descendente: bool):
+    """Condición 'posterior a (valor, id)' según el orden. SQLite ordena NULL como el menor valor.
+    
+    Se usa comparación de row values, (campo, id) < (?, ?), que SQLite resuelve
+    como un rango sobre el índice; con OR entre columnas recorrería el índice entero.
+    """
+    clave = tuple_(columna, columna_id)
+    anulable = getattr(columna.expression, 'nullable', True)
+    if descendente:
+        if valor is None:
+            return and_(columna.is_(None), columna_id < ultimo_id)
+        condicion = clave < tuple_(valor, ultimo_id)
+        return or_(condicion, columna.is_(None)) if anulable else condicion
+    if valor is None:
+        return or_(
+            and_(columna.is_(None), columna_id > ultimo_id),
+            columna.isnot(None)
+        )
+    return clave > tuple_(valor, ultimo_id)
+
 # Instancia global
 db_service = DatabaseService()
 
 # Decorator para transacciones
 def transactional(func):
-    """Decorator para operaciones transaccionales"""
+    """Decorator para operaciones transaccionales: ejecuta la función en una unidad de
+    trabajo de db_service. Se hace rollback si lanza una excepción o si devuelve la
+    tupla de fallo de los servicios, (False, mensaje, ...)"""
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        try:
+        if db_service.in_transaction():
+            # Anidada: la transacción exterior decide el commit
             return func(*args, **kwargs)
-        except Exception as e:
-            # En una implementación real, aquí harías rollback
-            raise e
-    return wrapper
\ No newline at end of file
+        with db_service.transaction() as session:
+            resultado = func(*args, **kwargs)
+            if isinstance(resultado, tuple) and resultado and resultado[0] is False:
+                session.rollback()
+            return resultado
+    return wrapper
@@ -0,0 +1,138 @@
+"""
+Búsqueda de texto libre
+Índice FTS5 de SQLite sobre marca, modelo y descripción de los vehículos activos.
+
+El índice (tabla virtual vehiculo_fts) usa la tabla vehiculo como contenido externo y
+se mantiene sincronizado con triggers en inserción, actualización, baja lógica
+(activo = 0) y borrado. El tokenizador unicode61 con remove_diacritics ignora
+mayúsculas y acentos ("Híbrido" encuentra "hibrido").
+
+Reconstruir el índice:
+    python -m backend_rx.apps.servicio.busqueda_texto reconstruir
+"""
+import re
+import sys
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import DDL, event, text
+from sqlalchemy.engine import Connection
+from sqlmodel import select
+
+from ..modelos.vehiculo import Vehiculo, EstadoVehiculo
+
+TABLA_FTS = "vehiculo_fts"
+
+# Con una fila en esta tabla el trigger de inserción no indexa (ver indexacion_diferida)
+TABLA_PAUSA = "vehiculo_fts_pausa"
+
+# Peso de cada columna en bm25 (marca, modelo, descripcion)
+PESOS = (10.0, 5.0, 1.0)
+
+SENTENCIAS_FTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        marca, modelo, descripcion,
+        content='vehiculo', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    f"CREATE TABLE IF NOT EXISTS {TABLA_PAUSA} (id INTEGER PRIMARY KEY)",
+    # Solo se indexan los vehículos activos
+    f"""CREATE TRIGGER IF NOT EXISTS vehiculo_fts_ai AFTER INSERT ON vehiculo
+    WHEN new.activo AND NOT EXISTS (SELECT 1 FROM {TABLA_PAUSA}) BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, marca, modelo, descripcion)
+        VALUES (new.id, new.marca, new.modelo, new.descripcion);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS vehiculo_fts_ad AFTER DELETE ON vehiculo
+    WHEN old.activo BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, marca, modelo, descripcion)
+        VALUES ('delete', old.id, old.marca, old.modelo, old.descripcion);
+    END""",
+    # Solo afecta a las columnas indexadas: los cambios de vistas o precio no tocan el índice.
+    # Borrado e inserción van en el mismo trigger para garantizar el orden
+    f"""CREATE TRIGGER IF NOT EXISTS vehiculo_fts_au
+    AFTER UPDATE OF marca, modelo, descripcion, activo ON vehiculo BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, marca, modelo, descripcion)
+        SELECT 'delete', old.id, old.marca, old.modelo, old.descripcion WHERE old.activo;
+        INSERT INTO {TABLA_FTS}(rowid, marca, modelo, descripcion)
+        SELECT new.id, new.marca, new.modelo, new.descripcion WHERE new.activo;
+    END""",
+]
+
+# Crear el índice junto con la tabla vehiculo (create_all, reflex db init)
+for _sentencia in SENTENCIAS_FTS:
+    event.listen(Vehiculo.__table__, "after_create", DDL(_sentencia).execute_if(dialect="sqlite"))
+
+def crear_indice(conn: Connection) -> None:
+    """Crea la tabla FTS y los triggers si no existen"""
+    for sentencia in SENTENCIAS_FTS:
+        conn.exec_driver_sql(sentencia)
+
+def reconstruir_indice(conn: Connection) -> int:
+    """Vacía y vuelve a poblar el índice con los vehículos activos"""
+    crear_indice(conn)
+    conn.exec_driver_sql(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('delete-all')")
+    conn.exec_driver_sql(
+        f"INSERT INTO {TABLA_FTS}(rowid, marca, modelo, descripcion) "
+        "SELECT id, marca, modelo, descripcion FROM vehiculo WHERE activo"
+    )
+    conn.exec_driver_sql(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('optimize')")
+    return conn.exec_driver_sql(f"SELECT count(*) FROM {TABLA_FTS}").scalar() or 0
+
+@contextmanager
+def indexacion_diferida(session):
+    """Para inserciones masivas dentro de una transacción: pausa el trigger de inserción
+    y, al terminar el bloque, indexa los vehículos nuevos con una sola sentencia.
+    
+    La pausa es una fila en vehiculo_fts_pausa que se inserta y se borra en la misma
+    transacción, así que ninguna otra conexión llega a verla. Al insertarla se toma el
+    bloqueo de escritura, por lo que los ids nuevos son todos mayores que el máximo leído.
+    """
+    conn = session.connection()
+    if conn.dialect.name != "sqlite":
+        yield
+        return
+    conn.exec_driver_sql(f"INSERT INTO {TABLA_PAUSA} DEFAULT VALUES")
+    ultimo_id = conn.exec_driver_sql("SELECT coalesce(max(id), 0) FROM vehiculo").scalar()
+    yield
+    conn.exec_driver_sql(f"DELETE FROM {TABLA_PAUSA}")
+    conn.exec_driver_sql(
+        f"INSERT INTO {TABLA_FTS}(rowid, marca, modelo, descripcion) "
+        "SELECT id, marca, modelo, descripcion FROM vehiculo WHERE id > ? AND activo",
+        (ultimo_id,)
+    )
+
+def construir_consulta(texto: str) -> str:
+    """Convierte el texto del buscador en una consulta FTS5 segura.
+    
+    Cada palabra se entrecomilla (sin operadores de FTS5) y se busca por prefijo,
+    para que "toyo cor" encuentre "Toyota Corolla" mientras el usuario escribe.
+    """
+    palabras = re.findall(r"\w+", texto, flags=re.UNICODE)
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+SQL_BUSQUEDA = text(f"""
+    SELECT vehiculo.* FROM {TABLA_FTS}
+    JOIN vehiculo ON vehiculo.id = {TABLA_FTS}.rowid
+    WHERE {TABLA_FTS} MATCH :consulta
+      AND vehiculo.activo = 1
+      AND vehiculo.estado = :estado
+    ORDER BY bm25({TABLA_FTS}, {PESOS[0]}, {PESOS[1]}, {PESOS[2]}), vehiculo.id
+    LIMIT :limite OFFSET :offset
+""")
+
+def buscar(session, consulta: str, limite: int, offset: int) -> List[Vehiculo]:
+    """Vehículos disponibles que coinciden con la consulta FTS5, ordenados por relevancia"""
+    statement = SQL_BUSQUEDA.bindparams(
+        consulta=consulta, estado=EstadoVehiculo.DISPONIBLE.name, limite=limite, offset=offset
+    )
+    return list(session.execute(select(Vehiculo).from_statement(statement)).scalars().all())
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["reconstruir"]:
+        print("Uso: python -m backend_rx.apps.servicio.busqueda_texto reconstruir")
+        sys.exit(2)
+    from .motor import motor_escritura
+    with motor_escritura().begin() as conexion:
+        total = reconstruir_indice(conexion)
+    print(f"Índice de texto reconstruido: {total} vehículos activos")
@@ -0,0 +1,312 @@
+"""
+Servicio de checkout
+Reserva y compra de vehículos con concurrencia optimista.
+
+Muchos compradores pueden intentar reservar a la vez el mismo anuncio. En lugar de leer el
+vehículo, comprobar en Python que está disponible y guardarlo (entre la lectura y la
+escritura otro comprador puede haberlo reservado), cada cambio de estado es un UPDATE
+condicional, un compare-and-swap sobre la columna estado:
+
+    UPDATE vehiculo SET estado = 'RESERVADO' WHERE id = ? AND estado = 'DISPONIBLE' AND activo = 1
+
+Si cambia una fila, la reserva es de este comprador; si no, otro se adelantó y se responde
+sin reintentar. La transacción no lee nada antes de escribir y dura un par de sentencias,
+así que el escritor de SQLite (motor.py) queda libre enseguida para las escrituras de otros
+anuncios; con bloqueo por fila solo se bloquearía la del vehículo. Además, el índice único
+parcial de Transaccion impide dos reservas vivas del mismo vehículo.
+
+- Las reservas caducan a los minutos_reserva. Una reserva caducada se libera cuando otro
+  comprador intenta reservar el vehículo, y todas las caducadas con expirar_reservas:
+      python -m backend_rx.apps.servicio.checkout_service expirar
+- reservar recibe una clave de idempotencia del cliente: repetir la petición (reintento,
+  doble clic) devuelve la misma transacción en lugar de fallar o crear otra.
+
+Ajustes en rxconfig.py con el prefijo checkout_ o variables REFLEX_CHECKOUT_<AJUSTE>.
+"""
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlmodel import select, update, desc, or_
+from sqlalchemy.exc import IntegrityError
+
+from ..modelos.transaccion import Transaccion, EstadoTransaccion
+from ..modelos.vehiculo import Vehiculo, EstadoVehiculo
+from ..modelos.usuario import Usuario
+from .base_datos import db_service
+from .instrumentacion import instrumentar
+from .motor import leer_ajustes
+from . import estadisticas
+from .similitud import indice_similitud
+from .ranking import ranking_vistas
+from .facetas import indice_facetas
+
+VEHICULO_NO_ENCONTRADO = "Vehículo no encontrado"
+TRANSACCION_NO_ENCONTRADA = "Transacción no encontrada"
+
+@dataclass(frozen=True)
+class ConfiguracionCheckout:
+    """Ajustes de las reservas"""
+    minutos_reserva: int = 15
+
+@instrumentar()
+class CheckoutService:
+    """Servicio de reservas y compras"""
+    
+    def __init__(self):
+        self.db = db_service
+        self.similitud = indice_similitud
+        self.ranking = ranking_vistas
+        self.facetas = indice_facetas
+        self._config: Optional[ConfiguracionCheckout] = None
+    
+    @property
+    def config(self) -> ConfiguracionCheckout:
+        if self._config is None:
+            self._config = leer_ajustes(ConfiguracionCheckout, "checkout")
+        return self._config
+    
+    # ==================== RESERVA Y COMPRA ====================
+    
+    def reservar(self, vehiculo_id: int, comprador_id: int,
+                 clave_idempotencia: str) -> Tuple[bool, str, Optional[Transaccion]]:
+        """Reserva el vehículo para el comprador durante minutos_reserva"""
+        try:
+            if not clave_idempotencia or len(clave_idempotencia) > 64:
+                return False, "Clave de idempotencia no válida", None
+            existente = self._por_clave(comprador_id, clave_idempotencia)
+            if existente:
+                return self._repetida(existente, vehiculo_id)
+            
+            try:
+                with self.db.transaction() as session:
+                    vehiculo = self._cambiar_estado(session, vehiculo_id, EstadoVehiculo.DISPONIBLE,
+                                                    EstadoVehiculo.RESERVADO, comprador_id)
+                    if vehiculo is None:
+                        # La reserva anterior puede haber caducado: se libera y se intenta otra vez
+                        liberado = self._liberar_caducada(session, vehiculo_id)
+                        if liberado is not None:
+                            vehiculo = self._cambiar_estado(session, vehiculo_id, EstadoVehiculo.DISPONIBLE,
+                                                            EstadoVehiculo.RESERVADO, comprador_id)
+                        if vehiculo is None:
+                            motivo = self._motivo(session, vehiculo_id, comprador_id)
+                    if vehiculo is not None:
+                        transaccion = Transaccion(
+                            vehiculo_id=vehiculo_id,
+                            comprador_id=comprador_id,
+                            vendedor_id=vehiculo.vendedor_id,
+                            clave_idempotencia=clave_idempotencia,
+                            precio=vehiculo.precio,
+                            expira=datetime.now() + timedelta(minutes=self.config.minutos_reserva),
+                        )
+                        session.add(transaccion)
+                        session.flush()
+            except IntegrityError:
+                # Otra petición con la misma clave se adelantó: se devuelve la suya
+                existente = self._por_clave(comprador_id, clave_idempotencia)
+                if existente:
+                    return self._repetida(existente, vehiculo_id)
+                raise
+            
+            if vehiculo is None:
+                if liberado is not None:
+                    self._sincronizar(liberado)
+                return False, motivo, None
+            self._sincronizar(vehiculo)
+            return True, "Vehículo reservado", transaccion
+        
+        except Exception as e:
+            return False, f"Error al reservar: {str(e)}", None
+    
+    def confirmar_compra(self, transaccion_id: int,
+                         comprador_id: int) -> Tuple[bool, str, Optional[Transaccion]]:
+        """Completa la compra de una reserva en vigor y marca el vehículo como vendido"""
+        try:
+            with self.db.transaction() as session:
+                ahora = datetime.now()
+                resultado = session.execute(
+                    update(Transaccion)
+                    .where(Transaccion.id == transaccion_id, Transaccion.comprador_id == comprador_id,
+                           Transaccion.estado == EstadoTransaccion.RESERVADA, Transaccion.expira > ahora)
+                    .values(estado=EstadoTransaccion.COMPLETADA, fecha_actualizacion=ahora)
+                    .execution_options(synchronize_session=False)
+                )
+                transaccion = session.get(Transaccion, transaccion_id, populate_existing=True)
+                if resultado.rowcount != 1:
+                    if not transaccion or transaccion.comprador_id != comprador_id:
+                        return False, TRANSACCION_NO_ENCONTRADA, None
+                    if transaccion.estado == EstadoTransaccion.COMPLETADA:
+                        # Confirmación repetida
+                        return True, "La compra ya estaba confirmada", transaccion
+                    if not transaccion.caducada:
+                        return False, f"La reserva está {transaccion.estado.value}", transaccion
+                    liberado = self._liberar_caducada(session, transaccion.vehiculo_id)
+                    # El UPDATE de _liberar_caducada no actualiza el objeto ya leído
+                    session.refresh(transaccion)
+                    vehiculo = None
+                else:
+                    vehiculo = self._cambiar_estado(session, transaccion.vehiculo_id,
+                                                    EstadoVehiculo.RESERVADO, EstadoVehiculo.VENDIDO)
+                    if vehiculo is None:
+                        # No debería ocurrir: la reserva en vigor mantiene el vehículo reservado
+                        raise RuntimeError("El vehículo de la reserva no está reservado")
+                    session.execute(
+                        update(Usuario).where(Usuario.id == transaccion.vendedor_id)
+                        .values(vehiculos_vendidos=Usuario.vehiculos_vendidos + 1, fecha_actualizacion=ahora)
+                        .execution_options(synchronize_session=False)
+                    )
+            
+            if vehiculo is None:
+                # Caducada: se expira en la misma transacción y el vehículo vuelve a estar disponible
+                if liberado is not None:
+                    self._sincronizar(liberado)
+                return False, "La reserva ha caducado", transaccion
+            self._sincronizar(vehiculo)
+            return True, "Compra confirmada", transaccion
+        
+        except Exception as e:
+            return False, f"Error al confirmar la compra: {str(e)}", None
+    
+    def cancelar_reserva(self, transaccion_id: int, usuario_id: int) -> Tuple[bool, str]:
+        """Cancela una reserva en vigor (el comprador o el vendedor) y libera el vehículo"""
+        try:
+            with self.db.transaction() as session:
+                ahora = datetime.now()
+                resultado = session.execute(
+                    update(Transaccion)
+                    .where(Transaccion.id == transaccion_id, Transaccion.estado == EstadoTransaccion.RESERVADA,
+                           or_(Transaccion.comprador_id == usuario_id, Transaccion.vendedor_id == usuario_id))
+                    .values(estado=EstadoTransaccion.CANCELADA, fecha_actualizacion=ahora)
+                    .execution_options(synchronize_session=False)
+                )
+                if resultado.rowcount != 1:
+                    transaccion = session.get(Transaccion, transaccion_id)
+                    if not transaccion or usuario_id not in (transaccion.comprador_id, transaccion.vendedor_id):
+                        return False, TRANSACCION_NO_ENCONTRADA
+                    return False, f"La reserva está {transaccion.estado.value}"
+                
+                vehiculo_id = session.exec(select(Transaccion.vehiculo_id)
+                                           .where(Transaccion.id == transaccion_id)).one()
+                vehiculo = self._cambiar_estado(session, vehiculo_id,
+                                                EstadoVehiculo.RESERVADO, EstadoVehiculo.DISPONIBLE)
+            
+            if vehiculo is not None:
+                self._sincronizar(vehiculo)
+            return True, "Reserva cancelada"
+        
+        except Exception as e:
+            return False, f"Error al cancelar la reserva: {str(e)}"
+    
+    def expirar_reservas(self, limite: int = 1000) -> int:
+        """Libera los vehículos de las reservas caducadas. Devuelve cuántas se han expirado"""
+        with self.db.get_session(solo_lectura=True) as session:
+            vehiculos = session.exec(
+                select(Transaccion.vehiculo_id)
+                .where(Transaccion.estado == EstadoTransaccion.RESERVADA, Transaccion.expira <= datetime.now())
+                .limit(limite)
+            ).all()
+        liberados = []
+        with self.db.transaction() as session:
+            for vehiculo_id in vehiculos:
+                vehiculo = self._liberar_caducada(session, vehiculo_id)
+                if vehiculo is not None:
+                    liberados.append(vehiculo)
+        for vehiculo in liberados:
+            self._sincronizar(vehiculo)
+        return len(liberados)
+    
+    # ==================== CONSULTA ====================
+    
+    def obtener_transaccion(self, transaccion_id: int, usuario_id: int) -> Optional[Transaccion]:
+        """Transacción visible para el comprador o el vendedor"""
+        transaccion = self.db.get_by_id(Transaccion, transaccion_id)
+        if transaccion and usuario_id in (transaccion.comprador_id, transaccion.vendedor_id):
+            return transaccion
+        return None
+    
+    def obtener_compras(self, comprador_id: int, limite: int = 50) -> List[Transaccion]:
+        """Transacciones del comprador, de la más reciente a la más antigua"""
+        with self.db.get_session(solo_lectura=True) as session:
+            return list(session.exec(
+                select(Transaccion).where(Transaccion.comprador_id == comprador_id)
+                .order_by(desc(Transaccion.fecha_creacion)).limit(limite)
+            ).all())
+    
+    # ==================== AUXILIARES ====================
+    
+    def _cambiar_estado(self, session, vehiculo_id: int, desde: EstadoVehiculo, hacia: EstadoVehiculo,
+                        comprador_id: Optional[int] = None) -> Optional[Vehiculo]:
+        """Compare-and-swap del estado del vehículo. Devuelve el vehículo si lo ha cambiado
+        esta llamada, o None si no estaba en el estado 'desde'"""
+        sentencia = (
+            update(Vehiculo)
+            .where(Vehiculo.id == vehiculo_id, Vehiculo.estado == desde, Vehiculo.activo == True)
+            .values(estado=hacia, fecha_actualizacion=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if comprador_id is not None:
+            # Nadie reserva su propio anuncio
+            sentencia = sentencia.where(Vehiculo.vendedor_id != comprador_id)
+        if session.execute(sentencia).rowcount != 1:
+            return None
+        vehiculo = session.get(Vehiculo, vehiculo_id, populate_existing=True)
+        anterior = estadisticas.huella(vehiculo)
+        anterior = (anterior[0], desde) + anterior[2:]
+        estadisticas.registrar_cambio(anterior, estadisticas.huella(vehiculo))
+        return vehiculo
+    
+    def _liberar_caducada(self, session, vehiculo_id: int) -> Optional[Vehiculo]:
+        """Expira la reserva caducada del vehículo, si la hay, y lo deja disponible"""
+        ahora = datetime.now()
+        resultado = session.execute(
+            update(Transaccion)
+            .where(Transaccion.vehiculo_id == vehiculo_id, Transaccion.estado == EstadoTransaccion.RESERVADA,
+                   Transaccion.expira <= ahora)
+            .values(estado=EstadoTransaccion.EXPIRADA, fecha_actualizacion=ahora)
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount != 1:
+            return None
+        return self._cambiar_estado(session, vehiculo_id, EstadoVehiculo.RESERVADO, EstadoVehiculo.DISPONIBLE)
+    
+    def _motivo(self, session, vehiculo_id: int, comprador_id: int) -> str:
+        """Por qué no se ha podido reservar (después de fallar el compare-and-swap)"""
+        fila = session.exec(select(Vehiculo.estado, Vehiculo.activo, Vehiculo.vendedor_id)
+                            .where(Vehiculo.id == vehiculo_id)).first()
+        if fila is None or not fila.activo:
+            return VEHICULO_NO_ENCONTRADO
+        if fila.vendedor_id == comprador_id:
+            return "No puedes reservar tu propio vehículo"
+        if fila.estado == EstadoVehiculo.VENDIDO:
+            return "El vehículo ya está vendido"
+        return "El vehículo ya está reservado"
+    
+    def _por_clave(self, comprador_id: int, clave_idempotencia: str) -> Optional[Transaccion]:
+        with self.db.get_session(solo_lectura=True) as session:
+            return session.exec(select(Transaccion).where(
+                Transaccion.comprador_id == comprador_id,
+                Transaccion.clave_idempotencia == clave_idempotencia,
+            )).first()
+    
+    def _repetida(self, transaccion: Transaccion, vehiculo_id: int) -> Tuple[bool, str, Optional[Transaccion]]:
+        if transaccion.vehiculo_id != vehiculo_id:
+            return False, "La clave de idempotencia ya se usó para otro vehículo", None
+        return True, "Reserva ya registrada", transaccion
+    
+    def _sincronizar(self, vehiculo: Vehiculo) -> None:
+        """Refleja el cambio de estado en los índices en memoria"""
+        self.similitud.sincronizar(vehiculo)
+        self.ranking.sincronizar(vehiculo)
+        self.facetas.sincronizar(vehiculo)
+
+# Instancia global del servicio
+checkout_service = CheckoutService()
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "expirar":
+        print(f"{checkout_service.expirar_reservas()} reservas caducadas liberadas")
+    else:
+        print("Uso: python -m backend_rx.apps.servicio.checkout_service expirar")
+        sys.exit(2)
@@ -0,0 +1,135 @@
+"""
+Contador de vistas con escritura diferida
+Acumula en memoria las vistas de la página de detalle y las vuelca periódicamente a la
+base de datos en lote, con UPDATE vehiculo SET vistas = vistas + n.
+
+El incremento en SQL es atómico, así que dos vistas simultáneas no se pisan. Además,
+cada vista ya no necesita su propia escritura (ni el bloqueo de escritura de SQLite).
+El número de vehículos pendientes está acotado: al llegar a max_pendientes el volcado
+se hace en el momento. Si falla (p. ej. "database is locked") la vista no falla: lo
+reintenta el hilo de volcado, y mientras la base de datos no responda se descartan las
+vistas más antiguas por encima de max_retenidos. Al cerrar el proceso se vuelca lo
+pendiente (atexit).
+"""
+import atexit
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import update, bindparam
+
+from ..modelos.vehiculo import Vehiculo
+from .base_datos import db_service
+
+logger = logging.getLogger(__name__)
+
+class BufferVistas:
+    """Buffer en proceso de incrementos de vistas por vehículo"""
+    
+    def __init__(self, intervalo_segundos: float = 5.0, max_pendientes: int = 10000,
+                 max_retenidos: Optional[int] = None):
+        self.intervalo_segundos = intervalo_segundos
+        self.max_pendientes = max_pendientes
+        # Límite duro del buffer cuando los volcados fallan
+        self.max_retenidos = max_retenidos or 5 * max_pendientes
+        self._pendientes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._lock_volcado = threading.Lock()
+        # Tras un volcado fallido solo reintenta el hilo, no cada vista
+        self._fallando = False
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+    
+    def registrar(self, vehiculo_id: int, n: int = 1) -> None:
+        """Suma n vistas pendientes al vehículo"""
+        with self._lock:
+            self._pendientes[vehiculo_id] = self._pendientes.get(vehiculo_id, 0) + n
+            lleno = len(self._pendientes) >= self.max_pendientes
+            self._recortar()
+        self._iniciar()
+        if lleno and not self._fallando and not self._lock_volcado.locked():
+            try:
+                self.volcar()
+            except Exception as e:
+                # Se queda en el buffer y lo reintenta el hilo de volcado
+                logger.warning("No se pudieron volcar las vistas pendientes: %s", e)
+    
+    def pendientes(self, vehiculo_id: int) -> int:
+        """Vistas registradas y todavía no volcadas de un vehículo"""
+        with self._lock:
+            return self._pendientes.get(vehiculo_id, 0)
+    
+    def todos_pendientes(self) -> Dict[int, int]:
+        """Copia de todas las vistas pendientes por vehículo"""
+        with self._lock:
+            return dict(self._pendientes)
+    
+    def volcar(self) -> int:
+        """Escribe los incrementos pendientes en una sola transacción. Devuelve las filas actualizadas"""
+        with self._lock_volcado:
+            with self._lock:
+                lote, self._pendientes = self._pendientes, {}
+            if not lote:
+                self._fallando = False
+                return 0
+            
+            sentencia = (
+                update(Vehiculo.__table__)
+                .where(Vehiculo.__table__.c.id == bindparam("b_id"))
+                .values(vistas=Vehiculo.__table__.c.vistas + bindparam("b_n"))
+            )
+            parametros = [{"b_id": vid, "b_n": n} for vid, n in sorted(lote.items())]
+            try:
+                with db_service.transaction() as session:
+                    session.connection().execute(sentencia, parametros)
+            except Exception:
+                # Devolver los incrementos al buffer para el siguiente intento, delante de
+                # los registrados mientras tanto (son más antiguos)
+                with self._lock:
+                    for vid, n in self._pendientes.items():
+                        lote[vid] = lote.get(vid, 0) + n
+                    self._pendientes = lote
+                    self._recortar()
+                self._fallando = True
+                raise
+            self._fallando = False
+            return len(lote)
+    
+    def _recortar(self) -> None:
+        """Descarta los vehículos más antiguos por encima de max_retenidos (con _lock)"""
+        sobrantes = len(self._pendientes) - self.max_retenidos
+        if sobrantes <= 0:
+            return
+        for vid in list(self._pendientes)[:sobrantes]:
+            del self._pendientes[vid]
+        logger.warning("Buffer de vistas lleno: se descartan las vistas de %s vehículos", sobrantes)
+    
+    def detener(self) -> None:
+        """Para el volcado periódico y vuelca lo pendiente"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=self.intervalo_segundos)
+            self._hilo = None
+        self.volcar()
+    
+    def _iniciar(self) -> None:
+        """Arranca el hilo de volcado periódico en el primer uso"""
+        if self._hilo is not None or self._detener.is_set():
+            return
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="volcado-vistas", daemon=True)
+            self._hilo.start()
+    
+    def _bucle(self) -> None:
+        while not self._detener.wait(self.intervalo_segundos):
+            try:
+                self.volcar()
+            except Exception:
+                # Se reintenta en el siguiente intervalo con los incrementos devueltos al buffer
+                logger.exception("Error al volcar las vistas pendientes")
+
+# Instancia global
+buffer_vistas = BufferVistas()
+atexit.register(buffer_vistas.detener)
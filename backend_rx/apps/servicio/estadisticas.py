@@ -0,0 +1,164 @@
+"""
+Estadísticas de vehículos
+Mantiene la tabla estadistica_vehiculo con contadores incrementales del catálogo.
+
+Cada operación del servicio de vehículos que cambia estado, marca, motor, precio o
+activo aplica la diferencia entre la huella anterior y la nueva del vehículo con un
+UPSERT atómico (cantidad = cantidad + delta). La lectura es una única consulta sobre
+una tabla de pocas filas, independiente del tamaño del catálogo.
+
+Reconstrucción completa (un solo GROUP BY) y control de desviaciones:
+    python -m backend_rx.apps.servicio.estadisticas reconstruir
+    python -m backend_rx.apps.servicio.estadisticas reconciliar [--reparar]
+"""
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import select, func, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from ..modelos.vehiculo import Vehiculo, EstadoVehiculo, TipoMotor
+from ..modelos.estadistica import EstadisticaVehiculo
+from .base_datos import db_service
+
+# (dimension, clave) -> (cantidad, suma_precio)
+Contadores = Dict[Tuple[str, str], Tuple[int, float]]
+
+# Huella de un vehículo: lo único que influye en las estadísticas
+Huella = Tuple[bool, EstadoVehiculo, str, TipoMotor, float]
+
+def huella(vehiculo: Optional[Vehiculo]) -> Optional[Huella]:
+    """Extrae los campos que afectan a las estadísticas (None si el vehículo no existe)"""
+    if vehiculo is None:
+        return None
+    return (vehiculo.activo, vehiculo.estado, vehiculo.marca, vehiculo.tipo_motor, vehiculo.precio)
+
+def _contribucion(h: Optional[Huella]) -> Contadores:
+    """Contadores que aporta un vehículo con la huella dada"""
+    if h is None:
+        return {}
+    activo, estado, marca, tipo_motor, precio = h
+    contadores = {("total", "*"): (1, 0.0)}
+    if activo:
+        contadores[("estado", estado.value)] = (1, 0.0)
+        contadores[("marca", marca)] = (1, 0.0)
+        contadores[("tipo_motor", tipo_motor.value)] = (1, float(precio or 0))
+    return contadores
+
+def _aplicar(session, deltas: Contadores) -> None:
+    """UPSERT atómico de cada delta: no hay lectura previa, así que no se pierden incrementos"""
+    if not deltas:
+        return
+    filas = [
+        {"dimension": dimension, "clave": clave, "cantidad": cantidad, "suma_precio": suma}
+        for (dimension, clave), (cantidad, suma) in deltas.items()
+    ]
+    sentencia = insert(EstadisticaVehiculo).values(filas)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=["dimension", "clave"],
+        set_={
+            "cantidad": EstadisticaVehiculo.cantidad + sentencia.excluded.cantidad,
+            "suma_precio": EstadisticaVehiculo.suma_precio + sentencia.excluded.suma_precio,
+        },
+    )
+    session.execute(sentencia)
+
+def registrar_cambio(antes: Optional[Huella], despues: Optional[Huella]) -> None:
+    """Aplica a las estadísticas el paso de un vehículo de la huella 'antes' a 'despues'"""
+    registrar_cambios([(antes, despues)])
+
+def registrar_cambios(cambios: Iterable[Tuple[Optional[Huella], Optional[Huella]]]) -> None:
+    """Aplica varios cambios sumando sus diferencias en un único UPSERT"""
+    deltas: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+    for antes, despues in cambios:
+        for signo, h in ((-1, antes), (1, despues)):
+            for clave, (cantidad, suma) in _contribucion(h).items():
+                deltas[clave][0] += signo * cantidad
+                deltas[clave][1] += signo * suma
+    deltas = {clave: (int(c), s) for clave, (c, s) in deltas.items() if c or s}
+    if not deltas:
+        return
+    # Dentro de una unidad de trabajo se aplica en la misma transacción que el cambio
+    with db_service.transaction() as session:
+        _aplicar(session, deltas)
+
+# ==================== RECONSTRUCCIÓN Y LECTURA ====================
+
+def calcular_desde_vehiculos(session) -> Contadores:
+    """Calcula todos los contadores en una pasada (un único GROUP BY)"""
+    filas = session.exec(
+        select(
+            Vehiculo.activo, Vehiculo.estado, Vehiculo.marca, Vehiculo.tipo_motor,
+            func.count(), func.coalesce(func.sum(Vehiculo.precio), 0.0)
+        ).group_by(Vehiculo.activo, Vehiculo.estado, Vehiculo.marca, Vehiculo.tipo_motor)
+    ).all()
+    
+    acumulado: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+    acumulado[("total", "*")]  # el total existe aunque no haya vehículos
+    for activo, estado, marca, tipo_motor, cantidad, suma in filas:
+        acumulado[("total", "*")][0] += cantidad
+        if activo:
+            acumulado[("estado", estado.value)][0] += cantidad
+            acumulado[("marca", marca)][0] += cantidad
+            acumulado[("tipo_motor", tipo_motor.value)][0] += cantidad
+            acumulado[("tipo_motor", tipo_motor.value)][1] += float(suma)
+    return {clave: (int(c), float(s)) for clave, (c, s) in acumulado.items()}
+
+def reconstruir() -> Contadores:
+    """Sustituye el contenido de la tabla por un recálculo completo, en una transacción"""
+    with db_service.transaction() as session:
+        contadores = calcular_desde_vehiculos(session)
+        session.execute(delete(EstadisticaVehiculo))
+        _aplicar(session, contadores)
+    return contadores
+
+def leer() -> Contadores:
+    """Lee todos los contadores. Si la tabla nunca se ha construido, la reconstruye"""
+    with db_service.get_session(solo_lectura=True) as session:
+        filas = session.exec(select(EstadisticaVehiculo)).all()
+        contadores = {(f.dimension, f.clave): (f.cantidad, f.suma_precio) for f in filas}
+    if ("total", "*") not in contadores:
+        return reconstruir()
+    return contadores
+
+def reconciliar(reparar: bool = False, tolerancia_precio: float = 0.01) -> List[Dict[str, Any]]:
+    """Compara la tabla con un recálculo desde vehiculo y devuelve las desviaciones.
+    Con reparar=True corrige la tabla aplicando las diferencias."""
+    with db_service.transaction() as session:
+        reales = calcular_desde_vehiculos(session)
+        filas = session.exec(select(EstadisticaVehiculo)).all()
+        guardados = {(f.dimension, f.clave): (f.cantidad, f.suma_precio) for f in filas}
+        
+        desviaciones = []
+        correcciones: Contadores = {}
+        for clave in set(reales) | set(guardados):
+            cantidad_real, suma_real = reales.get(clave, (0, 0.0))
+            cantidad_guardada, suma_guardada = guardados.get(clave, (0, 0.0))
+            if cantidad_real != cantidad_guardada or abs(suma_real - suma_guardada) > tolerancia_precio:
+                desviaciones.append({
+                    "dimension": clave[0], "clave": clave[1],
+                    "cantidad": cantidad_guardada, "cantidad_real": cantidad_real,
+                    "suma_precio": suma_guardada, "suma_precio_real": suma_real,
+                })
+                correcciones[clave] = (cantidad_real - cantidad_guardada, suma_real - suma_guardada)
+        
+        if reparar and correcciones:
+            _aplicar(session, correcciones)
+    return desviaciones
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "reconstruir":
+        print(f"Estadísticas reconstruidas: {len(reconstruir())} contadores")
+    elif comando == "reconciliar":
+        reparar = "--reparar" in sys.argv[2:]
+        desviaciones = reconciliar(reparar=reparar)
+        for d in desviaciones:
+            print(f"  {d['dimension']}={d['clave']}: {d['cantidad']} (real {d['cantidad_real']}), "
+                  f"suma_precio {d['suma_precio']:.2f} (real {d['suma_precio_real']:.2f})")
+        print(f"{len(desviaciones)} desviaciones" + (" corregidas" if reparar and desviaciones else ""))
+        sys.exit(1 if desviaciones and not reparar else 0)
+    else:
+        print("Uso: python -m backend_rx.apps.servicio.estadisticas reconstruir | reconciliar [--reparar]")
+        sys.exit(2)
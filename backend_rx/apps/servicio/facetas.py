@@ -0,0 +1,416 @@
+"""
+Facetas de búsqueda
+Recuentos por marca, provincia, tipo de motor, tipo de vehículo, rango de años y rango de
+precios para los filtros de una búsqueda, calculados en memoria.
+
+Los vehículos activos y disponibles se guardan en arrays indexados por id (un código por
+marca, provincia, motor y tipo, el año, el precio, el kilometraje y las coordenadas). Cada
+filtro, también los de distancia ('radio' y 'caja'), es una máscara y cada faceta un bincount. Las facetas son disyuntivas: cada una se cuenta con
+todos los filtros menos los de su propio campo, para que la barra lateral muestre cuántos
+resultados daría elegir otro valor de esa faceta.
+
+Los filtros que el índice no sabe evaluar (otros campos, like, isnull) se resuelven con
+una consulta de ids y se aplican como una máscara más. Los recuentos se cachean por
+filtros y la caché se vacía con cada alta, cambio, venta o baja, así que la barra lateral
+no cuesta nada en la mayoría de peticiones.
+
+Los cambios hechos en este proceso llegan con sincronizar; los de otros procesos (otros
+workers, la importación, la expiración de reservas) se detectan comparando el id máximo
+y la fecha_actualizacion máxima de vehiculo como mucho una vez por segundo, y entonces se
+releen solo los vehículos nuevos o cambiados. Cada RECONSTRUIR_CADA_S se reconstruye
+entero por si algún cambio no ha tocado ninguna de las dos columnas.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import select, func, or_
+
+from ..modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, EstadoVehiculo
+from .base_datos import db_service, compilar_filtros, _condiciones, _parametros_geo
+
+# Rangos de precio de la barra de filtros: [min, max), el último incluye su máximo
+RANGOS_PRECIOS = [
+    {"label": "< 5.000€", "min": 0, "max": 5000},
+    {"label": "5.000€ - 10.000€", "min": 5000, "max": 10000},
+    {"label": "10.000€ - 20.000€", "min": 10000, "max": 20000},
+    {"label": "20.000€ - 35.000€", "min": 20000, "max": 35000},
+    {"label": "35.000€ - 50.000€", "min": 35000, "max": 50000},
+    {"label": "> 50.000€", "min": 50000, "max": 999999}
+]
+
+# Rangos de antigüedad en años (hasta, inclusive) para la faceta de año
+ANTIGUEDADES = (2, 5, 10, 15)
+
+# Filas leídas de la base de datos en cada parte al construir el índice
+FILAS_POR_PARTE = 20000
+
+# Recuentos guardados en la caché (combinaciones de filtros distintas)
+TAMANO_CACHE = 512
+
+# Cada cuánto se comprueba si otros procesos han cambiado vehículos y cada cuánto se
+# reconstruye el índice entero (segundos)
+COMPROBAR_CADA_S = 1.0
+RECONSTRUIR_CADA_S = 600
+# Margen al releer por fecha_actualizacion: una transacción puede confirmarse después de
+# otra con una fecha posterior
+MARGEN_S = 30
+
+_MOTORES = list(TipoMotor)
+_TIPOS = list(TipoVehiculo)
+_CODIGO_MOTOR = {m: i for i, m in enumerate(_MOTORES)}
+_CODIGO_TIPO = {t: i for i, t in enumerate(_TIPOS)}
+_CATEGORICOS = {"marca": "marcas", "ubicacion_provincia": "provincias",
+                "tipo_motor": "tipos_motor", "tipo_vehiculo": "tipos_vehiculo"}
+_NUMERICOS = ("año", "precio", "kilometraje")
+_OPERADORES = ("eq", "ne", "lt", "lte", "gt", "gte", "between", "in")
+# Filtros implícitos en el índice (solo contiene vehículos activos y disponibles)
+_BASE = {"activo": True, "estado": EstadoVehiculo.DISPONIBLE}
+
+def rangos_años(año_actual: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Rangos de año de la faceta, de más reciente a más antiguo (min y max inclusive)"""
+    año_actual = año_actual or datetime.now().year
+    rangos, desde = [], año_actual
+    for hasta in ANTIGUEDADES:
+        rangos.append({"label": f"{año_actual - hasta} - {desde}", "min": año_actual - hasta, "max": desde})
+        desde = año_actual - hasta - 1
+    rangos.append({"label": f"Hasta {desde}", "min": 0, "max": desde})
+    return rangos
+
+def _enum(tipo, valor) -> Optional[Enum]:
+    """Miembro del enum a partir del miembro o de su nombre, igual que los filtros SQL
+    (los enums se guardan por nombre: un valor como 'diesel' no coincide con nada)"""
+    if isinstance(valor, tipo):
+        return valor
+    return tipo.__members__.get(valor) if isinstance(valor, str) else None
+
+def _clave_cache(valor: Any) -> Any:
+    """Forma hashable y estable de los filtros"""
+    if isinstance(valor, dict):
+        return tuple(sorted((str(k), _clave_cache(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple, set)):
+        return tuple(_clave_cache(v) for v in valor)
+    if isinstance(valor, Enum):
+        return valor.name
+    return valor
+
+class IndiceFacetas:
+    """Recuentos de facetas de los vehículos activos y disponibles"""
+    
+    def __init__(self, tamano_cache: int = TAMANO_CACHE):
+        self.tamano_cache = tamano_cache
+        self._lock = threading.RLock()
+        self._construido = False
+        self._construido_en = self._comprobado_en = 0.0
+        # (id máximo, fecha_actualizacion máxima) de vehiculo en la última lectura
+        self._version: Tuple[Optional[int], Optional[datetime]] = (None, None)
+        self._cache: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._marcas: Dict[str, int] = {}
+        self._provincias: Dict[str, int] = {}
+        # Arrays indexados por id; marca -1 = el vehículo no está en el índice
+        self._columnas = self._vacias(0)
+    
+    # ==================== CONSTRUCCIÓN Y ACTUALIZACIÓN ====================
+    
+    @staticmethod
+    def _vacias(capacidad: int) -> Dict[str, np.ndarray]:
+        return {
+            "marca": np.full(capacidad, -1, dtype=np.int32),
+            "ubicacion_provincia": np.zeros(capacidad, dtype=np.int32),
+            "tipo_motor": np.zeros(capacidad, dtype=np.int8),
+            "tipo_vehiculo": np.zeros(capacidad, dtype=np.int8),
+            "año": np.zeros(capacidad, dtype=np.int16),
+            "precio": np.zeros(capacidad, dtype=np.float64),
+            "kilometraje": np.zeros(capacidad, dtype=np.int64),
+            # Coordenadas (NaN si no se pudieron resolver) y celda de la rejilla
+            "latitud": np.full(capacidad, np.nan),
+            "longitud": np.full(capacidad, np.nan),
+            "celda_geo": np.full(capacidad, -1, dtype=np.int64),
+        }
+    
+    def _codigo(self, codigos: Dict[str, int], valor: Optional[str]) -> int:
+        if valor not in codigos:
+            codigos[valor] = len(codigos)
+        return codigos[valor]
+    
+    def _reservar(self, max_id: int) -> None:
+        actual = len(self._columnas["marca"])
+        if max_id < actual:
+            return
+        nuevas = self._vacias(max(max_id + 1, 2 * actual))
+        for campo, columna in self._columnas.items():
+            nuevas[campo][:actual] = columna
+        self._columnas = nuevas
+    
+    @staticmethod
+    def _leer_version(session) -> Tuple[Optional[int], Optional[datetime]]:
+        """Id y fecha_actualizacion máximos, cada uno en su subconsulta para que SQLite los
+        lea del final de un índice sin recorrer la tabla"""
+        return tuple(session.exec(select(
+            select(func.max(Vehiculo.id)).scalar_subquery(),
+            select(func.max(Vehiculo.fecha_actualizacion)).scalar_subquery(),
+        )).one())
+    
+    def _construir(self) -> None:
+        """Carga los vehículos activos y disponibles por partes, solo las columnas necesarias"""
+        partes = []
+        with db_service.get_session(solo_lectura=True) as session:
+            # Antes de leer: lo que se confirme durante la carga se relee en la siguiente comprobación
+            self._version = self._leer_version(session)
+            resultado = session.connection().execution_options(yield_per=FILAS_POR_PARTE).execute(
+                select(
+                    Vehiculo.id, Vehiculo.marca, Vehiculo.ubicacion_provincia, Vehiculo.tipo_motor,
+                    Vehiculo.tipo_vehiculo, Vehiculo.año, Vehiculo.precio, Vehiculo.kilometraje,
+                    Vehiculo.latitud, Vehiculo.longitud, Vehiculo.celda_geo,
+                ).where(Vehiculo.activo == True, Vehiculo.estado == EstadoVehiculo.DISPONIBLE)
+            )
+            for filas in resultado.partitions():
+                (ids, marcas, provincias, motores, tipos, años, precios, kilometrajes,
+                 latitudes, longitudes, celdas) = zip(*filas)
+                partes.append((
+                    np.array(ids, dtype=np.int64),
+                    np.array([self._codigo(self._marcas, m) for m in marcas], dtype=np.int32),
+                    np.array([self._codigo(self._provincias, p) for p in provincias], dtype=np.int32),
+                    np.array([_CODIGO_MOTOR[m] for m in motores], dtype=np.int8),
+                    np.array([_CODIGO_TIPO[t] for t in tipos], dtype=np.int8),
+                    np.array(años, dtype=np.int16),
+                    np.array(precios, dtype=np.float64),
+                    np.array([k or 0 for k in kilometrajes], dtype=np.int64),
+                    np.array(latitudes, dtype=np.float64),
+                    np.array(longitudes, dtype=np.float64),
+                    np.array([-1 if c is None else c for c in celdas], dtype=np.int64),
+                ))
+        self._columnas = self._vacias(0)
+        if partes:
+            ids, *valores = (np.concatenate(columna) for columna in zip(*partes))
+            self._reservar(int(ids.max()))
+            for columna, valor in zip(self._columnas.values(), valores):
+                columna[ids] = valor
+        self._cache.clear()
+        self._construido = True
+        self._construido_en = self._comprobado_en = time.monotonic()
+    
+    def _asegurar(self) -> None:
+        if not self._construido or time.monotonic() - self._construido_en >= RECONSTRUIR_CADA_S:
+            self._construir()
+        elif time.monotonic() - self._comprobado_en >= COMPROBAR_CADA_S:
+            self._refrescar()
+    
+    def _refrescar(self) -> None:
+        """Aplica los vehículos que otros procesos han creado o cambiado desde la última
+        lectura. Si son muchos (p. ej. una importación) reconstruye el índice"""
+        self._comprobado_en = time.monotonic()
+        with db_service.get_session(solo_lectura=True) as session:
+            version = self._leer_version(session)
+            if version == self._version:
+                return
+            ultimo_id, ultima_fecha = self._version
+            cambio = (Vehiculo.fecha_actualizacion.is_not(None) if ultima_fecha is None
+                      else Vehiculo.fecha_actualizacion >= ultima_fecha - timedelta(seconds=MARGEN_S))
+            condicion = or_(Vehiculo.id > (ultimo_id or 0), cambio)
+            cambiados = session.exec(select(Vehiculo).where(condicion).limit(FILAS_POR_PARTE + 1)).all()
+        if len(cambiados) > FILAS_POR_PARTE:
+            self._construir()
+            return
+        self._version = version
+        for vehiculo in cambiados:
+            self._aplicar(vehiculo)
+        self._cache.clear()
+    
+    def sincronizar(self, vehiculo: Vehiculo) -> None:
+        """Refleja un alta, un cambio, una venta o una baja y vacía la caché de recuentos"""
+        with self._lock:
+            if self._construido and self._aplicar(vehiculo):
+                self._cache.clear()
+    
+    def _aplicar(self, vehiculo: Vehiculo) -> bool:
+        """Pone el vehículo en el índice o lo quita. False si no había nada que cambiar"""
+        if vehiculo.activo and vehiculo.estado == EstadoVehiculo.DISPONIBLE:
+            self._reservar(vehiculo.id)
+            c = self._columnas
+            c["marca"][vehiculo.id] = self._codigo(self._marcas, vehiculo.marca)
+            c["ubicacion_provincia"][vehiculo.id] = self._codigo(self._provincias, vehiculo.ubicacion_provincia)
+            c["tipo_motor"][vehiculo.id] = _CODIGO_MOTOR[vehiculo.tipo_motor]
+            c["tipo_vehiculo"][vehiculo.id] = _CODIGO_TIPO[vehiculo.tipo_vehiculo]
+            c["año"][vehiculo.id] = vehiculo.año
+            c["precio"][vehiculo.id] = vehiculo.precio
+            c["kilometraje"][vehiculo.id] = vehiculo.kilometraje or 0
+            c["latitud"][vehiculo.id] = np.nan if vehiculo.latitud is None else vehiculo.latitud
+            c["longitud"][vehiculo.id] = np.nan if vehiculo.longitud is None else vehiculo.longitud
+            c["celda_geo"][vehiculo.id] = -1 if vehiculo.celda_geo is None else vehiculo.celda_geo
+            return True
+        if vehiculo.id < len(self._columnas["marca"]) and self._columnas["marca"][vehiculo.id] >= 0:
+            self._columnas["marca"][vehiculo.id] = -1
+            return True
+        return False
+    
+    def invalidar(self) -> None:
+        """Descarta el índice; se reconstruye en la siguiente lectura (p. ej. tras una importación)"""
+        with self._lock:
+            self._construido = False
+            self._cache.clear()
+    
+    # ==================== RECUENTOS ====================
+    
+    def _codigos(self, campo: str, valores: List[Any]) -> List[int]:
+        """Códigos internos de los valores de un campo categórico (los desconocidos se omiten)"""
+        if campo == "marca":
+            return [self._marcas[v] for v in valores if v in self._marcas]
+        if campo == "ubicacion_provincia":
+            return [self._provincias[v] for v in valores if v in self._provincias]
+        tipo, codigos = (TipoMotor, _CODIGO_MOTOR) if campo == "tipo_motor" else (TipoVehiculo, _CODIGO_TIPO)
+        miembros = [_enum(tipo, v) for v in valores]
+        return [codigos[m] for m in miembros if m is not None]
+    
+    def _mascara_geo(self, operador: str, valor: Any) -> np.ndarray:
+        """Filtros 'radio' y 'caja' de la rejilla, con las mismas condiciones que en SQL
+        (compilar_filtros): celda en la lista y distancia equirectangular o caja"""
+        c = self._columnas
+        latitud, longitud = c["latitud"], c["longitud"]
+        parametros = _parametros_geo("g", operador, valor)
+        mascara = np.isin(c["celda_geo"], parametros["g"])
+        if operador == "caja":
+            return (mascara & (latitud >= parametros["g_lat_min"]) & (latitud <= parametros["g_lat_max"])
+                    & (longitud >= parametros["g_lon_min"]) & (longitud <= parametros["g_lon_max"]))
+        dlat, dlon = latitud - parametros["g_lat"], longitud - parametros["g_lon"]
+        return mascara & (dlat * dlat + dlon * dlon * parametros["g_cos2"] <= parametros["g_r2"])
+    
+    def _mascara(self, campo: str, operador: str, valor: Any) -> np.ndarray:
+        if campo == "celda_geo":
+            return self._mascara_geo(operador, valor)
+        columna = self._columnas[campo]
+        if campo in _CATEGORICOS:
+            valores = list(valor) if operador == "in" else [valor]
+            codigos = self._codigos(campo, valores)
+            if operador in ("eq", "in"):
+                return np.isin(columna, codigos)
+            if operador == "ne":
+                return ~np.isin(columna, codigos)
+            raise ValueError(operador)
+        if operador == "eq":
+            return columna == valor
+        if operador == "ne":
+            return columna != valor
+        if operador == "lt":
+            return columna < valor
+        if operador == "lte":
+            return columna <= valor
+        if operador == "gt":
+            return columna > valor
+        if operador == "gte":
+            return columna >= valor
+        if operador == "between":
+            minimo, maximo = valor
+            return (columna >= minimo) & (columna <= maximo)
+        return np.isin(columna, list(valor))
+    
+    def _separar(self, filtros: Dict[str, Any]) -> Optional[Tuple[List[Tuple[str, str, Any]], Dict[str, Any]]]:
+        """Divide los filtros en los que evalúa el índice (campo, operador, valor) y el resto.
+        None si piden vehículos que no están en el índice (otro estado o inactivos)"""
+        propios, resto = [], {}
+        for campo, valor in filtros.items():
+            if not hasattr(Vehiculo, campo):
+                continue  # order_by y otras claves que no son filtros
+            if campo in _BASE:
+                if valor != _BASE[campo] and _enum(EstadoVehiculo, valor) != _BASE[campo]:
+                    return None
+                continue
+            operaciones = valor if isinstance(valor, dict) else {"eq": valor}
+            for operador, argumento in operaciones.items():
+                evaluable = (
+                    (campo in _CATEGORICOS and operador in ("eq", "ne", "in") and argumento is not None)
+                    or (campo in _NUMERICOS and operador in _OPERADORES and argumento is not None)
+                    or (campo == "celda_geo" and operador in ("radio", "caja"))
+                )
+                if evaluable:
+                    propios.append((campo, operador, argumento))
+                else:
+                    resto.setdefault(campo, {})[operador] = argumento
+        return propios, resto
+    
+    def _mascara_resto(self, resto: Dict[str, Any]) -> np.ndarray:
+        """Máscara de los filtros que no evalúa el índice, con una consulta de ids"""
+        forma, parametros = compilar_filtros(Vehiculo, {**_BASE, **resto})
+        with db_service.get_session(solo_lectura=True) as session:
+            ids = np.array(session.exec(
+                select(Vehiculo.id).where(*_condiciones(Vehiculo, forma)), params=parametros
+            ).all(), dtype=np.int64)
+        mascara = np.zeros(len(self._columnas["marca"]), dtype=bool)
+        mascara[ids[ids < len(mascara)]] = True
+        return mascara
+    
+    def _contar(self, propios: List[Tuple[str, str, Any]], resto: Dict[str, Any]) -> Dict[str, Any]:
+        c = self._columnas
+        base = c["marca"] >= 0
+        if resto:
+            base &= self._mascara_resto(resto)
+        mascaras = [(campo, self._mascara(campo, operador, valor)) for campo, operador, valor in propios]
+        
+        def seleccion(excluido: Optional[str]) -> np.ndarray:
+            mascara = base.copy()
+            for campo, m in mascaras:
+                if campo != excluido:
+                    mascara &= m
+            return mascara
+        
+        def por_codigo(campo: str, n: int) -> np.ndarray:
+            return np.bincount(c[campo][seleccion(campo)], minlength=n)
+        
+        def por_rangos(campo: str, rangos: List[Dict[str, Any]], cerrados: bool) -> List[Dict[str, Any]]:
+            valores = c[campo][seleccion(campo)]
+            resultado = []
+            for i, rango in enumerate(rangos):
+                ultimo = i == len(rangos) - 1
+                hasta = valores <= rango["max"] if cerrados or ultimo else valores < rango["max"]
+                resultado.append({**rango, "cantidad": int(np.count_nonzero((valores >= rango["min"]) & hasta))})
+            return resultado
+        
+        def nombrados(codigos: Dict[str, int], cuentas: np.ndarray) -> List[Dict[str, Any]]:
+            valores = [{"valor": valor, "cantidad": int(cuentas[codigo])}
+                       for valor, codigo in codigos.items() if codigo < len(cuentas) and cuentas[codigo]]
+            return sorted(valores, key=lambda v: (-v["cantidad"], str(v["valor"])))
+        
+        motores = por_codigo("tipo_motor", len(_MOTORES))
+        tipos = por_codigo("tipo_vehiculo", len(_TIPOS))
+        return {
+            "total": int(np.count_nonzero(seleccion(None))),
+            "marcas": nombrados(self._marcas, por_codigo("marca", len(self._marcas))),
+            "provincias": nombrados(self._provincias, por_codigo("ubicacion_provincia", len(self._provincias))),
+            "tipos_motor": [{"valor": m.value, "cantidad": int(n)} for m, n in zip(_MOTORES, motores)],
+            "tipos_vehiculo": [{"valor": t.value, "cantidad": int(n)} for t, n in zip(_TIPOS, tipos)],
+            "años": por_rangos("año", rangos_años(), cerrados=True),
+            "rangos_precios": por_rangos("precio", RANGOS_PRECIOS, cerrados=False),
+        }
+    
+    def contar(self, filtros: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Total y recuentos de cada faceta para los filtros de buscar_vehiculos.
+        None si los filtros piden vehículos no disponibles. El resultado se comparte entre
+        llamadas (caché): no modificarlo"""
+        filtros = filtros or {}
+        with self._lock:
+            self._asegurar()
+            try:
+                clave = _clave_cache(filtros)
+                hash(clave)
+            except TypeError:
+                clave = None
+            if clave is not None and clave in self._cache:
+                self._cache.move_to_end(clave)
+                return self._cache[clave]
+            
+            separados = self._separar(filtros)
+            if separados is None:
+                return None
+            recuentos = self._contar(*separados)
+            if clave is not None:
+                self._cache[clave] = recuentos
+                if len(self._cache) > self.tamano_cache:
+                    self._cache.popitem(last=False)
+            return recuentos
+
+# Instancia global del índice
+indice_facetas = IndiceFacetas()
@@ -0,0 +1,355 @@
+"""
+Servicio de fotos de vehículos
+Subida, almacenamiento por contenido y variantes en segundo plano.
+
+- Cada original se guarda en disco con su sha256 como nombre (<directorio>/originales), así
+  que una foto subida varias veces, al mismo anuncio o a otros, ocupa espacio una sola vez.
+  Cada subida tiene su fila FotoVehiculo, que apunta al hash.
+- En la petición solo se lee la cabecera de la imagen (formato y dimensiones), se calcula el
+  hash y se guarda el original. Las variantes (servicio/miniaturas.py) se generan en un pool
+  de procesos, fuera del GIL y de la petición: la foto queda PENDIENTE y al terminar pasa a
+  LISTA, y la primera foto lista del anuncio se copia en Vehiculo.foto_portada. Si el mismo
+  contenido ya tenía variantes, la foto queda LISTA en la misma petición.
+- La URL de cada variante lleva el hash (url_variante), así que su contenido no cambia nunca
+  y la API la sirve con caché de un año (GET /fotos/{hash}/{variante}.webp).
+
+Ajustes en rxconfig.py con el prefijo fotos_ o variables REFLEX_FOTOS_<AJUSTE>.
+
+    python -m backend_rx.apps.servicio.fotos reprocesar   # fotos pendientes, p. ej. tras un reinicio
+    python -m backend_rx.apps.servicio.fotos purgar       # ficheros que ya no usa ninguna foto
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from sqlmodel import select, func
+
+from ..modelos.foto import FotoVehiculo, EstadoFoto
+from ..modelos.vehiculo import Vehiculo
+from ..modelos.usuario import Usuario, TipoUsuario
+from .base_datos import db_service
+from .instrumentacion import instrumentar
+from .motor import leer_ajustes
+from . import miniaturas
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("JPEG", "PNG", "WEBP")
+PATRON_HASH = re.compile(r"^[0-9a-f]{64}$")
+URL_FOTOS = "/fotos"
+
+@dataclass(frozen=True)
+class ConfiguracionFotos:
+    """Ajustes del almacenamiento y del proceso de las fotos"""
+    directorio: str = "fotos"
+    procesos: int = 0                       # procesos del pool; 0 = uno por núcleo
+    max_bytes: int = 15 * 1024 * 1024
+    max_pixeles: int = 50_000_000           # por debajo del límite de Pillow contra bombas de descompresión
+    max_por_vehiculo: int = 30
+    antiguedad_purga_s: int = 3600          # margen para no borrar un original recién subido
+    x_accel_redirect: str = ""              # prefijo interno de nginx: la API delega el envío del fichero
+
+@instrumentar("esperar", "cerrar")
+class FotosService:
+    """Servicio de fotos de los anuncios"""
+    
+    def __init__(self):
+        self.db = db_service
+        self._config: Optional[ConfiguracionFotos] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Un solo trabajo por hash, aunque lleguen varias subidas del mismo contenido a la vez
+        self._en_curso: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def config(self) -> ConfiguracionFotos:
+        if self._config is None:
+            self._config = leer_ajustes(ConfiguracionFotos, "fotos")
+        return self._config
+    
+    # ==================== SUBIDA ====================
+    
+    def subir_foto(self, vehiculo_id: int, usuario_id: int,
+                   contenido: bytes) -> Tuple[bool, str, Optional[FotoVehiculo]]:
+        """Guarda una foto del vehículo y programa sus variantes"""
+        try:
+            if len(contenido) > self.config.max_bytes:
+                return False, f"La foto supera {self.config.max_bytes // (1024 * 1024)} MB", None
+            try:
+                # Image.open solo lee la cabecera; la decodificación es cosa del pool
+                with Image.open(io.BytesIO(contenido)) as imagen:
+                    formato, (ancho, alto) = imagen.format, imagen.size
+                    if imagen.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                        # Orientación EXIF girada 90°: las variantes saldrán con los lados cambiados
+                        ancho, alto = alto, ancho
+            except (UnidentifiedImageError, OSError):
+                return False, "El fichero no es una imagen válida", None
+            if formato not in FORMATOS:
+                return False, f"Formato no admitido: {formato}", None
+            if ancho * alto > self.config.max_pixeles:
+                return False, "La foto tiene demasiados píxeles", None
+            
+            hash = hashlib.sha256(contenido).hexdigest()
+            raiz = self.config.directorio
+            ruta = miniaturas.ruta_original(raiz, hash)
+            if os.path.exists(ruta):
+                # Renueva la fecha para que la purga no lo borre mientras se inserta la fila
+                os.utime(ruta)
+            else:
+                miniaturas.guardar_atomico(ruta, partial(_escribir, contenido))
+            
+            with self.db.transaction() as session:
+                vehiculo = session.get(Vehiculo, vehiculo_id)
+                if not vehiculo or not vehiculo.activo:
+                    return False, "Vehículo no encontrado", None
+                if vehiculo.vendedor_id != usuario_id:
+                    usuario = session.get(Usuario, usuario_id)
+                    if not usuario or usuario.tipo_usuario != TipoUsuario.ADMIN:
+                        return False, "Sin permisos para añadir fotos a este vehículo", None
+                
+                existente = session.exec(select(FotoVehiculo).where(
+                    FotoVehiculo.vehiculo_id == vehiculo_id, FotoVehiculo.hash == hash)).first()
+                if existente:
+                    return True, "La foto ya estaba en el anuncio", existente
+                
+                cantidad, ultimo = session.exec(
+                    select(func.count(), func.max(FotoVehiculo.orden))
+                    .where(FotoVehiculo.vehiculo_id == vehiculo_id)).one()
+                if cantidad >= self.config.max_por_vehiculo:
+                    return False, f"El anuncio ya tiene {cantidad} fotos", None
+                
+                foto = FotoVehiculo(
+                    vehiculo_id=vehiculo_id, hash=hash,
+                    orden=0 if ultimo is None else ultimo + 1,
+                    formato=formato.lower(), ancho=ancho, alto=alto, tamano_bytes=len(contenido),
+                )
+                # Mismo contenido ya procesado: se reutilizan sus variantes
+                if miniaturas.variantes_completas(raiz, hash):
+                    foto.estado = EstadoFoto.LISTA
+                session.add(foto)
+                session.flush()
+                if foto.estado == EstadoFoto.LISTA:
+                    self._actualizar_portada(session, vehiculo_id)
+            
+            if foto.estado == EstadoFoto.PENDIENTE:
+                # Después del commit, para que el proceso encuentre la fila al terminar
+                self._procesar(hash)
+                return True, "Foto recibida, procesando", foto
+            return True, "Foto añadida", foto
+        
+        except Exception as e:
+            return False, f"Error al subir la foto: {str(e)}", None
+    
+    def eliminar_foto(self, foto_id: int, usuario_id: int) -> Tuple[bool, str]:
+        """Quita una foto del anuncio. Los ficheros se borran al purgar si nadie más los usa"""
+        try:
+            with self.db.transaction() as session:
+                foto = session.get(FotoVehiculo, foto_id)
+                if not foto:
+                    return False, "Foto no encontrada"
+                vehiculo = session.get(Vehiculo, foto.vehiculo_id)
+                if vehiculo.vendedor_id != usuario_id:
+                    usuario = session.get(Usuario, usuario_id)
+                    if not usuario or usuario.tipo_usuario != TipoUsuario.ADMIN:
+                        return False, "Sin permisos para eliminar esta foto"
+                session.delete(foto)
+                session.flush()
+                self._actualizar_portada(session, foto.vehiculo_id)
+            return True, "Foto eliminada"
+        
+        except Exception as e:
+            return False, f"Error al eliminar la foto: {str(e)}"
+    
+    # ==================== CONSULTA ====================
+    
+    def obtener_fotos(self, vehiculo_id: int, solo_listas: bool = True) -> List[FotoVehiculo]:
+        """Fotos del vehículo en orden"""
+        try:
+            with self.db.get_session(solo_lectura=True) as session:
+                consulta = select(FotoVehiculo).where(FotoVehiculo.vehiculo_id == vehiculo_id)
+                if solo_listas:
+                    consulta = consulta.where(FotoVehiculo.estado == EstadoFoto.LISTA)
+                return list(session.exec(consulta.order_by(FotoVehiculo.orden, FotoVehiculo.id)).all())
+        except Exception:
+            logger.exception("Error al obtener las fotos del vehículo %s", vehiculo_id)
+            return []
+    
+    def url_variante(self, hash: str, variante: str = "miniatura") -> str:
+        return f"{URL_FOTOS}/{hash}/{variante}.{miniaturas.EXTENSION}"
+    
+    def srcset(self, foto: FotoVehiculo) -> str:
+        """Atributo srcset de <img> con el ancho real de cada variante"""
+        lado_mayor = max(foto.ancho, foto.alto, 1)
+        anchos: Dict[int, str] = {}
+        for variante, lado in reversed(miniaturas.VARIANTES.items()):
+            ancho = round(foto.ancho * min(1.0, lado / lado_mayor))
+            # Las fotos no se amplían: las variantes mayores que el original son iguales
+            anchos.setdefault(ancho, variante)
+        return ", ".join(f"{self.url_variante(foto.hash, v)} {a}w" for a, v in anchos.items())
+    
+    def ruta_variante(self, hash: str, variante: str) -> Optional[str]:
+        """Fichero de la variante, o None si no existe o el nombre no es válido"""
+        if not PATRON_HASH.match(hash) or variante not in miniaturas.VARIANTES:
+            return None
+        ruta = miniaturas.ruta_variante(self.config.directorio, hash, variante)
+        return ruta if os.path.isfile(ruta) else None
+    
+    # ==================== PROCESO EN SEGUNDO PLANO ====================
+    
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # forkserver: los procesos no heredan los hilos ni las conexiones de la API.
+                # Como con spawn, el script principal necesita if __name__ == "__main__"
+                metodos = multiprocessing.get_all_start_methods()
+                contexto = multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.config.procesos or os.cpu_count(), mp_context=contexto)
+            return self._pool
+    
+    def _procesar(self, hash: str) -> None:
+        pool = self._obtener_pool()
+        with self._lock:
+            if hash in self._en_curso:
+                return
+            futuro = pool.submit(miniaturas.generar_variantes, self.config.directorio, hash)
+            self._en_curso[hash] = futuro
+        futuro.add_done_callback(partial(self._terminar, hash))
+    
+    def _terminar(self, hash: str, futuro: Future) -> None:
+        """Marca como listas (o con error) todas las fotos pendientes del hash"""
+        registrado = False
+        try:
+            try:
+                ancho, alto = futuro.result()
+                estado = EstadoFoto.LISTA
+            except Exception as e:
+                logger.warning("No se pudieron generar las variantes de %s: %s", hash, e)
+                ancho = alto = None
+                estado = EstadoFoto.ERROR
+            
+            with self.db.transaction() as session:
+                fotos = session.exec(select(FotoVehiculo).where(
+                    FotoVehiculo.hash == hash, FotoVehiculo.estado == EstadoFoto.PENDIENTE)).all()
+                for foto in fotos:
+                    foto.estado = estado
+                    if ancho is not None:
+                        foto.ancho, foto.alto = ancho, alto
+                    session.add(foto)
+                session.flush()
+                for vehiculo_id in {foto.vehiculo_id for foto in fotos}:
+                    self._actualizar_portada(session, vehiculo_id)
+            registrado = True
+        except Exception:
+            logger.exception("Error al registrar las variantes de %s", hash)
+        finally:
+            with self._lock:
+                self._en_curso.pop(hash, None)
+        
+        # Una subida del mismo contenido confirmada después de la consulta de arriba, pero
+        # antes de sacar el hash de _en_curso, no se ha programado (lo vio en curso): se
+        # vuelve a programar. Las variantes ya existen, así que solo se lee la cabecera.
+        # Sin pool (cerrar) quedan para reprocesar_pendientes
+        if registrado and self._pool is not None:
+            try:
+                with self.db.get_session(solo_lectura=True) as session:
+                    pendiente = session.exec(select(FotoVehiculo.id).where(
+                        FotoVehiculo.hash == hash, FotoVehiculo.estado == EstadoFoto.PENDIENTE).limit(1)).first()
+                if pendiente is not None:
+                    self._procesar(hash)
+            except Exception:
+                logger.exception("Error al comprobar las fotos pendientes de %s", hash)
+    
+    def _actualizar_portada(self, session, vehiculo_id: int) -> None:
+        portada = session.exec(
+            select(FotoVehiculo.hash)
+            .where(FotoVehiculo.vehiculo_id == vehiculo_id, FotoVehiculo.estado == EstadoFoto.LISTA)
+            .order_by(FotoVehiculo.orden, FotoVehiculo.id).limit(1)
+        ).first()
+        vehiculo = session.get(Vehiculo, vehiculo_id)
+        if vehiculo and vehiculo.foto_portada != portada:
+            vehiculo.foto_portada = portada
+            # Cambia la tarjeta: invalida las cachés HTTP por fecha de actualización
+            vehiculo.fecha_actualizacion = datetime.now()
+            session.add(vehiculo)
+    
+    def reprocesar_pendientes(self) -> int:
+        """Programa las variantes de las fotos pendientes (las que se quedaron a medias al
+        parar el proceso). Devuelve el número de ficheros programados"""
+        with self.db.get_session(solo_lectura=True) as session:
+            hashes = session.exec(select(FotoVehiculo.hash).distinct()
+                                  .where(FotoVehiculo.estado == EstadoFoto.PENDIENTE)).all()
+        for hash in hashes:
+            self._procesar(hash)
+        return len(hashes)
+    
+    def esperar(self) -> None:
+        """Espera a que terminen los procesos en curso"""
+        while True:
+            with self._lock:
+                futuros = list(self._en_curso.values())
+            if not futuros:
+                return
+            for futuro in futuros:
+                try:
+                    futuro.result()
+                except Exception:
+                    pass
+            # El callback de cada futuro lo saca de _en_curso al registrar el resultado
+            time.sleep(0.01)
+    
+    def cerrar(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+    
+    # ==================== MANTENIMIENTO ====================
+    
+    def purgar(self) -> int:
+        """Borra los originales y variantes que no usa ninguna foto, y los temporales
+        abandonados, con más de antiguedad_purga_s. Devuelve el número de ficheros borrados"""
+        with self.db.get_session(solo_lectura=True) as session:
+            usados = set(session.exec(select(FotoVehiculo.hash).distinct()).all())
+        limite = time.time() - self.config.antiguedad_purga_s
+        borrados = 0
+        for carpeta in ("originales", "variantes"):
+            for directorio, _, ficheros in os.walk(os.path.join(self.config.directorio, carpeta)):
+                for nombre in ficheros:
+                    ruta = os.path.join(directorio, nombre)
+                    if nombre[:64] in usados or os.path.getmtime(ruta) > limite:
+                        continue
+                    os.unlink(ruta)
+                    borrados += 1
+        return borrados
+
+def _escribir(contenido: bytes, ruta: str) -> None:
+    with open(ruta, "wb") as fichero:
+        fichero.write(contenido)
+
+# Instancia global del servicio
+fotos_service = FotosService()
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "reprocesar":
+        print(f"{fotos_service.reprocesar_pendientes()} ficheros pendientes")
+        fotos_service.esperar()
+        fotos_service.cerrar()
+    elif comando == "purgar":
+        print(f"{fotos_service.purgar()} ficheros borrados")
+    else:
+        print("Uso: python -m backend_rx.apps.servicio.fotos reprocesar | purgar")
+        sys.exit(2)
@@ -0,0 +1,282 @@
+"""
+Geografía
+Nomenclátor de municipios y provincias de España con coordenadas y rejilla espacial de los
+anuncios, para buscar vehículos a una distancia de un punto sin servicios externos.
+
+Al guardar un anuncio, su ciudad y provincia se resuelven con el nomenclátor incluido en el
+repositorio (backend_rx/compartido/constantes/localidades.csv) a latitud y longitud. Si la
+ciudad no está, se usan las coordenadas de la capital de la provincia. Cada anuncio guarda
+además su celda de una rejilla de GRADOS_CELDA grados (celda_geo, indexada). Una búsqueda
+por radio o por caja se traduce en las celdas que la cortan (celda_geo IN ..., que resuelve
+el índice) más la condición exacta sobre latitud y longitud.
+
+Para rellenar las coordenadas de los anuncios existentes (tras la migración):
+
+    python -m backend_rx.apps.servicio.geografia geocodificar
+"""
+import csv
+import math
+import sys
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+NOMENCLATOR = Path(__file__).resolve().parents[2] / "compartido" / "constantes" / "localidades.csv"
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+
+# Tamaño de celda de la rejilla en grados (~22 km de norte a sur, ~17 km de este a oeste en
+# la península). Una búsqueda de 50 km recorre unas 30 celdas
+GRADOS_CELDA = 0.2
+COLUMNAS_REJILLA = round(360 / GRADOS_CELDA)
+
+# Radio de 'cerca' si no se indica radio_km
+RADIO_POR_DEFECTO_KM = 50
+
+# Límite de celdas de una búsqueda (~700 km de radio): con más, la lista IN deja de compensar
+MAX_CELDAS = 5000
+
+# Nombres alternativos de las provincias (normalizados, ver _normalizar)
+ALIAS_PROVINCIAS = {
+    "alacant": "Alicante",
+    "castello": "Castellón",
+    "baleares": "Illes Balears",
+    "islas baleares": "Illes Balears",
+    "balears": "Illes Balears",
+    "vizcaya": "Bizkaia",
+    "guipuzcoa": "Gipuzkoa",
+    "araba": "Álava",
+    "araba alava": "Álava",
+    "alava araba": "Álava",
+    "la coruna": "A Coruña",
+    "coruna": "A Coruña",
+    "orense": "Ourense",
+    "gerona": "Girona",
+    "lerida": "Lleida",
+    "principado de asturias": "Asturias",
+    "comunidad de madrid": "Madrid",
+    "region de murcia": "Murcia",
+    "comunidad foral de navarra": "Navarra",
+    "nafarroa": "Navarra",
+    "rioja": "La Rioja",
+    "tenerife": "Santa Cruz de Tenerife",
+    "gran canaria": "Las Palmas",
+}
+
+@dataclass(frozen=True)
+class Localidad:
+    municipio: str
+    provincia: str
+    latitud: float
+    longitud: float
+    poblacion: int
+
+def _normalizar(texto: Optional[str]) -> str:
+    """Minúsculas, sin tildes, sin guiones ni apóstrofos y con los espacios simplificados"""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    for separador in "-'/.,":
+        texto = texto.replace(separador, " ")
+    return " ".join(texto.split())
+
+class Nomenclator:
+    """Localidades del nomenclátor indexadas por nombre (y alias) normalizado"""
+    
+    def __init__(self, localidades: List[Localidad], alias: Dict[Localidad, List[str]]):
+        self.localidades = localidades
+        self.provincias: Dict[str, str] = {}
+        self.capitales: Dict[str, Localidad] = {}
+        self._por_nombre: Dict[Tuple[str, str], Localidad] = {}
+        self._por_municipio: Dict[str, List[Localidad]] = {}
+        for localidad in localidades:
+            provincia = _normalizar(localidad.provincia)
+            self.provincias.setdefault(provincia, localidad.provincia)
+            # La primera localidad de cada provincia en el fichero es la capital
+            self.capitales.setdefault(localidad.provincia, localidad)
+            for nombre in [localidad.municipio, *alias.get(localidad, [])]:
+                clave = _normalizar(nombre)
+                self._por_nombre.setdefault((clave, provincia), localidad)
+                candidatas = self._por_municipio.setdefault(clave, [])
+                if localidad not in candidatas:
+                    candidatas.append(localidad)
+        for alias_provincia, provincia in ALIAS_PROVINCIAS.items():
+            self.provincias.setdefault(alias_provincia, provincia)
+    
+    def provincia(self, nombre: Optional[str]) -> Optional[str]:
+        """Nombre canónico de la provincia (acepta alias como 'Vizcaya' o 'La Coruña')"""
+        return self.provincias.get(_normalizar(nombre))
+    
+    def buscar(self, ciudad: Optional[str], provincia: Optional[str] = None) -> Optional[Localidad]:
+        """Localidad de la ciudad en la provincia; si la ciudad no está, la capital de la
+        provincia; sin provincia, la ciudad si su nombre es único en el nomenclátor"""
+        canonica = self.provincia(provincia)
+        clave = _normalizar(ciudad)
+        if canonica:
+            localidad = self._por_nombre.get((clave, _normalizar(canonica)))
+            return localidad or self.capitales.get(canonica)
+        candidatas = self._por_municipio.get(clave, [])
+        return candidatas[0] if len(candidatas) == 1 else None
+
+@lru_cache(maxsize=1)
+def nomenclator() -> Nomenclator:
+    """Nomenclátor cargado del fichero CSV (una vez por proceso)"""
+    localidades, alias = [], {}
+    with open(NOMENCLATOR, encoding="utf-8", newline="") as f:
+        for fila in csv.DictReader(f):
+            localidad = Localidad(
+                municipio=fila["municipio"],
+                provincia=fila["provincia"],
+                latitud=float(fila["latitud"]),
+                longitud=float(fila["longitud"]),
+                poblacion=int(fila["poblacion"]),
+            )
+            localidades.append(localidad)
+            alias[localidad] = [a for a in (fila["alias"] or "").split("|") if a]
+    return Nomenclator(localidades, alias)
+
+# ==================== COORDENADAS DE LOS ANUNCIOS ====================
+
+def celda(latitud: float, longitud: float) -> int:
+    """Celda de la rejilla que contiene el punto"""
+    fila = math.floor((latitud + 90) / GRADOS_CELDA)
+    columna = math.floor((longitud + 180) / GRADOS_CELDA) % COLUMNAS_REJILLA
+    return fila * COLUMNAS_REJILLA + columna
+
+@lru_cache(maxsize=4096)
+def coordenadas(ciudad: Optional[str], provincia: Optional[str]) -> Dict[str, Any]:
+    """latitud, longitud y celda_geo de una ubicación (None si no se puede resolver)"""
+    localidad = nomenclator().buscar(ciudad, provincia)
+    if localidad is None:
+        return {"latitud": None, "longitud": None, "celda_geo": None}
+    return {
+        "latitud": localidad.latitud,
+        "longitud": localidad.longitud,
+        "celda_geo": celda(localidad.latitud, localidad.longitud),
+    }
+
+def ubicar(vehiculo) -> None:
+    """Rellena las coordenadas del vehículo a partir de su ciudad y provincia"""
+    for campo, valor in coordenadas(vehiculo.ubicacion_ciudad, vehiculo.ubicacion_provincia).items():
+        setattr(vehiculo, campo, valor)
+
+# ==================== DISTANCIAS Y CELDAS ====================
+
+def distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia de círculo máximo (haversine) en kilómetros"""
+    f1, f2 = math.radians(lat1), math.radians(lat2)
+    df, dl = f2 - f1, math.radians(lon2 - lon1)
+    a = math.sin(df / 2) ** 2 + math.cos(f1) * math.cos(f2) * math.sin(dl / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def caja_de_radio(latitud: float, longitud: float, radio_km: float) -> Tuple[float, float, float, float]:
+    """(lat_min, lon_min, lat_max, lon_max) que contiene el círculo"""
+    dlat = radio_km / KM_POR_GRADO
+    # Longitud en la latitud más alejada del ecuador dentro del círculo
+    extremo = min(abs(latitud) + dlat, 89.9)
+    dlon = min(radio_km / (KM_POR_GRADO * math.cos(math.radians(extremo))), 180.0)
+    return latitud - dlat, longitud - dlon, latitud + dlat, longitud + dlon
+
+def _rango_celdas(lat_min: float, lon_min: float, lat_max: float, lon_max: float):
+    filas = range(math.floor((lat_min + 90) / GRADOS_CELDA), math.floor((lat_max + 90) / GRADOS_CELDA) + 1)
+    columnas = range(math.floor((lon_min + 180) / GRADOS_CELDA), math.floor((lon_max + 180) / GRADOS_CELDA) + 1)
+    if len(filas) * len(columnas) > MAX_CELDAS:
+        raise ValueError("El área de búsqueda es demasiado grande")
+    return filas, columnas
+
+def celdas_en_caja(lat_min: float, lon_min: float, lat_max: float, lon_max: float) -> List[int]:
+    """Celdas de la rejilla que cortan la caja"""
+    filas, columnas = _rango_celdas(lat_min, lon_min, lat_max, lon_max)
+    return [f * COLUMNAS_REJILLA + c % COLUMNAS_REJILLA for f in filas for c in columnas]
+
+def celdas_en_radio(latitud: float, longitud: float, radio_km: float) -> List[int]:
+    """Celdas de la rejilla que cortan el círculo (el punto de cada celda más cercano al
+    centro está a radio_km o menos)"""
+    filas, columnas = _rango_celdas(*caja_de_radio(latitud, longitud, radio_km))
+    celdas = []
+    for f in filas:
+        sur = f * GRADOS_CELDA - 90
+        lat_cercana = min(max(latitud, sur), sur + GRADOS_CELDA)
+        for c in columnas:
+            oeste = c * GRADOS_CELDA - 180
+            lon_cercana = min(max(longitud, oeste), oeste + GRADOS_CELDA)
+            if distancia_km(latitud, longitud, lat_cercana, lon_cercana) <= radio_km:
+                celdas.append(f * COLUMNAS_REJILLA + c % COLUMNAS_REJILLA)
+    return celdas
+
+def filtros_ubicacion(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Traduce las claves 'cerca' y 'caja' de los filtros de búsqueda a filtros de la
+    rejilla sobre celda_geo ('radio' y 'caja' en compilar_filtros):
+        
+        {"cerca": {"ciudad": "Getafe", "provincia": "Madrid", "radio_km": 30}}
+        {"cerca": {"latitud": 40.41, "longitud": -3.70}}   (RADIO_POR_DEFECTO_KM)
+        {"caja": (lat_min, lon_min, lat_max, lon_max)}
+    """
+    if "cerca" not in filtros and "caja" not in filtros:
+        return filtros
+    filtros = dict(filtros)
+    cerca, caja = filtros.pop("cerca", None), filtros.pop("caja", None)
+    rejilla = {}
+    if cerca:
+        latitud, longitud = centro(cerca)
+        radio_km = float(cerca.get("radio_km") or RADIO_POR_DEFECTO_KM)
+        if radio_km <= 0:
+            raise ValueError("El radio debe ser mayor que cero")
+        rejilla["radio"] = (latitud, longitud, radio_km)
+    if caja:
+        lat_min, lon_min, lat_max, lon_max = (float(v) for v in caja)
+        if lat_min > lat_max or lon_min > lon_max:
+            raise ValueError("Caja no válida: los mínimos deben ser menores que los máximos")
+        rejilla["caja"] = (lat_min, lon_min, lat_max, lon_max)
+    if rejilla:
+        filtros["celda_geo"] = rejilla
+    return filtros
+
+def centro(cerca: Dict[str, Any]) -> Tuple[float, float]:
+    """(latitud, longitud) del filtro 'cerca' de buscar_vehiculos: coordenadas o ciudad y provincia"""
+    if cerca.get("latitud") is not None and cerca.get("longitud") is not None:
+        return float(cerca["latitud"]), float(cerca["longitud"])
+    localidad = nomenclator().buscar(cerca.get("ciudad"), cerca.get("provincia"))
+    if localidad is None:
+        raise ValueError(f"Ubicación desconocida: {cerca.get('ciudad') or cerca.get('provincia')}")
+    return localidad.latitud, localidad.longitud
+
+# ==================== LÍNEA DE COMANDOS ====================
+
+def geocodificar() -> int:
+    """Rellena las coordenadas de los vehículos que no las tienen, con un UPDATE por cada
+    par ciudad y provincia distinto. Devuelve cuántos vehículos se han actualizado"""
+    from sqlalchemy import update
+    from sqlmodel import select
+    from ..modelos.vehiculo import Vehiculo
+    from .base_datos import db_service
+    
+    actualizados = 0
+    with db_service.transaction() as session:
+        pares = session.exec(
+            select(Vehiculo.ubicacion_ciudad, Vehiculo.ubicacion_provincia)
+            .where(Vehiculo.celda_geo.is_(None)).distinct()
+        ).all()
+        for ciudad, provincia in pares:
+            valores = coordenadas(ciudad, provincia)
+            if valores["celda_geo"] is None:
+                continue
+            actualizados += session.execute(
+                update(Vehiculo.__table__)
+                .where(Vehiculo.ubicacion_ciudad == ciudad, Vehiculo.ubicacion_provincia == provincia,
+                       Vehiculo.celda_geo.is_(None))
+                .values(**valores)
+            ).rowcount
+    return actualizados
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "geocodificar":
+        print(f"{geocodificar()} vehículos geocodificados")
+    else:
+        print("Uso: python -m backend_rx.apps.servicio.geografia geocodificar")
+        sys.exit(2)
@@ -0,0 +1,380 @@
+"""
+Importación masiva de vehículos
+Carga inventarios de concesionarios desde CSV o JSONL en lotes.
+
+El fichero se lee en streaming: en memoria solo está el lote en curso, así que el
+consumo no depende del tamaño del fichero. Cada fila se convierte y se valida con las
+reglas de validar_datos_vehiculo. Los vendedores del lote se comprueban con una
+consulta, y cada lote se inserta con un INSERT múltiple en una transacción junto con
+vehiculos_publicados (un UPDATE por vendedor) y las estadísticas. Las filas con error
+no se insertan y se devuelven en el informe con su número de fila. Tras el commit de
+cada lote sus anuncios se encolan para las alertas de búsquedas guardadas.
+
+    python -m backend_rx.apps.servicio.importacion inventario.csv --vendedor 12
+    python -m backend_rx.apps.servicio.importacion inventario.jsonl --errores errores.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple, Type, Union
+
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import select
+
+from ..modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, EstadoVehiculo
+from ..modelos.usuario import Usuario
+from ..modelos.validaciones import validar_datos_vehiculo
+from .alertas import alertas_service
+from .base_datos import db_service
+from . import busqueda_texto, estadisticas, geografia
+from .similitud import indice_similitud
+from .ranking import ranking_vistas
+from .facetas import indice_facetas
+
+TAMANO_LOTE = 5000
+
+# Caché de páginas de SQLite durante cada lote (KiB). Con la de por defecto (2 MiB) las
+# páginas de los índices de vehiculo se expulsan y se releen varias veces por lote
+CACHE_LOTE_KIB = 128 * 1024
+
+CAMPOS_ENTEROS = ("año", "kilometraje", "vendedor_id")
+CAMPOS_DECIMALES = ("precio",)
+CAMPOS_BOOLEANOS = ("precio_negociable", "disponible_financiacion", "acepta_parte_pago")
+CAMPOS_ENUM: Dict[str, Type[Enum]] = {"tipo_motor": TipoMotor, "tipo_vehiculo": TipoVehiculo}
+CAMPOS_TEXTO = (
+    "marca", "modelo", "descripcion", "caracteristicas_extras", "color_exterior",
+    "color_interior", "ubicacion_ciudad", "ubicacion_provincia",
+)
+
+# Valores por defecto de los campos opcionales (las filas de un INSERT múltiple
+# deben tener todas las mismas columnas)
+VALORES_POR_DEFECTO = {
+    "precio_negociable": True,
+    "descripcion": None,
+    "caracteristicas_extras": None,
+    "color_exterior": None,
+    "color_interior": None,
+    "disponible_financiacion": False,
+    "acepta_parte_pago": False,
+    "foto_portada": None,
+}
+
+VERDADEROS = {"1", "true", "si", "sí", "s", "yes", "y"}
+FALSOS = {"0", "false", "no", "n", ""}
+
+# ==================== LECTURA ====================
+
+def leer_filas(fichero: TextIO, formato: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Recorre el fichero fila a fila y devuelve (número de fila, datos).
+    En CSV la fila 1 es la cabecera, así que los datos empiezan en la 2."""
+    if formato == "csv":
+        for numero, fila in enumerate(csv.DictReader(fichero), start=2):
+            yield numero, fila
+    elif formato == "jsonl":
+        for numero, linea in enumerate(fichero, start=1):
+            if not linea.strip():
+                continue
+            try:
+                datos = json.loads(linea)
+            except json.JSONDecodeError as e:
+                datos = {"__error__": f"JSON no válido: {e.msg}"}
+            if not isinstance(datos, dict):
+                datos = {"__error__": "Cada línea debe ser un objeto JSON"}
+            yield numero, datos
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+def _formato_de(ruta: str) -> str:
+    return "jsonl" if ruta.endswith((".jsonl", ".ndjson")) else "csv"
+
+# ==================== CONVERSIÓN Y VALIDACIÓN ====================
+
+def _valores_enum(tipo: Type[Enum]) -> Dict[str, Enum]:
+    """Acepta el valor ("gasolina") o el nombre ("GASOLINA") de cada miembro"""
+    valores = {miembro.value: miembro for miembro in tipo}
+    valores.update({miembro.name.lower(): miembro for miembro in tipo})
+    return valores
+
+VALORES_ENUM = {campo: _valores_enum(tipo) for campo, tipo in CAMPOS_ENUM.items()}
+
+def _convertir_booleano(valor: Any) -> bool:
+    if isinstance(valor, bool):
+        return valor
+    texto = str(valor).strip().lower()
+    if texto in VERDADEROS:
+        return True
+    if texto in FALSOS:
+        return False
+    raise ValueError(f"Valor no válido: {valor}")
+
+# int() y float() ya ignoran los espacios alrededor del número
+CONVERSIONES: Dict[str, Callable[[Any], Any]] = {
+    **{campo: int for campo in CAMPOS_ENTEROS},
+    **{campo: float for campo in CAMPOS_DECIMALES},
+    **{campo: _convertir_booleano for campo in CAMPOS_BOOLEANOS},
+}
+
+def convertir_fila(fila: Dict[str, Any], vendedor_id: Optional[int] = None) -> Dict[str, Any]:
+    """Convierte los valores de una fila (texto en CSV) a los tipos del modelo.
+    Las columnas desconocidas se ignoran. Lanza ValueError si un valor no es válido."""
+    if "__error__" in fila:
+        raise ValueError(fila["__error__"])
+    
+    datos: Dict[str, Any] = {}
+    for campo in CAMPOS_TEXTO:
+        valor = fila.get(campo)
+        if valor is not None:
+            valor = str(valor).strip()
+            if valor:
+                datos[campo] = valor
+    
+    for campo, convertir in CONVERSIONES.items():
+        valor = fila.get(campo)
+        if valor is None or valor == "":
+            continue
+        try:
+            datos[campo] = convertir(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"El campo {campo} no es válido: {valor}")
+    
+    for campo, tipo in CAMPOS_ENUM.items():
+        valor = fila.get(campo)
+        if valor in (None, ""):
+            raise ValueError(f"El campo {campo} es obligatorio")
+        miembro = valor if isinstance(valor, tipo) else VALORES_ENUM[campo].get(str(valor).strip().lower())
+        if miembro is None:
+            raise ValueError(f"El campo {campo} no es válido: {valor}")
+        datos[campo] = miembro
+    
+    datos.setdefault("vendedor_id", vendedor_id)
+    if datos["vendedor_id"] is None:
+        raise ValueError("El campo vendedor_id es obligatorio")
+    return datos
+
+def _vendedores_validos(session, ids: List[int], cache: Dict[int, Optional[str]]) -> None:
+    """Comprueba en una consulta los vendedores del lote que no están en la caché.
+    Guarda None si puede publicar o el mensaje de error si no."""
+    nuevos = [vid for vid in ids if vid not in cache]
+    if not nuevos:
+        return
+    filas = session.exec(select(Usuario.id, Usuario.puede_publicar).where(Usuario.id.in_(nuevos))).all()
+    encontrados = dict(filas)
+    for vid in nuevos:
+        if vid not in encontrados:
+            cache[vid] = "Vendedor no encontrado"
+        elif not encontrados[vid]:
+            cache[vid] = "El usuario no puede publicar vehículos"
+        else:
+            cache[vid] = None
+
+# ==================== INSERCIÓN ====================
+
+@lru_cache(maxsize=8)
+def _sentencia_insercion(dialecto) -> Tuple[str, List[str], Tuple[Tuple[str, Any], ...]]:
+    """INSERT de vehiculo en SQL del driver y el procesador de tipo de cada columna"""
+    tabla = Vehiculo.__table__
+    columnas = [columna for columna in tabla.columns if not columna.primary_key]
+    valores = {columna.name: bindparam(columna.name) for columna in columnas}
+    compilada = insert(tabla).values(valores).compile(dialect=dialecto)
+    procesadores = tuple(
+        (columna.name, columna.type.dialect_impl(dialecto).bind_processor(dialecto))
+        for columna in columnas
+    )
+    return str(compilada), compilada.positiontup, procesadores
+
+def _insertar_vehiculos(conn, filas: List[Dict[str, Any]]) -> None:
+    """INSERT múltiple (executemany del driver). Los valores se convierten con los
+    procesadores de tipo de SQLAlchemy una vez por columna, sin compilar parámetros por fila"""
+    if not conn.dialect.positional:
+        conn.execute(insert(Vehiculo.__table__), filas)
+        return
+    sql, posiciones, procesadores = _sentencia_insercion(conn.dialect)
+    orden = {nombre: i for i, nombre in enumerate(posiciones)}
+    columnas = [None] * len(posiciones)
+    for nombre, procesador in procesadores:
+        valores = [fila[nombre] for fila in filas]
+        columnas[orden[nombre]] = [procesador(v) for v in valores] if procesador else valores
+    conn.exec_driver_sql(sql, list(zip(*columnas)))
+
+def _encolar_alertas(vehiculo_ids: List[int]) -> None:
+    for vehiculo_id in vehiculo_ids:
+        alertas_service.encolar(vehiculo_id)
+
+def _insertar_lote(session, filas: List[Dict[str, Any]]) -> None:
+    """INSERT múltiple de las filas, vehiculos_publicados y estadísticas en la sesión dada.
+    Los anuncios se encolan para las alertas después del commit"""
+    # La transacción empieza con BEGIN IMMEDIATE: nadie más inserta entre las dos consultas,
+    # así que los ids mayores que el máximo anterior son los de este lote
+    anterior = session.execute(select(func.max(Vehiculo.id))).scalar() or 0
+    # El índice de texto se actualiza con una sentencia por lote en lugar de un trigger por fila
+    with busqueda_texto.indexacion_diferida(session):
+        _insertar_vehiculos(session.connection(), filas)
+    insertados = session.execute(select(Vehiculo.id).where(Vehiculo.id > anterior)).scalars().all()
+    db_service.al_confirmar(partial(_encolar_alertas, insertados))
+    
+    publicados: Dict[int, int] = {}
+    for fila in filas:
+        publicados[fila["vendedor_id"]] = publicados.get(fila["vendedor_id"], 0) + 1
+    tabla_usuario = Usuario.__table__
+    session.execute(
+        update(tabla_usuario)
+        .where(tabla_usuario.c.id == bindparam("b_id"))
+        .values(vehiculos_publicados=tabla_usuario.c.vehiculos_publicados + bindparam("b_n")),
+        [{"b_id": vid, "b_n": n} for vid, n in sorted(publicados.items())],
+    )
+    
+    estadisticas.registrar_cambios(
+        (None, (True, fila["estado"], fila["marca"], fila["tipo_motor"], fila["precio"]))
+        for fila in filas
+    )
+
+@contextmanager
+def _cache_ampliada(session):
+    """Amplía la caché de páginas de la conexión mientras dura el lote y la restaura después"""
+    conn = session.connection()
+    if conn.dialect.name != "sqlite":
+        yield
+        return
+    anterior = conn.exec_driver_sql("PRAGMA cache_size").scalar()
+    conn.exec_driver_sql(f"PRAGMA cache_size = -{CACHE_LOTE_KIB}")
+    try:
+        yield
+    finally:
+        conn.exec_driver_sql(f"PRAGMA cache_size = {anterior}")
+
+def _guardar_lote(filas: List[Tuple[int, Dict[str, Any]]], errores: Callable[[int, str], None]) -> int:
+    """Inserta el lote en una transacción. Si falla, reintenta fila a fila para
+    localizar las que dan error. Devuelve el número de filas insertadas."""
+    if not filas:
+        return 0
+    try:
+        with db_service.transaction() as session, _cache_ampliada(session):
+            _insertar_lote(session, [datos for _, datos in filas])
+        return len(filas)
+    except SQLAlchemyError:
+        insertadas = 0
+        for numero, datos in filas:
+            try:
+                with db_service.transaction() as session:
+                    _insertar_lote(session, [datos])
+                insertadas += 1
+            except SQLAlchemyError as e:
+                errores(numero, f"Error al guardar: {getattr(e, 'orig', e)}")
+        return insertadas
+
+def importar_vehiculos(fichero: Union[str, TextIO], formato: Optional[str] = None,
+                       vendedor_id: Optional[int] = None, tamano_lote: int = TAMANO_LOTE,
+                       max_errores: int = 1000,
+                       al_error: Optional[Callable[[int, str], None]] = None) -> Dict[str, Any]:
+    """Importa vehículos desde un fichero CSV o JSONL (ruta o fichero abierto).
+    
+    vendedor_id se aplica a las filas sin columna vendedor_id. El informe incluye como
+    mucho max_errores errores; al_error recibe todos (p. ej. para escribirlos a disco).
+    """
+    if isinstance(fichero, str):
+        formato = formato or _formato_de(fichero)
+        with open(fichero, encoding="utf-8", newline="") as f:
+            return importar_vehiculos(f, formato, vendedor_id, tamano_lote, max_errores, al_error)
+    
+    inicio = time.perf_counter()
+    informe: Dict[str, Any] = {"procesadas": 0, "insertadas": 0, "con_error": 0, "errores": []}
+    
+    def registrar_error(numero: int, mensaje: str) -> None:
+        informe["con_error"] += 1
+        if len(informe["errores"]) < max_errores:
+            informe["errores"].append({"fila": numero, "error": mensaje})
+        if al_error:
+            al_error(numero, mensaje)
+    
+    vendedores: Dict[int, Optional[str]] = {}
+    lote: List[Tuple[int, Dict[str, Any]]] = []
+    
+    def procesar_lote() -> None:
+        ahora = datetime.now()
+        with db_service.get_session(solo_lectura=True) as session:
+            _vendedores_validos(session, list({datos["vendedor_id"] for _, datos in lote}), vendedores)
+        validas = []
+        for numero, datos in lote:
+            error = vendedores[datos["vendedor_id"]]
+            if error:
+                registrar_error(numero, error)
+                continue
+            validas.append((numero, {
+                **VALORES_POR_DEFECTO, **datos,
+                **geografia.coordenadas(datos["ubicacion_ciudad"], datos["ubicacion_provincia"]),
+                "estado": EstadoVehiculo.DISPONIBLE, "activo": True, "destacado": False,
+                "vistas": 0, "fecha_creacion": ahora, "fecha_actualizacion": None,
+                "motivo_inactivo": None,
+            }))
+        informe["insertadas"] += _guardar_lote(validas, registrar_error)
+        lote.clear()
+    
+    for numero, fila in leer_filas(fichero, formato or "csv"):
+        informe["procesadas"] += 1
+        try:
+            datos = convertir_fila(fila, vendedor_id)
+        except ValueError as e:
+            registrar_error(numero, str(e))
+            continue
+        es_valido, mensaje_error = validar_datos_vehiculo(datos)
+        if not es_valido:
+            registrar_error(numero, mensaje_error)
+            continue
+        lote.append((numero, datos))
+        if len(lote) >= tamano_lote:
+            procesar_lote()
+    if lote:
+        procesar_lote()
+    if informe["insertadas"]:
+        # Con miles de filas es más barato reconstruir el índice de similares y el ranking
+        # que sincronizarlos fila a fila
+        indice_similitud.invalidar()
+        ranking_vistas.invalidar()
+        indice_facetas.invalidar()
+    
+    informe["errores"].sort(key=lambda error: error["fila"])
+    informe["segundos"] = round(time.perf_counter() - inicio, 3)
+    informe["filas_por_segundo"] = round(informe["procesadas"] / informe["segundos"]) if informe["segundos"] else None
+    return informe
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importación masiva de vehículos desde CSV o JSONL")
+    parser.add_argument("fichero", help="Ruta del fichero, o - para leer de la entrada estándar")
+    parser.add_argument("--formato", choices=["csv", "jsonl"], help="Por defecto, según la extensión")
+    parser.add_argument("--vendedor", type=int, help="vendedor_id de las filas que no lo indican")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Filas por transacción")
+    parser.add_argument("--errores", help="Escribe todos los errores en este CSV (fila, error)")
+    args = parser.parse_args()
+    
+    salida_errores = open(args.errores, "w", encoding="utf-8", newline="") if args.errores else None
+    escritor = csv.writer(salida_errores) if salida_errores else None
+    if escritor:
+        escritor.writerow(["fila", "error"])
+    try:
+        entrada = args.fichero
+        if entrada == "-":
+            entrada = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+        resultado = importar_vehiculos(
+            entrada, args.formato, args.vendedor, args.lote,
+            al_error=(lambda fila, error: escritor.writerow([fila, error])) if escritor else None,
+        )
+    finally:
+        if salida_errores:
+            salida_errores.close()
+        # El proceso termina aquí: se generan los avisos pendientes antes de salir
+        alertas_service.cerrar()
+    
+    print(f"{resultado['insertadas']} de {resultado['procesadas']} filas importadas "
+          f"en {resultado['segundos']} s ({resultado['filas_por_segundo']} filas/s)")
+    if not escritor:
+        for error in resultado["errores"]:
+            print(f"  fila {error['fila']}: {error['error']}")
+    sys.exit(1 if resultado["con_error"] else 0)
@@ -0,0 +1,363 @@
+"""
+Instrumentación de consultas
+Cuántas consultas lanza cada llamada a los servicios y cada evento de Reflex, cuánto
+tiempo pasan en la base de datos, cuántas filas devuelven y cuántas conexiones toman del
+pool, con histogramas en memoria y registro de consultas lentas.
+
+- Los eventos del motor (before/after_cursor_execute y el checkout del pool) suman cada
+  consulta a las mediciones activas del contexto (ContextVar), de modo que una llamada
+  anidada cuenta también en la llamada y el evento que la contienen.
+- @instrumentar (clases de servicio) y @medir_evento (manejadores de Reflex) abren una
+  medición por llamada y al terminar la acumulan en las métricas de su nombre.
+- Las consultas que superan consultas_lentas_ms se registran en el logger de este módulo
+  con el SQL, los parámetros y el plan (EXPLAIN QUERY PLAN en SQLite), y las últimas se
+  guardan para el endpoint de métricas (GET /metricas de la API).
+
+El coste es de unos microsegundos por consulta y por llamada. Ajustes en rxconfig.py con el
+prefijo instrumentacion_ o variables REFLEX_INSTRUMENTACION_<AJUSTE>:
+
+    REFLEX_INSTRUMENTACION_CONSULTAS_LENTAS_MS=50 reflex run
+    
+    with medicion("home") as m:
+        pagina = vehiculos_service.buscar_vehiculos(filtros)
+    print(m.consultas, m.tiempo_bd_ms)
+"""
+import inspect
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from sqlmodel import SQLModel
+
+from .motor import leer_ajustes
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ConfiguracionInstrumentacion:
+    """Ajustes de la instrumentación"""
+    activa: bool = True
+    consultas_lentas_ms: float = 100.0
+    plan_consultas_lentas: bool = True  # EXPLAIN QUERY PLAN de las consultas lentas
+    consultas_lentas_guardadas: int = 50
+
+# Límites superiores de los cubos de los histogramas (el último cubo es +inf)
+CUBOS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+CUBOS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+@dataclass
+class Medicion:
+    """Contadores de una llamada o un evento"""
+    nombre: str
+    consultas: int = 0
+    tiempo_bd_ms: float = 0.0
+    filas: int = 0
+    sesiones: int = 0
+    servicio: bool = True  # False para eventos y mediciones manuales
+
+class Histograma:
+    """Histograma acumulado de cubos fijos"""
+    
+    def __init__(self, cubos: Tuple[float, ...]):
+        self.cubos = cubos
+        self.cuentas = [0] * (len(cubos) + 1)
+        self.suma = 0.0
+        self.total = 0
+    
+    def observar(self, valor: float) -> None:
+        self.cuentas[bisect_left(self.cubos, valor)] += 1
+        self.suma += valor
+        self.total += 1
+    
+    def percentil(self, p: float) -> Optional[float]:
+        """Límite superior del cubo que contiene el percentil p (None si está en el último)"""
+        if not self.total:
+            return None
+        objetivo = p * self.total
+        acumulado = 0
+        for cubo, cuenta in zip(self.cubos, self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return cubo
+        return None
+    
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            "cubos": [*self.cubos, "+inf"],
+            "cuentas": list(self.cuentas),
+            "total": self.total,
+            "media": round(self.suma / self.total, 3) if self.total else None,
+            "p50": self.percentil(0.5),
+            "p95": self.percentil(0.95),
+        }
+
+class Metrica:
+    """Acumulado de todas las llamadas con el mismo nombre"""
+    
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = 0
+        self.duracion_ms = Histograma(CUBOS_MS)
+        self.bd_ms = Histograma(CUBOS_MS)
+        self.consultas = Histograma(CUBOS_CONSULTAS)
+        self.filas = 0
+        self.sesiones = 0
+    
+    def registrar(self, medicion: Medicion, duracion_ms: float, error: bool) -> None:
+        self.llamadas += 1
+        self.errores += error
+        self.duracion_ms.observar(duracion_ms)
+        self.bd_ms.observar(medicion.tiempo_bd_ms)
+        self.consultas.observar(medicion.consultas)
+        self.filas += medicion.filas
+        self.sesiones += medicion.sesiones
+    
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            "llamadas": self.llamadas,
+            "errores": self.errores,
+            "consultas_por_llamada": round(self.consultas.suma / self.llamadas, 2) if self.llamadas else 0,
+            "filas": self.filas,
+            "sesiones": self.sesiones,
+            "duracion_ms": self.duracion_ms.a_dict(),
+            "bd_ms": self.bd_ms.a_dict(),
+            "consultas": self.consultas.a_dict(),
+        }
+
+# ==================== ESTADO ====================
+
+_configuracion = ConfiguracionInstrumentacion()
+_configurada = False
+_mediciones: ContextVar[Tuple[Medicion, ...]] = ContextVar("mediciones", default=())
+_metricas: Dict[str, Metrica] = {}
+_sql = Histograma(CUBOS_MS)
+_lentas: Deque[Dict[str, Any]] = deque(maxlen=_configuracion.consultas_lentas_guardadas)
+# Los hilos del pool de vehiculos_async comparten las mediciones del evento que los lanzó
+_lock = threading.Lock()
+
+def _config() -> ConfiguracionInstrumentacion:
+    global _configurada
+    if not _configurada:
+        configurar()
+    return _configuracion
+
+def configurar(config: Optional[ConfiguracionInstrumentacion] = None) -> ConfiguracionInstrumentacion:
+    """Cambia los ajustes (sin argumentos, vuelve a los de rxconfig.py)"""
+    global _configuracion, _configurada, _lentas
+    _configuracion = config or leer_ajustes(ConfiguracionInstrumentacion, "instrumentacion")
+    _configurada = True
+    with _lock:
+        _lentas = deque(_lentas, maxlen=_configuracion.consultas_lentas_guardadas)
+    return _configuracion
+
+# ==================== EVENTOS DEL MOTOR ====================
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    context._inicio_instrumentacion = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_inicio_instrumentacion", None)
+    config = _config()
+    if inicio is None or not config.activa:
+        return
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    mediciones = _mediciones.get()
+    with _lock:
+        _sql.observar(duracion_ms)
+        for medicion in mediciones:
+            medicion.consultas += 1
+            medicion.tiempo_bd_ms += duracion_ms
+    if duracion_ms >= config.consultas_lentas_ms:
+        _consulta_lenta(conn, statement, parameters, executemany, duracion_ms, mediciones)
+
+@event.listens_for(Pool, "checkout")
+def _al_tomar_conexion(dbapi_connection, connection_record, connection_proxy):
+    mediciones = _mediciones.get()
+    if mediciones:
+        with _lock:
+            for medicion in mediciones:
+                medicion.sesiones += 1
+
+def _plan(conn, statement: str, parameters) -> Optional[List[str]]:
+    """EXPLAIN QUERY PLAN en otro cursor de la misma conexión (solo SQLite)"""
+    if conn.dialect.name != "sqlite":
+        return None
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            filas = cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        finally:
+            cursor.close()
+        return [fila[-1] for fila in filas]
+    except Exception as e:
+        return [f"(sin plan: {e})"]
+
+def _consulta_lenta(conn, statement: str, parameters, executemany: bool, duracion_ms: float,
+                    mediciones: Tuple[Medicion, ...]) -> None:
+    config = _config()
+    plan = None if executemany or not config.plan_consultas_lentas else _plan(conn, statement, parameters)
+    registro = {
+        "momento": time.time(),
+        "duracion_ms": round(duracion_ms, 3),
+        "llamada": mediciones[-1].nombre if mediciones else None,
+        "sql": statement,
+        "parametros": repr(parameters)[:500],
+        "plan": plan,
+    }
+    with _lock:
+        _lentas.append(registro)
+    logger.warning("Consulta lenta (%.1f ms) en %s: %s | parámetros=%s | plan=%s",
+                   duracion_ms, registro["llamada"], statement, registro["parametros"], plan)
+
+# ==================== MEDICIONES ====================
+
+def _contar_filas(resultado: Any) -> int:
+    """Filas en el valor devuelto por un servicio: listas, modelos, y las que haya dentro de
+    tuplas (exito, mensaje, vehiculo) o diccionarios ({'vehiculos': [...]})"""
+    if isinstance(resultado, list):
+        return len(resultado)
+    if isinstance(resultado, SQLModel):
+        return 1
+    if isinstance(resultado, tuple):
+        return sum(_contar_filas(valor) for valor in resultado)
+    if isinstance(resultado, dict):
+        return sum(len(valor) for valor in resultado.values() if isinstance(valor, list))
+    return 0
+
+def _cerrar(medicion: Medicion, anteriores: Tuple[Medicion, ...], inicio: float, error: bool) -> None:
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    with _lock:
+        # Las filas solo se pasan desde la llamada de servicio más externa (las anidadas
+        # devuelven las mismas filas que la que las contiene)
+        if medicion.servicio and not any(anterior.servicio for anterior in anteriores):
+            for anterior in anteriores:
+                anterior.filas += medicion.filas
+        metrica = _metricas.get(medicion.nombre)
+        if metrica is None:
+            metrica = _metricas[medicion.nombre] = Metrica()
+        metrica.registrar(medicion, duracion_ms, error)
+
+@contextmanager
+def medicion(nombre: str, servicio: bool = False) -> Iterator[Medicion]:
+    """Mide un bloque: consultas, tiempo en la base de datos, filas y sesiones"""
+    anteriores = _mediciones.get()
+    actual = Medicion(nombre, servicio=servicio)
+    token = _mediciones.set(anteriores + (actual,))
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield actual
+    except BaseException:
+        error = True
+        raise
+    finally:
+        try:
+            _mediciones.reset(token)
+        except ValueError:
+            # Generador reanudado en otro contexto (p. ej. otro hilo): se restaura a mano
+            _mediciones.set(anteriores)
+        _cerrar(actual, anteriores, inicio, error)
+
+def con_mediciones(funcion: Callable) -> Callable:
+    """Envuelve la función para que, ejecutada en otro hilo, cuente en las mediciones activas
+    aquí. Solo se propagan las mediciones (no todo el contexto, que incluye la transacción)"""
+    mediciones = _mediciones.get()
+    if not mediciones:
+        return funcion
+    
+    def en_hilo(*args, **kwargs):
+        token = _mediciones.set(mediciones)
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _mediciones.reset(token)
+    return en_hilo
+
+def _instrumentado(nombre: str, funcion: Callable) -> Callable:
+    @wraps(funcion)
+    def wrapper(*args, **kwargs):
+        if not _config().activa:
+            return funcion(*args, **kwargs)
+        with medicion(nombre, servicio=True) as actual:
+            resultado = funcion(*args, **kwargs)
+            actual.filas = _contar_filas(resultado)
+            return resultado
+    return wrapper
+
+def instrumentar(*excluir: str) -> Callable[[type], type]:
+    """Decorador de clase: mide cada método público (salvo los excluidos) como 'Clase.metodo'"""
+    def decorador(cls: type) -> type:
+        for nombre, funcion in list(vars(cls).items()):
+            if nombre.startswith("_") or nombre in excluir or not inspect.isfunction(funcion):
+                continue
+            setattr(cls, nombre, _instrumentado(f"{cls.__name__}.{nombre}", funcion))
+        return cls
+    return decorador
+
+def medir_evento(handler: Callable) -> Callable:
+    """Decorador para manejadores de eventos de Reflex (funciones o generadores, síncronos
+    o asíncronos). Las llamadas de vehiculos_async hechas desde el evento cuentan en él"""
+    nombre = f"evento:{handler.__qualname__}"
+    
+    if inspect.isasyncgenfunction(handler):
+        @wraps(handler)
+        async def wrapper_generador_asincrono(*args, **kwargs):
+            with medicion(nombre):
+                async for actualizacion in handler(*args, **kwargs):
+                    yield actualizacion
+        return wrapper_generador_asincrono
+    
+    if inspect.iscoroutinefunction(handler):
+        @wraps(handler)
+        async def wrapper_asincrono(*args, **kwargs):
+            with medicion(nombre):
+                return await handler(*args, **kwargs)
+        return wrapper_asincrono
+    
+    if inspect.isgeneratorfunction(handler):
+        @wraps(handler)
+        def wrapper_generador(*args, **kwargs):
+            with medicion(nombre):
+                yield from handler(*args, **kwargs)
+        return wrapper_generador
+    
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        with medicion(nombre):
+            return handler(*args, **kwargs)
+    return wrapper
+
+# ==================== CONSULTA DE MÉTRICAS ====================
+
+def metricas() -> Dict[str, Any]:
+    """Instantánea de las métricas: todas las consultas, cada llamada y evento, y las
+    últimas consultas lentas"""
+    config = _config()
+    with _lock:
+        return {
+            "activa": config.activa,
+            "umbral_consulta_lenta_ms": config.consultas_lentas_ms,
+            "consultas": _sql.a_dict(),
+            "llamadas": {nombre: metrica.a_dict() for nombre, metrica in sorted(_metricas.items())},
+            "consultas_lentas": list(_lentas),
+        }
+
+def reiniciar() -> None:
+    """Vacía las métricas acumuladas"""
+    global _sql
+    with _lock:
+        _metricas.clear()
+        _lentas.clear()
+        _sql = Histograma(CUBOS_MS)
@@ -0,0 +1,80 @@
+"""
+Variantes de las fotos
+Miniatura y tamaños para srcset de cada foto original, en WebP.
+
+Se ejecuta en los procesos del pool de servicio/fotos.py, así que este módulo solo importa
+Pillow y la biblioteca estándar: cada proceso lo carga al arrancar sin traer los modelos ni
+la base de datos. Las rutas dependen solo del hash del original, de modo que una foto
+repetida se procesa una vez.
+"""
+import os
+import tempfile
+from typing import Callable, Dict, Tuple
+
+from PIL import Image, ImageOps
+
+# Lado mayor de cada variante en píxeles, de mayor a menor (las fotos no se amplían)
+VARIANTES: Dict[str, int] = {"grande": 1600, "mediana": 960, "pequena": 480, "miniatura": 240}
+EXTENSION = "webp"
+CALIDAD = 80
+# Con Pillow, method=4 es el equilibrio por defecto entre tiempo y tamaño de WebP
+METODO_WEBP = 4
+
+def _subruta(hash: str) -> Tuple[str, str]:
+    # Dos niveles de directorios para no acumular cientos de miles de ficheros en uno
+    return hash[:2], hash[2:4]
+
+def ruta_original(raiz: str, hash: str) -> str:
+    return os.path.join(raiz, "originales", *_subruta(hash), hash)
+
+def ruta_variante(raiz: str, hash: str, variante: str) -> str:
+    return os.path.join(raiz, "variantes", *_subruta(hash), f"{hash}_{variante}.{EXTENSION}")
+
+def guardar_atomico(ruta: str, escribir: Callable[[str], None]) -> None:
+    """Escribe en un temporal del mismo directorio y lo renombra: quien lea la ruta ve el
+    fichero completo o ninguno, también con dos procesos guardando el mismo contenido"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=".tmp-")
+    os.close(descriptor)
+    try:
+        escribir(temporal)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+def variantes_completas(raiz: str, hash: str) -> bool:
+    return all(os.path.exists(ruta_variante(raiz, hash, variante)) for variante in VARIANTES)
+
+def generar_variantes(raiz: str, hash: str) -> Tuple[int, int]:
+    """Crea las variantes que falten del original. Devuelve el ancho y el alto ya orientado"""
+    with Image.open(ruta_original(raiz, hash)) as original:
+        if variantes_completas(raiz, hash):
+            # Otra subida del mismo contenido ya las creó: basta la cabecera
+            ancho, alto = original.size
+            if original.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                ancho, alto = alto, ancho
+            return ancho, alto
+        
+        # thumbnail decodifica los JPEG ya reducidos (draft a 1/2, 1/4 u 1/8) cuando el
+        # original es mucho mayor que la variante, en vez de decodificar a tamaño completo
+        imagen = original.copy() if max(original.size) <= VARIANTES["grande"] else original
+        ancho, alto = original.size
+        imagen.thumbnail((VARIANTES["grande"], VARIANTES["grande"]), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        orientacion = original.getexif().get(0x0112, 1)
+        # Girar según la orientación EXIF después de reducir: el lado mayor no cambia
+        imagen = ImageOps.exif_transpose(imagen) if orientacion != 1 else imagen
+        if orientacion in (5, 6, 7, 8):
+            ancho, alto = alto, ancho
+    
+    if imagen.mode not in ("RGB", "RGBA"):
+        imagen = imagen.convert("RGBA" if "A" in imagen.getbands() or "transparency" in imagen.info else "RGB")
+    
+    # Cada variante se reduce desde la anterior, que ya es pequeña
+    for variante, lado in VARIANTES.items():
+        imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        ruta = ruta_variante(raiz, hash, variante)
+        if not os.path.exists(ruta):
+            guardar_atomico(ruta, lambda destino: imagen.save(
+                destino, "WEBP", quality=CALIDAD, method=METODO_WEBP))
+    return ancho, alto
@@ -0,0 +1,162 @@
+"""
+Motores de base de datos
+Ajustes de SQLite y reparto de las conexiones entre lecturas y escrituras.
+
+Con la configuración por defecto de SQLite (diario de rollback) un escritor necesita
+que no haya lectores y los lectores esperan al escritor, y con muchos hilos aparece
+"database is locked". Aquí se activa WAL (los lectores no bloquean al escritor ni al
+revés) y se separan dos motores sobre la misma base de datos:
+
+- Escritor: una sola conexión, así que las escrituras del proceso se serializan en el
+  pool en vez de competir por el bloqueo. Las transacciones empiezan con BEGIN IMMEDIATE
+  para que otro proceso no pueda provocar un interbloqueo al pasar de lectura a escritura.
+- Lectores: un pool de conexiones con query_only para las búsquedas y las estadísticas
+  (DatabaseService.get_session(solo_lectura=True)).
+
+Los ajustes se leen de rxconfig.py con el prefijo sqlite_ y se pueden sobrescribir con
+variables de entorno REFLEX_SQLITE_<AJUSTE>:
+
+    config = rx.Config(app_name="main", db_url="sqlite:///reflex.db", sqlite_lectores=16)
+    REFLEX_SQLITE_CACHE_SIZE_MB=128 reflex run
+
+Con otras bases de datos, o con SQLite en memoria, los dos motores son el de Reflex.
+"""
+import os
+import threading
+from functools import partial
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Optional, Tuple, Type, TypeVar
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from reflex.config import get_config
+from reflex.model import get_engine
+
+MODOS_SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+A = TypeVar("A")
+
+@dataclass(frozen=True)
+class ConfiguracionSQLite:
+    """Ajustes del motor SQLite"""
+    wal: bool = True
+    synchronous: str = "NORMAL"     # con WAL, NORMAL solo arriesga la última transacción ante un corte de luz
+    busy_timeout_ms: int = 5000
+    cache_size_mb: int = 64         # caché de páginas por conexión
+    mmap_size_mb: int = 256
+    lectores: int = 8               # conexiones del pool de lectura
+    separar_lecturas: bool = True   # False: un solo pool para todo, como el motor de Reflex
+    espera_conexion_s: float = 30.0 # máximo de espera por una conexión libre del pool
+
+def _convertir(valor, tipo):
+    if tipo is bool and isinstance(valor, str):
+        return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+    return tipo(valor)
+
+def leer_ajustes(clase: Type[A], prefijo: str) -> A:
+    """Crea la dataclass con los ajustes de rxconfig.py (<prefijo>_<ajuste>) y las
+    variables REFLEX_<PREFIJO>_<AJUSTE> por encima"""
+    config = get_config()
+    valores = {}
+    for campo in fields(clase):
+        valor = os.environ.get(f"REFLEX_{prefijo.upper()}_{campo.name.upper()}")
+        if valor is None:
+            valor = getattr(config, f"{prefijo}_{campo.name}", None)
+        if valor is not None:
+            valores[campo.name] = _convertir(valor, campo.type)
+    return clase(**valores)
+
+def cargar_configuracion() -> ConfiguracionSQLite:
+    """Ajustes de rxconfig.py (sqlite_<ajuste>) con las variables REFLEX_SQLITE_<AJUSTE> por encima"""
+    return leer_ajustes(ConfiguracionSQLite, "sqlite")
+
+# ==================== CREACIÓN DE LOS MOTORES ====================
+
+_motores: Dict[str, Tuple[Engine, Engine]] = {}
+_configuracion: Optional[ConfiguracionSQLite] = None
+_lock = threading.Lock()
+
+def _es_sqlite_en_fichero(url: str) -> bool:
+    url = make_url(url)
+    base = url.database or ""
+    return (url.get_backend_name() == "sqlite" and base not in ("", ":memory:")
+            and "mode=memory" not in base and url.query.get("mode") != "memory")
+
+def _al_conectar(config: ConfiguracionSQLite, lectura: bool, conexion, _registro) -> None:
+    """PRAGMAs de cada conexión nueva"""
+    if not lectura and config.separar_lecturas:
+        # SQLAlchemy emite el BEGIN (ver _begin_inmediato) en lugar del driver
+        conexion.isolation_level = None
+    cursor = conexion.cursor()
+    if not lectura:
+        # El modo del diario se guarda en el fichero: basta con que lo fije el escritor
+        cursor.execute(f"PRAGMA journal_mode = {'WAL' if config.wal else 'DELETE'}")
+    cursor.execute(f"PRAGMA synchronous = {config.synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(config.busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA cache_size = -{int(config.cache_size_mb) * 1024}")
+    cursor.execute(f"PRAGMA mmap_size = {int(config.mmap_size_mb) * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    if lectura:
+        cursor.execute("PRAGMA query_only = 1")
+    cursor.close()
+
+def _begin_inmediato(conexion) -> None:
+    conexion.exec_driver_sql("BEGIN IMMEDIATE")
+
+def _crear_motor(url: str, config: ConfiguracionSQLite, lectura: bool) -> Engine:
+    pool_size = config.lectores if lectura or not config.separar_lecturas else 1
+    motor = sqlalchemy.create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=config.espera_conexion_s,
+        connect_args={"check_same_thread": False, "timeout": config.busy_timeout_ms / 1000},
+    )
+    event.listen(motor, "connect", partial(_al_conectar, config, lectura))
+    if not lectura and config.separar_lecturas:
+        event.listen(motor, "begin", _begin_inmediato)
+    return motor
+
+def _obtener_motores() -> Tuple[Engine, Engine]:
+    url = get_config().db_url
+    motores = _motores.get(url)
+    if motores is not None:
+        return motores
+    with _lock:
+        if url not in _motores:
+            if not _es_sqlite_en_fichero(url):
+                _motores[url] = (get_engine(url), get_engine(url))
+            else:
+                config = _configuracion or cargar_configuracion()
+                if config.synchronous.upper() not in MODOS_SYNCHRONOUS:
+                    raise ValueError(f"sqlite_synchronous debe ser uno de {MODOS_SYNCHRONOUS}")
+                escritor = _crear_motor(url, config, lectura=False)
+                # Primera conexión del escritor: deja el fichero en modo WAL antes de que lean
+                escritor.connect().close()
+                lector = _crear_motor(url, config, lectura=True) if config.separar_lecturas else escritor
+                _motores[url] = (escritor, lector)
+        return _motores[url]
+
+def motor_escritura() -> Engine:
+    """Motor para las escrituras y las transacciones"""
+    return _obtener_motores()[0]
+
+def motor_lectura() -> Engine:
+    """Motor de solo lectura para búsquedas y estadísticas"""
+    return _obtener_motores()[1]
+
+def configurar(config: Optional[ConfiguracionSQLite] = None, **ajustes) -> ConfiguracionSQLite:
+    """Cambia los ajustes en tiempo de ejecución (p. ej. en pruebas). Cierra los motores
+    creados; los siguientes usan los nuevos ajustes. Sin argumentos vuelve a rxconfig.py"""
+    global _configuracion
+    with _lock:
+        if config is not None or ajustes:
+            _configuracion = replace(config or cargar_configuracion(), **ajustes)
+        else:
+            _configuracion = None
+        for escritor, lector in _motores.values():
+            escritor.dispose()
+            lector.dispose()
+        _motores.clear()
+        return _configuracion or cargar_configuracion()
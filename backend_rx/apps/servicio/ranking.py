@@ -0,0 +1,291 @@
+"""
+Ranking de vehículos por vistas
+Más visitados y tendencias (vistas con decaimiento exponencial) mantenidos en memoria.
+
+Las vistas de cada vehículo activo y disponible se guardan en arrays indexados por id:
+el total y una puntuación de tendencia en la que cada vista vale la mitad cada
+vida_media_horas. La puntuación se guarda relativa a un instante fijo (cada vista suma
+2^((t - t0) / vida_media)), así que nunca baja y el decaimiento no obliga a reordenar.
+
+Para cada corte pedido (todos, un tipo de vehículo, una provincia o ambos) se mantiene
+una lista ordenada con los TAMANO_TOP primeros, que se actualiza con cada vista. Leer
+los k primeros es O(k). Una baja o una venta descarta las listas afectadas, que se
+recalculan en la siguiente lectura con una pasada vectorizada.
+
+Se construye desde la base de datos al arrancar la API (o en la primera lectura). Las
+tendencias de vistas anteriores se estiman suponiendo las vistas repartidas desde la
+publicación. Cada proceso cuenta solo sus propias vistas hasta la siguiente reconstrucción.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import select
+
+from ..modelos.vehiculo import Vehiculo, TipoVehiculo, EstadoVehiculo
+from .base_datos import db_service
+from .contador_vistas import buffer_vistas
+
+# Vida media de las vistas en las tendencias
+VIDA_MEDIA_HORAS = 24.0
+
+# Vehículos mantenidos por cada corte; para límites mayores se calcula con una pasada
+TAMANO_TOP = 100
+
+# Filas leídas de la base de datos en cada parte al construir el ranking
+FILAS_POR_PARTE = 20000
+
+# Vidas medias desde t0 a partir de las que se reescalan las puntuaciones (2^512 cabe en float64)
+_MAX_EXPONENTE = 512
+
+_TIPOS = {tipo: i for i, tipo in enumerate(TipoVehiculo)}
+
+# (criterio, tipo_vehiculo, provincia); None = sin filtrar por esa dimensión
+Corte = Tuple[str, Optional[int], Optional[int]]
+
+class _Top:
+    """Los primeros vehículos de un corte, ordenados de mayor a menor puntuación"""
+    
+    def __init__(self, capacidad: int, ids: np.ndarray, puntuaciones: np.ndarray):
+        self.capacidad = capacidad
+        self._orden: List[Tuple[float, int]] = [(-float(p), int(i)) for i, p in zip(ids, puntuaciones)]
+        self._puntos: Dict[int, float] = {i: -p for p, i in self._orden}
+    
+    def actualizar(self, vehiculo_id: int, puntuacion: float) -> None:
+        """Refleja la nueva puntuación (que nunca baja) de un vehículo del corte"""
+        anterior = self._puntos.get(vehiculo_id)
+        if anterior is not None:
+            del self._orden[bisect_left(self._orden, (-anterior, vehiculo_id))]
+        elif len(self._orden) >= self.capacidad and (-puntuacion, vehiculo_id) >= self._orden[-1]:
+            return
+        insort(self._orden, (-puntuacion, vehiculo_id))
+        self._puntos[vehiculo_id] = puntuacion
+        if len(self._orden) > self.capacidad:
+            _, fuera = self._orden.pop()
+            del self._puntos[fuera]
+    
+    def __contains__(self, vehiculo_id: int) -> bool:
+        return vehiculo_id in self._puntos
+    
+    def primeros(self, k: int) -> List[int]:
+        return [vehiculo_id for _, vehiculo_id in self._orden[:k]]
+
+class RankingVistas:
+    """Más visitados y tendencias por corte, actualizados con cada vista"""
+    
+    def __init__(self, vida_media_horas: float = VIDA_MEDIA_HORAS, tamano_top: int = TAMANO_TOP):
+        self.vida_media_segundos = vida_media_horas * 3600
+        self.tamano_top = tamano_top
+        self._lock = threading.RLock()
+        self._construido = False
+        self._tops: Dict[Corte, _Top] = {}
+        self._provincias: Dict[str, int] = {}
+        self._t0 = 0.0
+        # Arrays indexados por id; tipo -1 = el vehículo no está en el ranking
+        self._tipo = np.empty(0, dtype=np.int16)
+        self._provincia = np.empty(0, dtype=np.int32)
+        self._vistas = np.empty(0, dtype=np.int64)
+        self._tendencia = np.empty(0, dtype=np.float64)
+    
+    # ==================== CONSTRUCCIÓN Y ACTUALIZACIÓN ====================
+    
+    def _codigo_provincia(self, provincia: Optional[str], crear: bool = True) -> Optional[int]:
+        clave = (provincia or "").strip().lower()
+        if clave not in self._provincias and crear:
+            self._provincias[clave] = len(self._provincias)
+        return self._provincias.get(clave)
+    
+    def _reservar(self, max_id: int) -> None:
+        if max_id < len(self._tipo):
+            return
+        capacidad = max(max_id + 1, 2 * len(self._tipo))
+        tipo = np.full(capacidad, -1, dtype=np.int16)
+        tipo[:len(self._tipo)] = self._tipo
+        self._tipo = tipo
+        self._provincia = np.resize(self._provincia, capacidad)
+        self._vistas = np.resize(self._vistas, capacidad)
+        self._tendencia = np.resize(self._tendencia, capacidad)
+    
+    def reconstruir(self) -> int:
+        """Carga las vistas de los vehículos activos y disponibles. Devuelve cuántos hay"""
+        ahora = time.time()
+        partes = []
+        with db_service.get_session(solo_lectura=True) as session:
+            resultado = session.connection().execution_options(yield_per=FILAS_POR_PARTE).execute(
+                select(
+                    Vehiculo.id, Vehiculo.vistas, Vehiculo.fecha_creacion,
+                    Vehiculo.tipo_vehiculo, Vehiculo.ubicacion_provincia,
+                ).where(Vehiculo.activo == True, Vehiculo.estado == EstadoVehiculo.DISPONIBLE)
+            )
+            with self._lock:
+                for filas in resultado.partitions():
+                    ids, vistas, fechas, tipos, provincias = zip(*filas)
+                    partes.append((
+                        np.array(ids, dtype=np.int64),
+                        np.array(vistas, dtype=np.int64),
+                        np.array([ahora - f.timestamp() if f else 0.0 for f in fechas]),
+                        np.array([_TIPOS[t] for t in tipos], dtype=np.int16),
+                        np.array([self._codigo_provincia(p) for p in provincias], dtype=np.int32),
+                    ))
+        
+        with self._lock:
+            self._tipo = np.empty(0, dtype=np.int16)
+            self._tops = {}
+            self._t0 = ahora
+            self._construido = True
+            if not partes:
+                return 0
+            ids, vistas, antiguedad, tipos, provincias = (np.concatenate(c) for c in zip(*partes))
+            self._reservar(int(ids.max()))
+            self._tipo[ids] = tipos
+            self._provincia[ids] = provincias
+            self._vistas[ids] = vistas
+            self._tendencia[ids] = vistas * self._factor_historico(antiguedad)
+            # Vistas de este proceso pendientes de volcar: todavía no están en la base de datos
+            for vehiculo_id, n in buffer_vistas.todos_pendientes().items():
+                if self._esta(vehiculo_id):
+                    self._vistas[vehiculo_id] += n
+                    self._tendencia[vehiculo_id] += n
+            return len(ids)
+    
+    def _factor_historico(self, antiguedad: np.ndarray) -> np.ndarray:
+        """Peso actual de las vistas de un anuncio con esta antigüedad (en segundos),
+        si se repartieron por igual desde su publicación"""
+        edad = np.maximum(antiguedad, 1.0) / self.vida_media_segundos
+        return (1 - np.exp2(-edad)) / (edad * math.log(2))
+    
+    def _asegurar(self) -> None:
+        if not self._construido:
+            self.reconstruir()
+    
+    def _cortes(self, vehiculo_id: int) -> List[Corte]:
+        """Cortes existentes en los que está el vehículo"""
+        tipo, provincia = int(self._tipo[vehiculo_id]), int(self._provincia[vehiculo_id])
+        return [
+            corte for corte in self._tops
+            if corte[1] in (None, tipo) and corte[2] in (None, provincia)
+        ]
+    
+    def _actualizar_tops(self, vehiculo_id: int) -> None:
+        valores = {"vistas": float(self._vistas[vehiculo_id]), "tendencia": float(self._tendencia[vehiculo_id])}
+        for corte in self._cortes(vehiculo_id):
+            self._tops[corte].actualizar(vehiculo_id, valores[corte[0]])
+    
+    def _esta(self, vehiculo_id: int) -> bool:
+        return vehiculo_id < len(self._tipo) and self._tipo[vehiculo_id] >= 0
+    
+    def _agregar(self, vehiculo: Vehiculo, vistas: int, tendencia: float) -> None:
+        self._reservar(vehiculo.id)
+        self._tipo[vehiculo.id] = _TIPOS[vehiculo.tipo_vehiculo]
+        self._provincia[vehiculo.id] = self._codigo_provincia(vehiculo.ubicacion_provincia)
+        self._vistas[vehiculo.id] = vistas
+        self._tendencia[vehiculo.id] = tendencia
+        self._actualizar_tops(vehiculo.id)
+    
+    def registrar_vista(self, vehiculo: Vehiculo, n: int = 1) -> None:
+        """Suma n vistas de ahora al vehículo"""
+        with self._lock:
+            if not self._construido:
+                return  # la reconstrucción leerá las vistas de la base de datos y del buffer
+            if not self._esta(vehiculo.id):
+                if not (vehiculo.activo and vehiculo.estado == EstadoVehiculo.DISPONIBLE):
+                    return
+                self._agregar(vehiculo, vehiculo.vistas or 0, 0.0)
+            exponente = (time.time() - self._t0) / self.vida_media_segundos
+            if exponente > _MAX_EXPONENTE:
+                self._reescalar(exponente)
+                exponente = 0.0
+            self._vistas[vehiculo.id] += n
+            self._tendencia[vehiculo.id] += n * 2.0 ** exponente
+            self._actualizar_tops(vehiculo.id)
+    
+    def _reescalar(self, exponente: float) -> None:
+        """Mueve t0 a ahora; el orden no cambia, pero las listas guardan puntuaciones antiguas"""
+        self._tendencia *= 2.0 ** -exponente
+        self._t0 += exponente * self.vida_media_segundos
+        self._tops = {corte: top for corte, top in self._tops.items() if corte[0] != "tendencia"}
+    
+    def sincronizar(self, vehiculo: Vehiculo) -> None:
+        """Refleja un alta, un cambio de tipo o provincia, una venta o una baja"""
+        with self._lock:
+            if not self._construido:
+                return
+            if self._esta(vehiculo.id):
+                if (vehiculo.activo and vehiculo.estado == EstadoVehiculo.DISPONIBLE
+                        and self._tipo[vehiculo.id] == _TIPOS[vehiculo.tipo_vehiculo]
+                        and self._provincia[vehiculo.id] == self._codigo_provincia(vehiculo.ubicacion_provincia)):
+                    return
+                # Sale de sus cortes: las listas en las que estaba se recalculan al leerlas
+                for corte in self._cortes(vehiculo.id):
+                    if vehiculo.id in self._tops[corte]:
+                        del self._tops[corte]
+                self._tipo[vehiculo.id] = -1
+                if vehiculo.activo and vehiculo.estado == EstadoVehiculo.DISPONIBLE:
+                    self._agregar(vehiculo, self._vistas[vehiculo.id], self._tendencia[vehiculo.id])
+            elif vehiculo.activo and vehiculo.estado == EstadoVehiculo.DISPONIBLE:
+                self._agregar(vehiculo, vehiculo.vistas or 0, 0.0)
+    
+    def invalidar(self) -> None:
+        """Descarta el ranking; se reconstruye en la siguiente lectura (p. ej. tras una importación)"""
+        with self._lock:
+            self._construido = False
+            self._tops = {}
+    
+    # ==================== LECTURA ====================
+    
+    def mas_visitados(self, limite: int = 10, tipo_vehiculo: Optional[TipoVehiculo] = None,
+                      provincia: Optional[str] = None) -> List[int]:
+        """Ids de los vehículos con más vistas en total, de más a menos"""
+        return self._primeros("vistas", limite, tipo_vehiculo, provincia)
+    
+    def tendencias(self, limite: int = 10, tipo_vehiculo: Optional[TipoVehiculo] = None,
+                   provincia: Optional[str] = None) -> List[int]:
+        """Ids de los vehículos con más vistas recientes (con decaimiento), de más a menos"""
+        return self._primeros("tendencia", limite, tipo_vehiculo, provincia)
+    
+    def vistas_recientes(self, vehiculo_id: int) -> float:
+        """Vistas con decaimiento de un vehículo: cada una pesa 1 ahora y 0,5 tras una vida media"""
+        with self._lock:
+            self._asegurar()
+            if not self._esta(vehiculo_id):
+                return 0.0
+            exponente = (time.time() - self._t0) / self.vida_media_segundos
+            return float(self._tendencia[vehiculo_id] * 2.0 ** -exponente)
+    
+    def _primeros(self, criterio: str, limite: int, tipo_vehiculo: Optional[TipoVehiculo],
+                  provincia: Optional[str]) -> List[int]:
+        with self._lock:
+            self._asegurar()
+            tipo = _TIPOS[tipo_vehiculo] if tipo_vehiculo is not None else None
+            codigo = self._codigo_provincia(provincia, crear=False) if provincia else None
+            if provincia and codigo is None:
+                return []
+            corte = (criterio, tipo, codigo)
+            if limite > self.tamano_top:
+                return self._calcular(corte, limite).tolist()
+            if corte not in self._tops:
+                ids = self._calcular(corte, self.tamano_top)
+                valores = self._vistas if criterio == "vistas" else self._tendencia
+                self._tops[corte] = _Top(self.tamano_top, ids, valores[ids])
+            return self._tops[corte].primeros(limite)
+    
+    def _calcular(self, corte: Corte, limite: int) -> np.ndarray:
+        """Los primeros de un corte con una pasada sobre los arrays (desempate por id)"""
+        criterio, tipo, provincia = corte
+        mascara = self._tipo >= 0
+        if tipo is not None:
+            mascara &= self._tipo == tipo
+        if provincia is not None:
+            mascara &= self._provincia == provincia
+        ids = np.flatnonzero(mascara)
+        valores = (self._vistas if criterio == "vistas" else self._tendencia)[ids]
+        if len(ids) > limite:
+            umbral = np.partition(valores, len(ids) - limite)[len(ids) - limite]
+            ids, valores = ids[valores >= umbral], valores[valores >= umbral]
+        return ids[np.lexsort((ids, -valores))][:limite]
+
+# Instancia global
+ranking_vistas = RankingVistas()
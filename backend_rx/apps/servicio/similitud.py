@@ -0,0 +1,286 @@
+"""
+Índice de similitud de vehículos
+k vecinos más cercanos en memoria (NumPy) sobre los anuncios activos y disponibles.
+
+Cada vehículo se representa con tres características numéricas escaladas (log del
+precio, año y log del kilometraje) y cuatro categóricas (tipo de vehículo, motor,
+marca y provincia). La distancia es el cuadrado de la distancia euclídea de las
+numéricas más una penalización por cada categoría distinta.
+
+Los vehículos se agrupan por (tipo_vehiculo, tipo_motor). Una búsqueda recorre los
+grupos de menor a mayor penalización mínima y se detiene cuando esa penalización ya no
+puede mejorar el k-ésimo resultado. El resultado es exacto, y normalmente basta con uno
+o dos grupos. Dentro de un grupo la distancia se calcula en una pasada vectorizada.
+
+El índice se construye en la primera búsqueda y se actualiza al crear, modificar,
+vender o dar de baja un vehículo. Cada proceso tiene su propia copia: el servicio
+vuelve a filtrar los resultados en la base de datos, así que una entrada desfasada
+nunca se muestra.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import select
+
+from ..modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, EstadoVehiculo
+from .base_datos import db_service
+
+# Escala de las características numéricas: una diferencia de esta magnitud suma 1
+ESCALA_PRECIO = 0.2        # en log: ~22% de diferencia de precio
+ESCALA_AÑO = 3.0           # años
+ESCALA_KILOMETRAJE = 0.5   # en log1p: ~65% de diferencia de kilometraje
+
+# Penalización por categoría distinta
+PENALIZACION_TIPO = 4.0
+PENALIZACION_MOTOR = 2.0
+PENALIZACION_MARCA = 1.0
+PENALIZACION_PROVINCIA = 0.5
+
+_TIPOS = {tipo: i for i, tipo in enumerate(TipoVehiculo)}
+_MOTORES = {motor: i for i, motor in enumerate(TipoMotor)}
+
+# Filas leídas de la base de datos en cada parte al construir el índice
+FILAS_POR_PARTE = 20000
+
+Grupo = Tuple[int, int]
+
+def _escalar(precios, años, kilometrajes) -> np.ndarray:
+    """Características numéricas escaladas, una fila por característica"""
+    precios = np.maximum(np.asarray(precios, dtype=np.float64), 1.0)
+    años = np.asarray(años, dtype=np.float64)
+    kilometrajes = np.maximum(np.asarray(kilometrajes, dtype=np.float64), 0.0)
+    return np.stack([
+        np.log(precios) / ESCALA_PRECIO,
+        años / ESCALA_AÑO,
+        np.log1p(kilometrajes) / ESCALA_KILOMETRAJE,
+    ]).astype(np.float32)
+
+class _Bloque:
+    """Vehículos de un grupo (tipo_vehiculo, tipo_motor) en arrays contiguos"""
+    
+    def __init__(self, ids: np.ndarray, numericas: np.ndarray, marcas: np.ndarray,
+                 provincias: np.ndarray):
+        self.n = len(ids)
+        self.ids = ids
+        self.numericas = numericas  # (3, capacidad): cada característica es contigua
+        self.marcas = marcas
+        self.provincias = provincias
+    
+    @classmethod
+    def vacio(cls, capacidad: int = 64) -> "_Bloque":
+        bloque = cls(np.empty(capacidad, dtype=np.int64), np.empty((3, capacidad), dtype=np.float32),
+                     np.empty(capacidad, dtype=np.int32), np.empty(capacidad, dtype=np.int32))
+        bloque.n = 0
+        return bloque
+    
+    def agregar(self, vehiculo_id: int, numericas: np.ndarray, marca: int, provincia: int) -> int:
+        if self.n == len(self.ids):
+            capacidad = max(2 * len(self.ids), 64)
+            self.ids = np.resize(self.ids, capacidad)
+            self.marcas = np.resize(self.marcas, capacidad)
+            self.provincias = np.resize(self.provincias, capacidad)
+            numericas_anteriores = self.numericas
+            self.numericas = np.empty((3, capacidad), dtype=np.float32)
+            self.numericas[:, :self.n] = numericas_anteriores[:, :self.n]
+        posicion = self.n
+        self.ids[posicion] = vehiculo_id
+        self.numericas[:, posicion] = numericas
+        self.marcas[posicion] = marca
+        self.provincias[posicion] = provincia
+        self.n += 1
+        return posicion
+    
+    def quitar(self, posicion: int) -> Optional[int]:
+        """Quita la posición moviendo a ella el último elemento. Devuelve el id movido"""
+        self.n -= 1
+        if posicion == self.n:
+            return None
+        self.ids[posicion] = self.ids[self.n]
+        self.numericas[:, posicion] = self.numericas[:, self.n]
+        self.marcas[posicion] = self.marcas[self.n]
+        self.provincias[posicion] = self.provincias[self.n]
+        return int(self.ids[posicion])
+
+class IndiceSimilitud:
+    """Índice k-NN en memoria de los vehículos activos y disponibles"""
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bloques: Optional[Dict[Grupo, _Bloque]] = None
+        # Ubicación de cada id (su grupo y su posición en el bloque), indexada por id:
+        # con ids consecutivos ocupa mucho menos que un diccionario
+        self._grupo_de = np.empty(0, dtype=np.int16)
+        self._posicion_de = np.empty(0, dtype=np.int32)
+        self._marcas: Dict[str, int] = {}
+        self._provincias: Dict[str, int] = {}
+    
+    # ==================== CONSTRUCCIÓN Y ACTUALIZACIÓN ====================
+    
+    def _codigo(self, codigos: Dict[str, int], valor: Optional[str]) -> int:
+        clave = (valor or "").strip().lower()
+        if clave not in codigos:
+            codigos[clave] = len(codigos)
+        return codigos[clave]
+    
+    def _caracteristicas(self, vehiculo: Vehiculo) -> Tuple[Grupo, np.ndarray, int, int]:
+        return (
+            (_TIPOS[vehiculo.tipo_vehiculo], _MOTORES[vehiculo.tipo_motor]),
+            _escalar([vehiculo.precio or 0], [vehiculo.año or 0], [vehiculo.kilometraje or 0])[:, 0],
+            self._codigo(self._marcas, vehiculo.marca),
+            self._codigo(self._provincias, vehiculo.ubicacion_provincia),
+        )
+    
+    def _ubicacion(self, vehiculo_id: int) -> Optional[Tuple[Grupo, int]]:
+        if not 0 <= vehiculo_id < len(self._grupo_de) or self._grupo_de[vehiculo_id] < 0:
+            return None
+        return divmod(int(self._grupo_de[vehiculo_id]), len(_MOTORES)), int(self._posicion_de[vehiculo_id])
+    
+    def _ubicar(self, ids: np.ndarray, grupo: Grupo, posiciones: np.ndarray) -> None:
+        if len(ids) and ids.max() >= len(self._grupo_de):
+            capacidad = max(int(ids.max()) + 1, 2 * len(self._grupo_de))
+            grupo_de = np.full(capacidad, -1, dtype=np.int16)
+            grupo_de[:len(self._grupo_de)] = self._grupo_de
+            self._grupo_de = grupo_de
+            self._posicion_de = np.resize(self._posicion_de, capacidad)
+        self._grupo_de[ids] = grupo[0] * len(_MOTORES) + grupo[1]
+        self._posicion_de[ids] = posiciones
+    
+    def _eliminar(self, vehiculo_id: int) -> None:
+        ubicacion = self._ubicacion(vehiculo_id)
+        if ubicacion is None:
+            return
+        grupo, posicion = ubicacion
+        self._grupo_de[vehiculo_id] = -1
+        movido = self._bloques[grupo].quitar(posicion)
+        if movido is not None:
+            self._posicion_de[movido] = posicion
+    
+    def _construir(self) -> None:
+        """Carga todos los vehículos activos y disponibles con una consulta y los agrupa.
+        Las filas se leen por partes para no tener todas en memoria como tuplas."""
+        partes = []
+        with db_service.get_session(solo_lectura=True) as session:
+            # Sin cargar entidades del ORM: solo las columnas, por la conexión
+            resultado = session.connection().execution_options(yield_per=FILAS_POR_PARTE).execute(
+                select(
+                    Vehiculo.id, Vehiculo.precio, Vehiculo.año, Vehiculo.kilometraje,
+                    Vehiculo.tipo_vehiculo, Vehiculo.tipo_motor, Vehiculo.marca,
+                    Vehiculo.ubicacion_provincia,
+                ).where(Vehiculo.activo == True, Vehiculo.estado == EstadoVehiculo.DISPONIBLE)
+            )
+            for filas in resultado.partitions():
+                ids, precios, años, kilometrajes, tipos, motores, marcas, provincias = zip(*filas)
+                partes.append((
+                    np.array(ids, dtype=np.int64),
+                    _escalar(precios, años, kilometrajes),
+                    np.array([self._codigo(self._marcas, m) for m in marcas], dtype=np.int32),
+                    np.array([self._codigo(self._provincias, p) for p in provincias], dtype=np.int32),
+                    np.array([_TIPOS[t] * len(_MOTORES) + _MOTORES[m] for t, m in zip(tipos, motores)],
+                             dtype=np.int32),
+                ))
+        if partes:
+            ids, numericas, marcas, provincias, grupos = (
+                np.concatenate(columna, axis=-1) for columna in zip(*partes)
+            )
+        else:
+            ids, grupos = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        
+        orden = np.argsort(grupos, kind="stable")
+        limites = np.flatnonzero(np.diff(grupos[orden])) + 1
+        self._bloques = {}
+        self._grupo_de = np.empty(0, dtype=np.int16)
+        for seleccion in np.split(orden, limites) if len(orden) else []:
+            grupo = divmod(int(grupos[seleccion[0]]), len(_MOTORES))
+            bloque = _Bloque(ids[seleccion], numericas[:, seleccion].copy(),
+                             marcas[seleccion], provincias[seleccion])
+            self._bloques[grupo] = bloque
+            self._ubicar(bloque.ids, grupo, np.arange(bloque.n))
+    
+    def _asegurar(self) -> None:
+        if self._bloques is None:
+            self._construir()
+    
+    def sincronizar(self, vehiculo: Vehiculo) -> None:
+        """Refleja en el índice el estado actual de un vehículo (alta, cambio, venta o baja)"""
+        with self._lock:
+            if self._bloques is None:
+                return  # se construirá completo en la primera búsqueda
+            self._eliminar(vehiculo.id)
+            if vehiculo.activo and vehiculo.estado == EstadoVehiculo.DISPONIBLE:
+                grupo, numericas, marca, provincia = self._caracteristicas(vehiculo)
+                if grupo not in self._bloques:
+                    self._bloques[grupo] = _Bloque.vacio()
+                posicion = self._bloques[grupo].agregar(vehiculo.id, numericas, marca, provincia)
+                self._ubicar(np.array([vehiculo.id]), grupo, np.array([posicion]))
+    
+    def invalidar(self) -> None:
+        """Descarta el índice; se reconstruye en la siguiente búsqueda (p. ej. tras una importación)"""
+        with self._lock:
+            self._bloques = None
+            self._grupo_de = np.empty(0, dtype=np.int16)
+            self._posicion_de = np.empty(0, dtype=np.int32)
+    
+    def __len__(self) -> int:
+        with self._lock:
+            self._asegurar()
+            return sum(bloque.n for bloque in self._bloques.values())
+    
+    # ==================== BÚSQUEDA ====================
+    
+    def vecinos(self, vehiculo_id: int, k: int) -> Optional[List[int]]:
+        """Ids de los k vehículos más parecidos a uno del índice, del más al menos parecido.
+        None si el vehículo no está en el índice (vendido, inactivo o inexistente)."""
+        with self._lock:
+            self._asegurar()
+            ubicacion = self._ubicacion(vehiculo_id)
+            if ubicacion is None:
+                return None
+            grupo, posicion = ubicacion
+            bloque = self._bloques[grupo]
+            return self._buscar(grupo, bloque.numericas[:, posicion].copy(), int(bloque.marcas[posicion]),
+                                int(bloque.provincias[posicion]), k, excluir=vehiculo_id)
+    
+    def vecinos_de(self, vehiculo: Vehiculo, k: int) -> List[int]:
+        """Ids de los k vehículos del índice más parecidos a un vehículo cualquiera"""
+        with self._lock:
+            self._asegurar()
+            return self._buscar(*self._caracteristicas(vehiculo), k, excluir=vehiculo.id)
+    
+    def _buscar(self, grupo: Grupo, numericas: np.ndarray, marca: int, provincia: int,
+                k: int, excluir: Optional[int]) -> List[int]:
+        # Penalización mínima de cada grupo respecto a la consulta, de menor a mayor
+        cotas = sorted(
+            (PENALIZACION_TIPO * (g[0] != grupo[0]) + PENALIZACION_MOTOR * (g[1] != grupo[1]), g)
+            for g, bloque in self._bloques.items() if bloque.n
+        )
+        # Se pide uno más por si el propio vehículo está entre los resultados
+        n_buscados = k + (excluir is not None)
+        mejores_d = np.empty(0, dtype=np.float32)
+        mejores_ids = np.empty(0, dtype=np.int64)
+        for cota, g in cotas:
+            if len(mejores_d) >= n_buscados and cota >= mejores_d.max():
+                break  # ningún vehículo de este grupo ni de los siguientes puede entrar
+            bloque = self._bloques[g]
+            n = bloque.n
+            distancias = np.square(bloque.numericas[0, :n] - numericas[0])
+            for i in (1, 2):
+                distancias += np.square(bloque.numericas[i, :n] - numericas[i])
+            distancias += np.float32(cota)
+            distancias += np.float32(PENALIZACION_MARCA) * (bloque.marcas[:n] != marca)
+            distancias += np.float32(PENALIZACION_PROVINCIA) * (bloque.provincias[:n] != provincia)
+            if n > n_buscados:
+                seleccion = np.argpartition(distancias, n_buscados)[:n_buscados]
+            else:
+                seleccion = np.arange(n)
+            mejores_d = np.concatenate([mejores_d, distancias[seleccion]])
+            mejores_ids = np.concatenate([mejores_ids, bloque.ids[seleccion]])
+            if len(mejores_d) > n_buscados:
+                seleccion = np.argpartition(mejores_d, n_buscados)[:n_buscados]
+                mejores_d, mejores_ids = mejores_d[seleccion], mejores_ids[seleccion]
+        
+        orden = np.argsort(mejores_d, kind="stable")
+        return [int(i) for i in mejores_ids[orden] if i != excluir][:k]
+
+# Instancia global
+indice_similitud = IndiceSimilitud()
@@ -0,0 +1,112 @@
+"""
+Servicio asíncrono de vehículos
+Versión de VehiculosService para los manejadores de eventos de Reflex.
+
+Los manejadores se ejecutan en el bucle de asyncio, y una consulta síncrona bloquea el
+bucle y con él a todos los clientes conectados. AsyncVehiculosService expone los mismos
+métodos que VehiculosService como corrutinas que se ejecutan en un pool de hilos
+acotado. Mientras SQLite trabaja (sin el GIL) el bucle sigue atendiendo otros eventos,
+y las lecturas independientes pueden lanzarse a la vez con asyncio.gather.
+
+    vehiculos = await vehiculos_async.buscar_vehiculos(filtros, limite=20)
+    inicio = await vehiculos_async.obtener_inicio()
+    async for bloque in vehiculos_async.iterar_vehiculos_vendedor(vendedor_id):
+        ...
+
+Los métodos generadores (iterar_vehiculos_vendedor) son iteradores asíncronos: cada
+elemento, y con él su consulta, se pide en el pool.
+
+Con SQLite un motor asíncrono (aiosqlite) también ejecuta cada conexión en un hilo, así
+que el pool da el mismo resultado sin duplicar la lógica del servicio.
+"""
+import asyncio
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from .vehiculos_service import VehiculosService, vehiculos_service
+from .instrumentacion import con_mediciones
+from .motor import cargar_configuracion
+
+# Hilos del pool por núcleo: SQLite libera el GIL, pero la parte ORM es Python y con más
+# hilos compiten por él
+HILOS_POR_NUCLEO = 4
+
+def hilos_por_defecto() -> int:
+    """4 por núcleo sin superar las conexiones del pool de lectura de motor.py
+    (sqlite_lectores, sin overflow): los hilos de más solo esperarían una conexión libre"""
+    return min(HILOS_POR_NUCLEO * (os.cpu_count() or 1), cargar_configuracion().lectores)
+
+class AsyncVehiculosService:
+    """Servicio de vehículos con métodos asíncronos"""
+    
+    def __init__(self, servicio: Optional[VehiculosService] = None, max_hilos: Optional[int] = None):
+        self.servicio = servicio or vehiculos_service
+        self.max_hilos = max_hilos
+        self._pool: Optional[ThreadPoolExecutor] = None
+    
+    async def ejecutar(self, funcion: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecuta una función síncrona en el pool sin bloquear el bucle de eventos"""
+        if self._pool is None:
+            self.max_hilos = self.max_hilos or hilos_por_defecto()
+            self._pool = ThreadPoolExecutor(max_workers=self.max_hilos, thread_name_prefix="vehiculos-db")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, partial(con_mediciones(funcion), *args, **kwargs))
+    
+    async def obtener_inicio(self, limite: int = 10) -> Dict[str, Any]:
+        """Destacados, recientes, más visitados y tendencias de la página de inicio, consultados a la vez"""
+        destacados, recientes, mas_visitados, tendencias = await asyncio.gather(
+            self.obtener_destacados(limite),
+            self.obtener_recientes(limite),
+            self.obtener_mas_visitados(limite),
+            self.obtener_tendencias(limite),
+        )
+        return {"destacados": destacados, "recientes": recientes, "mas_visitados": mas_visitados,
+                "tendencias": tendencias}
+    
+    def cerrar(self) -> None:
+        """Espera a las operaciones en curso y cierra el pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+def _version_asincrona(nombre: str) -> Callable[..., Any]:
+    """Corrutina que ejecuta en el pool el método del mismo nombre de VehiculosService"""
+    @wraps(getattr(VehiculosService, nombre))
+    async def metodo(self: AsyncVehiculosService, *args, **kwargs):
+        return await self.ejecutar(getattr(self.servicio, nombre), *args, **kwargs)
+    return metodo
+
+# Marca de fin del generador en next()
+_FIN = object()
+
+def _iterador_asincrono(nombre: str) -> Callable[..., AsyncIterator[Any]]:
+    """Iterador asíncrono sobre el generador del mismo nombre de VehiculosService: cada
+    next() se ejecuta en el pool, así que ninguna consulta del generador corre en el bucle"""
+    @wraps(getattr(VehiculosService, nombre))
+    async def metodo(self: AsyncVehiculosService, *args, **kwargs):
+        # Crear el generador no ejecuta nada de su cuerpo
+        iterador = getattr(self.servicio, nombre)(*args, **kwargs)
+        try:
+            while True:
+                elemento = await self.ejecutar(next, iterador, _FIN)
+                if elemento is _FIN:
+                    return
+                yield elemento
+        finally:
+            if inspect.getgeneratorstate(iterador) != inspect.GEN_CLOSED:
+                # Se ha dejado a medias: cierra el generador (y lo que tenga abierto) en el pool
+                await self.ejecutar(iterador.close)
+    return metodo
+
+# Mismos métodos públicos que VehiculosService (instrumentar los envuelve: se mira el original)
+for _nombre, _funcion in inspect.getmembers(VehiculosService, inspect.isfunction):
+    if not _nombre.startswith("_"):
+        es_generador = inspect.isgeneratorfunction(inspect.unwrap(_funcion))
+        setattr(AsyncVehiculosService, _nombre,
+                _iterador_asincrono(_nombre) if es_generador else _version_asincrona(_nombre))
+
+# Instancia global
+vehiculos_async = AsyncVehiculosService()
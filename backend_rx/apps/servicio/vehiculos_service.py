@@ -3,24 +3,42 @@ Servicio de Gestión de Vehículos
 Contiene la lógica de negocio para la gestión de vehículos en el ecosistema de negocios de autos.
 Autor: Ibar - Tech Lead Backend
 """
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Iterator
 from datetime import datetime, timedelta
-from sqlmodel import select, and_, or_, desc, asc, func
+from functools import partial
+from sqlmodel import select, update, and_, or_, desc, asc, func, case
+from sqlalchemy import DateTime, bindparam
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.attributes import set_committed_value
 
 # Importar modelos y servicios
 from ..modelos.vehiculo import Vehiculo, TipoMotor, EstadoVehiculo, TipoVehiculo
 from ..modelos.usuario import Usuario, TipoUsuario
 from ..modelos.validaciones import validar_datos_vehiculo
 from .base_datos import db_service, transactional
+from .instrumentacion import instrumentar
+from . import busqueda_texto, estadisticas, geografia
+from .contador_vistas import buffer_vistas
+from .similitud import indice_similitud
+from .ranking import ranking_vistas
+from .facetas import indice_facetas
+from .alertas import alertas_service
 
+@instrumentar()
 class VehiculosService:
     """Servicio para gestión completa de vehículos"""
     
     def __init__(self):
         self.db = db_service
+        self.vistas = buffer_vistas
+        self.similitud = indice_similitud
+        self.ranking = ranking_vistas
+        self.facetas = indice_facetas
+        self.alertas = alertas_service
     
     # ==================== OPERACIONES BÁSICAS CRUD ====================
     
+    @transactional
     def crear_vehiculo(self, datos_vehiculo: Dict[str, Any], vendedor_id: int) -> Tuple[bool, str, Optional[Vehiculo]]:
         """Crea un nuevo vehículo con validaciones"""
         try:
@@ -46,13 +64,17 @@ class VehiculosService:
                 activo=True,
                 vistas=0
             )
+            geografia.ubicar(vehiculo)
             
             # Guardar en base de datos
             vehiculo_creado = self.db.create(vehiculo)
+            estadisticas.registrar_cambio(None, estadisticas.huella(vehiculo_creado))
+            self._sincronizar(vehiculo_creado)
+            # Avisos de búsquedas guardadas en segundo plano, solo si se confirma el alta
+            self.db.al_confirmar(partial(self.alertas.encolar, vehiculo_creado.id))
             
             # Actualizar estadísticas del vendedor
-            vendedor.vehiculos_publicados += 1
-            self.db.update(vendedor)
+            self._incrementar_contador(vendedor_id, Usuario.vehiculos_publicados)
             
             return True, "Vehículo creado exitosamente", vehiculo_creado
             
@@ -60,15 +82,27 @@ class VehiculosService:
             return False, f"Error al crear vehículo: {str(e)}", None
     
     def obtener_vehiculo(self, vehiculo_id: int, incrementar_vista: bool = False) -> Optional[Vehiculo]:
-        """Obtiene un vehículo por ID con opción de incrementar vistas"""
+        """Obtiene un vehículo por ID con opción de incrementar vistas.
+        La vista se acumula en el buffer de vistas y se escribe en lote más tarde."""
         vehiculo = self.db.get_by_id(Vehiculo, vehiculo_id)
         
         if vehiculo and incrementar_vista and vehiculo.activo:
-            vehiculo.incrementar_vistas()
-            self.db.update(vehiculo)
+            self.vistas.registrar(vehiculo_id)
+            self.ranking.registrar_vista(vehiculo)
         
+        if vehiculo:
+            self._sumar_vistas_pendientes([vehiculo])
         return vehiculo
     
+    def _sumar_vistas_pendientes(self, vehiculos: List[Vehiculo]) -> None:
+        """Muestra en vistas las que siguen en el buffer, sin marcar el atributo como modificado
+        (un db.update posterior no lo escribe y no se cuentan dos veces)"""
+        for vehiculo in vehiculos:
+            pendientes = self.vistas.pendientes(vehiculo.id)
+            if pendientes:
+                set_committed_value(vehiculo, 'vistas', vehiculo.vistas + pendientes)
+    
+    @transactional
     def actualizar_vehiculo(self, vehiculo_id: int, datos_actualizacion: Dict[str, Any], 
                         usuario_id: int) -> Tuple[bool, str, Optional[Vehiculo]]:
         """Actualiza un vehículo existente"""
@@ -83,6 +117,8 @@ class VehiculosService:
                 if not usuario or usuario.tipo_usuario != TipoUsuario.ADMIN:
                     return False, "Sin permisos para actualizar este vehículo", None
             
+            huella_anterior = estadisticas.huella(vehiculo)
+            
             # Actualizar campos permitidos
             campos_actualizables = [
                 'precio', 'precio_negociable', 'descripcion', 'caracteristicas_extras',
@@ -94,14 +130,20 @@ class VehiculosService:
                 if campo in campos_actualizables and hasattr(vehiculo, campo):
                     setattr(vehiculo, campo, valor)
             
+            if {'ubicacion_ciudad', 'ubicacion_provincia'} & datos_actualizacion.keys():
+                geografia.ubicar(vehiculo)
+            
             vehiculo.fecha_actualizacion = datetime.now()
             vehiculo_actualizado = self.db.update(vehiculo)
+            estadisticas.registrar_cambio(huella_anterior, estadisticas.huella(vehiculo_actualizado))
+            self._sincronizar(vehiculo_actualizado)
             
             return True, "Vehículo actualizado exitosamente", vehiculo_actualizado
             
         except Exception as e:
             return False, f"Error al actualizar vehículo: {str(e)}", None
     
+    @transactional
     def eliminar_vehiculo(self, vehiculo_id: int, usuario_id: int, 
                         motivo: str = "Eliminado por el usuario") -> Tuple[bool, str]:
         """Elimina (soft delete) un vehículo"""
@@ -116,11 +158,18 @@ class VehiculosService:
                 if not usuario or usuario.tipo_usuario != TipoUsuario.ADMIN:
                     return False, "Sin permisos para eliminar este vehículo"
             
+            if vehiculo.estado == EstadoVehiculo.RESERVADO:
+                # Inactivo, el comprador ya no podría confirmar la compra (checkout_service.py)
+                return False, "El vehículo tiene una reserva en curso"
+            
             # Soft delete
+            huella_anterior = estadisticas.huella(vehiculo)
             vehiculo.activo = False
             vehiculo.motivo_inactivo = motivo
             vehiculo.fecha_actualizacion = datetime.now()
             self.db.update(vehiculo)
+            estadisticas.registrar_cambio(huella_anterior, estadisticas.huella(vehiculo))
+            self._sincronizar(vehiculo)
             
             return True, "Vehículo eliminado exitosamente"
             
@@ -130,8 +179,18 @@ class VehiculosService:
     # ==================== BÚSQUEDA Y FILTRADO ====================
     
     def buscar_vehiculos(self, filtros: Dict[str, Any] = None, 
-                        limite: int = 20, pagina: int = 1) -> Dict[str, Any]:
-        """Búsqueda avanzada de vehículos con filtros y paginación"""
+                        limite: int = 20, pagina: int = 1,
+                        modo_total: str = 'separado', facetas: bool = False,
+                        proyeccion: Optional[type] = None) -> Dict[str, Any]:
+        """Búsqueda avanzada de vehículos con filtros y paginación por número de página.
+        modo_total: 'separado' (COUNT en la misma sesión), 'ventana' (COUNT(*) OVER ()
+        en la misma consulta) o 'ninguno' (total y total_paginas son None).
+        Con facetas se añaden los recuentos por marca, provincia, motor, tipo, años y precio
+        para los filtros actuales (clave 'facetas'); el total sale de ellos sin COUNT.
+        Los filtros 'cerca' y 'caja' buscan por distancia (ver geografia.filtros_ubicacion);
+        con 'cerca' se puede ordenar por 'distancia' y se añaden las distancias en km por id.
+        Con proyeccion=TarjetaVehiculo se leen solo las columnas de la tarjeta del listado.
+        Para páginas profundas usar buscar_vehiculos_cursor."""
         offset = (pagina - 1) * limite
         filtros = filtros or {}
         
@@ -141,29 +200,43 @@ class VehiculosService:
             "estado": EstadoVehiculo.DISPONIBLE
         }
         
-        # Combinar filtros
-        filtros_finales = {**filtros_base, **filtros}
-        
         try:
-            vehiculos = self.db.search(
+            # Combinar filtros
+            filtros_finales = {**filtros_base, **geografia.filtros_ubicacion(filtros)}
+            recuentos = self.facetas.contar(filtros_finales) if facetas else None
+            
+            # Sin total se pide un elemento extra para saber si hay página siguiente
+            con_total = modo_total != 'ninguno'
+            vehiculos, total = self.db.search_with_count(
                 Vehiculo, 
                 filtros_finales, 
-                limit=limite, 
+                limit=limite if con_total else limite + 1, 
                 offset=offset,
-                order_by=filtros.get('order_by', '-fecha_creacion')
+                order_by=filtros.get('order_by', '-fecha_creacion'),
+                total='ninguno' if recuentos is not None else modo_total,
+                proyeccion=proyeccion
             )
+            if recuentos is not None and con_total:
+                total = recuentos["total"]
             
-            total = self.db.count(Vehiculo, filtros_finales)
-            total_paginas = (total + limite - 1) // limite
+            if con_total:
+                total_paginas = (total + limite - 1) // limite
+                has_siguiente = pagina < total_paginas
+            else:
+                total_paginas = None
+                has_siguiente = len(vehiculos) > limite
+                vehiculos = vehiculos[:limite]
             
             return {
                 "vehiculos": vehiculos,
                 "total": total,
                 "pagina_actual": pagina,
                 "total_paginas": total_paginas,
-                "has_siguiente": pagina < total_paginas,
+                "has_siguiente": has_siguiente,
                 "has_anterior": pagina > 1,
-                "limite": limite
+                "limite": limite,
+                **({"facetas": recuentos} if facetas else {}),
+                **({"distancias": self._distancias(filtros["cerca"], vehiculos)} if filtros.get("cerca") else {})
             }
             
         except Exception as e:
@@ -178,9 +251,81 @@ class VehiculosService:
                 "error": str(e)
             }
     
-    def buscar_por_texto(self, query: str, limite: int = 20) -> List[Vehiculo]:
-        """Búsqueda de texto libre en marca, modelo y descripción"""
-        with self.db.get_session() as session:
+    def buscar_vehiculos_cursor(self, filtros: Dict[str, Any] = None, limite: int = 20,
+                                cursor: Optional[str] = None, proyeccion: Optional[type] = None,
+                                total: bool = False) -> Dict[str, Any]:
+        """Búsqueda paginada por cursor: coste constante en cualquier página y estable ante inserciones.
+        Con total se añade el número de coincidencias (de las facetas en memoria)"""
+        filtros = filtros or {}
+        
+        try:
+            filtros_finales = {
+                "activo": True,
+                "estado": EstadoVehiculo.DISPONIBLE,
+                **geografia.filtros_ubicacion(filtros)
+            }
+            
+            vehiculos, siguiente_cursor = self.db.search_keyset(
+                Vehiculo,
+                filtros_finales,
+                limit=limite,
+                order_by=filtros.get('order_by', '-fecha_creacion'),
+                cursor=cursor,
+                proyeccion=proyeccion
+            )
+            
+            return {
+                "vehiculos": vehiculos,
+                "siguiente_cursor": siguiente_cursor,
+                "has_siguiente": siguiente_cursor is not None,
+                "limite": limite,
+                **({"total": self._contar(filtros_finales)} if total else {})
+            }
+        
+        except Exception as e:
+            return {
+                "vehiculos": [],
+                "siguiente_cursor": None,
+                "has_siguiente": False,
+                "limite": limite,
+                "error": str(e)
+            }
+    
+    def _contar(self, filtros: Dict[str, Any]) -> int:
+        """Coincidencias de los filtros: de las facetas en memoria o, si no las cubren, con COUNT"""
+        recuentos = self.facetas.contar(filtros)
+        if recuentos is not None:
+            return recuentos["total"]
+        return self.db.count(Vehiculo, filtros)
+    
+    def _distancias(self, cerca: Dict[str, Any], vehiculos: List[Vehiculo]) -> Dict[int, float]:
+        """Distancia en km de cada vehículo al centro del filtro 'cerca'"""
+        latitud, longitud = geografia.centro(cerca)
+        return {
+            v.id: round(geografia.distancia_km(latitud, longitud, v.latitud, v.longitud), 1)
+            for v in vehiculos if v.latitud is not None
+        }
+    
+    def buscar_por_texto(self, query: str, limite: int = 20, pagina: int = 1) -> List[Vehiculo]:
+        """Búsqueda de texto libre en marca, modelo y descripción, ordenada por relevancia.
+        Ignora mayúsculas y acentos y busca por prefijo (autocompletado)."""
+        consulta = busqueda_texto.construir_consulta(query)
+        if not consulta:
+            return []
+        
+        offset = (pagina - 1) * limite
+        with self.db.get_session(solo_lectura=True) as session:
+            try:
+                return busqueda_texto.buscar(session, consulta, limite, offset)
+            except OperationalError:
+                # Sin índice FTS5 (no creado o SQLite sin FTS5): búsqueda por LIKE
+                session.rollback()
+        
+        return self._buscar_por_texto_like(query, limite, offset)
+    
+    def _buscar_por_texto_like(self, query: str, limite: int, offset: int) -> List[Vehiculo]:
+        """Búsqueda de texto con LIKE: recorre la tabla entera, solo como respaldo"""
+        with self.db.get_session(solo_lectura=True) as session:
             query_lower = query.lower()
             
             statement = select(Vehiculo).where(
@@ -193,127 +338,94 @@ class VehiculosService:
                         func.lower(Vehiculo.descripcion).contains(query_lower)
                     )
                 )
-            ).limit(limite)
+            ).offset(offset).limit(limite)
             
             return list(session.exec(statement).all())
     
     def obtener_filtros_disponibles(self) -> Dict[str, List[Any]]:
-        """Obtiene todos los valores únicos para filtros"""
-        with self.db.get_session() as session:
-            # Obtener marcas únicas
-            marcas = list(session.exec(
-                select(Vehiculo.marca).distinct().where(Vehiculo.activo == True)
-            ).all())
-            
-            # Obtener provincias únicas
-            provincias = list(session.exec(
-                select(Vehiculo.ubicacion_provincia).distinct().where(Vehiculo.activo == True)
-            ).all())
-            
-            # Tipos de motor disponibles
-            tipos_motor = [motor.value for motor in TipoMotor]
-            
-            # Tipos de vehículo disponibles
-            tipos_vehiculo = [tipo.value for tipo in TipoVehiculo]
-            
-            # Rangos de años
-            años = list(range(datetime.now().year, 1950, -1))
-            
-            # Rangos de precios predefinidos
-            rangos_precios = [
-                {"label": "< 5.000€", "min": 0, "max": 5000},
-                {"label": "5.000€ - 10.000€", "min": 5000, "max": 10000},
-                {"label": "10.000€ - 20.000€", "min": 10000, "max": 20000},
-                {"label": "20.000€ - 35.000€", "min": 20000, "max": 35000},
-                {"label": "35.000€ - 50.000€", "min": 35000, "max": 50000},
-                {"label": "> 50.000€", "min": 50000, "max": 999999}
-            ]
-            
-            return {
-                "marcas": sorted(marcas),
-                "provincias": sorted(provincias),
-                "tipos_motor": tipos_motor,
-                "tipos_vehiculo": tipos_vehiculo,
-                "años": años,
-                "rangos_precios": rangos_precios
-            }
+        """Obtiene todos los valores únicos para filtros, con el número de vehículos disponibles
+        de cada uno (recuentos en memoria, cacheados hasta el siguiente cambio de anuncios)"""
+        facetas = self.facetas.contar({})
+        
+        return {
+            "marcas": sorted(f["valor"] for f in facetas["marcas"]),
+            "provincias": sorted(f["valor"] for f in facetas["provincias"]),
+            "tipos_motor": [motor.value for motor in TipoMotor],
+            "tipos_vehiculo": [tipo.value for tipo in TipoVehiculo],
+            "años": list(range(datetime.now().year, 1950, -1)),
+            "rangos_precios": facetas["rangos_precios"],
+            "facetas": facetas
+        }
     
     # ==================== VEHÍCULOS DESTACADOS Y RECOMENDACIONES ====================
     
-    def obtener_destacados(self, limite: int = 10) -> List[Vehiculo]:
+    def obtener_destacados(self, limite: int = 10, proyeccion: Optional[type] = None) -> List[Vehiculo]:
         """Obtiene vehículos marcados como destacados"""
         filtros = {
             "activo": True,
             "estado": EstadoVehiculo.DISPONIBLE,
             "destacado": True
         }
-        return self.db.search(Vehiculo, filtros, limit=limite, order_by='-fecha_creacion')
+        return self.db.search(Vehiculo, filtros, limit=limite, order_by='-fecha_creacion', proyeccion=proyeccion)
     
-    def obtener_recientes(self, limite: int = 10, dias: int = 7) -> List[Vehiculo]:
+    def obtener_recientes(self, limite: int = 10, dias: int = 7, proyeccion: Optional[type] = None) -> List[Vehiculo]:
         """Obtiene vehículos publicados recientemente"""
-        fecha_limite = datetime.now() - timedelta(days=dias)
-        
-        with self.db.get_session() as session:
-            statement = select(Vehiculo).where(
-                and_(
-                    Vehiculo.activo == True,
-                    Vehiculo.estado == EstadoVehiculo.DISPONIBLE,
-                    Vehiculo.fecha_creacion >= fecha_limite
-                )
-            ).order_by(desc(Vehiculo.fecha_creacion)).limit(limite)
-            
-            return list(session.exec(statement).all())
-    
-    def obtener_mas_visitados(self, limite: int = 10) -> List[Vehiculo]:
-        """Obtiene vehículos más visitados"""
         filtros = {
             "activo": True,
-            "estado": EstadoVehiculo.DISPONIBLE
+            "estado": EstadoVehiculo.DISPONIBLE,
+            "fecha_creacion": {"gte": datetime.now() - timedelta(days=dias)}
         }
-        return self.db.search(Vehiculo, filtros, limit=limite, order_by='-vistas')
+        return self.db.search(Vehiculo, filtros, limit=limite, order_by='-fecha_creacion', proyeccion=proyeccion)
     
-    def obtener_similares(self, vehiculo_id: int, limite: int = 5) -> List[Vehiculo]:
-        """Obtiene vehículos similares basados en marca, precio y tipo"""
-        vehiculo = self.db.get_by_id(Vehiculo, vehiculo_id)
-        if not vehiculo:
+    def obtener_mas_visitados(self, limite: int = 10, tipo_vehiculo: Optional[TipoVehiculo] = None,
+                              provincia: Optional[str] = None) -> List[Vehiculo]:
+        """Obtiene los vehículos con más vistas (incluidas las aún no volcadas), opcionalmente
+        de un tipo de vehículo o una provincia"""
+        # Margen por si el ranking de este proceso aún no sabe de una venta o una baja
+        ids = self.ranking.mas_visitados(2 * limite, tipo_vehiculo, provincia)
+        vehiculos = self._obtener_disponibles(ids)[:limite]
+        self._sumar_vistas_pendientes(vehiculos)
+        return vehiculos
+    
+    def obtener_tendencias(self, limite: int = 10, tipo_vehiculo: Optional[TipoVehiculo] = None,
+                           provincia: Optional[str] = None) -> List[Vehiculo]:
+        """Obtiene los vehículos con más vistas recientes: cada vista pierde la mitad de su peso
+        por cada vida media (ranking.VIDA_MEDIA_HORAS)"""
+        ids = self.ranking.tendencias(2 * limite, tipo_vehiculo, provincia)
+        vehiculos = self._obtener_disponibles(ids)[:limite]
+        self._sumar_vistas_pendientes(vehiculos)
+        return vehiculos
+    
+    def _obtener_disponibles(self, ids: List[int]) -> List[Vehiculo]:
+        """Vehículos activos y disponibles con esos ids, en el mismo orden (una consulta)"""
+        if not ids:
             return []
-        
-        # Rango de precios (±20%)
-        precio_min = vehiculo.precio * 0.8
-        precio_max = vehiculo.precio * 1.2
-        
-        with self.db.get_session() as session:
+        with self.db.get_session(solo_lectura=True) as session:
             statement = select(Vehiculo).where(
                 and_(
-                    Vehiculo.id != vehiculo_id,
+                    Vehiculo.id.in_(ids),
                     Vehiculo.activo == True,
-                    Vehiculo.estado == EstadoVehiculo.DISPONIBLE,
-                    Vehiculo.marca == vehiculo.marca,
-                    Vehiculo.precio.between(precio_min, precio_max)
+                    Vehiculo.estado == EstadoVehiculo.DISPONIBLE
                 )
-            ).limit(limite)
-            
-            similares = list(session.exec(statement).all())
-            
-            # Si no hay suficientes de la misma marca, buscar por tipo de vehículo
-            if len(similares) < limite:
-                statement2 = select(Vehiculo).where(
-                    and_(
-                        Vehiculo.id != vehiculo_id,
-                        Vehiculo.activo == True,
-                        Vehiculo.estado == EstadoVehiculo.DISPONIBLE,
-                        Vehiculo.tipo_vehiculo == vehiculo.tipo_vehiculo,
-                        Vehiculo.precio.between(precio_min, precio_max),
-                        Vehiculo.marca != vehiculo.marca  # Diferente marca
-                    )
-                ).limit(limite - len(similares))
-                
-                similares.extend(list(session.exec(statement2).all()))
-            
-            return similares[:limite]
+            )
+            por_id = {v.id: v for v in session.exec(statement).all()}
+        return [por_id[i] for i in ids if i in por_id]
+    
+    def obtener_similares(self, vehiculo_id: int, limite: int = 5) -> List[Vehiculo]:
+        """Obtiene los vehículos más parecidos por precio, año, kilometraje, motor, tipo, marca y provincia"""
+        # Se piden algunos de más por si el índice de este proceso está desfasado
+        candidatos = self.similitud.vecinos(vehiculo_id, 2 * limite)
+        if candidatos is None:
+            # Vendido o inactivo: se buscan los parecidos a partir de sus datos
+            vehiculo = self.db.get_by_id(Vehiculo, vehiculo_id)
+            if not vehiculo:
+                return []
+            candidatos = self.similitud.vecinos_de(vehiculo, 2 * limite)
+        return self._obtener_disponibles(candidatos)[:limite]
     
     # ==================== GESTIÓN DE ESTADO ====================
     
+    @transactional
     def marcar_como_vendido(self, vehiculo_id: int, usuario_id: int) -> Tuple[bool, str]:
         """Marca un vehículo como vendido"""
         try:
@@ -327,20 +439,47 @@ class VehiculosService:
                 if not usuario or usuario.tipo_usuario != TipoUsuario.ADMIN:
                     return False, "Sin permisos para modificar este vehículo"
             
+            if vehiculo.estado == EstadoVehiculo.RESERVADO:
+                # La venta de una reserva la confirma el comprador (checkout_service.py)
+                return False, "El vehículo tiene una reserva en curso"
+            
+            huella_anterior = estadisticas.huella(vehiculo)
             vehiculo.marcar_como_vendido()
             self.db.update(vehiculo)
+            estadisticas.registrar_cambio(huella_anterior, estadisticas.huella(vehiculo))
+            self._sincronizar(vehiculo)
             
             # Actualizar estadísticas del vendedor
-            vendedor = self.db.get_by_id(Usuario, vehiculo.vendedor_id)
-            if vendedor:
-                vendedor.actualizar_estadisticas(vehiculo_vendido=True)
-                self.db.update(vendedor)
+            self._incrementar_contador(vehiculo.vendedor_id, Usuario.vehiculos_vendidos,
+                                       fecha_actualizacion=datetime.now())
             
             return True, "Vehículo marcado como vendido"
             
         except Exception as e:
             return False, f"Error al marcar como vendido: {str(e)}"
     
+    def _sincronizar(self, vehiculo: Vehiculo) -> None:
+        """Refleja el cambio en los índices en memoria después del commit; si la transacción
+        se deshace, los índices no llegan a verlo"""
+        def sincronizar() -> None:
+            self.similitud.sincronizar(vehiculo)
+            self.ranking.sincronizar(vehiculo)
+            self.facetas.sincronizar(vehiculo)
+        self.db.al_confirmar(sincronizar)
+    
+    def _incrementar_contador(self, vendedor_id: int, contador, **valores: Any) -> None:
+        """Suma uno a un contador del vendedor en el propio UPDATE. Leerlo, sumar en Python y
+        guardarlo pierde incrementos cuando dos peticiones lo hacen a la vez"""
+        with self.db.get_session() as session:
+            session.execute(
+                update(Usuario).where(Usuario.id == vendedor_id)
+                .values({contador: contador + 1, **valores})
+                .execution_options(synchronize_session=False)
+            )
+            if not self.db.in_transaction():
+                session.commit()
+    
+    @transactional
     def destacar_vehiculo(self, vehiculo_id: int, usuario_id: int) -> Tuple[bool, str]:
         """Marca un vehículo como destacado"""
         try:
@@ -363,60 +502,103 @@ class VehiculosService:
     # ==================== ESTADÍSTICAS Y REPORTES ====================
     
     def obtener_estadisticas_generales(self) -> Dict[str, Any]:
-        """Obtiene estadísticas generales de vehículos"""
-        stats = self.db.get_stats(Vehiculo)
+        """Obtiene estadísticas generales de vehículos desde los contadores incrementales"""
+        contadores = estadisticas.leer()
         
-        # Estadísticas adicionales específicas de vehículos
-        with self.db.get_session() as session:
-            # Vehículos por estado
-            por_estado = {}
-            for estado in EstadoVehiculo:
-                count = len(list(session.exec(
-                    select(Vehiculo).where(
-                        and_(Vehiculo.estado == estado, Vehiculo.activo == True)
-                    )
-                ).all()))
-                por_estado[estado.value] = count
-            
-            # Top 5 marcas
-            from sqlmodel import func
-            top_marcas = list(session.exec(
-                select(Vehiculo.marca, func.count(Vehiculo.id).label('count'))
-                .where(Vehiculo.activo == True)
-                .group_by(Vehiculo.marca)
-                .order_by(desc('count'))
-                .limit(5)
-            ).all())
-            
-            # Precio promedio por tipo de motor
-            precio_por_motor = {}
-            for tipo_motor in TipoMotor:
-                avg_precio = session.exec(
-                    select(func.avg(Vehiculo.precio))
-                    .where(
-                        and_(
-                            Vehiculo.tipo_motor == tipo_motor,
-                            Vehiculo.activo == True
-                        )
-                    )
-                ).first()
-                precio_por_motor[tipo_motor.value] = round(float(avg_precio or 0), 2)
+        def cantidad(dimension: str, clave: str) -> int:
+            return contadores.get((dimension, clave), (0, 0.0))[0]
+        
+        # Vehículos por estado
+        por_estado = {estado.value: cantidad("estado", estado.value) for estado in EstadoVehiculo}
+        
+        # Top 5 marcas
+        marcas = [
+            (clave, c) for (dimension, clave), (c, _) in contadores.items()
+            if dimension == "marca" and c > 0
+        ]
+        top_marcas = sorted(marcas, key=lambda m: (-m[1], m[0]))[:5]
         
-        stats.update({
+        # Precio promedio por tipo de motor
+        precio_por_motor = {}
+        for tipo_motor in TipoMotor:
+            c, suma = contadores.get(("tipo_motor", tipo_motor.value), (0, 0.0))
+            precio_por_motor[tipo_motor.value] = round(suma / c, 2) if c else 0.0
+        
+        return {
+            "total": cantidad("total", "*"),
             "por_estado": por_estado,
             "top_marcas": [{"marca": marca, "count": count} for marca, count in top_marcas],
             "precio_promedio_por_motor": precio_por_motor
-        })
-        
-        return stats
+        }
     
-    def obtener_vehiculos_vendedor(self, vendedor_id: int, incluir_inactivos: bool = False) -> List[Vehiculo]:
-        """Obtiene todos los vehículos de un vendedor"""
+    def obtener_vehiculos_vendedor(self, vendedor_id: int, incluir_inactivos: bool = False,
+                                   proyeccion: Optional[type] = None) -> List[Vehiculo]:
+        """Obtiene todos los vehículos de un vendedor, sin límite (ver iterar_vehiculos_vendedor)"""
+        return [
+            vehiculo
+            for bloque in self.iterar_vehiculos_vendedor(vendedor_id, incluir_inactivos, proyeccion=proyeccion)
+            for vehiculo in bloque
+        ]
+    
+    def iterar_vehiculos_vendedor(self, vendedor_id: int, incluir_inactivos: bool = False,
+                                  tamaño_bloque: int = 500,
+                                  proyeccion: Optional[type] = None) -> Iterator[List[Vehiculo]]:
+        """Inventario completo del vendedor, del más reciente al más antiguo, en bloques.
+        Cada bloque es una consulta por cursor sobre ix_vehiculo_vendedor: entre bloques no
+        queda abierta ninguna sesión ni lectura, aunque quien consume tarde en pedir el siguiente"""
         filtros = {"vendedor_id": vendedor_id}
         if not incluir_inactivos:
             filtros["activo"] = True
         
-        return self.db.search(Vehiculo, filtros, limit=1000, order_by='-fecha_creacion')
+        cursor = None
+        while True:
+            vehiculos, cursor = self.db.search_keyset(Vehiculo, filtros, tamaño_bloque, '-fecha_creacion',
+                                                      cursor, proyeccion=proyeccion)
+            if vehiculos:
+                yield vehiculos
+            if cursor is None:
+                return
+    
+    def obtener_panel_vendedor(self, vendedor_id: int) -> Dict[str, Any]:
+        """Resumen del inventario del vendedor con una consulta agrupada por activo y estado:
+        vehículos, vistas (las ya volcadas del buffer), precio medio y días en el mercado
+        (hasta la venta o la baja, o hasta hoy si sigue publicado)"""
+        ahora = bindparam("ahora", datetime.now(), type_=DateTime)
+        fuera_del_mercado = or_(Vehiculo.activo == False, Vehiculo.estado == EstadoVehiculo.VENDIDO)
+        fin = case((fuera_del_mercado, func.coalesce(Vehiculo.fecha_actualizacion, ahora)), else_=ahora)
+        statement = (
+            select(
+                Vehiculo.activo,
+                Vehiculo.estado,
+                func.count(),
+                func.sum(Vehiculo.vistas),
+                func.sum(Vehiculo.precio),
+                func.sum(func.julianday(fin) - func.julianday(Vehiculo.fecha_creacion)),
+            )
+            .where(Vehiculo.vendedor_id == vendedor_id)
+            .group_by(Vehiculo.activo, Vehiculo.estado)
+        )
+        with self.db.get_session(solo_lectura=True) as session:
+            filas = session.exec(statement).all()
+        
+        def resumen(grupos: List[tuple]) -> Dict[str, Any]:
+            cantidad = sum(g[2] for g in grupos)
+            return {
+                "cantidad": cantidad,
+                "vistas": sum(g[3] or 0 for g in grupos),
+                "precio_promedio": round(sum(g[4] or 0.0 for g in grupos) / cantidad, 2) if cantidad else 0.0,
+                "dias_en_mercado_promedio": round(sum(g[5] or 0.0 for g in grupos) / cantidad, 1) if cantidad else 0.0,
+            }
+        
+        activas = [fila for fila in filas if fila[0]]
+        return {
+            **resumen(filas),
+            "por_estado": {
+                estado.value: resumen([fila for fila in activas if fila[1] == estado])
+                for estado in EstadoVehiculo
+            },
+            "inactivos": resumen([fila for fila in filas if not fila[0]]),
+        }
 
 # Instancia global del servicio
 vehiculos_service = VehiculosService()
\ No newline at end of file
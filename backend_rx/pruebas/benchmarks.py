@@ -0,0 +1,1135 @@
+"""
+Benchmarks de servicios
+
+Mediciones de rendimiento de los servicios del backend sobre una base de datos de pruebas.
+Ejecutar desde la raíz del repositorio apuntando a una base de datos desechable:
+
+    REFLEX_DB_URL=sqlite:///bench.db python -m backend_rx.pruebas.benchmarks paginacion
+"""
+import io
+import os
+import hashlib
+import asyncio
+import sys
+import csv
+import json
+import time
+import random
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Any, List
+
+import numpy as np
+import reflex as rx
+from reflex.model import get_engine
+from sqlalchemy import event, bindparam
+from sqlmodel import select, func
+
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, EstadoVehiculo, TarjetaVehiculo
+from backend_rx.apps.modelos.usuario import Usuario
+from backend_rx.apps.modelos.foto import FotoVehiculo, EstadoFoto
+from backend_rx.apps.modelos.transaccion import Transaccion, EstadoTransaccion
+from backend_rx.apps.modelos.busqueda import BusquedaGuardada, AlertaBusqueda
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+from backend_rx.apps.servicio.vehiculos_async import vehiculos_async
+from backend_rx.apps.servicio.base_datos import db_service, _codificar_cursor
+from backend_rx.apps.servicio import estadisticas, motor
+from backend_rx.apps.servicio.importacion import importar_vehiculos, convertir_fila
+from backend_rx.apps.servicio.similitud import IndiceSimilitud
+from backend_rx.apps.servicio.ranking import RankingVistas
+from backend_rx.apps.servicio.facetas import IndiceFacetas
+from backend_rx.apps.servicio.fotos import fotos_service
+from backend_rx.apps.servicio import miniaturas
+from backend_rx.apps.servicio.checkout_service import checkout_service
+from backend_rx.apps.servicio.alertas import alertas_service, IndiceBusquedas
+from backend_rx.apps.autenticacion.autenticacion_service import autenticacion_service, ConfiguracionAutenticacion
+from backend_rx.pruebas import datos_sinteticos
+
+MARCAS = list(datos_sinteticos.MARCAS)
+PROVINCIAS = list(datos_sinteticos.PROVINCIAS)
+PALABRAS_DESCRIPCION = datos_sinteticos.PALABRAS_DESCRIPCION
+
+# ==================== PREPARACIÓN DE DATOS ====================
+
+def preparar_datos(n_vehiculos: int, semilla: int = 42) -> None:
+    """Crea las tablas y rellena la base de datos hasta tener n_vehiculos (datos sintéticos,
+    con un vendedor por cada 20 vehículos)"""
+    datos_sinteticos.generar(max(n_vehiculos // 20, 1), n_vehiculos, semilla)
+
+def medir(funcion: Callable[[], Any], repeticiones: int = 20) -> Dict[str, float]:
+    """Ejecuta la función varias veces y devuelve la mediana y el p95 en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return {
+        "mediana_ms": round(tiempos[len(tiempos) // 2], 3),
+        "p95_ms": round(tiempos[int(len(tiempos) * 0.95) - 1], 3),
+    }
+
+# ==================== BENCHMARKS ====================
+
+def bench_paginacion(limite: int = 20, pagina_profunda: int = 5000) -> Dict[str, Any]:
+    """Compara la página 1 y una página profunda con offset y con cursor"""
+    # Alrededor del 84% de los anuncios sintéticos están activos y disponibles
+    preparar_datos(int(limite * (pagina_profunda + 1) / 0.8))
+    resultados = {}
+    
+    for order_by in ['-fecha_creacion', 'precio', '-vistas']:
+        filtros = {"order_by": order_by}
+        
+        # Token de la página profunda a partir del último elemento de la página anterior
+        ultimo = vehiculos_service.db.search(
+            Vehiculo, {"activo": True, "estado": EstadoVehiculo.DISPONIBLE},
+            limit=1, offset=limite * (pagina_profunda - 1) - 1, order_by=order_by
+        )[0]
+        campo = order_by.lstrip('-')
+        cursor_profundo = _codificar_cursor(getattr(ultimo, campo), ultimo.id, order_by)
+        
+        resultados[order_by] = {
+            "offset_pagina_1": medir(lambda: vehiculos_service.buscar_vehiculos(filtros, limite, 1)),
+            f"offset_pagina_{pagina_profunda}": medir(
+                lambda: vehiculos_service.buscar_vehiculos(filtros, limite, pagina_profunda)
+            ),
+            "cursor_pagina_1": medir(lambda: vehiculos_service.buscar_vehiculos_cursor(filtros, limite)),
+            f"cursor_pagina_{pagina_profunda}": medir(
+                lambda: vehiculos_service.buscar_vehiculos_cursor(filtros, limite, cursor_profundo)
+            ),
+        }
+    return resultados
+
+def bench_busqueda(n_vehiculos: int = 100000, limite: int = 20) -> Dict[str, Any]:
+    """Página + total con conteo separado, con COUNT(*) OVER () y sin total"""
+    preparar_datos(n_vehiculos)
+    filtros = {"activo": True, "estado": EstadoVehiculo.DISPONIBLE, "precio": {"between": (10000, 30000)}}
+    db = vehiculos_service.db
+    return {
+        modo: medir(lambda modo=modo: db.search_with_count(
+            Vehiculo, filtros, limit=limite, order_by='-fecha_creacion', total=modo
+        ))
+        for modo in ('separado', 'ventana', 'ninguno')
+    }
+
+def bench_texto(n_vehiculos: int = 100000, limite: int = 20) -> Dict[str, Any]:
+    """Búsqueda de texto con FTS5 frente al LIKE de respaldo"""
+    preparar_datos(n_vehiculos)
+    consultas = {"palabra": "hibrido", "prefijo": "clim", "varias": "toyota cuero camara"}
+    resultados = {}
+    for nombre, consulta in consultas.items():
+        resultados[f"fts_{nombre}"] = medir(lambda: vehiculos_service.buscar_por_texto(consulta, limite))
+        resultados[f"fts_{nombre}_pagina_10"] = medir(
+            lambda: vehiculos_service.buscar_por_texto(consulta, limite, pagina=10)
+        )
+        resultados[f"like_{nombre}"] = medir(
+            lambda: vehiculos_service._buscar_por_texto_like(consulta, limite, 0), repeticiones=5
+        )
+    return resultados
+
+def bench_estadisticas(n_vehiculos: int = 100000) -> Dict[str, Any]:
+    """Lectura de los contadores incrementales frente al recálculo completo (GROUP BY)"""
+    preparar_datos(n_vehiculos)
+    return {
+        "obtener_estadisticas_generales": medir(vehiculos_service.obtener_estadisticas_generales),
+        "reconstruir_group_by": medir(estadisticas.reconstruir, repeticiones=5),
+        "reconciliar": medir(estadisticas.reconciliar, repeticiones=5),
+    }
+
+def bench_vistas(n_vehiculos: int = 100000, n_vistas: int = 2000) -> Dict[str, Any]:
+    """Vista de detalle con escritura por vista frente al buffer de vistas"""
+    preparar_datos(n_vehiculos)
+    db = vehiculos_service.db
+    rng = random.Random(7)
+    ids = [rng.randint(1, n_vehiculos) for _ in range(n_vistas)]
+    
+    def escritura_por_vista():
+        # Comportamiento anterior: cargar, incrementar y guardar la fila entera
+        vehiculo = db.get_by_id(Vehiculo, rng.choice(ids))
+        vehiculo.incrementar_vistas()
+        db.update(vehiculo)
+    
+    resultado = {
+        "escritura_por_vista": medir(escritura_por_vista, repeticiones=200),
+        "buffer_vistas": medir(
+            lambda: vehiculos_service.obtener_vehiculo(rng.choice(ids), incrementar_vista=True),
+            repeticiones=200
+        ),
+    }
+    # Registrar n_vistas y volcarlas en un lote
+    resultado[f"volcado_{n_vistas}_vistas"] = medir(
+        lambda: [vehiculos_service.vistas.registrar(i) for i in ids] and vehiculos_service.vistas.volcar(),
+        repeticiones=5
+    )
+    return resultado
+
+def bench_transacciones(n_vehiculos: int = 100000, repeticiones: int = 200) -> Dict[str, Any]:
+    """Operaciones de escritura del servicio: tiempo, commits y conexiones por operación"""
+    preparar_datos(n_vehiculos)
+    engine = motor.motor_escritura()
+    contadores = {"commits": 0, "conexiones": 0}
+    
+    def contar(clave):
+        def _contar(*_):
+            contadores[clave] += 1
+        return _contar
+    
+    escuchas = [(engine, "commit", contar("commits")), (engine.pool, "checkout", contar("conexiones"))]
+    for objetivo, evento, funcion in escuchas:
+        event.listen(objetivo, evento, funcion)
+    
+    with rx.session() as session:
+        vendedor_id = session.exec(select(Usuario.id)).first()
+    datos = {
+        "marca": "Seat", "modelo": "Ibiza", "año": 2019, "precio": 9500.0,
+        "kilometraje": 60000, "ubicacion_ciudad": "Madrid", "ubicacion_provincia": "Madrid",
+        "tipo_motor": TipoMotor.GASOLINA, "tipo_vehiculo": TipoVehiculo.HATCHBACK,
+    }
+    creados = []
+    operaciones = {
+        "crear_vehiculo": lambda: creados.append(vehiculos_service.crear_vehiculo(datos, vendedor_id)[2].id),
+        "actualizar_vehiculo": lambda: vehiculos_service.actualizar_vehiculo(
+            creados[-1], {"precio": random.randint(5000, 20000)}, vendedor_id
+        ),
+        "marcar_como_vendido": lambda: vehiculos_service.marcar_como_vendido(creados.pop(), vendedor_id),
+    }
+    resultados = {}
+    try:
+        for nombre, operacion in operaciones.items():
+            contadores.update(commits=0, conexiones=0)
+            resultados[nombre] = medir(operacion, repeticiones)
+            resultados[nombre]["commits_por_operacion"] = contadores["commits"] / repeticiones
+            resultados[nombre]["conexiones_por_operacion"] = contadores["conexiones"] / repeticiones
+    finally:
+        for objetivo, evento, funcion in escuchas:
+            event.remove(objetivo, evento, funcion)
+    return resultados
+
+def escribir_inventario(ruta: str, n_filas: int, formato: str = "csv", semilla: int = 42,
+                        proporcion_errores: float = 0.01) -> None:
+    """Genera un inventario sintético para la importación masiva, con algunas filas no válidas"""
+    rng = random.Random(semilla)
+    columnas = [
+        "marca", "modelo", "año", "tipo_motor", "tipo_vehiculo", "precio", "kilometraje",
+        "descripcion", "ubicacion_ciudad", "ubicacion_provincia", "disponible_financiacion",
+    ]
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.DictWriter(f, columnas) if formato == "csv" else None
+        if escritor:
+            escritor.writeheader()
+        for _ in range(n_filas):
+            provincia = rng.choice(PROVINCIAS)
+            fila = {
+                "marca": rng.choice(MARCAS),
+                "modelo": f"Modelo {rng.randint(1, 30)}",
+                "año": rng.randint(2000, datetime.now().year),
+                "tipo_motor": rng.choice(list(TipoMotor)).value,
+                "tipo_vehiculo": rng.choice(list(TipoVehiculo)).value,
+                "precio": rng.randint(1500, 90000),
+                "kilometraje": rng.randint(1, 300000),
+                "descripcion": " ".join(rng.sample(PALABRAS_DESCRIPCION, 6)),
+                "ubicacion_ciudad": provincia,
+                "ubicacion_provincia": provincia,
+                "disponible_financiacion": rng.choice(["si", "no"]),
+            }
+            if rng.random() < proporcion_errores:
+                fila["precio"] = -1
+            if escritor:
+                escritor.writerow(fila)
+            else:
+                f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+
+def bench_importacion(n_vehiculos: int = 100000, n_filas: int = 100000) -> Dict[str, Any]:
+    """Importación masiva de un inventario CSV y JSONL frente a crear_vehiculo fila a fila"""
+    preparar_datos(n_vehiculos)
+    with rx.session() as session:
+        vendedor_id = session.exec(select(Usuario.id)).first()
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        for formato in ("csv", "jsonl"):
+            ruta = os.path.join(directorio, f"inventario.{formato}")
+            escribir_inventario(ruta, n_filas, formato)
+            informe = importar_vehiculos(ruta, vendedor_id=vendedor_id)
+            resultados[formato] = {
+                "filas_por_segundo": informe["filas_por_segundo"],
+                "insertadas": informe["insertadas"],
+                "con_error": informe["con_error"],
+            }
+        
+        # Pico de memoria (tracemalloc) con ficheros de distinto tamaño: debe ser constante
+        for n in (n_filas // 10, n_filas):
+            ruta = os.path.join(directorio, f"memoria_{n}.csv")
+            escribir_inventario(ruta, n)
+            tracemalloc.start()
+            importar_vehiculos(ruta, vendedor_id=vendedor_id)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resultados[f"memoria_pico_mb_{n}_filas"] = round(pico / 2**20, 1)
+        
+        # Referencia: el mismo inventario con una llamada al servicio por fila
+        ruta = os.path.join(directorio, "referencia.csv")
+        escribir_inventario(ruta, 500)
+        with open(ruta, encoding="utf-8", newline="") as f:
+            filas = list(csv.DictReader(f))
+        t0 = time.perf_counter()
+        for fila in filas:
+            try:
+                vehiculos_service.crear_vehiculo(convertir_fila(fila, vendedor_id), vendedor_id)
+            except ValueError:
+                pass
+        resultados["crear_vehiculo_por_fila"] = {"filas_por_segundo": round(len(filas) / (time.perf_counter() - t0))}
+    return resultados
+
+def bench_concurrencia(n_vehiculos: int = 100000, clientes: int = 200, peticiones: int = 10,
+                       pausa_s: tuple = (2.0, 6.0)) -> Dict[str, Any]:
+    """Latencia con clientes simultáneos en un bucle de asyncio: llamadas síncronas
+    (bloquean el bucle) frente a AsyncVehiculosService (pool de hilos).
+    Cada cliente espera pausa_s (aleatoria) entre peticiones, como un usuario navegando."""
+    preparar_datos(n_vehiculos)
+    
+    def peticion(rng: random.Random):
+        """Operación de un cliente: listado, texto, detalle o portada"""
+        opcion = rng.randrange(4)
+        if opcion == 0:
+            return "buscar_vehiculos", ({"precio": {"lte": rng.randint(5000, 90000)}}, 20, rng.randint(1, 50)), {}
+        if opcion == 1:
+            return "buscar_por_texto", (rng.choice(PALABRAS_DESCRIPCION),), {}
+        if opcion == 2:
+            return "obtener_vehiculo", (rng.randint(1, n_vehiculos),), {}
+        return "inicio", (), {}
+    
+    async def sincrono(nombre, args, kwargs):
+        if nombre == "inicio":
+            return [vehiculos_service.obtener_destacados(), vehiculos_service.obtener_recientes(),
+                    vehiculos_service.obtener_mas_visitados()]
+        return getattr(vehiculos_service, nombre)(*args, **kwargs)
+    
+    async def asincrono(nombre, args, kwargs):
+        if nombre == "inicio":
+            return await vehiculos_async.obtener_inicio()
+        return await getattr(vehiculos_async, nombre)(*args, **kwargs)
+    
+    async def simular(ejecutar) -> Dict[str, Any]:
+        latencias = []
+        retrasos_bucle = []
+        terminado = asyncio.Event()
+        
+        async def latido():
+            # Retraso del bucle de eventos: lo que espera cualquier otro cliente conectado
+            while not terminado.is_set():
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.01)
+                retrasos_bucle.append((time.perf_counter() - t0 - 0.01) * 1000)
+        
+        async def cliente(i: int):
+            rng = random.Random(i)
+            # La petición llega en su hora prevista aunque el bucle esté bloqueado:
+            # la latencia incluye la espera hasta que el bucle o el pool la atienden
+            envio = time.perf_counter() + rng.uniform(0, pausa_s[1])
+            for _ in range(peticiones):
+                await asyncio.sleep(max(0.0, envio - time.perf_counter()))
+                nombre, args, kwargs = peticion(rng)
+                await ejecutar(nombre, args, kwargs)
+                fin = time.perf_counter()
+                latencias.append(((fin - envio) * 1000, nombre))
+                envio = fin + rng.uniform(*pausa_s)
+        
+        tarea_latido = asyncio.create_task(latido())
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(i) for i in range(clientes)))
+        total = time.perf_counter() - inicio
+        terminado.set()
+        await tarea_latido
+        todas = sorted(ms for ms, _ in latencias)
+        # Detalle y portada: peticiones de ~1 ms que no deberían esperar a las pesadas
+        ligeras = sorted(ms for ms, nombre in latencias if nombre in ("obtener_vehiculo", "inicio"))
+        retrasos_bucle.sort()
+        return {
+            "p50_ms": round(todas[len(todas) // 2], 1),
+            "p99_ms": round(todas[int(len(todas) * 0.99) - 1], 1),
+            "p99_ligeras_ms": round(ligeras[int(len(ligeras) * 0.99) - 1], 1),
+            "peticiones_por_segundo": round(len(todas) / total),
+            "retraso_bucle_max_ms": round(retrasos_bucle[-1], 1) if retrasos_bucle else None,
+        }
+    
+    return {
+        "sincrono": asyncio.run(simular(sincrono)),
+        "pool_hilos": asyncio.run(simular(asincrono)),
+    }
+
+def bench_api(n_vehiculos: int = 100000, limite: int = 100) -> Dict[str, Any]:
+    """Endpoints de vehículos de la API: respuesta completa frente a 304 y exportación en streaming"""
+    from fastapi.testclient import TestClient
+    from backend_rx.apps.autenticacion.main import app
+    
+    preparar_datos(n_vehiculos)
+    cliente = TestClient(app)
+    parametros = {"limite": limite, "precio_max": 40000}
+    primera = cliente.get("/vehiculos", params=parametros)
+    condicional = {"If-None-Match": primera.headers["etag"]}
+    resultados = {
+        "listado_200": medir(lambda: cliente.get("/vehiculos", params=parametros)),
+        "listado_304": medir(lambda: cliente.get("/vehiculos", params=parametros, headers=condicional)),
+        "bytes_200": len(primera.content),
+        "bytes_304": len(cliente.get("/vehiculos", params=parametros, headers=condicional).content),
+    }
+    t0 = time.perf_counter()
+    exportados = len(cliente.get("/vehiculos/exportar", params={"precio_max": 40000}).json())
+    resultados["exportar_vehiculos_por_segundo"] = round(exportados / (time.perf_counter() - t0))
+    return resultados
+
+def bench_similares(n_vehiculos: int = 500000, k: int = 10, consultas: int = 2000) -> Dict[str, Any]:
+    """Vecinos más cercanos con el índice en memoria frente a las consultas SQL por marca y precio"""
+    preparar_datos(n_vehiculos)
+    with rx.session() as session:
+        ids = list(session.exec(select(Vehiculo.id).where(Vehiculo.activo == True)).all())
+    rng = random.Random(7)
+    
+    indice = IndiceSimilitud()
+    t0 = time.perf_counter()
+    tamano = len(indice)
+    construccion = time.perf_counter() - t0
+    tracemalloc.start()
+    len(IndiceSimilitud())
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    def sql_marca_precio() -> None:
+        # La consulta que se usaba antes: misma marca y ±20% de precio, después mismo tipo
+        vehiculo = vehiculos_service.db.get_by_id(Vehiculo, rng.choice(ids))
+        with rx.session() as session:
+            for filtro in (Vehiculo.marca == vehiculo.marca, Vehiculo.tipo_vehiculo == vehiculo.tipo_vehiculo):
+                session.exec(select(Vehiculo).where(
+                    Vehiculo.id != vehiculo.id, Vehiculo.activo == True,
+                    Vehiculo.estado == EstadoVehiculo.DISPONIBLE, filtro,
+                    Vehiculo.precio.between(vehiculo.precio * 0.8, vehiculo.precio * 1.2),
+                ).limit(k)).all()
+    
+    vehiculo = vehiculos_service.obtener_vehiculo(ids[0])
+    return {
+        "vehiculos_en_indice": tamano,
+        "construccion_s": round(construccion, 2),
+        "memoria_construccion_mb": round(pico / 1e6, 1),
+        "indice_vecinos": medir(lambda: indice.vecinos(rng.choice(ids), k), consultas),
+        "indice_actualizacion": medir(lambda: indice.sincronizar(vehiculo), consultas),
+        "obtener_similares": medir(lambda: vehiculos_service.obtener_similares(rng.choice(ids), k), 200),
+        "sql_marca_precio": medir(sql_marca_precio, 200),
+    }
+
+def bench_ranking(n_vehiculos: int = 500000, limite: int = 10, n_vistas: int = 20000) -> Dict[str, Any]:
+    """Más visitados y tendencias con el ranking en memoria frente a ORDER BY vistas"""
+    preparar_datos(n_vehiculos)
+    filtros = {"activo": True, "estado": EstadoVehiculo.DISPONIBLE}
+    por_provincia = {**filtros, "ubicacion_provincia": "Sevilla"}
+    
+    ranking = RankingVistas()
+    t0 = time.perf_counter()
+    ranking.reconstruir()
+    reconstruccion = time.perf_counter() - t0
+    
+    with rx.session() as session:
+        vehiculos = list(session.exec(select(Vehiculo).where(Vehiculo.activo == True).limit(n_vistas)).all())
+    rng = random.Random(11)
+    t0 = time.perf_counter()
+    for _ in range(n_vistas):
+        ranking.registrar_vista(vehiculos[int(rng.paretovariate(1.2)) % len(vehiculos)])
+    por_vista = (time.perf_counter() - t0) / n_vistas
+    
+    return {
+        "reconstruccion_s": round(reconstruccion, 2),
+        "registrar_vista_us": round(por_vista * 1e6, 1),
+        "sql_mas_visitados": medir(lambda: vehiculos_service.db.search(Vehiculo, filtros, limit=limite, order_by="-vistas")),
+        "sql_mas_visitados_provincia": medir(lambda: vehiculos_service.db.search(Vehiculo, por_provincia, limit=limite, order_by="-vistas")),
+        "ranking_mas_visitados": medir(lambda: ranking.mas_visitados(limite), 1000),
+        "ranking_mas_visitados_provincia": medir(lambda: ranking.mas_visitados(limite, provincia="Sevilla"), 1000),
+        "ranking_tendencias": medir(lambda: ranking.tendencias(limite), 1000),
+        "obtener_mas_visitados": medir(lambda: vehiculos_service.obtener_mas_visitados(limite)),
+        "obtener_tendencias": medir(lambda: vehiculos_service.obtener_tendencias(limite)),
+    }
+
+def bench_facetas(n_vehiculos: int = 100000) -> Dict[str, Any]:
+    """Recuentos de facetas con GROUP BY por faceta frente al índice en memoria, con y sin caché"""
+    preparar_datos(n_vehiculos)
+    base = {"activo": True, "estado": EstadoVehiculo.DISPONIBLE}
+    filtros = {**base, "marca": "Toyota", "precio": {"lte": 20000}, "año": {"gte": 2012}}
+    
+    def sql_facetas() -> None:
+        with rx.session() as session:
+            for campo in ("marca", "ubicacion_provincia", "tipo_motor", "tipo_vehiculo", "año"):
+                columna = getattr(Vehiculo, campo)
+                condiciones = [
+                    Vehiculo.activo == True, Vehiculo.estado == EstadoVehiculo.DISPONIBLE,
+                    *([] if campo == "marca" else [Vehiculo.marca == "Toyota"]),
+                    Vehiculo.precio <= 20000, *([] if campo == "año" else [Vehiculo.año >= 2012]),
+                ]
+                session.exec(select(columna, func.count()).where(*condiciones).group_by(columna)).all()
+    
+    indice = IndiceFacetas()
+    t0 = time.perf_counter()
+    indice.contar({})
+    construccion = time.perf_counter() - t0
+    
+    def sin_cache(f: Dict[str, Any]) -> None:
+        indice._cache.clear()
+        indice.contar(f)
+    
+    return {
+        "construccion_s": round(construccion, 2),
+        "sql_group_by": medir(sql_facetas),
+        "indice_sin_filtros": medir(lambda: sin_cache(base), 200),
+        "indice_filtros": medir(lambda: sin_cache(filtros), 200),
+        "indice_cache": medir(lambda: indice.contar(filtros), 1000),
+        "obtener_filtros_disponibles": medir(vehiculos_service.obtener_filtros_disponibles, 1000),
+        "buscar_vehiculos": medir(lambda: vehiculos_service.buscar_vehiculos(filtros)),
+        "buscar_vehiculos_facetas": medir(lambda: vehiculos_service.buscar_vehiculos(filtros, facetas=True)),
+    }
+
+def bench_geo(n_vehiculos: int = 1000000, limite: int = 20) -> Dict[str, Any]:
+    """Búsqueda por distancia con la rejilla frente al filtro por provincia"""
+    preparar_datos(n_vehiculos)
+    getafe = {"ciudad": "Getafe", "provincia": "Madrid", "radio_km": 30}
+    
+    resultado: Dict[str, Any] = {}
+    for nombre, cerca in (("30km_getafe", getafe), ("50km_murcia", {"ciudad": "Murcia", "radio_km": 50}),
+                          ("10km_huelva", {"ciudad": "Huelva", "provincia": "Huelva", "radio_km": 10})):
+        resultado[f"total_{nombre}"] = vehiculos_service.buscar_vehiculos({"cerca": cerca}, 1)["total"]
+        resultado[f"radio_{nombre}"] = medir(lambda: vehiculos_service.buscar_vehiculos({"cerca": cerca}, limite))
+    resultado.update({
+        "provincia_madrid": medir(lambda: vehiculos_service.buscar_vehiculos({"ubicacion_provincia": "Madrid"}, limite)),
+        "radio_por_distancia": medir(lambda: vehiculos_service.buscar_vehiculos(
+            {"cerca": getafe, "order_by": "distancia"}, limite)),
+        "radio_por_precio": medir(lambda: vehiculos_service.buscar_vehiculos(
+            {"cerca": getafe, "order_by": "precio"}, limite)),
+        "radio_con_filtros": medir(lambda: vehiculos_service.buscar_vehiculos(
+            {"cerca": getafe, "marca": "Seat", "precio": {"lte": 15000}}, limite)),
+        "radio_sin_total": medir(lambda: vehiculos_service.buscar_vehiculos({"cerca": getafe}, limite, modo_total="ninguno")),
+        "radio_cursor": medir(lambda: vehiculos_service.buscar_vehiculos_cursor({"cerca": getafe}, limite)),
+        "radio_facetas": medir(lambda: vehiculos_service.buscar_vehiculos({"cerca": getafe}, limite, facetas=True)),
+    })
+    return resultado
+
+def bench_proyecciones(n_vehiculos: int = 100000) -> Dict[str, Any]:
+    """Listados con entidades Vehiculo completas frente a la proyección TarjetaVehiculo:
+    latencia y memoria retenida por el resultado (tracemalloc) con 20, 100 y 1000 elementos"""
+    preparar_datos(n_vehiculos)
+    
+    def memoria_kb(funcion: Callable[[], Any]) -> float:
+        tracemalloc.start()
+        resultado = funcion()
+        retenida, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del resultado
+        return round(retenida / 1024, 1)
+    
+    resultados: Dict[str, Any] = {}
+    for limite in (20, 100, 1000):
+        for nombre, proyeccion in (("completo", None), ("tarjeta", TarjetaVehiculo)):
+            buscar = lambda: vehiculos_service.buscar_vehiculos(
+                {"order_by": "precio"}, limite, 2, modo_total="ninguno", proyeccion=proyeccion)["vehiculos"]
+            resultados[f"{nombre}_{limite}"] = {**medir(buscar), "memoria_kb": memoria_kb(buscar)}
+    vendedor = vehiculos_service.buscar_vehiculos({}, 1)["vehiculos"][0].vendedor_id
+    for nombre, proyeccion in (("completo", None), ("tarjeta", TarjetaVehiculo)):
+        resultados[f"destacados_{nombre}"] = medir(lambda: vehiculos_service.obtener_destacados(20, proyeccion))
+        resultados[f"recientes_{nombre}"] = medir(lambda: vehiculos_service.obtener_recientes(20, 30, proyeccion))
+        resultados[f"vendedor_{nombre}"] = medir(
+            lambda: vehiculos_service.obtener_vehiculos_vendedor(vendedor, True, proyeccion))
+    return resultados
+
+def _carga_mixta(semilla: int, hilos: int, fin: float, escrituras: float, n_vehiculos: int,
+                 vendedor_id: int, cola) -> None:
+    """Un proceso de la carga mixta: hilos que leen y escriben hasta fin"""
+    resultado = {"lecturas": [], "escrituras": [], "errores": []}
+    lecturas = [
+        lambda rng: vehiculos_service.buscar_vehiculos({"marca": rng.choice(MARCAS)}, 20, rng.randint(1, 50)),
+        lambda rng: vehiculos_service.obtener_vehiculo(rng.randint(1, n_vehiculos)),
+        lambda rng: vehiculos_service.obtener_estadisticas_generales(),
+    ]
+    
+    def ejecutar(rng: random.Random) -> None:
+        while time.time() < fin:
+            t0 = time.perf_counter()
+            if rng.random() < escrituras:
+                ok, mensaje, _ = vehiculos_service.actualizar_vehiculo(
+                    rng.randint(1, n_vehiculos), {"precio": float(rng.randint(1500, 90000))}, vendedor_id
+                )
+                resultado["escrituras"].append(time.perf_counter() - t0)
+                if not ok:
+                    resultado["errores"].append(mensaje)
+            else:
+                try:
+                    rng.choice(lecturas)(rng)
+                except Exception as e:
+                    resultado["errores"].append(str(e))
+                resultado["lecturas"].append(time.perf_counter() - t0)
+    
+    trabajadores = [threading.Thread(target=ejecutar, args=(random.Random(semilla * 100 + i),)) for i in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+    cola.put(resultado)
+
+def bench_carga_mixta(n_vehiculos: int = 100000, procesos: int = 4, hilos: int = 4,
+                      segundos: float = 10.0, escrituras: float = 0.2) -> Dict[str, Any]:
+    """Carga mixta de lecturas y escrituras desde varios procesos con varios hilos: motor de
+    Reflex por defecto (diario de rollback, un pool para todo) frente a WAL con lectores y
+    escritor separados"""
+    import multiprocessing
+    
+    preparar_datos(n_vehiculos)
+    with rx.session() as session:
+        vendedor_id = session.exec(select(Usuario.id)).first()
+    # Los procesos hijos crean sus propias conexiones, y el cambio de modo de diario
+    # necesita que no haya otras abiertas
+    get_engine().dispose()
+    
+    configuraciones = {
+        "reflex_por_defecto": motor.ConfiguracionSQLite(
+            wal=False, synchronous="FULL", cache_size_mb=2, mmap_size_mb=0,
+            lectores=15, separar_lecturas=False,
+        ),
+        "wal_lectores_escritor": motor.ConfiguracionSQLite(),
+    }
+    
+    def percentil(tiempos: list, q: float) -> float:
+        tiempos = sorted(tiempos)
+        return round(tiempos[int(len(tiempos) * q) - 1] * 1000, 2) if tiempos else 0.0
+    
+    contexto = multiprocessing.get_context("fork")
+    resultados = {}
+    try:
+        for nombre, configuracion in configuraciones.items():
+            motor.configurar(configuracion)
+            # Fija el modo de diario antes de lanzar los procesos
+            motor.motor_escritura().connect().close()
+            motor.configurar(configuracion)
+            cola = contexto.Queue()
+            fin = time.time() + segundos
+            hijos = [
+                contexto.Process(target=_carga_mixta, args=(i, hilos, fin, escrituras, n_vehiculos, vendedor_id, cola))
+                for i in range(procesos)
+            ]
+            for hijo in hijos:
+                hijo.start()
+            total = {"lecturas": [], "escrituras": [], "errores": []}
+            for _ in hijos:
+                for clave, valores in cola.get().items():
+                    total[clave] += valores
+            for hijo in hijos:
+                hijo.join()
+            resultados[nombre] = {
+                "operaciones_por_segundo": round((len(total["lecturas"]) + len(total["escrituras"])) / segundos),
+                "lecturas_por_segundo": round(len(total["lecturas"]) / segundos),
+                "escrituras_por_segundo": round(len(total["escrituras"]) / segundos),
+                "p95_lectura_ms": percentil(total["lecturas"], 0.95),
+                "p95_escritura_ms": percentil(total["escrituras"], 0.95),
+                "errores": len(total["errores"]),
+                "database_is_locked": sum("locked" in e for e in total["errores"]),
+            }
+    finally:
+        motor.configurar()
+    return resultados
+
+def _jpeg_sintetico(rng: np.random.Generator, ancho: int, alto: int) -> bytes:
+    """Foto sintética: color suave a gran escala con ruido, para que el JPEG pese como una foto"""
+    from PIL import Image
+    
+    base = rng.integers(0, 256, size=(alto // 64 + 1, ancho // 64 + 1, 3), dtype=np.uint8)
+    imagen = Image.fromarray(base).resize((ancho, alto), Image.Resampling.BILINEAR)
+    ruido = Image.fromarray(rng.integers(0, 24, size=(alto, ancho, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    Image.blend(imagen, ruido, 0.15).save(buffer, "JPEG", quality=88)
+    return buffer.getvalue()
+
+def bench_fotos(n_vehiculos: int = 100000, n_fotos: int = 48, clientes: int = 8,
+                ancho: int = 4000, alto: int = 3000) -> Dict[str, Any]:
+    """Subida concurrente de fotos: variantes generadas en la petición frente al pool de
+    procesos (rendimiento de subida y latencia hasta que la foto está lista) y subida de
+    fotos repetidas, que reutilizan fichero y variantes"""
+    preparar_datos(n_vehiculos)
+    rng = np.random.default_rng(42)
+    fotos = [_jpeg_sintetico(rng, ancho, alto) for _ in range(n_fotos)]
+    with rx.session() as session:
+        vehiculos = session.exec(
+            select(Vehiculo.id, Vehiculo.vendedor_id).where(Vehiculo.activo == True).limit(3 * n_fotos)
+        ).all()
+    
+    def percentil(tiempos: list, q: float) -> float:
+        tiempos = sorted(tiempos)
+        return round(tiempos[max(int(len(tiempos) * q) - 1, 0)] * 1000, 1)
+    
+    def subir(lote: list, en_peticion: bool) -> Dict[str, Any]:
+        """Sube las fotos del lote desde `clientes` hilos y espera a que estén listas"""
+        def una(argumentos) -> tuple:
+            (vehiculo_id, vendedor_id), contenido = argumentos
+            t0 = time.perf_counter()
+            if en_peticion:
+                # Sin el pool: la petición guarda el original y genera las variantes antes de
+                # registrar la foto, que ya queda lista
+                raiz, hash = fotos_service.config.directorio, hashlib.sha256(contenido).hexdigest()
+                miniaturas.guardar_atomico(miniaturas.ruta_original(raiz, hash),
+                                           lambda ruta: Path(ruta).write_bytes(contenido))
+                miniaturas.generar_variantes(raiz, hash)
+            ok, mensaje, foto = fotos_service.subir_foto(vehiculo_id, vendedor_id, contenido)
+            assert ok, mensaje
+            return foto.id, t0, time.perf_counter(), foto.estado
+        
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(clientes) as pool:
+            subidas = list(pool.map(una, lote))
+        fin_subidas = time.perf_counter()
+        # Momento en que cada foto aparece como lista
+        lista_en = {foto_id: fin for foto_id, _, fin, estado in subidas if estado != EstadoFoto.PENDIENTE}
+        pendientes = {foto_id for foto_id, *_ in subidas} - set(lista_en)
+        while pendientes:
+            with rx.session() as session:
+                listas = session.exec(select(FotoVehiculo.id).where(
+                    FotoVehiculo.id.in_(pendientes), FotoVehiculo.estado != EstadoFoto.PENDIENTE)).all()
+            ahora = time.perf_counter()
+            for foto_id in listas:
+                lista_en[foto_id] = ahora
+            pendientes -= set(listas)
+            if pendientes:
+                time.sleep(0.005)
+        fin = time.perf_counter()
+        return {
+            "subidas_por_segundo": round(len(lote) / (fin_subidas - inicio), 1),
+            "p50_subida_ms": percentil([f - i for _, i, f, _ in subidas], 0.5),
+            "p95_subida_ms": percentil([f - i for _, i, f, _ in subidas], 0.95),
+            "p50_hasta_lista_ms": percentil([lista_en[foto_id] - i for foto_id, i, _, _ in subidas], 0.5),
+            "p95_hasta_lista_ms": percentil([lista_en[foto_id] - i for foto_id, i, _, _ in subidas], 0.95),
+            "fotos_listas_por_segundo": round(len(lote) / (fin - inicio), 1),
+        }
+    
+    def ocupado_mb(directorio: str) -> float:
+        return round(sum(os.path.getsize(os.path.join(d, f))
+                         for d, _, ficheros in os.walk(directorio) for f in ficheros) / 2**20, 1)
+    
+    configuracion = fotos_service.config
+    resultados: Dict[str, Any] = {"foto_kb": round(sum(map(len, fotos)) / len(fotos) / 1024)}
+    try:
+        for nombre, en_peticion, desplazamiento in (("en_peticion", True, 0), ("pool_procesos", False, n_fotos)):
+            with tempfile.TemporaryDirectory() as directorio:
+                fotos_service._config = replace(configuracion, directorio=directorio)
+                lote = list(zip(vehiculos[desplazamiento:desplazamiento + n_fotos], fotos))
+                resultados[nombre] = subir(lote, en_peticion)
+                if not en_peticion:
+                    # Las mismas fotos en otros anuncios: sin escribir originales ni variantes
+                    antes = ocupado_mb(directorio)
+                    resultados["repetidas"] = subir(list(zip(vehiculos[2 * n_fotos:3 * n_fotos], fotos)), False)
+                    resultados["repetidas"]["mb_escritos"] = round(ocupado_mb(directorio) - antes, 1)
+                    resultados["disco_mb"] = antes
+                fotos_service.esperar()
+    finally:
+        fotos_service.cerrar()
+        fotos_service._config = configuracion
+        with rx.session() as session:
+            session.execute(FotoVehiculo.__table__.delete())
+            session.execute(Vehiculo.__table__.update().values(foto_portada=None)
+                         .where(Vehiculo.foto_portada.is_not(None)))
+            session.commit()
+    return resultados
+
+def bench_autenticacion(n_vehiculos: int = 100000, coste: int = 10, inicios: int = 32,
+                        verificaciones: int = 20000) -> Dict[str, Any]:
+    """Inicios de sesión simultáneos con bcrypt en el bucle de eventos frente al pool de
+    bcrypt (retraso del bucle mientras duran) y coste por petición de verificar el token,
+    con la caché y sin ella"""
+    preparar_datos(n_vehiculos)
+    configuracion = autenticacion_service.config
+    autenticacion_service.configurar(replace(configuracion, coste_bcrypt=coste, secreto="benchmark-" + "x" * 32))
+    email, password = f"bench-auth@{datos_sinteticos.DOMINIO_EMAIL}", "contraseña-de-prueba"
+    autenticacion_service.registrar_usuario({"email": email, "password": password, "nombre": "Bench",
+                                             "apellido": "Auth", "ciudad": "Madrid", "provincia": "Madrid"})
+    
+    async def avalancha(en_bucle: bool) -> Dict[str, Any]:
+        """Lanza los inicios de sesión a la vez y mide cada 1 ms lo que tarda el bucle en responder"""
+        retrasos = []
+        terminado = asyncio.Event()
+        
+        async def latido():
+            while not terminado.is_set():
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.001)
+                retrasos.append(time.perf_counter() - t0 - 0.001)
+        
+        async def inicio():
+            t0 = time.perf_counter()
+            if en_bucle:
+                ok, mensaje, _ = autenticacion_service.autenticar(email, password)
+            else:
+                ok, mensaje, _ = await autenticacion_service.iniciar_sesion(email, password)
+            assert ok, mensaje
+            return time.perf_counter() - t0
+        
+        tarea = asyncio.create_task(latido())
+        await asyncio.sleep(0.01)
+        t0 = time.perf_counter()
+        duraciones = sorted(await asyncio.gather(*(inicio() for _ in range(inicios))))
+        total = time.perf_counter() - t0
+        terminado.set()
+        await tarea
+        retrasos.sort()
+        return {
+            "inicios_por_segundo": round(inicios / total, 1),
+            "p95_inicio_ms": round(duraciones[int(len(duraciones) * 0.95) - 1] * 1000, 1),
+            "p99_retraso_bucle_ms": round(retrasos[int(len(retrasos) * 0.99) - 1] * 1000, 2),
+            "max_retraso_bucle_ms": round(retrasos[-1] * 1000, 2),
+        }
+    
+    def por_verificacion_us(funcion: Callable[[], Any], n: int) -> float:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            funcion()
+        return round((time.perf_counter() - t0) / n * 1e6, 2)
+    
+    resultados: Dict[str, Any] = {}
+    try:
+        t0 = time.perf_counter()
+        autenticacion_service.cifrar_password(password)
+        resultados["hash_bcrypt_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        resultados["en_bucle"] = asyncio.run(avalancha(True))
+        resultados["pool_bcrypt"] = asyncio.run(avalancha(False))
+        
+        _, _, sesion = autenticacion_service.autenticar(email, password)
+        token = sesion["access_token"]
+        resultados["verificar_con_cache_us"] = por_verificacion_us(
+            lambda: autenticacion_service.verificar_token(token), verificaciones)
+        
+        def sin_cache():
+            autenticacion_service._tokens.vaciar()
+            autenticacion_service._usuarios.vaciar()
+            autenticacion_service.verificar_token(token)
+        resultados["verificar_sin_cache_us"] = por_verificacion_us(sin_cache, verificaciones // 10)
+        resultados["token_no_valido_us"] = por_verificacion_us(
+            lambda: autenticacion_service.verificar_token(token[:-4] + "AAAA"), verificaciones // 10)
+    finally:
+        autenticacion_service.configurar(configuracion)
+    return resultados
+
+def bench_checkout(n_vehiculos: int = 100000, compradores: int = 32, rondas: int = 30,
+                   escritores: int = 4) -> Dict[str, Any]:
+    """Muchos compradores reservando a la vez el mismo anuncio, ronda a ronda: leer,
+    comprobar y guardar frente al compare-and-swap de checkout_service (ganadores por ronda
+    y latencia), y latencia de las escrituras en otros anuncios durante la competencia"""
+    preparar_datos(n_vehiculos)
+    with rx.session() as session:
+        usuarios = session.exec(select(Usuario.id).order_by(Usuario.id).limit(compradores + 1)).all()
+        disponibles = session.exec(
+            select(Vehiculo.id, Vehiculo.vendedor_id)
+            .where(Vehiculo.activo == True, Vehiculo.estado == EstadoVehiculo.DISPONIBLE)
+            .limit(200)
+        ).all()
+    # El anuncio disputado y los de los escritores, de vendedores que no compiten
+    compradores_ids = usuarios[:compradores]
+    ajenos = [(v, vendedor) for v, vendedor in disponibles if vendedor not in compradores_ids]
+    (disputado, _), otros = ajenos[0], ajenos[1:1 + escritores]
+    
+    def leer_comprobar_guardar(vehiculo_id: int, comprador_id: int, clave: str) -> bool:
+        """Sin concurrencia optimista: otro comprador puede reservar entre la lectura y la escritura"""
+        vehiculo = vehiculos_service.db.get_by_id(Vehiculo, vehiculo_id)
+        if vehiculo.estado != EstadoVehiculo.DISPONIBLE:
+            return False
+        vehiculo.estado = EstadoVehiculo.RESERVADO
+        vehiculos_service.db.update(vehiculo)
+        return True
+    
+    def cas(vehiculo_id: int, comprador_id: int, clave: str) -> bool:
+        return checkout_service.reservar(vehiculo_id, comprador_id, clave)[0]
+    
+    def liberar() -> None:
+        # En la conexión de escritura del servicio: con otra conexión competiría por el bloqueo
+        with db_service.transaction() as session:
+            session.execute(Transaccion.__table__.update()
+                            .where(Transaccion.vehiculo_id == disputado,
+                                   Transaccion.estado == EstadoTransaccion.RESERVADA)
+                            .values(estado=EstadoTransaccion.CANCELADA))
+            session.execute(Vehiculo.__table__.update().where(Vehiculo.id == disputado)
+                            .values(estado=EstadoVehiculo.DISPONIBLE))
+    
+    def competir(reservar: Callable[[int, int, str], bool], con_escritores: bool) -> Dict[str, Any]:
+        intentos, ganadores, escrituras = [], [], []
+        fin = threading.Event()
+        barrera = threading.Barrier(compradores)
+        
+        def comprador(posicion: int) -> None:
+            for ronda in range(rondas):
+                barrera.wait()
+                t0 = time.perf_counter()
+                if reservar(disputado, compradores_ids[posicion], f"bench-{time.time_ns()}-{posicion}"):
+                    ganadores.append(ronda)
+                intentos.append(time.perf_counter() - t0)
+                if barrera.wait() == 0:
+                    liberar()
+        
+        def escritor(vehiculo_id: int, vendedor_id: int) -> None:
+            rng = random.Random(vehiculo_id)
+            while not fin.is_set():
+                t0 = time.perf_counter()
+                vehiculos_service.actualizar_vehiculo(vehiculo_id, {"precio": float(rng.randint(2000, 90000))}, vendedor_id)
+                escrituras.append(time.perf_counter() - t0)
+                # Tráfico de edición continuo pero no un bucle cerrado que acapare el escritor
+                fin.wait(0.01)
+        
+        hilos = [threading.Thread(target=comprador, args=(i,)) for i in range(compradores)]
+        if con_escritores:
+            hilos += [threading.Thread(target=escritor, args=otro) for otro in otros]
+        inicio = time.perf_counter()
+        for hilo in hilos[:compradores]:
+            hilo.start()
+        for hilo in hilos[compradores:]:
+            hilo.start()
+        for hilo in hilos[:compradores]:
+            hilo.join()
+        total = time.perf_counter() - inicio
+        fin.set()
+        for hilo in hilos[compradores:]:
+            hilo.join()
+        
+        por_ronda = [ganadores.count(ronda) for ronda in range(rondas)]
+        intentos.sort()
+        resultado = {
+            "intentos_por_segundo": round(len(intentos) / total),
+            "p95_intento_ms": round(intentos[int(len(intentos) * 0.95) - 1] * 1000, 2),
+            "rondas_con_varios_ganadores": sum(n > 1 for n in por_ronda),
+            "max_ganadores_ronda": max(por_ronda),
+        }
+        if escrituras:
+            escrituras.sort()
+            resultado["p95_escritura_otro_anuncio_ms"] = round(escrituras[int(len(escrituras) * 0.95) - 1] * 1000, 2)
+        return resultado
+    
+    def solo_escritores() -> Dict[str, Any]:
+        tiempos = []
+        for _ in range(200):
+            vehiculo_id, vendedor_id = random.choice(otros)
+            t0 = time.perf_counter()
+            vehiculos_service.actualizar_vehiculo(vehiculo_id, {"precio": float(random.randint(2000, 90000))}, vendedor_id)
+            tiempos.append(time.perf_counter() - t0)
+        tiempos.sort()
+        return {"p95_escritura_otro_anuncio_ms": round(tiempos[int(len(tiempos) * 0.95) - 1] * 1000, 2)}
+    
+    resultados: Dict[str, Any] = {}
+    try:
+        resultados["sin_competencia"] = solo_escritores()
+        resultados["leer_comprobar_guardar"] = competir(leer_comprobar_guardar, False)
+        liberar()
+        resultados["compare_and_swap"] = competir(cas, False)
+        liberar()
+        resultados["compare_and_swap_con_escritores"] = competir(cas, True)
+    finally:
+        liberar()
+        with db_service.transaction() as session:
+            session.execute(Transaccion.__table__.delete().where(Transaccion.clave_idempotencia.like("bench-%")))
+        # leer_comprobar_guardar y liberar cambian el estado sin pasar por las estadísticas
+        estadisticas.reconciliar(reparar=True)
+    return resultados
+
+def bench_panel_vendedor(n_vehiculos: int = 100000, inventario: int = 5000) -> Dict[str, Any]:
+    """Panel de un concesionario con más de 1000 anuncios: agregados con la consulta agrupada
+    frente a cargar las entidades y agregar en Python, e inventario completo como lista
+    frente a recorrido en bloques (pico de memoria con tracemalloc)"""
+    preparar_datos(n_vehiculos)
+    with db_service.transaction() as session:
+        concesionario = session.exec(select(Usuario.id).order_by(Usuario.id.desc()).limit(1)).one()
+        originales = session.exec(select(Vehiculo.id, Vehiculo.vendedor_id).order_by(Vehiculo.id).limit(inventario)).all()
+        # Se le asignan temporalmente los primeros anuncios; al final vuelven a sus vendedores
+        session.execute(Vehiculo.__table__.update().where(Vehiculo.id <= originales[-1][0])
+                        .values(vendedor_id=concesionario))
+    
+    def desde_entidades() -> Dict[str, Any]:
+        vehiculos = vehiculos_service.obtener_vehiculos_vendedor(concesionario, True)
+        por_estado: Dict[str, int] = {}
+        for vehiculo in vehiculos:
+            por_estado[vehiculo.estado.value] = por_estado.get(vehiculo.estado.value, 0) + 1
+        return {"por_estado": por_estado, "vistas": sum(v.vistas for v in vehiculos),
+                "precio_promedio": sum(v.precio for v in vehiculos) / len(vehiculos)}
+    
+    def pico_kb(funcion: Callable[[], Any]) -> float:
+        tracemalloc.start()
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return round(pico / 1024, 1)
+    
+    def lista() -> int:
+        return len(json.dumps([v._asdict() for v in vehiculos_service.obtener_vehiculos_vendedor(
+            concesionario, True, TarjetaVehiculo)], default=str))
+    
+    def bloques() -> int:
+        return sum(len(json.dumps([v._asdict() for v in bloque], default=str))
+                   for bloque in vehiculos_service.iterar_vehiculos_vendedor(concesionario, True, proyeccion=TarjetaVehiculo))
+    
+    try:
+        return {
+            "anuncios": inventario,
+            "limite_anterior_1000": len(db_service.search(Vehiculo, {"vendedor_id": concesionario}, limit=1000)),
+            "panel_consulta_agrupada": medir(lambda: vehiculos_service.obtener_panel_vendedor(concesionario)),
+            "panel_desde_entidades": medir(desde_entidades, repeticiones=5),
+            "inventario_lista": {**medir(lista, repeticiones=5), "pico_kb": pico_kb(lista)},
+            "inventario_bloques": {**medir(bloques, repeticiones=5), "pico_kb": pico_kb(bloques)},
+        }
+    finally:
+        with db_service.transaction() as session:
+            session.execute(Vehiculo.__table__.update().where(Vehiculo.id == bindparam("b_id"))
+                            .values(vendedor_id=bindparam("b_vendedor")),
+                            [{"b_id": id, "b_vendedor": vendedor} for id, vendedor in originales])
+
+def bench_alertas(n_vehiculos: int = 100000, n_busquedas: int = 1000000, muestra: int = 200,
+                  altas: int = 50) -> Dict[str, Any]:
+    """Percolador de búsquedas guardadas con n_busquedas en la base de datos: carga del
+    índice, búsquedas que cumple un anuncio nuevo frente a recorrer todas (también como
+    comprobación de resultados) y latencia de crear_vehiculo con los avisos en segundo plano"""
+    preparar_datos(n_vehiculos)
+    rng = random.Random(25)
+    motores, tipos = [m.name for m in TipoMotor], [t.name for t in TipoVehiculo]
+    
+    def busqueda() -> Dict[str, Any]:
+        filtros: Dict[str, Any] = {}
+        azar = rng.random()
+        if azar < 0.85:
+            filtros["marca"] = rng.choice(MARCAS)
+        elif azar < 0.95:
+            filtros["marca"] = {"in": rng.sample(MARCAS, 3)}
+        if rng.random() < 0.7:
+            filtros["ubicacion_provincia"] = rng.choice(PROVINCIAS)
+        if rng.random() < 0.3:
+            filtros["tipo_motor"] = rng.choice(motores)
+        if rng.random() < 0.2:
+            filtros["tipo_vehiculo"] = rng.choice(tipos)
+        if rng.random() < 0.8:
+            desde = rng.choice((0, 3000, 5000, 8000, 10000, 15000, 25000))
+            filtros["precio"] = {"between": [desde, desde + rng.choice((5000, 10000, 20000))]}
+        if rng.random() < 0.5:
+            filtros["año"] = {"gte": rng.randint(2005, 2022)}
+        if rng.random() < 0.4:
+            filtros["kilometraje"] = {"lt": rng.choice((50000, 100000, 150000))}
+        return filtros or {"precio": {"lte": 20000}}
+    
+    def cumple(filtros: Dict[str, Any], vehiculo: Vehiculo) -> bool:
+        """Evaluación directa de los filtros que genera busqueda()"""
+        for campo, valor in filtros.items():
+            actual = getattr(vehiculo, campo)
+            actual = actual.name if isinstance(actual, (TipoMotor, TipoVehiculo)) else actual
+            operador, argumento = next(iter(valor.items())) if isinstance(valor, dict) else ("eq", valor)
+            if operador == "eq" and actual != argumento:
+                return False
+            if operador == "in" and actual not in argumento:
+                return False
+            if operador == "between" and not argumento[0] <= actual <= argumento[1]:
+                return False
+            if operador == "gte" and not actual >= argumento:
+                return False
+            if operador == "lte" and not actual <= argumento:
+                return False
+            if operador == "lt" and not (actual is not None and actual < argumento):
+                return False
+        return True
+    
+    def recorrido(vehiculos: List[Vehiculo]) -> List[set]:
+        """Sin índice: leer todas las búsquedas y comprobar cada una con cada anuncio"""
+        coincidencias = [set() for _ in vehiculos]
+        with db_service.get_session(solo_lectura=True) as session:
+            resultado = session.connection().execution_options(yield_per=20000).execute(
+                select(BusquedaGuardada.id, BusquedaGuardada.filtros).where(BusquedaGuardada.id > primer_id))
+            for filas in resultado.partitions():
+                for busqueda_id, texto in filas:
+                    filtros = json.loads(texto)
+                    for encontradas, vehiculo in zip(coincidencias, vehiculos):
+                        if cumple(filtros, vehiculo):
+                            encontradas.add(busqueda_id)
+        return coincidencias
+    
+    with db_service.transaction() as session:
+        primer_id = session.exec(select(func.coalesce(func.max(BusquedaGuardada.id), 0))).one()
+        usuarios = session.exec(select(Usuario.id).order_by(Usuario.id)).all()
+        vendedor = session.exec(select(Usuario.id).order_by(Usuario.id.desc()).limit(1)).one()
+        for inicio in range(0, n_busquedas, 20000):
+            session.execute(BusquedaGuardada.__table__.insert(), [
+                {"usuario_id": rng.choice(usuarios), "nombre": "bench", "filtros": json.dumps(busqueda()),
+                 "activa": True, "fecha_creacion": datetime.now()}
+                for _ in range(min(20000, n_busquedas - inicio))
+            ])
+    
+    nuevos: List[int] = []
+    try:
+        alertas_service.indice = IndiceBusquedas()
+        alertas_service._ultimo_id = primer_id
+        t0 = time.perf_counter()
+        cargadas = alertas_service.actualizar_indice()
+        resultados: Dict[str, Any] = {"busquedas": cargadas, "carga_indice_s": round(time.perf_counter() - t0, 1)}
+        
+        with db_service.get_session(solo_lectura=True) as session:
+            anuncios = session.exec(select(Vehiculo).where(Vehiculo.activo == True).order_by(func.random()).limit(muestra)).all()
+        coincidencias = [alertas_service.indice.coincidencias(v)[0] for v in anuncios]
+        tiempos = sorted(medir(lambda: alertas_service.indice.coincidencias(v), 5)["mediana_ms"] for v in anuncios)
+        resultados["indice"] = {"mediana_ms": tiempos[len(tiempos) // 2], "p95_ms": tiempos[int(len(tiempos) * 0.95) - 1],
+                                "coincidencias_media": round(sum(map(len, coincidencias)) / len(anuncios), 1)}
+        t0 = time.perf_counter()
+        recorrido(anuncios[:1])
+        resultados["recorrido_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        resultados["mismos_resultados"] = all(
+            set(ids.tolist()) == esperadas for ids, esperadas in zip(coincidencias[:20], recorrido(anuncios[:20])))
+        
+        rng_altas = random.Random(26)
+        altas_ms = []
+        t_inicio = time.perf_counter()
+        for _ in range(altas):
+            t0 = time.perf_counter()
+            _, _, vehiculo = vehiculos_service.crear_vehiculo(datos_sinteticos.datos_vehiculo(rng_altas), vendedor)
+            altas_ms.append((time.perf_counter() - t0) * 1000)
+            nuevos.append(vehiculo.id)
+        alertas_service.esperar()
+        altas_ms.sort()
+        with db_service.get_session(solo_lectura=True) as session:
+            avisos = session.exec(select(func.count()).select_from(AlertaBusqueda)
+                                  .where(AlertaBusqueda.vehiculo_id.in_(nuevos))).one()
+        resultados["altas"] = {"p95_crear_vehiculo_ms": round(altas_ms[int(len(altas_ms) * 0.95) - 1], 2),
+                               "avisos_generados_s": round(time.perf_counter() - t_inicio, 2), "avisos": avisos}
+        return resultados
+    finally:
+        with db_service.transaction() as session:
+            session.execute(AlertaBusqueda.__table__.delete().where(AlertaBusqueda.busqueda_id > primer_id))
+            session.execute(BusquedaGuardada.__table__.delete().where(BusquedaGuardada.id > primer_id))
+        for vehiculo_id in nuevos:
+            vehiculos_service.eliminar_vehiculo(vehiculo_id, vendedor)
+        alertas_service.indice = IndiceBusquedas()
+        alertas_service._ultimo_id = primer_id
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "paginacion": bench_paginacion,
+    "busqueda": bench_busqueda,
+    "texto": bench_texto,
+    "estadisticas": bench_estadisticas,
+    "vistas": bench_vistas,
+    "transacciones": bench_transacciones,
+    "importacion": bench_importacion,
+    "concurrencia": bench_concurrencia,
+    "api": bench_api,
+    "similares": bench_similares,
+    "ranking": bench_ranking,
+    "facetas": bench_facetas,
+    "geo": bench_geo,
+    "proyecciones": bench_proyecciones,
+    "carga_mixta": bench_carga_mixta,
+    "fotos": bench_fotos,
+    "autenticacion": bench_autenticacion,
+    "checkout": bench_checkout,
+    "panel_vendedor": bench_panel_vendedor,
+    "alertas": bench_alertas,
+}
+
+if __name__ == "__main__":
+    # Argumentos: nombre o nombre:n_vehiculos (p. ej. texto:1000000)
+    argumentos = sys.argv[1:] or list(BENCHMARKS)
+    for argumento in argumentos:
+        nombre, _, n = argumento.partition(":")
+        print(f"== {argumento}")
+        opciones = {"n_vehiculos": int(n)} if n else {}
+        for clave, valor in BENCHMARKS[nombre](**opciones).items():
+            print(f"  {clave}: {valor}")
@@ -0,0 +1,70 @@
+"""
+Configuración común de los tests
+
+Los tests usan una base de datos SQLite temporal, nunca la de rxconfig.py: REFLEX_DB_URL
+se fija antes de que se importe ningún servicio (la configuración de Reflex se lee una
+vez por proceso).
+
+    python -m pytest backend_rx/pruebas
+"""
+import os
+import tempfile
+from itertools import count
+from typing import Any, Callable, Dict
+
+import pytest
+
+_DIRECTORIO = tempfile.mkdtemp(prefix="pruebas-marketplace-")
+os.environ["REFLEX_DB_URL"] = f"sqlite:///{_DIRECTORIO}/pruebas.db"
+# bcrypt con el coste mínimo: los tests comprueban el flujo, no la resistencia del hash
+os.environ["REFLEX_AUTENTICACION_COSTE_BCRYPT"] = "4"
+
+from sqlmodel import SQLModel
+
+from backend_rx.apps.modelos import vehiculo, usuario, foto, transaccion, busqueda, estadistica  # noqa: F401
+from backend_rx.apps.modelos.usuario import Usuario
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.motor import motor_escritura
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+
+_secuencia = count(1)
+
+@pytest.fixture(scope="session", autouse=True)
+def base_datos():
+    """Crea las tablas una vez por sesión"""
+    SQLModel.metadata.create_all(motor_escritura())
+    yield
+
+@pytest.fixture
+def marca_unica() -> Callable[[], str]:
+    """Marcas que no comparte ningún otro test, para filtrar solo los vehículos propios
+    (la base de datos es la misma para toda la sesión)"""
+    return lambda: f"Prueba{next(_secuencia)}"
+
+@pytest.fixture
+def crear_usuario() -> Callable[..., Usuario]:
+    """Crea usuarios con email único; los argumentos sustituyen a los valores por defecto"""
+    def crear(**datos: Any) -> Usuario:
+        n = next(_secuencia)
+        return db_service.create(Usuario(**{
+            "email": f"usuario{n}@pruebas.test", "password_hash": "x", "nombre": "Prueba",
+            "apellido": str(n), "telefono": None, "ciudad": "Madrid", "provincia": "Madrid",
+            **datos,
+        }))
+    return crear
+
+@pytest.fixture
+def crear_vehiculo(crear_usuario) -> Callable[..., Vehiculo]:
+    """Publica un vehículo con VehiculosService; sin vendedor_id crea un vendedor nuevo"""
+    def crear(vendedor_id: int = None, **datos: Any) -> Vehiculo:
+        vendedor_id = vendedor_id or crear_usuario().id
+        valores: Dict[str, Any] = {
+            "marca": "Seat", "modelo": "Ibiza", "año": 2019, "precio": 9500.0, "kilometraje": 60000,
+            "tipo_motor": TipoMotor.GASOLINA, "tipo_vehiculo": TipoVehiculo.HATCHBACK,
+            "ubicacion_ciudad": "Madrid", "ubicacion_provincia": "Madrid", **datos,
+        }
+        exito, mensaje, creado = vehiculos_service.crear_vehiculo(valores, vendedor_id)
+        assert exito, mensaje
+        return creado
+    return crear
@@ -0,0 +1,350 @@
+"""
+Datos sintéticos
+
+Generador determinista de usuarios y vehículos para los benchmarks. Las distribuciones
+imitan el mercado de segunda mano: marcas y provincias con su peso real aproximado,
+modelos con su carrocería, antigüedad sesgada a coches de 4-10 años, precios que se
+deprecian con la edad y dependen de la marca, kilometraje proporcional a la edad, y
+vistas con cola larga (unos pocos anuncios concentran muchas visitas).
+
+Los datos se generan por bloques de BLOQUE filas, cada uno con su propio generador
+(semilla, número de bloque). Así la fila i es la misma se genere de una vez o rellenando
+una base de datos que ya tenía parte de las filas:
+
+    generar(n_usuarios=5000, n_vehiculos=100000)      # en la base de datos de rxconfig
+"""
+import random
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from reflex.model import get_engine
+from sqlmodel import SQLModel, select, func, insert, update
+
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoMotor, TipoVehiculo, EstadoVehiculo
+from backend_rx.apps.modelos.usuario import Usuario, TipoUsuario
+from backend_rx.apps.servicio import estadisticas, geografia
+
+# Cambiar si cambian las distribuciones: forma parte del nombre de las bases de datos cacheadas
+VERSION = 2
+
+BLOQUE = 10000
+DOMINIO_EMAIL = "sinteticos.automercado.es"
+
+S, H, B, C = TipoVehiculo.SUV, TipoVehiculo.HATCHBACK, TipoVehiculo.BERLINA, TipoVehiculo.COUPE
+
+# marca: (peso en el mercado, precio de un modelo nuevo típico, [(modelo, carrocería, factor de precio)])
+MARCAS: Dict[str, Tuple[float, float, List[Tuple[str, TipoVehiculo, float]]]] = {
+    "Volkswagen": (9.5, 30000, [("Golf", H, 1.0), ("Polo", H, 0.75), ("Passat", B, 1.3),
+                                ("Tiguan", S, 1.35), ("T-Roc", S, 1.1), ("Touran", TipoVehiculo.MONOVOLUMEN, 1.15),
+                                ("Caddy", TipoVehiculo.FURGONETA, 0.95)]),
+    "Seat": (8.5, 24000, [("Ibiza", H, 0.8), ("Leon", H, 1.0), ("Arona", S, 0.95),
+                          ("Ateca", S, 1.2), ("Alhambra", TipoVehiculo.MONOVOLUMEN, 1.3)]),
+    "Renault": (8.0, 23000, [("Clio", H, 0.8), ("Megane", H, 1.0), ("Captur", S, 1.0),
+                             ("Kadjar", S, 1.2), ("Kangoo", TipoVehiculo.FURGONETA, 0.9)]),
+    "Peugeot": (8.0, 25000, [("208", H, 0.8), ("308", H, 1.0), ("2008", S, 1.0),
+                             ("3008", S, 1.25), ("508", B, 1.35), ("Partner", TipoVehiculo.FURGONETA, 0.9)]),
+    "Toyota": (7.0, 28000, [("Yaris", H, 0.7), ("Corolla", H, 1.0), ("C-HR", S, 1.1),
+                            ("RAV4", S, 1.4), ("Hilux", TipoVehiculo.PICKUP, 1.5)]),
+    "Ford": (6.5, 24000, [("Fiesta", H, 0.75), ("Focus", H, 1.0), ("Kuga", S, 1.3),
+                          ("Mondeo", B, 1.2), ("Ranger", TipoVehiculo.PICKUP, 1.5), ("Transit", TipoVehiculo.FURGONETA, 1.3)]),
+    "Citroen": (6.0, 22000, [("C3", H, 0.8), ("C4", H, 1.0), ("C5 Aircross", S, 1.3),
+                             ("Berlingo", TipoVehiculo.FURGONETA, 0.95)]),
+    "Opel": (5.5, 22000, [("Corsa", H, 0.8), ("Astra", H, 1.0), ("Mokka", S, 1.05),
+                          ("Insignia", B, 1.3), ("Zafira", TipoVehiculo.MONOVOLUMEN, 1.15)]),
+    "BMW": (5.0, 45000, [("Serie 1", H, 0.75), ("Serie 3", TipoVehiculo.SEDAN, 1.0), ("Serie 5", TipoVehiculo.SEDAN, 1.4),
+                         ("X1", S, 0.95), ("X3", S, 1.3), ("Serie 4", C, 1.2)]),
+    "Mercedes": (5.0, 47000, [("Clase A", H, 0.75), ("Clase C", TipoVehiculo.SEDAN, 1.0), ("Clase E", TipoVehiculo.SEDAN, 1.4),
+                              ("GLA", S, 0.95), ("GLC", S, 1.3), ("Vito", TipoVehiculo.FURGONETA, 1.1)]),
+    "Audi": (4.5, 44000, [("A1", H, 0.65), ("A3", H, 0.85), ("A4", TipoVehiculo.SEDAN, 1.0), ("A6", TipoVehiculo.SEDAN, 1.35),
+                          ("Q3", S, 1.0), ("Q5", S, 1.3), ("TT", C, 1.1)]),
+    "Kia": (4.5, 24000, [("Picanto", H, 0.55), ("Ceed", H, 1.0), ("Sportage", S, 1.3),
+                         ("Niro", S, 1.2)]),
+    "Hyundai": (4.5, 24000, [("i10", H, 0.55), ("i20", H, 0.75), ("i30", H, 1.0),
+                             ("Tucson", S, 1.3), ("Kona", S, 1.1)]),
+    "Nissan": (4.0, 25000, [("Micra", H, 0.7), ("Juke", S, 0.95), ("Qashqai", S, 1.15),
+                            ("X-Trail", S, 1.4), ("Navara", TipoVehiculo.PICKUP, 1.5)]),
+    "Dacia": (3.5, 15000, [("Sandero", H, 0.85), ("Duster", S, 1.1), ("Jogger", TipoVehiculo.MONOVOLUMEN, 1.15)]),
+    "Fiat": (3.0, 17000, [("500", H, 0.85), ("Panda", H, 0.8), ("Tipo", B, 1.0),
+                          ("Doblo", TipoVehiculo.FURGONETA, 1.05)]),
+    "Skoda": (3.0, 25000, [("Fabia", H, 0.75), ("Octavia", B, 1.0), ("Karoq", S, 1.15),
+                           ("Kodiaq", S, 1.4)]),
+    "Mazda": (2.0, 28000, [("Mazda2", H, 0.7), ("Mazda3", H, 0.95), ("CX-5", S, 1.2),
+                           ("MX-5", C, 1.1)]),
+    "Volvo": (1.5, 45000, [("V40", H, 0.7), ("XC40", S, 0.9), ("XC60", S, 1.15),
+                           ("XC90", S, 1.6)]),
+    "Tesla": (0.5, 50000, [("Model 3", TipoVehiculo.SEDAN, 1.0), ("Model Y", S, 1.1)]),
+}
+
+# provincia: peso ~ población. La ciudad de cada usuario es un municipio de la provincia
+# en el nomenclátor de geografia, con peso según su población
+PROVINCIAS: Dict[str, float] = {
+    "Madrid": 6.8, "Barcelona": 5.7, "Valencia": 2.6, "Alicante": 1.9, "Sevilla": 1.9,
+    "Málaga": 1.7, "Murcia": 1.5, "Cádiz": 1.2, "Illes Balears": 1.2, "Bizkaia": 1.1,
+    "A Coruña": 1.1, "Las Palmas": 1.1, "Asturias": 1.0, "Zaragoza": 1.0,
+    "Santa Cruz de Tenerife": 1.0, "Pontevedra": 0.9, "Granada": 0.9, "Tarragona": 0.8,
+    "Córdoba": 0.8, "Girona": 0.8, "Gipuzkoa": 0.7, "Toledo": 0.7, "Almería": 0.7, "Badajoz": 0.7,
+    "Navarra": 0.7, "Jaén": 0.6, "Cantabria": 0.6, "Castellón": 0.6, "Valladolid": 0.5,
+    "Huelva": 0.5,
+}
+
+COLORES = {"Blanco": 25, "Gris": 20, "Negro": 18, "Plata": 12, "Azul": 10, "Rojo": 8,
+           "Marrón": 3, "Verde": 2, "Naranja": 2}
+COLORES_INTERIOR = {"Negro": 60, "Gris": 25, "Beige": 10, "Marrón": 5}
+
+# Mezcla de motores según el año del vehículo: (hasta el año, {motor: peso})
+MOTORES_POR_AÑO = (
+    (2011, {TipoMotor.DIESEL: 60, TipoMotor.GASOLINA: 40}),
+    (2018, {TipoMotor.DIESEL: 45, TipoMotor.GASOLINA: 45, TipoMotor.HIBRIDO: 10}),
+    (9999, {TipoMotor.GASOLINA: 45, TipoMotor.DIESEL: 20, TipoMotor.HIBRIDO: 20,
+            TipoMotor.ELECTRICO: 8, TipoMotor.HIBRIDO_ENCHUFABLE: 7}),
+)
+
+# estado y activo: la mayoría de anuncios están publicados y disponibles
+ESTADOS = {EstadoVehiculo.DISPONIBLE: 88, EstadoVehiculo.RESERVADO: 4, EstadoVehiculo.VENDIDO: 8}
+PROPORCION_INACTIVOS = 0.05
+PROPORCION_DESTACADOS = 0.03
+
+NOMBRES = ["Lucía", "Hugo", "Martina", "Mateo", "Sofía", "Leo", "Julia", "Daniel", "Paula", "Alejandro",
+           "Carmen", "Pablo", "María", "Javier", "Laura", "David", "Ana", "Sergio", "Elena", "Jorge"]
+APELLIDOS = ["García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez", "Pérez",
+             "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Álvarez"]
+
+PALABRAS_DESCRIPCION = [
+    "híbrido", "diésel", "gasolina", "eléctrico", "automático", "manual", "navegador", "cuero",
+    "techo", "solar", "libro", "revisiones", "único", "propietario", "garantía", "neumáticos",
+    "nuevos", "cámara", "trasera", "sensores", "aparcamiento", "climatizador", "bizona", "llantas",
+    "aleación", "xenon", "led", "bluetooth", "carplay", "android", "auto", "asientos",
+    "calefactables", "control", "crucero", "adaptativo", "enganche", "remolque", "itv", "pasada",
+    "distribución", "cambiada", "embrague", "frenos", "pintura", "original", "impecable", "urbano",
+    "familiar", "deportivo", "económico", "fiable", "espacioso", "etiqueta", "eco", "cero",
+    "financiación", "transferencia", "incluida", "oportunidad", "km", "certificados", "garaje", "nacional",
+]
+
+def _pesos(pesos) -> np.ndarray:
+    pesos = np.asarray(list(pesos), dtype=np.float64)
+    return pesos / pesos.sum()
+
+_NOMBRES_MARCAS = list(MARCAS)
+_PESOS_MARCAS = _pesos(peso for peso, _, _ in MARCAS.values())
+_NOMBRES_PROVINCIAS = list(PROVINCIAS)
+_PESOS_PROVINCIAS = _pesos(PROVINCIAS.values())
+
+def _ciudades(provincia: str) -> Tuple[List[str], np.ndarray]:
+    localidades = [l for l in geografia.nomenclator().localidades if l.provincia == provincia]
+    return [l.municipio for l in localidades], np.cumsum(_pesos(l.poblacion for l in localidades))
+
+_CIUDADES = {provincia: _ciudades(provincia) for provincia in PROVINCIAS}
+
+def _ciudad(provincia: str, azar: float) -> str:
+    nombres, acumulados = _CIUDADES[provincia]
+    return nombres[min(int(np.searchsorted(acumulados, azar, side="right")), len(nombres) - 1)]
+_COLORES, _PESOS_COLORES = list(COLORES), _pesos(COLORES.values())
+_INTERIORES, _PESOS_INTERIORES = list(COLORES_INTERIOR), _pesos(COLORES_INTERIOR.values())
+_ESTADOS, _PESOS_ESTADOS = list(ESTADOS), _pesos(ESTADOS.values())
+
+# ==================== GENERACIÓN POR BLOQUES ====================
+
+def _generador(semilla: int, tabla: int, bloque: int) -> np.random.Generator:
+    return np.random.default_rng([semilla, tabla, bloque])
+
+def _hoy() -> datetime:
+    # Las fechas son relativas al día actual (no a la hora) para que obtener_recientes
+    # encuentre anuncios; dentro del mismo día las filas son idénticas
+    return datetime.combine(date.today(), time())
+
+def _filas_usuarios(semilla: int, bloque: int) -> List[Dict[str, Any]]:
+    rng = _generador(semilla, 0, bloque)
+    provincias = rng.choice(len(_NOMBRES_PROVINCIAS), BLOQUE, p=_PESOS_PROVINCIAS)
+    nombres = rng.integers(0, len(NOMBRES), BLOQUE)
+    apellidos = rng.integers(0, len(APELLIDOS), BLOQUE)
+    telefonos = rng.integers(600000000, 700000000, BLOQUE)
+    sin_telefono = rng.random(BLOQUE) < 0.2
+    antiguedad = rng.exponential(400, BLOQUE).clip(0, 3650)
+    ciudades = rng.random(BLOQUE)
+    hoy = _hoy()
+    filas = []
+    for j in range(BLOQUE):
+        i = bloque * BLOQUE + j
+        provincia = _NOMBRES_PROVINCIAS[provincias[j]]
+        filas.append({
+            "email": f"usuario{i}@{DOMINIO_EMAIL}",
+            "password_hash": "-",
+            "nombre": NOMBRES[nombres[j]],
+            "apellido": APELLIDOS[apellidos[j]],
+            "telefono": None if sin_telefono[j] else str(telefonos[j]),
+            # El primer usuario es administrador (para los caminos de permisos)
+            "tipo_usuario": (TipoUsuario.ADMIN if i == 0 else TipoUsuario.PARTICULAR).name,
+            "ciudad": _ciudad(provincia, ciudades[j]),
+            "provincia": provincia,
+            "activo": True,
+            "puede_publicar": True,
+            "vehiculos_publicados": 0,
+            "vehiculos_vendidos": 0,
+            "fecha_registro": hoy - timedelta(days=float(antiguedad[j])),
+        })
+    return filas
+
+def _columnas_vehiculos(rng: np.random.Generator, n: int) -> Dict[str, np.ndarray]:
+    """Columnas numéricas y categóricas de n vehículos (índices en las tablas de arriba)"""
+    marcas = rng.choice(len(_NOMBRES_MARCAS), n, p=_PESOS_MARCAS)
+    # Modelo uniforme dentro de la marca
+    n_modelos = np.array([len(MARCAS[m][2]) for m in _NOMBRES_MARCAS])
+    modelos = (rng.random(n) * n_modelos[marcas]).astype(np.int64)
+    # Antigüedad: gamma con media ~7 años, hasta 25
+    edad = np.minimum(rng.gamma(2.2, 3.3, n), 25.0)
+    año = date.today().year - np.floor(edad).astype(np.int64)
+    # Precio: nuevo según marca y modelo, -13% al año, ±25% de dispersión
+    base = np.array([MARCAS[m][1] for m in _NOMBRES_MARCAS])[marcas]
+    factor = np.array([MARCAS[_NOMBRES_MARCAS[m]][2][k][2] for m, k in zip(marcas, modelos)])
+    precio = base * factor * 0.87 ** edad * rng.lognormal(0.0, 0.25, n)
+    precio = np.maximum(np.round(precio / 50) * 50, 500)
+    # Kilometraje: ~14.000 km al año con dispersión, al menos 100 km
+    km = np.maximum(edad * rng.lognormal(np.log(14000), 0.45, n), 100).astype(np.int64)
+    return {"marcas": marcas, "modelos": modelos, "año": año, "precio": precio, "km": km,
+            "colores": rng.choice(len(_COLORES), n, p=_PESOS_COLORES),
+            "interiores": rng.choice(len(_INTERIORES), n, p=_PESOS_INTERIORES),
+            "azar": rng.random((n, 4)), "motores": rng.random(n)}
+
+def _motor(año: int, azar: float) -> TipoMotor:
+    for hasta, pesos in MOTORES_POR_AÑO:
+        if año <= hasta:
+            break
+    total = sum(pesos.values())
+    acumulado = 0.0
+    for motor, peso in pesos.items():
+        acumulado += peso / total
+        if azar < acumulado:
+            return motor
+    return motor
+
+def _filas_vehiculos(semilla: int, bloque: int, vendedores: np.ndarray,
+                     ubicaciones: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    rng = _generador(semilla, 1, bloque)
+    c = _columnas_vehiculos(rng, BLOQUE)
+    # Vendedor: unos pocos (profesionales) publican mucho y la mayoría uno o dos anuncios
+    vendedor = np.minimum((rng.random(BLOQUE) ** 1.5 * len(vendedores)).astype(np.int64), len(vendedores) - 1)
+    # Días publicado: sesgado a anuncios recientes
+    dias = np.minimum(rng.exponential(60, BLOQUE), 365.0)
+    # Vistas: ritmo diario con cola larga; los destacados reciben más
+    destacado = rng.random(BLOQUE) < PROPORCION_DESTACADOS
+    ritmo = rng.lognormal(np.log(3), 1.0, BLOQUE) * np.where(destacado, 3.0, 1.0)
+    vistas = rng.poisson(ritmo * np.maximum(dias, 0.1))
+    estados = rng.choice(len(_ESTADOS), BLOQUE, p=_PESOS_ESTADOS)
+    inactivo = rng.random(BLOQUE) < PROPORCION_INACTIVOS
+    palabras = rng.integers(0, len(PALABRAS_DESCRIPCION), (BLOQUE, 6))
+    hoy = _hoy()
+    filas = []
+    for j in range(BLOQUE):
+        marca = _NOMBRES_MARCAS[c["marcas"][j]]
+        modelo, carroceria, _ = MARCAS[marca][2][c["modelos"][j]]
+        ciudad, provincia = ubicaciones[vendedor[j]]
+        año = int(c["año"][j])
+        estado = _ESTADOS[estados[j]]
+        fecha_creacion = hoy - timedelta(days=float(dias[j]))
+        azar = c["azar"][j]
+        filas.append({
+            "marca": marca,
+            "modelo": modelo,
+            "año": año,
+            "tipo_motor": _motor(año, c["motores"][j]).name,
+            "tipo_vehiculo": carroceria.name,
+            "precio": float(c["precio"][j]),
+            "precio_negociable": bool(azar[0] < 0.7),
+            "kilometraje": int(c["km"][j]),
+            "descripcion": f"{marca} {modelo} " + " ".join(PALABRAS_DESCRIPCION[k] for k in palabras[j]),
+            "caracteristicas_extras": None,
+            "color_exterior": _COLORES[c["colores"][j]],
+            "color_interior": _INTERIORES[c["interiores"][j]],
+            "ubicacion_ciudad": ciudad,
+            "ubicacion_provincia": provincia,
+            **geografia.coordenadas(ciudad, provincia),
+            "estado": estado.name,
+            "activo": not inactivo[j],
+            "destacado": bool(destacado[j]),
+            "vistas": int(vistas[j]),
+            "vendedor_id": int(vendedores[vendedor[j]]),
+            "fecha_creacion": fecha_creacion,
+            "fecha_actualizacion": fecha_creacion + timedelta(days=float(azar[1]) * dias[j])
+                                   if estado != EstadoVehiculo.DISPONIBLE or inactivo[j] else None,
+            "disponible_financiacion": bool(azar[2] < 0.4),
+            "acepta_parte_pago": bool(azar[3] < 0.25),
+            "motivo_inactivo": "Eliminado por el usuario" if inactivo[j] else None,
+        })
+    return filas
+
+def _insertar(conn, modelo, existentes: int, total: int, filas_bloque) -> None:
+    """Inserta las filas [existentes, total) generando solo los bloques necesarios"""
+    for bloque in range(existentes // BLOQUE, -(-total // BLOQUE)):
+        inicio = bloque * BLOQUE
+        filas = filas_bloque(bloque)[max(existentes - inicio, 0):total - inicio]
+        if filas:
+            conn.execute(insert(modelo), filas)
+
+# ==================== API ====================
+
+def datos_vehiculo(rng: random.Random) -> Dict[str, Any]:
+    """Datos de un vehículo con las mismas distribuciones, en el formato de
+    VehiculosService.crear_vehiculo (para benchmarks de escritura)"""
+    c = _columnas_vehiculos(np.random.default_rng(rng.getrandbits(64)), 1)
+    marca = _NOMBRES_MARCAS[c["marcas"][0]]
+    modelo, carroceria, _ = MARCAS[marca][2][c["modelos"][0]]
+    provincia = rng.choices(_NOMBRES_PROVINCIAS, weights=_PESOS_PROVINCIAS)[0]
+    ciudad = _ciudad(provincia, rng.random())
+    año = int(c["año"][0])
+    return {
+        "marca": marca,
+        "modelo": modelo,
+        "año": año,
+        "tipo_motor": _motor(año, c["motores"][0]),
+        "tipo_vehiculo": carroceria,
+        "precio": float(c["precio"][0]),
+        "kilometraje": int(c["km"][0]),
+        "descripcion": f"{marca} {modelo} " + " ".join(rng.sample(PALABRAS_DESCRIPCION, 6)),
+        "color_exterior": _COLORES[c["colores"][0]],
+        "ubicacion_ciudad": ciudad,
+        "ubicacion_provincia": provincia,
+    }
+
+def generar(n_usuarios: int, n_vehiculos: int, semilla: int = 42) -> Dict[str, int]:
+    """Crea las tablas y rellena la base de datos hasta tener n_usuarios usuarios
+    sintéticos y n_vehiculos vehículos. Devuelve cuántas filas se han insertado"""
+    if n_usuarios < 1:
+        raise ValueError("Hace falta al menos un usuario que publique los vehículos")
+    engine = get_engine()
+    SQLModel.metadata.create_all(engine)
+    sinteticos = Usuario.email.like(f"%@{DOMINIO_EMAIL}")
+    
+    with engine.begin() as conn:
+        usuarios_existentes = conn.execute(select(func.count()).select_from(Usuario).where(sinteticos)).scalar()
+        _insertar(conn, Usuario, usuarios_existentes, n_usuarios,
+                  lambda bloque: _filas_usuarios(semilla, bloque))
+        
+        vendedores = conn.execute(
+            select(Usuario.id, Usuario.ciudad, Usuario.provincia).where(sinteticos).order_by(Usuario.id).limit(n_usuarios)
+        ).all()
+        vehiculos_existentes = conn.execute(select(func.count()).select_from(Vehiculo)).scalar()
+        # El administrador no publica (salvo que sea el único usuario)
+        vendedores = vendedores[1:] or vendedores
+        ids = np.array([id for id, _, _ in vendedores], dtype=np.int64)
+        ubicaciones = [(ciudad, provincia) for _, ciudad, provincia in vendedores]
+        _insertar(conn, Vehiculo, vehiculos_existentes, n_vehiculos,
+                  lambda bloque: _filas_vehiculos(semilla, bloque, ids, ubicaciones))
+    
+    insertados = {"usuarios": max(n_usuarios - usuarios_existentes, 0),
+                  "vehiculos": max(n_vehiculos - vehiculos_existentes, 0)}
+    if insertados["vehiculos"]:
+        # La inserción directa no pasa por el servicio: contadores de los vendedores,
+        # contadores de estadísticas y estadísticas del planificador
+        publicados = (select(func.count()).select_from(Vehiculo)
+                      .where(Vehiculo.vendedor_id == Usuario.id).scalar_subquery())
+        vendidos = (select(func.count()).select_from(Vehiculo)
+                    .where(Vehiculo.vendedor_id == Usuario.id,
+                           Vehiculo.estado == EstadoVehiculo.VENDIDO).scalar_subquery())
+        with engine.begin() as conn:
+            conn.execute(update(Usuario).where(sinteticos)
+                         .values(vehiculos_publicados=publicados, vehiculos_vendidos=vendidos))
+        estadisticas.reconstruir()
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+    return insertados
@@ -0,0 +1,409 @@
+"""
+Suite de rendimiento
+
+Mide cada método público de VehiculosService y DatabaseService sobre bases de datos
+sintéticas (datos_sinteticos.py) de 1.000, 100.000 y 1.000.000 de vehículos, guarda los
+tiempos en JSON y los compara con una referencia. Termina con código 1 si algún caso es
+más lento que la referencia por encima del umbral.
+
+    python -m backend_rx.pruebas.suite_rendimiento
+    python -m backend_rx.pruebas.suite_rendimiento --tamanos 1000,100000 --solo buscar
+    python -m backend_rx.pruebas.suite_rendimiento --guardar-referencia
+
+Cada tamaño se genera una vez y se guarda en --directorio; cada ejecución trabaja sobre
+una copia, así que las escrituras de una ejecución no cambian los datos de la siguiente.
+Los tiempos dependen de la máquina: la referencia debe generarse en la misma máquina (o el
+mismo tipo de runner de CI) en la que se compara.
+
+Un método público nuevo sin caso en CASOS hace fallar la suite (código 2).
+"""
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlmodel import select, func
+
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoVehiculo, EstadoVehiculo, TarjetaVehiculo
+from backend_rx.apps.modelos.usuario import Usuario
+from backend_rx.apps.servicio.base_datos import DatabaseService, db_service
+from backend_rx.apps.servicio.vehiculos_service import VehiculosService, vehiculos_service
+from backend_rx.pruebas import datos_sinteticos
+from backend_rx.pruebas.benchmarks import medir
+
+TAMANOS = (1_000, 100_000, 1_000_000)
+VEHICULOS_POR_USUARIO = 20
+UMBRAL = 0.25            # regresión: más de un 25% más lento que la referencia...
+MINIMO_MS = 0.5          # ...y al menos 0,5 ms más lento (por debajo es ruido)
+PRESUPUESTO_S = 1.0      # tiempo aproximado de medición por caso
+REPETICIONES = (5, 50)   # mínimo y máximo de repeticiones por caso
+REFERENCIA = Path(__file__).with_name("referencia_rendimiento.json")
+DIRECTORIO = Path(tempfile.gettempdir()) / "automercado_rendimiento"
+
+# ==================== CONTEXTO DE LOS CASOS ====================
+
+class Contexto:
+    """Datos de apoyo de los casos: ids de muestra, el vendedor con más anuncios y un
+    vendedor propio para las escrituras"""
+    
+    def __init__(self, semilla: int):
+        self.rng = random.Random(semilla)
+        with db_service.get_session(solo_lectura=True) as session:
+            disponibles = session.exec(
+                select(Vehiculo.id).where(Vehiculo.activo == True,
+                                          Vehiculo.estado == EstadoVehiculo.DISPONIBLE)
+            ).all()
+            self.vendedor_mayor = session.exec(
+                select(Vehiculo.vendedor_id).group_by(Vehiculo.vendedor_id)
+                .order_by(func.count().desc(), Vehiculo.vendedor_id).limit(1)
+            ).first()
+        self.disponibles = len(disponibles)
+        self._ids = itertools.cycle(self.rng.sample(disponibles, min(len(disponibles), 500)))
+        self.vendedor = db_service.create(Usuario(
+            email=f"suite{semilla}@{datos_sinteticos.DOMINIO_EMAIL}", password_hash="-",
+            nombre="Suite", apellido="Rendimiento", telefono=None, ciudad="Madrid", provincia="Madrid"
+        )).id
+    
+    def siguiente_id(self) -> int:
+        """Un vehículo disponible de la muestra (rota para no medir siempre la misma fila)"""
+        return next(self._ids)
+    
+    def datos_vehiculo(self) -> Dict[str, Any]:
+        return datos_sinteticos.datos_vehiculo(self.rng)
+    
+    def propios(self, n: int) -> List[int]:
+        """Crea n vehículos del vendedor propio (fuera de la medición)"""
+        ids = []
+        for _ in range(n):
+            exito, mensaje, vehiculo = vehiculos_service.crear_vehiculo(self.datos_vehiculo(), self.vendedor)
+            if not exito:
+                raise RuntimeError(mensaje)
+            ids.append(vehiculo.id)
+        return ids
+
+# Los casos de escritura consumen un vehículo propio por llamada
+_POR_CASO = REPETICIONES[1] + 2
+
+_DISPONIBLES = {"activo": True, "estado": EstadoVehiculo.DISPONIBLE}
+
+def _pagina_profunda(c: Contexto) -> Callable[[], Any]:
+    pagina = max(c.disponibles // 40, 1)  # a mitad del listado
+    return lambda: vehiculos_service.buscar_vehiculos({}, 20, pagina)
+
+def _cursor_segunda_pagina(c: Contexto) -> Callable[[], Any]:
+    filtros = {"order_by": "-fecha_creacion"}
+    cursor = vehiculos_service.buscar_vehiculos_cursor(filtros, 20)["siguiente_cursor"]
+    return lambda: vehiculos_service.buscar_vehiculos_cursor(filtros, 20, cursor)
+
+def _keyset_segunda_pagina(c: Contexto) -> Callable[[], Any]:
+    _, cursor = db_service.search_keyset(Vehiculo, _DISPONIBLES, 20, "-fecha_creacion")
+    return lambda: db_service.search_keyset(Vehiculo, _DISPONIBLES, 20, "-fecha_creacion", cursor)
+
+def _actualizar(c: Contexto) -> Callable[[], Any]:
+    vehiculo_id = c.propios(1)[0]
+    precios = itertools.cycle([15000.0, 15500.0])
+    return lambda: vehiculos_service.actualizar_vehiculo(vehiculo_id, {"precio": next(precios)}, c.vendedor)
+
+def _sobre_propios(metodo: Callable[[int, int], Any]) -> Callable[[Contexto], Callable[[], Any]]:
+    def fabrica(c: Contexto) -> Callable[[], Any]:
+        ids = iter(c.propios(_POR_CASO))
+        return lambda: metodo(next(ids), c.vendedor)
+    return fabrica
+
+def _db_update(c: Contexto) -> Callable[[], Any]:
+    vehiculo = db_service.get_by_id(Vehiculo, c.propios(1)[0])
+    precios = itertools.cycle([15000.0, 15500.0])
+    
+    def actualizar():
+        vehiculo.precio = next(precios)
+        return db_service.update(vehiculo)
+    return actualizar
+
+def _db_create(c: Contexto) -> Callable[[], Any]:
+    contador = itertools.count()
+    return lambda: db_service.create(Usuario(
+        email=f"alta{next(contador)}@{datos_sinteticos.DOMINIO_EMAIL}", password_hash="-",
+        nombre="Alta", apellido="Suite", telefono=None, ciudad="Madrid", provincia="Madrid"
+    ))
+
+def _db_get_session(c: Contexto) -> Callable[[], Any]:
+    def sesion():
+        with db_service.get_session(solo_lectura=True) as session:
+            return session.exec(select(func.max(Vehiculo.id))).first()
+    return sesion
+
+def _db_transaction(c: Contexto) -> Callable[[], Any]:
+    def transaccion():
+        with db_service.transaction():
+            return db_service.in_transaction()
+    return transaccion
+
+# nombre ("Clase.metodo" o "Clase.metodo:variante") -> fábrica que recibe el contexto y
+# devuelve la llamada a medir. La preparación de la fábrica no se mide.
+CASOS: Dict[str, Callable[[Contexto], Callable[[], Any]]] = {
+    # Lecturas de VehiculosService
+    "VehiculosService.obtener_vehiculo":
+        lambda c: lambda: vehiculos_service.obtener_vehiculo(c.siguiente_id()),
+    "VehiculosService.obtener_vehiculo:con_vista":
+        lambda c: lambda: vehiculos_service.obtener_vehiculo(c.siguiente_id(), incrementar_vista=True),
+    "VehiculosService.buscar_vehiculos":
+        lambda c: lambda: vehiculos_service.buscar_vehiculos({}, 20, 1),
+    "VehiculosService.buscar_vehiculos:filtros":
+        lambda c: lambda: vehiculos_service.buscar_vehiculos(
+            {"marca": "Seat", "precio": {"between": (8000, 20000)}, "order_by": "precio"}, 20, 1),
+    "VehiculosService.buscar_vehiculos:facetas":
+        lambda c: lambda: vehiculos_service.buscar_vehiculos(
+            {"marca": "Seat", "precio": {"between": (8000, 20000)}, "order_by": "precio"}, 20, 1, facetas=True),
+    "VehiculosService.buscar_vehiculos:cerca":
+        lambda c: lambda: vehiculos_service.buscar_vehiculos(
+            {"cerca": {"ciudad": "Zaragoza", "provincia": "Zaragoza", "radio_km": 50}, "order_by": "distancia"}, 20, 1),
+    "VehiculosService.buscar_vehiculos:tarjetas":
+        lambda c: lambda: vehiculos_service.buscar_vehiculos({}, 100, 1, modo_total="ninguno", proyeccion=TarjetaVehiculo),
+    "VehiculosService.buscar_vehiculos:pagina_profunda": _pagina_profunda,
+    "VehiculosService.buscar_vehiculos_cursor": _cursor_segunda_pagina,
+    "VehiculosService.buscar_por_texto":
+        lambda c: lambda: vehiculos_service.buscar_por_texto("diésel navegador"),
+    "VehiculosService.obtener_destacados":
+        lambda c: lambda: vehiculos_service.obtener_destacados(),
+    "VehiculosService.obtener_recientes":
+        lambda c: lambda: vehiculos_service.obtener_recientes(),
+    "VehiculosService.obtener_mas_visitados":
+        lambda c: lambda: vehiculos_service.obtener_mas_visitados(),
+    "VehiculosService.obtener_mas_visitados:segmento":
+        lambda c: lambda: vehiculos_service.obtener_mas_visitados(10, TipoVehiculo.SUV, "Madrid"),
+    "VehiculosService.obtener_tendencias":
+        lambda c: lambda: vehiculos_service.obtener_tendencias(),
+    "VehiculosService.obtener_similares":
+        lambda c: lambda: vehiculos_service.obtener_similares(c.siguiente_id()),
+    "VehiculosService.obtener_vehiculos_vendedor":
+        lambda c: lambda: vehiculos_service.obtener_vehiculos_vendedor(c.vendedor_mayor, incluir_inactivos=True),
+    "VehiculosService.iterar_vehiculos_vendedor":
+        lambda c: lambda: list(vehiculos_service.iterar_vehiculos_vendedor(c.vendedor_mayor, True, 100)),
+    "VehiculosService.obtener_panel_vendedor":
+        lambda c: lambda: vehiculos_service.obtener_panel_vendedor(c.vendedor_mayor),
+    "VehiculosService.obtener_filtros_disponibles":
+        lambda c: lambda: vehiculos_service.obtener_filtros_disponibles(),
+    "VehiculosService.obtener_estadisticas_generales":
+        lambda c: lambda: vehiculos_service.obtener_estadisticas_generales(),
+    # Escrituras de VehiculosService
+    "VehiculosService.crear_vehiculo":
+        lambda c: lambda: vehiculos_service.crear_vehiculo(c.datos_vehiculo(), c.vendedor),
+    "VehiculosService.actualizar_vehiculo": _actualizar,
+    "VehiculosService.destacar_vehiculo": _sobre_propios(vehiculos_service.destacar_vehiculo),
+    "VehiculosService.marcar_como_vendido": _sobre_propios(vehiculos_service.marcar_como_vendido),
+    "VehiculosService.eliminar_vehiculo": _sobre_propios(vehiculos_service.eliminar_vehiculo),
+    # DatabaseService
+    "DatabaseService.get_by_id":
+        lambda c: lambda: db_service.get_by_id(Vehiculo, c.siguiente_id()),
+    "DatabaseService.search":
+        lambda c: lambda: db_service.search(Vehiculo, _DISPONIBLES, 20, 0, "-fecha_creacion"),
+    "DatabaseService.search_with_count":
+        lambda c: lambda: db_service.search_with_count(Vehiculo, _DISPONIBLES, 20, 0, "-fecha_creacion"),
+    "DatabaseService.search_keyset": _keyset_segunda_pagina,
+    "DatabaseService.count":
+        lambda c: lambda: db_service.count(Vehiculo, {**_DISPONIBLES, "marca": "Toyota"}),
+    "DatabaseService.get_stats":
+        lambda c: lambda: db_service.get_stats(Vehiculo),
+    "DatabaseService.create": _db_create,
+    "DatabaseService.update": _db_update,
+    "DatabaseService.get_session": _db_get_session,
+    "DatabaseService.transaction": _db_transaction,
+    "DatabaseService.in_transaction":
+        lambda c: lambda: db_service.in_transaction(),
+    "DatabaseService.al_confirmar":
+        lambda c: lambda: db_service.al_confirmar(lambda: None),
+}
+
+def metodos_sin_caso() -> List[str]:
+    """Métodos públicos de los servicios que no tienen ningún caso en CASOS"""
+    cubiertos = {nombre.partition(":")[0] for nombre in CASOS}
+    return [
+        f"{clase.__name__}.{nombre}"
+        for clase in (VehiculosService, DatabaseService)
+        for nombre, _ in inspect.getmembers(clase, inspect.isfunction)
+        if not nombre.startswith("_") and f"{clase.__name__}.{nombre}" not in cubiertos
+    ]
+
+# ==================== MEDICIÓN ====================
+
+def cronometrar(funcion: Callable[[], Any]) -> Dict[str, float]:
+    """Primera llamada (incluye cachés e índices en memoria) y mediana/p95 del resto.
+    Las repeticiones se ajustan para que cada caso dure alrededor de PRESUPUESTO_S"""
+    t0 = time.perf_counter()
+    funcion()
+    primera_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    funcion()
+    segunda_ms = (time.perf_counter() - t0) * 1000
+    minimo, maximo = REPETICIONES
+    repeticiones = int(min(max(PRESUPUESTO_S * 1000 / max(segunda_ms, 0.001), minimo), maximo))
+    return {"primera_ms": round(primera_ms, 3), **medir(funcion, repeticiones), "repeticiones": repeticiones}
+
+def ejecutar(semilla: int, solo: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Mide los casos sobre la base de datos configurada (ya generada)"""
+    contexto = Contexto(semilla)
+    resultados = {}
+    for nombre, fabrica in CASOS.items():
+        if solo and solo not in nombre:
+            continue
+        resultados[nombre] = cronometrar(fabrica(contexto))
+        print(f"  {nombre}: {resultados[nombre]['mediana_ms']} ms", file=sys.stderr, flush=True)
+    return resultados
+
+# ==================== ORQUESTACIÓN ====================
+
+def _fase(fase: str, base_datos: Path, tamano: int, semilla: int, salida: Optional[Path] = None,
+          solo: Optional[str] = None) -> None:
+    """Ejecuta una fase en un proceso aparte: la URL de la base de datos se fija al arrancar"""
+    comando = [sys.executable, "-m", "backend_rx.pruebas.suite_rendimiento", "--fase", fase,
+               "--tamanos", str(tamano), "--semilla", str(semilla)]
+    if salida is not None:
+        comando += ["--salida", str(salida)]
+    if solo:
+        comando += ["--solo", solo]
+    entorno = {**os.environ, "REFLEX_DB_URL": f"sqlite:///{base_datos.resolve()}"}
+    subprocess.run(comando, env=entorno, check=True)
+
+def _quitar(ruta: Path) -> None:
+    for sufijo in ("", "-wal", "-shm", "-journal"):
+        Path(f"{ruta}{sufijo}").unlink(missing_ok=True)
+
+def preparar_base(tamano: int, semilla: int, directorio: Path) -> Path:
+    """Base de datos sintética de este tamaño, generándola si no está en el directorio"""
+    ruta = directorio / f"sinteticos_v{datos_sinteticos.VERSION}_s{semilla}_{tamano}.db"
+    if not ruta.exists():
+        temporal = ruta.with_suffix(".tmp")
+        _quitar(temporal)
+        print(f"Generando {tamano} vehículos en {ruta}", file=sys.stderr, flush=True)
+        _fase("generar", temporal, tamano, semilla)
+        # Integra el WAL en el fichero para poder copiarlo solo
+        conexion = sqlite3.connect(temporal)
+        conexion.execute("PRAGMA journal_mode = DELETE")
+        conexion.close()
+        temporal.rename(ruta)
+    return ruta
+
+def medir_tamanos(tamanos: List[int], semilla: int, directorio: Path,
+                  solo: Optional[str] = None) -> Dict[str, Any]:
+    directorio.mkdir(parents=True, exist_ok=True)
+    resultados = {}
+    for tamano in tamanos:
+        base = preparar_base(tamano, semilla, directorio)
+        trabajo = directorio / f"trabajo_{tamano}.db"
+        _quitar(trabajo)
+        shutil.copyfile(base, trabajo)
+        salida = directorio / f"resultados_{tamano}.json"
+        print(f"== {tamano} vehículos", file=sys.stderr, flush=True)
+        _fase("medir", trabajo, tamano, semilla, salida, solo)
+        resultados[str(tamano)] = json.loads(salida.read_text())
+        _quitar(trabajo)
+    return {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "plataforma": platform.platform(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count(),
+            "semilla": semilla,
+            "version_datos": datos_sinteticos.VERSION,
+        },
+        "resultados": resultados,
+    }
+
+def comparar(actual: Dict[str, Any], referencia: Dict[str, Any], umbral: float = UMBRAL,
+             minimo_ms: float = MINIMO_MS) -> List[Dict[str, Any]]:
+    """Compara las medianas caso a caso. Solo cuentan los casos presentes en ambos"""
+    filas = []
+    for tamano, casos in actual["resultados"].items():
+        casos_referencia = referencia["resultados"].get(tamano, {})
+        for nombre, medida in casos.items():
+            if nombre not in casos_referencia:
+                continue
+            antes, ahora = casos_referencia[nombre]["mediana_ms"], medida["mediana_ms"]
+            filas.append({
+                "tamano": tamano,
+                "caso": nombre,
+                "referencia_ms": antes,
+                "actual_ms": ahora,
+                "cambio": (ahora - antes) / antes if antes else 0.0,
+                "regresion": ahora > antes * (1 + umbral) and ahora - antes > minimo_ms,
+            })
+    return filas
+
+def _imprimir(filas: List[Dict[str, Any]]) -> None:
+    for fila in filas:
+        marca = "  REGRESIÓN" if fila["regresion"] else ""
+        print(f"{fila['tamano']:>8} {fila['caso']:<55} {fila['referencia_ms']:>10.3f} "
+              f"{fila['actual_ms']:>10.3f} {fila['cambio']:>+8.1%}{marca}")
+
+def main(argumentos: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Suite de rendimiento de los servicios")
+    parser.add_argument("--tamanos", default=",".join(map(str, TAMANOS)),
+                        help="número de vehículos de cada base de datos, separados por comas")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--directorio", type=Path, default=DIRECTORIO,
+                        help="dónde se guardan las bases de datos generadas")
+    parser.add_argument("--salida", type=Path, help="fichero JSON de resultados")
+    parser.add_argument("--referencia", type=Path, default=REFERENCIA)
+    parser.add_argument("--guardar-referencia", action="store_true",
+                        help="guarda los resultados como nueva referencia en lugar de comparar")
+    parser.add_argument("--umbral", type=float, default=UMBRAL,
+                        help="fracción de empeoramiento que cuenta como regresión")
+    parser.add_argument("--solo", help="mide solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--fase", choices=("generar", "medir"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argumentos)
+    tamanos = [int(tamano) for tamano in args.tamanos.split(",")]
+    
+    if args.fase == "generar":
+        datos_sinteticos.generar(max(tamanos[0] // VEHICULOS_POR_USUARIO, 1), tamanos[0], args.semilla)
+        return 0
+    if args.fase == "medir":
+        args.salida.write_text(json.dumps(ejecutar(args.semilla, args.solo), indent=1))
+        return 0
+    
+    faltan = metodos_sin_caso()
+    if faltan:
+        print(f"Métodos públicos sin caso en CASOS: {', '.join(faltan)}", file=sys.stderr)
+        return 2
+    
+    actual = medir_tamanos(tamanos, args.semilla, args.directorio, args.solo)
+    if args.salida:
+        args.salida.write_text(json.dumps(actual, indent=1, ensure_ascii=False))
+    
+    if args.guardar_referencia:
+        # Conserva los tamaños y casos de la referencia anterior que no se han medido ahora
+        if args.referencia.exists():
+            resultados = json.loads(args.referencia.read_text())["resultados"]
+            for tamano, casos in actual["resultados"].items():
+                resultados[tamano] = {**resultados.get(tamano, {}), **casos}
+            actual["resultados"] = resultados
+        args.referencia.write_text(json.dumps(actual, indent=1, ensure_ascii=False) + "\n")
+        print(f"Referencia guardada en {args.referencia}")
+        return 0
+    
+    if not args.referencia.exists():
+        print(f"No hay referencia en {args.referencia}: usa --guardar-referencia")
+        return 0
+    referencia = json.loads(args.referencia.read_text())
+    if referencia["meta"].get("plataforma") != actual["meta"]["plataforma"]:
+        print(f"Aviso: la referencia es de otra máquina ({referencia['meta'].get('plataforma')})")
+    filas = comparar(actual, referencia, args.umbral)
+    _imprimir(filas)
+    regresiones = [fila for fila in filas if fila["regresion"]]
+    print(f"{len(filas)} casos comparados, {len(regresiones)} regresiones (umbral {args.umbral:.0%})")
+    return 1 if regresiones else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
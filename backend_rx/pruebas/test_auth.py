@@ -3,4 +3,92 @@ Tests de autenticación
 
 Contiene pruebas unitarias y de integración para la autenticación de usuarios en el ecosistema de negocios de autos.
 """
-# Aquí van los tests de autenticación.
\ No newline at end of file
+import asyncio
+import time
+from dataclasses import replace
+
+import jwt
+import pytest
+
+from backend_rx.apps.autenticacion import autenticacion_service as modulo
+from backend_rx.apps.autenticacion.autenticacion_service import (
+    autenticacion_service, CacheTTL, CREDENCIALES_INVALIDAS,
+)
+from backend_rx.apps.modelos.usuario import Usuario
+from backend_rx.apps.servicio.base_datos import db_service
+
+PASSWORD = "contraseña-segura"
+
+@pytest.fixture
+def servicio():
+    """El servicio con sus ajustes de siempre y las cachés vacías al entrar y al salir"""
+    config = autenticacion_service.config
+    autenticacion_service.configurar(config)
+    yield autenticacion_service
+    autenticacion_service.configurar(config)
+
+@pytest.fixture
+def registrado(servicio, crear_usuario) -> Usuario:
+    """Usuario con contraseña cifrada de verdad"""
+    return crear_usuario(password_hash=servicio.cifrar_password(PASSWORD))
+
+def test_inicio_de_sesion_emite_token_valido(servicio, registrado):
+    exito, mensaje, sesion = asyncio.run(servicio.iniciar_sesion(registrado.email.upper(), PASSWORD))
+    
+    assert exito, mensaje
+    assert sesion["usuario"]["id"] == registrado.id
+    usuario = servicio.verificar_token(sesion["access_token"])
+    assert usuario is not None and usuario.id == registrado.id
+
+def test_password_incorrecta_y_email_desconocido_dan_el_mismo_error(servicio, registrado):
+    assert asyncio.run(servicio.iniciar_sesion(registrado.email, "otra-contraseña")) == \
+        (False, CREDENCIALES_INVALIDAS, None)
+    assert asyncio.run(servicio.iniciar_sesion("nadie@pruebas.test", PASSWORD)) == \
+        (False, CREDENCIALES_INVALIDAS, None)
+
+def test_token_caducado_o_manipulado_no_vale(servicio, registrado):
+    config = servicio.config
+    ahora = int(time.time())
+    caducado = jwt.encode({"sub": str(registrado.id), "iss": config.emisor, "iat": ahora - 120, "exp": ahora - 60},
+                          servicio.secreto, algorithm=config.algoritmo)
+    assert servicio.verificar_token(caducado) is None
+    
+    token, _ = servicio.emitir_token(registrado)
+    assert servicio.verificar_token(token[:-2] + ("AA" if not token.endswith("AA") else "BB")) is None
+
+def test_usuario_desactivado_sigue_en_cache_hasta_invalidarlo(servicio, registrado):
+    token, _ = servicio.emitir_token(registrado)
+    assert servicio.verificar_token(token) is not None
+    
+    registrado.activo = False
+    db_service.update(registrado)
+    # Dentro del TTL se responde desde la caché, sin consultar la base de datos
+    assert servicio.verificar_token(token) is not None
+    
+    servicio.invalidar_usuario(registrado.id)
+    assert servicio.verificar_token(token) is None
+
+def test_usuario_en_cache_caduca_con_el_ttl(servicio, registrado, monkeypatch):
+    servicio.configurar(replace(servicio.config, cache_ttl_s=30.0))
+    token, _ = servicio.emitir_token(registrado)
+    assert servicio.verificar_token(token) is not None
+    
+    registrado.activo = False
+    db_service.update(registrado)
+    ahora = time.monotonic()
+    monkeypatch.setattr(modulo.time, "monotonic", lambda: ahora + 31)
+    assert servicio.verificar_token(token) is None
+
+def test_cache_ttl_caduca_y_descarta_la_mas_antigua(monkeypatch):
+    reloj = [100.0]
+    monkeypatch.setattr(modulo.time, "monotonic", lambda: reloj[0])
+    cache = CacheTTL(maximo=2)
+    
+    cache.guardar("a", 1, ttl_s=10)
+    cache.guardar("b", 2, ttl_s=10)
+    cache.guardar("c", 3, ttl_s=10)
+    assert cache.obtener("a") is None
+    assert cache.obtener("b") == 2
+    
+    reloj[0] += 11
+    assert cache.obtener("c", "caducada") == "caducada"
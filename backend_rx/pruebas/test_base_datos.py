@@ -0,0 +1,131 @@
+"""
+Tests de base de datos
+
+Contiene pruebas de integración del servicio de base de datos: paginación por cursor,
+compilador de filtros y unidad de trabajo.
+"""
+import pytest
+
+from backend_rx.apps.modelos.usuario import Usuario
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoMotor
+from backend_rx.apps.servicio.base_datos import db_service, compilar_filtros, transactional
+
+COLORES = [None, "Azul", None, "Rojo", "Azul", None, "Verde"]
+
+def _clave(vehiculo: Vehiculo) -> tuple:
+    """Orden ascendente de (color_exterior, id) en SQLite: NULL antes que cualquier valor"""
+    return (vehiculo.color_exterior is not None, vehiculo.color_exterior or "", vehiculo.id)
+
+def _recorrer_con_altas(marca: str, order_by: str, crear) -> tuple:
+    """Recorre las páginas de 2 en 2 y, tras la primera, publica dos vehículos: uno que
+    queda antes del cursor y otro después"""
+    vistos, cursor, nuevos = [], None, []
+    while True:
+        pagina, cursor = db_service.search_keyset(Vehiculo, {"marca": marca}, limit=2,
+                                                  order_by=order_by, cursor=cursor)
+        vistos.extend(pagina)
+        if not nuevos:
+            nuevos = [crear(color_exterior=None), crear(color_exterior="Amarillo"), crear(color_exterior="Zafiro")]
+            posicion = _clave(vistos[-1])
+        if cursor is None:
+            return vistos, nuevos, posicion
+
+def test_cursor_estable_con_nulos_y_altas_entre_paginas(crear_vehiculo, marca_unica):
+    for order_by, descendente in (("color_exterior", False), ("-color_exterior", True)):
+        marca = marca_unica()
+        primero = crear_vehiculo(marca=marca, color_exterior=COLORES[0])
+        originales = [primero] + [crear_vehiculo(primero.vendedor_id, marca=marca, color_exterior=color)
+                                  for color in COLORES[1:]]
+        crear = lambda **datos: crear_vehiculo(primero.vendedor_id, marca=marca, **datos)
+        
+        vistos, nuevos, posicion = _recorrer_con_altas(marca, order_by, crear)
+        
+        # Orden correcto y sin repetidos
+        assert [_clave(v) for v in vistos] == sorted((_clave(v) for v in vistos), reverse=descendente)
+        # Los que ya existían salen todos, y de los nuevos solo los posteriores al cursor
+        esperados = [v.id for v in originales] + [
+            v.id for v in nuevos if (_clave(v) < posicion if descendente else _clave(v) > posicion)
+        ]
+        assert sorted(v.id for v in vistos) == sorted(esperados), order_by
+
+def test_compilar_filtros_separa_forma_y_parametros():
+    forma, parametros = compilar_filtros(Vehiculo, {
+        "precio": {"between": (1000, 5000)}, "tipo_motor": {"in": (TipoMotor.DIESEL,)},
+        "color_exterior": {"isnull": True}, "activo": True, "order_by": "precio",
+    })
+    
+    assert forma == (("activo", "eq", True), ("color_exterior", "isnull", True),
+                     ("precio", "between", None), ("tipo_motor", "in", None))
+    assert parametros == {"precio__between_min": 1000, "precio__between_max": 5000,
+                          "tipo_motor__in": [TipoMotor.DIESEL]}
+    with pytest.raises(ValueError):
+        compilar_filtros(Vehiculo, {"precio": {"entre": (1, 2)}})
+
+@pytest.mark.parametrize("total", ["ventana", "separado"])
+def test_total_coincide_con_las_filas(crear_vehiculo, marca_unica, total):
+    marca = marca_unica()
+    vendedor_id = crear_vehiculo(marca=marca, precio=500.0).vendedor_id
+    datos = [
+        (3000.0, TipoMotor.DIESEL, None), (4000.0, TipoMotor.GASOLINA, None), (5000.0, TipoMotor.DIESEL, "Rojo"),
+        (5000.0, TipoMotor.HIBRIDO, None), (6000.0, TipoMotor.DIESEL, None), (2000.0, TipoMotor.DIESEL, None),
+        (1000.0, TipoMotor.GASOLINA, None),
+    ]
+    vehiculos = [crear_vehiculo(vendedor_id, marca=marca, precio=precio, tipo_motor=motor, color_exterior=color)
+                 for precio, motor, color in datos]
+    filtros = {"marca": marca, "precio": {"between": (1000, 5000)},
+               "tipo_motor": {"in": [TipoMotor.DIESEL, TipoMotor.GASOLINA]}, "color_exterior": {"isnull": True}}
+    esperados = [v.id for v in vehiculos if 1000 <= v.precio <= 5000 and v.color_exterior is None
+                 and v.tipo_motor in (TipoMotor.DIESEL, TipoMotor.GASOLINA)]
+    
+    leidos = []
+    for offset in range(0, 6, 2):
+        pagina, cuenta = db_service.search_with_count(Vehiculo, filtros, limit=2, offset=offset,
+                                                      order_by="precio", total=total)
+        assert cuenta == len(esperados) == db_service.count(Vehiculo, filtros)
+        leidos.extend(v.id for v in pagina)
+    
+    assert sorted(leidos) == sorted(esperados)
+
+def _existe(email: str) -> bool:
+    """Consulta con una conexión de lectura, fuera de cualquier transacción"""
+    return bool(db_service.count(Usuario, {"email": email}))
+
+def _operacion(email: str, avisos: list, resultado=None, error: Exception = None):
+    @transactional
+    def operacion():
+        db_service.create(Usuario(email=email, password_hash="x", nombre="Prueba", apellido="Transaccion",
+                                  ciudad="Madrid", provincia="Madrid"))
+        db_service.al_confirmar(lambda: avisos.append(_existe(email)))
+        assert avisos == []
+        if error:
+            raise error
+        return resultado
+    return operacion
+
+def test_transactional_deshace_el_resultado_de_fallo(marca_unica):
+    email, avisos = f"{marca_unica()}@pruebas.test", []
+    
+    assert _operacion(email, avisos, (False, "No válido", None))() == (False, "No válido", None)
+    
+    assert not _existe(email)
+    assert avisos == []
+
+def test_transactional_deshace_la_excepcion(marca_unica):
+    email, avisos = f"{marca_unica()}@pruebas.test", []
+    
+    with pytest.raises(KeyError):
+        _operacion(email, avisos, error=KeyError("fallo"))()
+    
+    assert not _existe(email)
+    assert avisos == []
+
+def test_al_confirmar_se_ejecuta_despues_del_commit(marca_unica):
+    email, avisos = f"{marca_unica()}@pruebas.test", []
+    
+    assert _operacion(email, avisos, (True, "Hecho", None))()[0]
+    
+    # El aviso ve los datos desde otra conexión: ya se ha hecho el commit
+    assert avisos == [True]
+    fuera = []
+    db_service.al_confirmar(lambda: fuera.append(True))
+    assert fuera == [True]
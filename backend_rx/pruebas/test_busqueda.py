@@ -0,0 +1,100 @@
+"""
+Tests de búsqueda
+
+Contiene pruebas de integración de la búsqueda de vehículos: texto libre, facetas y distancia.
+"""
+from sqlmodel import select, func
+
+from backend_rx.apps.modelos.vehiculo import Vehiculo, TipoMotor, EstadoVehiculo
+from backend_rx.apps.servicio import geografia
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+
+def _ids(vehiculos) -> list:
+    return [v.id for v in vehiculos]
+
+def test_texto_sin_acentos_por_prefijo_y_sin_eliminados(crear_vehiculo, marca_unica):
+    marca = marca_unica()
+    hibrido = crear_vehiculo(marca=marca, modelo="Ibiza", descripcion="Motor híbrido, único dueño")
+    diesel = crear_vehiculo(hibrido.vendedor_id, marca=marca, modelo="Leon", descripcion="Diésel")
+    
+    # LIKE no encontraría "hibrido" en "híbrido": el resultado sale del índice FTS5
+    assert _ids(vehiculos_service.buscar_por_texto(f"{marca} HIBRIDO")) == [hibrido.id]
+    assert _ids(vehiculos_service.buscar_por_texto(f"{marca.lower()} ibi")) == [hibrido.id]
+    assert _ids(vehiculos_service.buscar_por_texto(f"{marca} dies")) == [diesel.id]
+    assert sorted(_ids(vehiculos_service.buscar_por_texto(marca))) == [hibrido.id, diesel.id]
+    
+    assert vehiculos_service.eliminar_vehiculo(hibrido.id, hibrido.vendedor_id)[0]
+    assert vehiculos_service.buscar_por_texto(f"{marca} hibrido") == []
+    assert _ids(vehiculos_service.buscar_por_texto(marca)) == [diesel.id]
+
+def _agrupar(columna, *condiciones) -> dict:
+    """Recuento por valor de la columna de los vehículos disponibles, con GROUP BY en SQL"""
+    with db_service.get_session(solo_lectura=True) as session:
+        filas = session.exec(
+            select(columna, func.count())
+            .where(Vehiculo.activo == True, Vehiculo.estado == EstadoVehiculo.DISPONIBLE, *condiciones)
+            .group_by(columna)
+        ).all()
+    return {getattr(valor, "value", valor): cantidad for valor, cantidad in filas}
+
+def _faceta(valores: list) -> dict:
+    return {v["valor"]: v["cantidad"] for v in valores if v["cantidad"]}
+
+def test_facetas_coinciden_con_group_by(crear_vehiculo, marca_unica):
+    modelo = marca_unica()
+    otra_marca = marca_unica()
+    datos = [
+        ("Seat", TipoMotor.DIESEL, "Madrid"), ("Seat", TipoMotor.GASOLINA, "Madrid"),
+        (otra_marca, TipoMotor.DIESEL, "Barcelona"), (otra_marca, TipoMotor.DIESEL, "Valencia"),
+        ("Seat", TipoMotor.ELECTRICO, "Valencia"), ("Seat", TipoMotor.DIESEL, "Barcelona"),
+    ]
+    vehiculos = [crear_vehiculo(marca=marca, modelo=modelo, tipo_motor=motor,
+                                ubicacion_ciudad=provincia, ubicacion_provincia=provincia)
+                 for marca, motor, provincia in datos]
+    # Ni los vendidos ni los eliminados cuentan
+    assert vehiculos_service.marcar_como_vendido(vehiculos[0].id, vehiculos[0].vendedor_id)[0]
+    assert vehiculos_service.eliminar_vehiculo(vehiculos[3].id, vehiculos[3].vendedor_id)[0]
+    
+    resultado = vehiculos_service.buscar_vehiculos({"modelo": modelo, "tipo_motor": TipoMotor.DIESEL},
+                                                   facetas=True)
+    facetas = resultado["facetas"]
+    
+    ambos = (Vehiculo.modelo == modelo, Vehiculo.tipo_motor == TipoMotor.DIESEL)
+    assert resultado["total"] == facetas["total"] == sum(_agrupar(Vehiculo.modelo, *ambos).values()) == 2
+    assert _faceta(facetas["marcas"]) == _agrupar(Vehiculo.marca, *ambos)
+    assert _faceta(facetas["provincias"]) == _agrupar(Vehiculo.ubicacion_provincia, *ambos)
+    # Facetas disyuntivas: la de motor no se filtra por el propio motor
+    assert _faceta(facetas["tipos_motor"]) == _agrupar(Vehiculo.tipo_motor, Vehiculo.modelo == modelo)
+    assert _faceta(facetas["tipos_motor"]) == {"diesel": 2, "gasolina": 1, "electrico": 1}
+
+LOCALIDADES = [("Madrid", "Madrid"), ("Getafe", "Madrid"), ("Alcalá de Henares", "Madrid"),
+               ("Guadalajara", "Guadalajara"), ("Toledo", "Toledo"), ("Barcelona", "Barcelona")]
+
+def test_radio_y_caja_filtran_por_distancia(crear_vehiculo, marca_unica):
+    marca = marca_unica()
+    vehiculos = [crear_vehiculo(marca=marca, ubicacion_ciudad=ciudad, ubicacion_provincia=provincia)
+                 for ciudad, provincia in LOCALIDADES]
+    latitud, longitud = geografia.centro({"ciudad": "Madrid", "provincia": "Madrid"})
+    distancias = {v.id: geografia.distancia_km(latitud, longitud, v.latitud, v.longitud) for v in vehiculos}
+    
+    for radio_km in (40, 60):
+        filtros = {"marca": marca, "order_by": "distancia",
+                   "cerca": {"ciudad": "Madrid", "provincia": "Madrid", "radio_km": radio_km}}
+        resultado = vehiculos_service.buscar_vehiculos(filtros, facetas=True)
+        esperados = sorted((d, i) for i, d in distancias.items() if d <= radio_km)
+        assert len(esperados) == {40: 3, 60: 4}[radio_km]
+        
+        assert _ids(resultado["vehiculos"]) == [i for _, i in esperados]
+        assert resultado["total"] == resultado["facetas"]["total"] == len(esperados)
+        assert resultado["distancias"] == {i: round(d, 1) for d, i in esperados}
+        del filtros["order_by"]
+        cursor = vehiculos_service.buscar_vehiculos_cursor(filtros, total=True)
+        assert sorted(_ids(cursor["vehiculos"])) == sorted(i for _, i in esperados)
+        assert cursor["total"] == len(esperados)
+    
+    caja = (39.8, -4.1, 40.35, -3.6)
+    resultado = vehiculos_service.buscar_vehiculos({"marca": marca, "caja": caja}, facetas=True)
+    dentro = [v.id for v in vehiculos if caja[0] <= v.latitud <= caja[2] and caja[1] <= v.longitud <= caja[3]]
+    assert sorted(_ids(resultado["vehiculos"])) == sorted(dentro)
+    assert len(dentro) == resultado["facetas"]["total"] == 2
@@ -3,4 +3,119 @@ Tests de checkout
 
 Contiene pruebas unitarias y de integración para el proceso de checkout en el ecosistema de negocios de autos.
 """
-# Aquí van los tests de checkout.
\ No newline at end of file
+import threading
+from datetime import datetime, timedelta
+
+from sqlmodel import select, update
+
+from backend_rx.apps.modelos.transaccion import Transaccion, EstadoTransaccion
+from backend_rx.apps.modelos.vehiculo import Vehiculo, EstadoVehiculo
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.checkout_service import checkout_service
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+
+def _caducar(transaccion_id: int) -> None:
+    """Adelanta el vencimiento de la reserva al pasado"""
+    with db_service.transaction() as session:
+        session.execute(update(Transaccion).where(Transaccion.id == transaccion_id)
+                        .values(expira=datetime.now() - timedelta(minutes=1)))
+
+def _estado(vehiculo_id: int) -> EstadoVehiculo:
+    with db_service.get_session(solo_lectura=True) as session:
+        return session.exec(select(Vehiculo.estado).where(Vehiculo.id == vehiculo_id)).one()
+
+def _transacciones(vehiculo_id: int):
+    with db_service.get_session(solo_lectura=True) as session:
+        return session.exec(select(Transaccion).where(Transaccion.vehiculo_id == vehiculo_id)).all()
+
+def test_reservas_concurrentes_solo_una_gana(crear_usuario, crear_vehiculo):
+    vehiculo = crear_vehiculo()
+    compradores = [crear_usuario().id for _ in range(8)]
+    salida = threading.Barrier(len(compradores))
+    resultados = []
+    
+    def reservar(comprador_id: int) -> None:
+        salida.wait()
+        resultados.append(checkout_service.reservar(vehiculo.id, comprador_id, f"clave-{comprador_id}"))
+    
+    hilos = [threading.Thread(target=reservar, args=(c,)) for c in compradores]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    
+    ganadores = [r for r in resultados if r[0]]
+    assert len(resultados) == len(compradores)
+    assert len(ganadores) == 1
+    assert all(mensaje == "El vehículo ya está reservado" for exito, mensaje, _ in resultados if not exito)
+    assert _estado(vehiculo.id) == EstadoVehiculo.RESERVADO
+    assert [t.estado for t in _transacciones(vehiculo.id)] == [EstadoTransaccion.RESERVADA]
+
+def test_repetir_con_la_misma_clave_devuelve_la_misma_reserva(crear_usuario, crear_vehiculo):
+    vehiculo = crear_vehiculo()
+    comprador = crear_usuario()
+    
+    exito, _, primera = checkout_service.reservar(vehiculo.id, comprador.id, "doble-clic")
+    repetida = checkout_service.reservar(vehiculo.id, comprador.id, "doble-clic")
+    
+    assert exito
+    assert repetida[0] and repetida[1] == "Reserva ya registrada"
+    assert repetida[2].id == primera.id
+    assert len(_transacciones(vehiculo.id)) == 1
+
+def test_clave_reutilizada_para_otro_vehiculo(crear_usuario, crear_vehiculo):
+    primero, segundo = crear_vehiculo(), crear_vehiculo()
+    comprador = crear_usuario()
+    
+    assert checkout_service.reservar(primero.id, comprador.id, "misma-clave")[0]
+    exito, mensaje, transaccion = checkout_service.reservar(segundo.id, comprador.id, "misma-clave")
+    
+    assert not exito and transaccion is None
+    assert mensaje == "La clave de idempotencia ya se usó para otro vehículo"
+    assert _estado(segundo.id) == EstadoVehiculo.DISPONIBLE
+
+def test_reserva_caducada_se_libera_al_reservar_otro(crear_usuario, crear_vehiculo):
+    vehiculo = crear_vehiculo()
+    primero, segundo = crear_usuario(), crear_usuario()
+    _, _, anterior = checkout_service.reservar(vehiculo.id, primero.id, "primera")
+    
+    assert not checkout_service.reservar(vehiculo.id, segundo.id, "en-vigor")[0]
+    _caducar(anterior.id)
+    exito, _, nueva = checkout_service.reservar(vehiculo.id, segundo.id, "tras-caducar")
+    
+    assert exito and nueva.comprador_id == segundo.id
+    estados = {t.id: t.estado for t in _transacciones(vehiculo.id)}
+    assert estados == {anterior.id: EstadoTransaccion.EXPIRADA, nueva.id: EstadoTransaccion.RESERVADA}
+    assert _estado(vehiculo.id) == EstadoVehiculo.RESERVADO
+
+def test_confirmar_compra_caducada(crear_usuario, crear_vehiculo):
+    vehiculo = crear_vehiculo()
+    comprador = crear_usuario()
+    _, _, reserva = checkout_service.reservar(vehiculo.id, comprador.id, "tarde")
+    _caducar(reserva.id)
+    
+    exito, mensaje, transaccion = checkout_service.confirmar_compra(reserva.id, comprador.id)
+    
+    assert not exito and mensaje == "La reserva ha caducado"
+    assert transaccion.estado == EstadoTransaccion.EXPIRADA
+    assert _estado(vehiculo.id) == EstadoVehiculo.DISPONIBLE
+
+def test_confirmar_compra_vende_una_sola_vez(crear_usuario, crear_vehiculo):
+    vehiculo = crear_vehiculo()
+    comprador = crear_usuario()
+    _, _, reserva = checkout_service.reservar(vehiculo.id, comprador.id, "compra")
+    
+    assert checkout_service.confirmar_compra(reserva.id, comprador.id)[:2] == (True, "Compra confirmada")
+    assert checkout_service.confirmar_compra(reserva.id, comprador.id)[:2] == (True, "La compra ya estaba confirmada")
+    assert _estado(vehiculo.id) == EstadoVehiculo.VENDIDO
+    assert not checkout_service.reservar(vehiculo.id, crear_usuario().id, "despues")[0]
+
+def test_no_se_elimina_un_vehiculo_reservado(crear_usuario, crear_vehiculo):
+    vehiculo = crear_vehiculo()
+    comprador = crear_usuario()
+    _, _, reserva = checkout_service.reservar(vehiculo.id, comprador.id, "antes-de-borrar")
+    
+    assert vehiculos_service.eliminar_vehiculo(vehiculo.id, vehiculo.vendedor_id) == \
+        (False, "El vehículo tiene una reserva en curso")
+    assert checkout_service.confirmar_compra(reserva.id, comprador.id)[:2] == (True, "Compra confirmada")
+    assert _estado(vehiculo.id) == EstadoVehiculo.VENDIDO
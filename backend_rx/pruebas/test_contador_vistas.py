@@ -0,0 +1,71 @@
+"""
+Tests del contador de vistas
+
+Contiene pruebas de integración del buffer de vistas con escritura diferida.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlmodel import select
+
+from backend_rx.apps.modelos.vehiculo import Vehiculo
+from backend_rx.apps.servicio import contador_vistas
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.contador_vistas import BufferVistas
+
+class BaseDatosBloqueada:
+    """Sustituye a db_service en contador_vistas: toda transacción falla"""
+    
+    def __init__(self):
+        self.intentos = 0
+    
+    @contextmanager
+    def transaction(self):
+        self.intentos += 1
+        raise RuntimeError("database is locked")
+        yield
+
+@pytest.fixture
+def buffer():
+    # Sin volcados periódicos durante el test: solo los que se piden
+    buffer = BufferVistas(intervalo_segundos=3600, max_pendientes=2, max_retenidos=3)
+    yield buffer
+    buffer.detener()
+
+def _vistas(ids) -> dict:
+    with db_service.get_session(solo_lectura=True) as session:
+        return dict(session.exec(select(Vehiculo.id, Vehiculo.vistas).where(Vehiculo.id.in_(ids))).all())
+
+def test_volcar_suma_las_vistas_en_lote(crear_vehiculo, buffer):
+    primero = crear_vehiculo()
+    segundo = crear_vehiculo(primero.vendedor_id)
+    
+    buffer.registrar(primero.id, 3)
+    assert buffer.pendientes(primero.id) == 3
+    buffer.registrar(segundo.id)  # con max_pendientes=2 se vuelca en el momento
+    buffer.registrar(primero.id)
+    
+    assert buffer.todos_pendientes() == {primero.id: 1}
+    assert buffer.volcar() == 1
+    assert _vistas([primero.id, segundo.id]) == {primero.id: 4, segundo.id: 1}
+    assert buffer.todos_pendientes() == {}
+
+def test_volcado_fallido_conserva_las_vistas_hasta_max_retenidos(crear_vehiculo, buffer, monkeypatch):
+    ids = [crear_vehiculo().id for _ in range(4)]
+    bloqueada = BaseDatosBloqueada()
+    monkeypatch.setattr(contador_vistas, "db_service", bloqueada)
+    
+    buffer.registrar(ids[0])
+    buffer.registrar(ids[1])  # lleno: el volcado falla, pero la vista no
+    buffer.registrar(ids[2])  # sigue fallando: no se reintenta en cada vista
+    assert bloqueada.intentos == 1
+    buffer.registrar(ids[3])  # por encima de max_retenidos se descarta la más antigua
+    assert buffer.todos_pendientes() == {ids[1]: 1, ids[2]: 1, ids[3]: 1}
+    
+    with pytest.raises(RuntimeError):
+        buffer.volcar()
+    assert buffer.todos_pendientes() == {ids[1]: 1, ids[2]: 1, ids[3]: 1}
+    
+    monkeypatch.setattr(contador_vistas, "db_service", db_service)
+    assert buffer.volcar() == 3
+    assert _vistas(ids) == {ids[0]: 0, ids[1]: 1, ids[2]: 1, ids[3]: 1}
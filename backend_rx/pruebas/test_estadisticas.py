@@ -0,0 +1,22 @@
+"""
+Tests de estadísticas
+
+Contiene pruebas de integración de los contadores incrementales de vehículos.
+"""
+from backend_rx.apps.servicio import estadisticas
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+
+def test_contadores_sin_desviaciones_tras_alta_cambio_venta_y_baja(crear_vehiculo, marca_unica):
+    # Punto de partida conocido, independiente de los tests anteriores
+    estadisticas.reconciliar(reparar=True)
+    marca = marca_unica()
+    actualizado = crear_vehiculo(marca=marca, precio=10000.0)
+    vendido = crear_vehiculo(actualizado.vendedor_id, marca=marca)
+    eliminado = crear_vehiculo(actualizado.vendedor_id, marca=marca)
+    
+    assert vehiculos_service.actualizar_vehiculo(actualizado.id, {"precio": 12500.0}, actualizado.vendedor_id)[0]
+    assert vehiculos_service.marcar_como_vendido(vendido.id, vendido.vendedor_id)[0]
+    assert vehiculos_service.eliminar_vehiculo(eliminado.id, eliminado.vendedor_id)[0]
+    
+    assert estadisticas.reconciliar() == []
+    assert estadisticas.leer()[("marca", marca)][0] == 2
@@ -0,0 +1,85 @@
+"""
+Tests de fotos
+
+Contiene pruebas de integración de la subida de fotos y del proceso de sus variantes.
+"""
+import io
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from PIL import Image
+
+from backend_rx.apps.modelos.foto import FotoVehiculo, EstadoFoto
+from backend_rx.apps.servicio import miniaturas
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.fotos import FotosService, ConfiguracionFotos
+
+def _png(color: str) -> bytes:
+    salida = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(salida, "PNG")
+    return salida.getvalue()
+
+def _esperar_estado(foto_id: int, segundos: float = 30) -> EstadoFoto:
+    limite = time.monotonic() + segundos
+    while True:
+        estado = db_service.get_by_id(FotoVehiculo, foto_id).estado
+        if estado != EstadoFoto.PENDIENTE or time.monotonic() > limite:
+            return estado
+        time.sleep(0.05)
+
+class BaseDatosConPausa:
+    """db_service que, una vez armado, ejecuta una función al salir de la siguiente transacción"""
+    
+    def __init__(self):
+        self.al_salir = None
+    
+    def __getattr__(self, nombre):
+        return getattr(db_service, nombre)
+    
+    @contextmanager
+    def transaction(self):
+        funcion, self.al_salir = self.al_salir, None
+        with db_service.transaction() as session:
+            yield session
+        if funcion:
+            funcion()
+
+@pytest.fixture
+def servicio(tmp_path):
+    servicio = FotosService()
+    servicio._config = ConfiguracionFotos(directorio=str(tmp_path), procesos=1)
+    servicio.db = BaseDatosConPausa()
+    yield servicio
+    servicio.esperar()
+    servicio.cerrar()
+
+def test_subida_repetida_durante_el_registro_no_queda_pendiente(servicio, crear_vehiculo, monkeypatch):
+    primero = crear_vehiculo()
+    segundo = crear_vehiculo(primero.vendedor_id)
+    contenido = _png("red")
+    subidas = {}
+    subida = threading.Event()
+    
+    def subir_segunda() -> None:
+        # Desde otro hilo, como otra petición: el hash sigue en _en_curso
+        hilo = threading.Thread(target=lambda: subidas.update(
+            segunda=servicio.subir_foto(segundo.id, segundo.vendedor_id, contenido)))
+        hilo.start()
+        hilo.join()
+        subida.set()
+    
+    exito, _, primera = servicio.subir_foto(primero.id, primero.vendedor_id, contenido)
+    assert exito and primera.estado == EstadoFoto.PENDIENTE
+    # Como si la segunda subida hubiera comprobado las variantes antes de que el pool las
+    # terminara (solo en este proceso: el pool las genera igualmente)
+    monkeypatch.setattr(miniaturas, "variantes_completas", lambda raiz, hash: False)
+    # La siguiente transacción es la de _terminar: la segunda subida se confirma justo después
+    servicio.db.al_salir = subir_segunda
+    
+    assert subida.wait(30)
+    assert _esperar_estado(primera.id) == EstadoFoto.LISTA
+    exito, mensaje, segunda = subidas["segunda"]
+    assert exito and segunda.estado == EstadoFoto.PENDIENTE, mensaje
+    assert _esperar_estado(segunda.id) == EstadoFoto.LISTA
@@ -3,4 +3,58 @@ Tests de vehículos
 
 Contiene pruebas unitarias y de integración para la gestión de vehículos en el ecosistema de negocios de autos.
 """
-# Aquí van los tests básicos de vehículos.
\ No newline at end of file
+import asyncio
+import io
+import threading
+
+from backend_rx.apps.servicio.alertas import alertas_service
+from backend_rx.apps.servicio.base_datos import db_service
+from backend_rx.apps.servicio.importacion import importar_vehiculos
+from backend_rx.apps.servicio.vehiculos_async import AsyncVehiculosService
+from backend_rx.apps.servicio.vehiculos_service import vehiculos_service
+
+CSV = """marca,modelo,año,precio,kilometraje,tipo_motor,tipo_vehiculo,ubicacion_ciudad,ubicacion_provincia
+Lancia,Ypsilon,2018,8000,70000,gasolina,hatchback,Madrid,Madrid
+Lancia,Delta,2015,6500,120000,diesel,hatchback,Madrid,Madrid
+Lancia,Ypsilon,2019,,50000,gasolina,hatchback,Madrid,Madrid
+"""
+
+def test_importacion_genera_avisos_de_busquedas_guardadas(crear_usuario):
+    vendedor, comprador = crear_usuario(), crear_usuario()
+    exito, mensaje, _ = alertas_service.guardar_busqueda(comprador.id, "Lancia", {"marca": "Lancia"})
+    assert exito, mensaje
+    
+    informe = importar_vehiculos(io.StringIO(CSV), "csv", vendedor_id=vendedor.id)
+    alertas_service.esperar()
+    
+    assert (informe["insertadas"], informe["con_error"]) == (2, 1)
+    avisos = alertas_service.obtener_alertas(comprador.id)
+    assert len(avisos) == 2
+    assert not alertas_service.obtener_alertas(vendedor.id)
+
+def test_inventario_asincrono_consulta_cada_bloque_en_el_pool(crear_vehiculo, monkeypatch):
+    primero = crear_vehiculo()
+    for _ in range(4):
+        crear_vehiculo(primero.vendedor_id)
+    esperados = [v.id for v in vehiculos_service.obtener_vehiculos_vendedor(primero.vendedor_id)]
+    servicio = AsyncVehiculosService(vehiculos_service, max_hilos=1)
+    hilos = []
+    search_keyset = db_service.search_keyset
+    
+    def registrar_hilo(*args, **kwargs):
+        hilos.append(threading.current_thread().name)
+        return search_keyset(*args, **kwargs)
+    monkeypatch.setattr(db_service, "search_keyset", registrar_hilo)
+    
+    async def leer():
+        return [[v.id for v in bloque]
+                async for bloque in servicio.iterar_vehiculos_vendedor(primero.vendedor_id, tamaño_bloque=2)]
+    
+    try:
+        bloques = asyncio.run(leer())
+    finally:
+        servicio.cerrar()
+    
+    assert [len(bloque) for bloque in bloques] == [2, 2, 1]
+    assert sum(bloques, []) == esperados
+    assert len(hilos) == 3 and all(nombre.startswith("vehiculos-db") for nombre in hilos)
@@ -0,0 +1,124 @@
+"""
+Verificación de índices
+
+Ejecuta cada método público de VehiculosService sobre una base de datos de pruebas,
+captura las consultas SQL que emite y revisa su plan (EXPLAIN QUERY PLAN). Marca las
+consultas que recorren la tabla vehiculo completa u ordenan en un B-tree temporal, y
+los métodos públicos nuevos que todavía no tienen caso de verificación.
+
+    REFLEX_DB_URL=sqlite:///bench.db python -m backend_rx.pruebas.verificar_indices
+
+Sale con código 1 si hay consultas sin índice que no estén en PERMITIDOS.
+"""
+import sys
+import inspect
+from typing import Dict, List, Tuple, Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from backend_rx.apps.modelos.vehiculo import TipoMotor, TipoVehiculo
+from backend_rx.apps.servicio.vehiculos_service import VehiculosService, vehiculos_service
+from backend_rx.apps.servicio.motor import motor_escritura, motor_lectura
+from backend_rx.pruebas.benchmarks import preparar_datos
+
+# Argumentos con los que se ejercita cada método público del servicio
+CASOS: Dict[str, Tuple[tuple, dict]] = {
+    "crear_vehiculo": (({
+        "marca": "Seat", "modelo": "Ibiza", "año": 2019, "precio": 9500.0,
+        "kilometraje": 60000, "ubicacion_ciudad": "Madrid", "ubicacion_provincia": "Madrid",
+        "tipo_motor": TipoMotor.GASOLINA, "tipo_vehiculo": TipoVehiculo.HATCHBACK,
+    }, 1), {}),
+    "obtener_vehiculo": ((1,), {"incrementar_vista": True}),
+    "actualizar_vehiculo": ((1, {"precio": 9000.0}, 1), {}),
+    "eliminar_vehiculo": ((2, 1), {}),
+    "buscar_vehiculos": (({"precio": {"between": (5000, 20000)}},), {}),
+    "buscar_vehiculos_cursor": (({"order_by": "precio"},), {}),
+    "buscar_por_texto": (("ibiza",), {}),
+    "obtener_filtros_disponibles": ((), {}),
+    "obtener_destacados": ((), {}),
+    "obtener_recientes": ((), {}),
+    "obtener_mas_visitados": ((), {}),
+    "obtener_tendencias": ((), {"tipo_vehiculo": TipoVehiculo.SUV}),
+    "obtener_similares": ((3,), {}),
+    "marcar_como_vendido": ((4, 1), {}),
+    "destacar_vehiculo": ((5, 1), {}),
+    "obtener_estadisticas_generales": ((), {}),
+    "obtener_vehiculos_vendedor": ((1,), {}),
+    "iterar_vehiculos_vendedor": ((1,), {"tamaño_bloque": 50}),
+    "obtener_panel_vendedor": ((1,), {}),
+}
+
+# Consultas que recorren la tabla de forma conocida, con el motivo
+PERMITIDOS: Dict[str, str] = {
+    "obtener_estadisticas_generales": "reconstrucción con GROUP BY si la tabla de contadores está vacía",
+}
+
+def _problemas_plan(plan: List[str]) -> List[str]:
+    """Pasos del plan que indican un recorrido completo u ordenación sin índice"""
+    # Ordenar en memoria es aceptable si antes se ha acotado con un índice (SEARCH)
+    acotada = any(paso.startswith("SEARCH vehiculo") for paso in plan)
+    problemas = []
+    for paso in plan:
+        recorrido = paso.startswith("SCAN vehiculo") and "INDEX" not in paso
+        if recorrido or ("USE TEMP B-TREE" in paso and not acotada):
+            problemas.append(paso)
+    return problemas
+
+def verificar(n_vehiculos: int = 2000) -> Dict[str, List[Dict[str, Any]]]:
+    """Devuelve, por método, las consultas con problemas de índice"""
+    preparar_datos(n_vehiculos)
+    with motor_escritura().begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    
+    capturadas: List[Tuple[str, Any]] = []
+    
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "vehiculo" in statement:
+            capturadas.append((statement, parameters))
+    
+    # En la clase Engine, como instrumentacion.py: db_service consulta con los motores de
+    # lectura y escritura de motor.py, no con el de Reflex
+    event.listen(Engine, "before_cursor_execute", capturar)
+    resultado: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        metodos = [
+            nombre for nombre, _ in inspect.getmembers(VehiculosService, inspect.isfunction)
+            if not nombre.startswith("_")
+        ]
+        for nombre in metodos:
+            if nombre not in CASOS:
+                resultado[nombre] = [{"sql": None, "plan": ["sin caso de verificación en CASOS"]}]
+                continue
+            args, kwargs = CASOS[nombre]
+            capturadas.clear()
+            getattr(vehiculos_service, nombre)(*args, **kwargs)
+            consultas = list(capturadas)
+            
+            problemas = []
+            # EXPLAIN no empieza por SELECT: capturar no lo recoge
+            with motor_lectura().connect() as conn:
+                for sql, parametros in consultas:
+                    filas = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, parametros).all()
+                    plan = [fila[-1] for fila in filas]
+                    if _problemas_plan(plan):
+                        problemas.append({"sql": " ".join(sql.split()), "plan": plan})
+            if problemas:
+                resultado[nombre] = problemas
+    finally:
+        event.remove(Engine, "before_cursor_execute", capturar)
+    return resultado
+
+if __name__ == "__main__":
+    fallos = 0
+    for metodo, problemas in verificar().items():
+        permitido = PERMITIDOS.get(metodo)
+        estado = f"PERMITIDO ({permitido})" if permitido else "SIN ÍNDICE"
+        fallos += 0 if permitido else 1
+        print(f"[{estado}] {metodo}")
+        for problema in problemas:
+            if problema["sql"]:
+                print(f"    {problema['sql'][:160]}")
+            for paso in problema["plan"]:
+                print(f"      -> {paso}")
+    sys.exit(1 if fallos else 0)
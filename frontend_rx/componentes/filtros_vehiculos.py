@@ -2,4 +2,61 @@
 Componente FiltrosVehiculos
 
 Contiene los filtros para búsqueda y selección de vehículos en el marketplace.
-"""
\ No newline at end of file
+"""
+import reflex as rx
+
+from backend_rx.apps.modelos.vehiculo import TipoMotor
+from frontend_rx.estados.vehiculos import VehiculosState, PRECIO_MAXIMO
+
+ORDENAMIENTOS = {
+    "-fecha_creacion": "Más recientes",
+    "precio": "Precio: menor a mayor",
+    "-precio": "Precio: mayor a menor",
+    "kilometraje": "Menos kilómetros",
+    "-año": "Más nuevos",
+}
+
+# "" no es un valor válido en rx.select: se usa "todos" para quitar el filtro
+TODOS = "todos"
+
+def filtros_vehiculos() -> rx.Component:
+    """Barra de filtros del listado. Cada cambio llega al estado, que espera a que
+    terminen los cambios seguidos (debounce) antes de consultar"""
+    return rx.hstack(
+        rx.input(
+            placeholder="Marca",
+            value=VehiculosState.marca,
+            on_change=VehiculosState.cambiar_marca,
+            debounce_timeout=300,
+        ),
+        rx.select.root(
+            rx.select.trigger(placeholder="Motor"),
+            rx.select.content(
+                rx.select.item("Todos los motores", value=TODOS),
+                *[rx.select.item(motor.value.replace("_", " ").capitalize(), value=motor.value) for motor in TipoMotor],
+            ),
+            on_change=lambda valor: VehiculosState.cambiar_tipo_motor(rx.cond(valor == TODOS, "", valor)),
+        ),
+        rx.vstack(
+            rx.text("Precio: ", VehiculosState.precio[0], " - ", VehiculosState.precio[1], " €", size="2"),
+            rx.slider(
+                default_value=[0, PRECIO_MAXIMO],
+                min=0,
+                max=PRECIO_MAXIMO,
+                step=1000,
+                on_change=VehiculosState.cambiar_precio.throttle(100),
+                width="240px",
+            ),
+            spacing="1",
+        ),
+        rx.select.root(
+            rx.select.trigger(),
+            rx.select.content(*[rx.select.item(texto, value=valor) for valor, texto in ORDENAMIENTOS.items()]),
+            value=VehiculosState.order_by,
+            on_change=VehiculosState.cambiar_orden,
+        ),
+        rx.button("Limpiar", variant="soft", on_click=VehiculosState.limpiar_filtros),
+        spacing="4",
+        align="end",
+        wrap="wrap",
+    )
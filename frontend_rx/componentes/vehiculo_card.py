@@ -2,4 +2,43 @@
 Componente VehiculoCard
 
 Representa la tarjeta visual de un vehículo en el listado del marketplace.
-"""
\ No newline at end of file
+"""
+import reflex as rx
+
+from frontend_rx.estados.vehiculos import CAMPOS_TARJETA, ALTO_TARJETA_PX
+
+ALTO_FOTO_PX = 120
+
+def vehiculo_card(tarjeta: rx.Var) -> rx.Component:
+    """Tarjeta de un vehículo a partir de su lista compacta (estados/vehiculos.py).
+    La altura es fija: el listado calcula con ella qué bloque está a la vista"""
+    def campo(nombre: str) -> rx.Var:
+        return tarjeta[CAMPOS_TARJETA.index(nombre)]
+    
+    return rx.card(
+        rx.vstack(
+            # La miniatura (240 px de lado mayor, WebP) se pide al entrar en pantalla; sin
+            # foto queda un hueco de la misma altura
+            rx.cond(
+                campo("foto"),
+                rx.image(src=campo("foto"), alt="", loading="lazy", decoding="async",
+                         width="100%", height=f"{ALTO_FOTO_PX}px", object_fit="cover"),
+                rx.box(width="100%", height=f"{ALTO_FOTO_PX}px", background_color=rx.color("gray", 3)),
+            ),
+            rx.hstack(
+                rx.text(campo("marca"), " ", campo("modelo"), weight="bold", trim="both"),
+                rx.cond(campo("destacado"), rx.badge("Destacado", color_scheme="amber")),
+                justify="between",
+                width="100%",
+            ),
+            rx.text(campo("precio"), size="6", weight="bold"),
+            rx.text(campo("año"), " · ", campo("kilometraje"), " · ", campo("tipo_motor")),
+            rx.text(campo("ciudad"), " (", campo("provincia"), ")", color_scheme="gray"),
+            spacing="2",
+            height="100%",
+        ),
+        # Por id y no por posición: al mover la ventana React conserva las tarjetas que siguen
+        key=campo("id"),
+        height=f"{ALTO_TARJETA_PX}px",
+        overflow="hidden",
+    )
@@ -2,4 +2,308 @@
 Estado Vehiculos
 
 Gestiona el estado de la lista y detalles de vehículos en el marketplace.
-"""
\ No newline at end of file
+
+El listado (paginas/listado.py) es un scroll infinito con ventana: los resultados se leen por
+cursor en bloques de BLOQUE tarjetas y en el estado, y por tanto en el navegador, solo están
+los BLOQUES_VENTANA bloques alrededor de la posición visible. El siguiente bloque se precarga
+en segundo plano y se guarda en el servidor hasta que entra en la ventana. Lo que queda por
+encima se sustituye por un espacio de la misma altura, así que el DOM y el estado no crecen
+aunque se recorran decenas de miles de resultados; de cada bloque ya visto solo se conserva
+su cursor, para volver a leerlo al subir.
+
+Cada tarjeta es una lista de valores ya formateados (en el orden de CAMPOS_TARJETA) indexada
+por id, y el orden de la ventana va aparte en una lista de ids. Reflex envía al navegador
+cada variable modificada completa, así que solo se reasignan las variables cuyo contenido
+cambia.
+
+Los cambios de filtros esperan DEBOUNCE_S antes de consultar y cada uno deja obsoletas las
+lecturas anteriores, que se descartan aunque ya estén en marcha: mientras se arrastra el
+control de precio solo se consulta el último valor.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import reflex as rx
+
+from backend_rx.apps.modelos.vehiculo import TarjetaVehiculo, TipoMotor, TipoVehiculo
+from backend_rx.apps.servicio.vehiculos_async import vehiculos_async
+from backend_rx.apps.servicio.fotos import fotos_service
+from backend_rx.apps.servicio.instrumentacion import medir_evento
+
+# Espera tras el último cambio de filtros antes de consultar
+DEBOUNCE_S = 0.25
+PRECIO_MAXIMO = 100000
+
+# Ventana del listado. Las tarjetas tienen altura fija para poder calcular qué bloque se
+# ve a partir de la posición del scroll
+ID_LISTADO = "listado-vehiculos"
+COLUMNAS = 3
+BLOQUE = 30
+BLOQUES_VENTANA = 3
+ALTO_TARJETA_PX = 300
+SEPARACION_PX = 20
+ALTO_FILA_PX = ALTO_TARJETA_PX + SEPARACION_PX
+ALTO_BLOQUE_PX = BLOQUE // COLUMNAS * ALTO_FILA_PX
+
+# Posición de cada dato en la lista compacta de una tarjeta
+CAMPOS_TARJETA = ("id", "marca", "modelo", "año", "precio", "kilometraje",
+                  "ciudad", "provincia", "tipo_motor", "destacado", "foto")
+
+def tarjeta_compacta(tarjeta: TarjetaVehiculo) -> List[Any]:
+    """Valores de la tarjeta en el orden de CAMPOS_TARJETA. La foto es la URL de la
+    miniatura de la portada, o "" si el anuncio no tiene fotos listas"""
+    return [
+        tarjeta.id, tarjeta.marca, tarjeta.modelo, tarjeta.año, tarjeta.precio_formateado,
+        f"{tarjeta.kilometraje:,} km", tarjeta.ubicacion_ciudad, tarjeta.ubicacion_provincia,
+        tarjeta.tipo_motor.value, tarjeta.destacado,
+        fotos_service.url_variante(tarjeta.foto_portada) if tarjeta.foto_portada else "",
+    ]
+
+class VehiculosState(rx.State):
+    """Listado de vehículos con filtros, orden y scroll infinito con ventana"""
+    
+    # Filtros
+    marca: str = ""
+    provincia: str = ""
+    tipo_motor: str = ""
+    tipo_vehiculo: str = ""
+    precio: List[int] = [0, PRECIO_MAXIMO]
+    order_by: str = "-fecha_creacion"
+    
+    # Ventana: primer bloque, ids en orden y tarjetas compactas por id (str, como las claves JSON)
+    bloque_inicial: int = 0
+    orden: List[str] = []
+    tarjetas: Dict[str, List[Any]] = {}
+    total: int = 0
+    has_siguiente: bool = False
+    cargando: bool = False
+    error: str = ""
+    
+    # Número del último cambio de filtros; las lecturas anteriores ya no se aplican
+    _generacion: int = 0
+    # Filtros de los bloques que se están leyendo (None mientras hay un cambio pendiente)
+    _filtros_ventana: Optional[Dict[str, Any]] = None
+    _consulta: Optional[Tuple[Any, ...]] = None
+    # Cursor con el que se lee cada bloque: None en el 0 es el principio y en los demás el final
+    _cursores: List[Optional[str]] = [None]
+    # Bloques leídos: los de la ventana y el siguiente, precargado
+    _bloques: Dict[int, List[List[Any]]] = {}
+    # Primer bloque de la ventana según la posición del scroll
+    _objetivo: int = 0
+    _leyendo: bool = False
+    
+    @rx.var
+    def espacio_superior(self) -> str:
+        """Altura de los bloques que han salido de la ventana por arriba"""
+        return f"{self.bloque_inicial * ALTO_BLOQUE_PX}px"
+    
+    def _filtros(self) -> Dict[str, Any]:
+        """Filtros en el formato de VehiculosService"""
+        filtros: Dict[str, Any] = {"order_by": self.order_by}
+        if self.marca:
+            filtros["marca"] = self.marca
+        if self.provincia:
+            filtros["ubicacion_provincia"] = self.provincia
+        if self.tipo_motor:
+            filtros["tipo_motor"] = TipoMotor(self.tipo_motor)
+        if self.tipo_vehiculo:
+            filtros["tipo_vehiculo"] = TipoVehiculo(self.tipo_vehiculo)
+        minimo, maximo = self.precio
+        if maximo < PRECIO_MAXIMO:
+            filtros["precio"] = {"between": (minimo, maximo)}
+        elif minimo > 0:
+            filtros["precio"] = {"gte": minimo}
+        return filtros
+    
+    def _ultimo_bloque(self) -> int:
+        """Último bloque que se sabe que existe"""
+        if len(self._cursores) > 1 and self._cursores[-1] is None:
+            return len(self._cursores) - 2
+        return len(self._cursores) - 1
+    
+    def _bloque_pendiente(self) -> Optional[int]:
+        """Primer bloque de la ventana o de la precarga que falta por leer"""
+        if self._filtros_ventana is None:
+            return None
+        for bloque in range(self._objetivo, self._objetivo + BLOQUES_VENTANA + 1):
+            if bloque > self._ultimo_bloque():
+                return None
+            if bloque not in self._bloques:
+                return bloque
+        return None
+    
+    def _mostrar(self) -> None:
+        """Pasa a la ventana los bloques leídos desde _objetivo y olvida los que quedan fuera.
+        Reasigna solo las variables que cambian, para que Reflex no reenvíe las demás"""
+        if self._objetivo not in self._bloques:
+            # Se sigue mostrando la ventana anterior hasta que llegue el bloque
+            return
+        filas: List[List[Any]] = []
+        ultimo = self._objetivo
+        for bloque in range(self._objetivo, self._objetivo + BLOQUES_VENTANA):
+            if bloque not in self._bloques:
+                break
+            filas.extend(self._bloques[bloque])
+            ultimo = bloque
+        
+        tarjetas = {str(fila[0]): fila for fila in filas}
+        orden = list(tarjetas)
+        if tarjetas != self.tarjetas:
+            self.tarjetas = tarjetas
+        if orden != self.orden:
+            self.orden = orden
+        if self._objetivo != self.bloque_inicial:
+            self.bloque_inicial = self._objetivo
+        has_siguiente = ultimo < self._ultimo_bloque()
+        if has_siguiente != self.has_siguiente:
+            self.has_siguiente = has_siguiente
+        
+        self._bloques = {
+            bloque: contenido for bloque, contenido in self._bloques.items()
+            if self._objetivo <= bloque <= self._objetivo + BLOQUES_VENTANA
+        }
+    
+    def _guardar_bloque(self, bloque: int, resultado: Dict[str, Any]) -> None:
+        self._bloques[bloque] = [tarjeta_compacta(t) for t in resultado["vehiculos"]]
+        if len(self._cursores) == bloque + 1:
+            self._cursores.append(resultado["siguiente_cursor"])
+        if "total" in resultado and resultado["total"] != self.total:
+            self.total = resultado["total"]
+    
+    async def _cargar_ventana(self) -> None:
+        """Lee de uno en uno los bloques que faltan en la ventana y en la precarga.
+        Solo hay un lector a la vez; el que está en marcha atiende también los cambios de posición"""
+        async with self:
+            if self._leyendo:
+                return
+            self._leyendo = True
+        try:
+            while True:
+                async with self:
+                    bloque = self._bloque_pendiente()
+                    if bloque is None:
+                        self._leyendo = False
+                        if self.cargando:
+                            self.cargando = False
+                        return
+                    generacion = self._generacion
+                    filtros, cursor = self._filtros_ventana, self._cursores[bloque]
+                
+                # El total (de las facetas en memoria, sin COUNT) solo con el primer bloque
+                resultado = await vehiculos_async.buscar_vehiculos_cursor(
+                    filtros, BLOQUE, cursor, proyeccion=TarjetaVehiculo, total=bloque == 0)
+                
+                async with self:
+                    if generacion != self._generacion:
+                        # Los filtros han cambiado mientras se leía
+                        continue
+                    if "error" in resultado:
+                        self.error = resultado["error"]
+                        self._filtros_ventana = self._consulta = None
+                        continue
+                    self._guardar_bloque(bloque, resultado)
+                    self._mostrar()
+        except BaseException:
+            async with self:
+                self._leyendo = False
+            raise
+    
+    def _nueva_busqueda(self):
+        """Deja obsoletas las lecturas en curso, vuelve arriba y programa una búsqueda"""
+        self._generacion += 1
+        self._filtros_ventana = None
+        return [rx.call_script(f"document.getElementById('{ID_LISTADO}').scrollTop = 0"),
+                VehiculosState.buscar]
+    
+    @rx.event
+    @medir_evento
+    def cargar(self):
+        """Carga inicial de la página (on_load): consulta siempre"""
+        self._consulta = None
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def cambiar_marca(self, marca: str):
+        self.marca = marca
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def cambiar_provincia(self, provincia: str):
+        self.provincia = provincia
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def cambiar_tipo_motor(self, tipo_motor: str):
+        self.tipo_motor = tipo_motor
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def cambiar_tipo_vehiculo(self, tipo_vehiculo: str):
+        self.tipo_vehiculo = tipo_vehiculo
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def cambiar_precio(self, precio: List[float]):
+        """Rango [mínimo, máximo] del control deslizante; llega en cada movimiento"""
+        self.precio = [int(precio[0]), int(precio[1])]
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def cambiar_orden(self, order_by: str):
+        self.order_by = order_by
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def limpiar_filtros(self):
+        self.marca = self.provincia = self.tipo_motor = self.tipo_vehiculo = ""
+        self.precio = [0, PRECIO_MAXIMO]
+        return self._nueva_busqueda()
+    
+    @rx.event
+    @medir_evento
+    def desplazar(self, scroll_top: int):
+        """Posición del scroll del listado: la ventana empieza un bloque antes del visible"""
+        objetivo = min(max(0, int(scroll_top) // ALTO_BLOQUE_PX - 1), self._ultimo_bloque())
+        if objetivo == self._objetivo:
+            return
+        self._objetivo = objetivo
+        self._mostrar()
+        return VehiculosState.completar_ventana
+    
+    @rx.event(background=True)
+    @medir_evento
+    async def completar_ventana(self):
+        await self._cargar_ventana()
+    
+    @rx.event(background=True)
+    @medir_evento
+    async def buscar(self):
+        """Empieza el listado de los filtros actuales si en DEBOUNCE_S no ha llegado otro cambio"""
+        async with self:
+            generacion = self._generacion
+        await asyncio.sleep(DEBOUNCE_S)
+        
+        async with self:
+            if generacion != self._generacion:
+                return
+            filtros = self._filtros()
+            consulta = tuple(sorted((k, repr(v)) for k, v in filtros.items()))
+            if consulta != self._consulta:
+                self._consulta = consulta
+                self._cursores = [None]
+                self._bloques = {}
+                self.cargando = True
+                if self.error:
+                    self.error = ""
+            self._objetivo = 0
+            self._filtros_ventana = filtros
+            self._mostrar()
+        
+        await self._cargar_ventana()
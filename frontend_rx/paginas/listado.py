@@ -1,7 +1,51 @@
-# Lista de vehículos
-# Aquí va el código de la página de listado de vehículos.
 """
 Página Listado
 
 Muestra el listado de vehículos disponibles en el marketplace.
-"""
\ No newline at end of file
+"""
+import reflex as rx
+
+from frontend_rx.componentes.filtros_vehiculos import filtros_vehiculos
+from frontend_rx.componentes.vehiculo_card import vehiculo_card
+from frontend_rx.estados.vehiculos import VehiculosState, ID_LISTADO, COLUMNAS, SEPARACION_PX
+
+def _posicion_scroll() -> rx.Var:
+    return rx.Var(f"document.getElementById('{ID_LISTADO}').scrollTop").to(int)
+
+def listado() -> rx.Component:
+    """Listado con scroll infinito: solo se dibuja la ventana de tarjetas que mantiene
+    VehiculosState; lo que ha quedado arriba es un espacio de la misma altura"""
+    return rx.container(
+        rx.vstack(
+            rx.heading("Vehículos en venta", size="7"),
+            filtros_vehiculos(),
+            rx.hstack(
+                rx.text(VehiculosState.total, " vehículos"),
+                rx.cond(VehiculosState.cargando, rx.spinner()),
+                spacing="2",
+            ),
+            rx.cond(VehiculosState.error != "", rx.callout(VehiculosState.error, color_scheme="red")),
+            rx.box(
+                rx.box(height=VehiculosState.espacio_superior),
+                rx.grid(
+                    rx.foreach(VehiculosState.orden, lambda id: vehiculo_card(VehiculosState.tarjetas[id])),
+                    columns=str(COLUMNAS),
+                    gap=f"{SEPARACION_PX}px",
+                    # La separación también tras la última fila: cada bloque mide ALTO_BLOQUE_PX
+                    # (filas × ALTO_FILA_PX), como suponen espacio_superior y desplazar
+                    padding_bottom=f"{SEPARACION_PX}px",
+                ),
+                rx.cond(VehiculosState.has_siguiente, rx.center(rx.spinner(), padding="4")),
+                id=ID_LISTADO,
+                height="calc(100vh - 220px)",
+                overflow_y="auto",
+                width="100%",
+                # Mientras se desplaza, como mucho una posición cada 100 ms, y la final
+                on_scroll=VehiculosState.desplazar(_posicion_scroll()).throttle(100),
+                on_scroll_end=VehiculosState.desplazar(_posicion_scroll()),
+            ),
+            spacing="4",
+            width="100%",
+        ),
+        max_width="1200px",
+    )
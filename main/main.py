@@ -1,6 +1,9 @@
 # main/main.py (corregido para nueva versión de Reflex)
 import reflex as rx
 
+from frontend_rx.estados.vehiculos import VehiculosState
+from frontend_rx.paginas.listado import listado
+
 # Datos de prueba temporales
 vehiculos_db = [
     {"id": 1, "marca": "BMW", "modelo": "Serie 3", "precio": 25000},
@@ -37,4 +40,5 @@ def index():
     )
 
 app = rx.App()
-app.add_page(index, route="/")
\ No newline at end of file
+app.add_page(index, route="/")
+app.add_page(listado, route="/listado", title="Vehículos en venta", on_load=VehiculosState.cargar)
\ No newline at end of file
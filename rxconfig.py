@@ -6,4 +6,24 @@ config = rx.Config(
     db_url="sqlite:///reflex.db",
     env=rx.Env.DEV,
     disable_plugins=['reflex.plugins.sitemap.SitemapPlugin'],  # Silenciar warning
+    # Ajustes de SQLite (backend_rx/apps/servicio/motor.py); REFLEX_SQLITE_<AJUSTE> los sobrescribe
+    sqlite_wal=True,
+    sqlite_synchronous="NORMAL",
+    sqlite_busy_timeout_ms=5000,
+    sqlite_cache_size_mb=64,
+    sqlite_mmap_size_mb=256,
+    sqlite_lectores=8,
+    # Instrumentación de consultas (backend_rx/apps/servicio/instrumentacion.py)
+    instrumentacion_activa=True,
+    instrumentacion_consultas_lentas_ms=100,
+    # Fotos de los anuncios (backend_rx/apps/servicio/fotos.py)
+    fotos_directorio="fotos",
+    # Contraseñas y tokens (backend_rx/apps/autenticacion/autenticacion_service.py); el
+    # secreto de firma va en REFLEX_AUTENTICACION_SECRETO
+    autenticacion_coste_bcrypt=12,
+    autenticacion_expiracion_min=60,
+    # Reservas (backend_rx/apps/servicio/checkout_service.py)
+    checkout_minutos_reserva=15,
+    # Avisos de búsquedas guardadas (backend_rx/apps/servicio/alertas.py)
+    alertas_lote=200,
 )
\ No newline at end of file